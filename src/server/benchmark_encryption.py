@@ -0,0 +1,101 @@
+import os
+import base64
+import json
+import time
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.backends import default_backend
+
+from main import encryption
+from main.encryption import FieldCipher, LazyDecryptedDocument, decrypt_documents
+
+# --- Configuration ---
+# This script is designed to be run from the `src/server` directory:
+#   python benchmark_encryption.py
+# It uses random keys, so it needs no .env and touches no database.
+KEY = os.urandom(32)
+IV = os.urandom(16)
+ROUNDS = 20
+SENSITIVE_MESSAGE_FIELDS = ["content", "thoughts", "tool_calls", "tool_results"]
+SENSITIVE_TASK_FIELDS = ["name", "description", "plan", "runs", "original_context", "chat_history", "error", "clarifying_questions", "result", "swarm_details"]
+
+# --- The per-field path this replaces: a new Cipher, backend and padder for every value ---
+
+def old_aes_encrypt(data: str) -> str:
+    cipher = Cipher(algorithms.AES(KEY), modes.CBC(IV), backend=default_backend())
+    encryptor = cipher.encryptor()
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    padded_data = padder.update(data.encode()) + padder.finalize()
+    return base64.b64encode(encryptor.update(padded_data) + encryptor.finalize()).decode()
+
+def old_aes_decrypt(encrypted_data: str) -> str:
+    cipher = Cipher(algorithms.AES(KEY), modes.CBC(IV), backend=default_backend())
+    decryptor = cipher.decryptor()
+    decrypted = decryptor.update(base64.b64decode(encrypted_data)) + decryptor.finalize()
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+    return (unpadder.update(decrypted) + unpadder.finalize()).decode()
+
+def old_decrypt_docs(docs, fields):
+    for doc in docs:
+        for field in fields:
+            if field in doc and doc[field] is not None:
+                try:
+                    doc[field] = json.loads(old_aes_decrypt(doc[field]))
+                except Exception:
+                    pass
+
+# --- Sample data ---
+
+def make_messages(count: int):
+    return [{
+        "message_id": f"m{i}", "role": "assistant",
+        "content": "Here is what I found about your upcoming trip. " * 20,
+        "thoughts": ["Look up the flight", "Check the calendar"],
+        "tool_calls": [{"name": "gcal_search", "args": {"query": "flight"}}],
+        "tool_results": [{"result": "x" * 400}],
+    } for i in range(count)]
+
+def make_task():
+    return {
+        "task_id": "t1", "name": "Weekly report", "description": "Compile the weekly report " * 10,
+        "plan": [{"tool": "gdocs", "description": "Write the report " * 5}] * 10,
+        "runs": [{"run_id": f"r{i}", "status": "completed", "result": "y" * 2000, "progress_updates": ["step"] * 50} for i in range(30)],
+        "swarm_details": {"results": ["z" * 1000] * 50}, "original_context": {"source": "chat"},
+        "chat_history": [], "error": None, "clarifying_questions": [], "result": "done",
+    }
+
+def encrypt_with(encrypt, docs, fields):
+    for doc in docs:
+        for field in fields:
+            if doc.get(field) is not None:
+                doc[field] = encrypt(json.dumps(doc[field]))
+    return docs
+
+def timed(label: str, fn, make_input):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        data = make_input()
+        start = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<42} {best * 1000:8.3f} ms")
+
+def main():
+    encryption._cipher = FieldCipher(KEY, IV)
+    v1_cipher = FieldCipher(KEY, IV, write_version="v1")
+
+    print("Decrypting 30 chat messages (4 encrypted fields each):")
+    legacy_messages = encrypt_with(old_aes_encrypt, make_messages(30), SENSITIVE_MESSAGE_FIELDS)
+    v1_messages = encrypt_with(v1_cipher.encrypt, make_messages(30), SENSITIVE_MESSAGE_FIELDS)
+    timed("per-field path (new Cipher per value)", lambda docs: old_decrypt_docs(docs, SENSITIVE_MESSAGE_FIELDS), lambda: [dict(d) for d in legacy_messages])
+    timed("shared cipher, batch (legacy CBC)", lambda docs: decrypt_documents(docs, SENSITIVE_MESSAGE_FIELDS), lambda: [dict(d) for d in legacy_messages])
+    timed("shared cipher, batch (v1 AES-GCM)", lambda docs: decrypt_documents(docs, SENSITIVE_MESSAGE_FIELDS), lambda: [dict(d) for d in v1_messages])
+
+    print("Loading one large task and reading its name:")
+    legacy_task = encrypt_with(old_aes_encrypt, [make_task()], SENSITIVE_TASK_FIELDS)[0]
+    timed("per-field path, every field decrypted", lambda doc: old_decrypt_docs([doc], SENSITIVE_TASK_FIELDS), lambda: dict(legacy_task))
+    timed("shared cipher, every field decrypted", lambda doc: decrypt_documents([doc], SENSITIVE_TASK_FIELDS), lambda: dict(legacy_task))
+    timed("lazy document, only `name` decrypted", lambda doc: LazyDecryptedDocument(doc, SENSITIVE_TASK_FIELDS)["name"], lambda: dict(legacy_task))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+# --- Configuration ---
+# This script is designed to be run from the `src/server` directory, with the server's .env in place
+# and MongoDB reachable:
+#   BENCHMARK_TOKEN=<access token of a test user> python benchmark_workers.py [METHOD] [path]
+# It starts the main server with 1, 2 and 4 workers in turn and measures throughput on one
+# authenticated path (default POST /tasks/fetch-tasks, which validates the token and loads and
+# decrypts the user's tasks). Use a test user with a realistic number of tasks.
+PORT = int(os.getenv("BENCHMARK_PORT", 5099))
+WORKER_COUNTS = [1, 2, 4]
+CONCURRENCY = 64
+DURATION_SECONDS = 15
+STARTUP_TIMEOUT_SECONDS = 120
+
+def start_server(workers: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main.app:app", "--host", "127.0.0.1", "--port", str(PORT),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env={**os.environ, "WEB_CONCURRENCY": str(workers)},
+    )
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, workers: int):
+    """Waits for /ready to report every startup component ready. Exits if it never does."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    last_status = "no response"
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server with {workers} worker(s) exited with code {server.returncode} before becoming ready.")
+        try:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return
+            last_status = f"{response.status_code} {response.text}"
+        except httpx.HTTPError as e:
+            last_status = repr(e)
+        await asyncio.sleep(0.5)
+    sys.exit(f"Server with {workers} worker(s) was not ready after {STARTUP_TIMEOUT_SECONDS}s. Last /ready: {last_status}")
+
+async def check_path(client: httpx.AsyncClient, method: str, path: str, headers: dict):
+    """Fails before measuring if the path is rejected, e.g. by an expired token."""
+    response = await client.request(method, path, headers=headers)
+    if response.status_code >= 400:
+        sys.exit(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+
+async def load(client: httpx.AsyncClient, method: str, path: str, headers: dict):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + DURATION_SECONDS
+
+    async def user():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, headers=headers)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[user() for _ in range(CONCURRENCY)])
+    latencies.sort()
+    return len(latencies), errors, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+async def main():
+    method, path = (sys.argv[1].upper(), sys.argv[2]) if len(sys.argv) > 2 else ("POST", "/tasks/fetch-tasks")
+    token = os.getenv("BENCHMARK_TOKEN")
+    if not token:
+        sys.exit("BENCHMARK_TOKEN must be set to an access token of a test user.")
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY)
+
+    print(f"{method} {path}, {CONCURRENCY} concurrent clients, {DURATION_SECONDS}s per run:")
+    baseline, failed = None, False
+    for workers in WORKER_COUNTS:
+        server = start_server(workers)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+                await wait_until_ready(client, server, workers)
+                await check_path(client, method, path, headers)
+                requests, errors, p50, p99 = await load(client, method, path, headers)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        throughput = requests / DURATION_SECONDS
+        baseline = baseline or throughput
+        failed = failed or errors > 0
+        print(f"  {workers} worker(s): {throughput:9.1f} req/s ({throughput / baseline:4.2f}x)  p50 {p50 * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms  errors {errors}")
+    if failed:
+        sys.exit("Some requests failed, so the numbers above are not comparable.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
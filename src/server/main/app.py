@@ -10,7 +10,9 @@ import logging
 logging.basicConfig(level=logging.INFO)
 import socket
 
-if platform.system() == 'Windows':
+def _configure_webrtc_ip():
+    if platform.system() != 'Windows':
+        return
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         s.connect(('8.8.8.8', 80))
@@ -27,18 +29,22 @@ if platform.system() == 'Windows':
 from contextlib import asynccontextmanager
 import logging
 from bson import ObjectId
-from typing import Optional
 import httpx
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import ENCODERS_BY_TYPE
 
 from main.config import (
-    APP_SERVER_PORT, STT_PROVIDER, TTS_PROVIDER, ELEVENLABS_API_KEY, DEEPGRAM_API_KEY,
-    FASTER_WHISPER_MODEL_SIZE, FASTER_WHISPER_DEVICE, FASTER_WHISPER_COMPUTE_TYPE, ORPHEUS_MODEL_PATH, ORPHEUS_N_GPU_LAYERS
+    APP_SERVER_PORT, APP_SERVER_WORKERS, VOICE_ENABLED, VOICE_MODEL_LOADING, CHROMA_WARMUP_ON_STARTUP,
+    REDIS_URL, WEBSOCKET_BACKPLANE, SHARED_STATE_BACKEND, USAGE_METER_BACKEND, VOICE_INFERENCE_URL
 )
-from main.dependencies import mongo_manager
+from main.dependencies import mongo_manager, websocket_manager
+from main.auth.utils import jwks_manager, auth0_management_client
+from main.worker_events import worker_event_consumer
+from main.usage import usage_meter
+from main.startup import StartupManager, Subsystem
 from main.auth.routes import router as auth_router
 from main.chat.routes import router as chat_router
 from main.notifications.routes import router as notifications_router
@@ -51,24 +57,13 @@ from main.search.routes import router as search_router
 from main.memories.db import close_db_pool as close_memories_pg_pool
 from main.memories.routes import router as memories_router
 from main.files.routes import router as files_router
-# FIX: Import both router and stream from voice.routes
-from main.voice.routes import router as voice_router, stream as voice_stream
-from main.voice.stt.base import BaseSTT
-from main.voice.stt.elevenlabs import ElevenLabsSTT
-from main.voice.stt.deepgram import DeepgramSTT
-from main.voice.tts.base import BaseTTS
-from main.voice.tts.elevenlabs import ElevenLabsTTS as ElevenLabsTTSImpl
-
-# Conditionally import heavy voice models only if they are selected
-if STT_PROVIDER == "FASTER_WHISPER":
-    from main.voice.stt.faster_whisper import FasterWhisperSTT
-else:
-    FasterWhisperSTT = None
-
-if TTS_PROVIDER == "ORPHEUS":
-    from main.voice.tts.orpheus import OrpheusTTS
-else:
-    OrpheusTTS = None
+from main.voice import providers as voice_providers
+
+# Voice pulls in FastRTC and audio libraries, so text-only deployments skip it entirely.
+if VOICE_ENABLED:
+    # FastRTC reads WEBRTC_IP when the stream is created.
+    _configure_webrtc_ip()
+    from main.voice.routes import router as voice_router, stream as voice_stream, rtc_token_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__) 
@@ -77,69 +72,68 @@ logger = logging.getLogger(__name__)
 ENCODERS_BY_TYPE[ObjectId] = str
 
 http_client: httpx.AsyncClient = httpx.AsyncClient()
-stt_model_instance: Optional[BaseSTT] = None
-tts_model_instance: Optional[BaseTTS] = None
-
-def initialize_stt():
-    global stt_model_instance
-    logger.info(f"Initializing STT model provider: {STT_PROVIDER}")
-    if STT_PROVIDER == "FASTER_WHISPER":
-        try:
-            if FasterWhisperSTT: # Check if the import was successful
-                stt_model_instance = FasterWhisperSTT(
-                    model_size=FASTER_WHISPER_MODEL_SIZE, device=FASTER_WHISPER_DEVICE,
-                    compute_type=FASTER_WHISPER_COMPUTE_TYPE
-                )
-            else:
-                logger.error("FasterWhisperSTT is configured but could not be imported. Check dependencies.")
-        except Exception as e:
-            logger.error(f"Failed to initialize FasterWhisper STT: {e}", exc_info=True)
-    elif STT_PROVIDER == "ELEVENLABS":
-        if not ELEVENLABS_API_KEY:
-            logger.error("ELEVENLABS_API_KEY not set for STT.")
-        else:
-            stt_model_instance = ElevenLabsSTT()
-    elif STT_PROVIDER == "DEEPGRAM":
-        if not DEEPGRAM_API_KEY:
-            logger.error("DEEPGRAM_API_KEY not set for STT.")
-        else:
-            stt_model_instance = DeepgramSTT()
-    else:
-        logger.warning(f"Invalid STT_PROVIDER: '{STT_PROVIDER}'. No STT model loaded.")
-
-def initialize_tts():
-    global tts_model_instance
-    logger.info(f"Initializing TTS model provider: {TTS_PROVIDER}")
-    if TTS_PROVIDER == "ORPHEUS":
-        try:
-            if OrpheusTTS:
-                tts_model_instance = OrpheusTTS(
-                    model_path=ORPHEUS_MODEL_PATH, n_gpu_layers=ORPHEUS_N_GPU_LAYERS
-                )
-            else:
-                logger.error("OrpheusTTS is configured but could not be imported. Check dependencies.")
-        except Exception as e:
-            logger.error(f"Failed to initialize OrpheusTTS: {e}", exc_info=True)
-    elif TTS_PROVIDER == "ELEVENLABS":
-        if not ELEVENLABS_API_KEY:
-            logger.error("ELEVENLABS_API_KEY not set for TTS.")
-        else:
-            tts_model_instance = ElevenLabsTTSImpl()
-    else:
-        logger.warning(f"Invalid TTS_PROVIDER: '{TTS_PROVIDER}'. No TTS model loaded.")
+
+def _close_mongo_client():
+    if mongo_manager and mongo_manager.client:
+        mongo_manager.client.close()
+
+def _warm_chroma():
+    from main.vector_db import get_conversation_summaries_collection
+    get_conversation_summaries_collection()
+
+def _check_multi_worker_config():
+    """With several workers, any state that is still per-process silently diverges between them."""
+    if APP_SERVER_WORKERS <= 1:
+        return
+    problems = []
+    if WEBSOCKET_BACKPLANE != "redis":
+        problems.append("WEBSOCKET_BACKPLANE is not 'redis', so notifications only reach sockets on the sending worker")
+    if SHARED_STATE_BACKEND != "redis":
+        problems.append("SHARED_STATE_BACKEND is not 'redis', so voice tokens fail on other workers")
+    if USAGE_METER_BACKEND != "redis" or not REDIS_URL:
+        problems.append("the usage meter is local, so each worker enforces plan limits separately")
+    if VOICE_ENABLED and not VOICE_INFERENCE_URL:
+        problems.append("VOICE_INFERENCE_URL is not set, so every worker loads its own STT/TTS models")
+    for problem in problems:
+        print(f"[{datetime.datetime.now()}] [STARTUP_WARNING] WEB_CONCURRENCY={APP_SERVER_WORKERS} but {problem}.")
+
+# --- Subsystems ---
+# Only websockets start before the server serves; everything heavier loads in the background
+# and is reported by /ready. Dependencies also fix the shutdown order (e.g. usage counters are
+# flushed before the Mongo client closes).
+startup_manager = StartupManager()
+startup_manager.register(Subsystem("database", start=mongo_manager.initialize_db, stop=_close_mongo_client, background=True))
+startup_manager.register(Subsystem("memories_pg", stop=close_memories_pg_pool, critical=False))
+startup_manager.register(Subsystem("websockets", start=websocket_manager.start, stop=websocket_manager.stop))
+startup_manager.register(Subsystem("usage_meter", start=usage_meter.start, stop=usage_meter.stop, depends_on=["database"], background=True))
+if jwks_manager:
+    startup_manager.register(Subsystem("jwks", start=jwks_manager.start, stop=jwks_manager.stop, background=True))
+if auth0_management_client:
+    startup_manager.register(Subsystem("auth0_management", stop=auth0_management_client.close, critical=False))
+if worker_event_consumer:
+    startup_manager.register(Subsystem(
+        "worker_events", start=worker_event_consumer.start, stop=worker_event_consumer.stop,
+        depends_on=["database", "websockets"], background=True
+    ))
+if VOICE_ENABLED:
+    startup_manager.register(Subsystem("rtc_tokens", start=rtc_token_store.start, stop=rtc_token_store.stop, critical=False))
+if VOICE_ENABLED and VOICE_MODEL_LOADING != "lazy":
+    # Voice is optional: a model that fails to load leaves the server ready for everything else.
+    background_voice = VOICE_MODEL_LOADING != "eager"
+    startup_manager.register(Subsystem("stt", start=voice_providers.load_stt, background=background_voice, critical=False))
+    startup_manager.register(Subsystem("tts", start=voice_providers.load_tts, background=background_voice, critical=False))
+if CHROMA_WARMUP_ON_STARTUP:
+    startup_manager.register(Subsystem("chroma", start=_warm_chroma, background=True, blocking=True, critical=False))
 
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
     print(f"[{datetime.datetime.now(timezone.utc).isoformat()}] [LIFESPAN] App startup...")
-    await mongo_manager.initialize_db()
-    initialize_stt()
-    initialize_tts()
-    print(f"[{datetime.datetime.now(timezone.utc).isoformat()}] [LIFESPAN] App startup complete.")
+    _check_multi_worker_config()
+    await startup_manager.start()
+    print(f"[{datetime.datetime.now(timezone.utc).isoformat()}] [LIFESPAN] App serving; import took {END_TIME - START_TIME:.2f}s.")
     yield 
     print(f"[{datetime.datetime.now(timezone.utc).isoformat()}] [LIFESPAN] App shutdown sequence initiated...")    
-    if mongo_manager and mongo_manager.client:
-        mongo_manager.client.close()
-    await close_memories_pg_pool()
+    await startup_manager.stop()
     print(f"[{datetime.datetime.now(timezone.utc).isoformat()}] [LIFESPAN] App shutdown complete.")
 
 app = FastAPI(title="Sentient Main Server", version="2.2.0", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
@@ -152,8 +146,9 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-# FIX: Mount the FastRTC stream with a /voice prefix
-voice_stream.mount(app, "/voice")
+if VOICE_ENABLED:
+    # FIX: Mount the FastRTC stream with a /voice prefix
+    voice_stream.mount(app, "/voice")
 
 app.include_router(auth_router)
 app.include_router(chat_router)
@@ -165,7 +160,8 @@ app.include_router(settings_router)
 app.include_router(testing_router)
 app.include_router(search_router)
 app.include_router(memories_router)
-app.include_router(voice_router)
+if VOICE_ENABLED:
+    app.include_router(voice_router)
 app.include_router(files_router)
 
 @app.get("/", tags=["General"])
@@ -174,16 +170,27 @@ async def root():
 
 @app.get("/health", tags=["General"])
 async def health():
+    """Liveness: the process is up and its event loop responds. Never waits on a dependency."""
     return {
         "status": "healthy",
         "timestamp": datetime.datetime.now(timezone.utc).isoformat(),
-        "services": {
-            "database": "connected" if mongo_manager.client else "disconnected",
-            "stt": "loaded" if stt_model_instance else "not_loaded",
-            "tts": "loaded" if tts_model_instance else "not_loaded",
-            "llm": "qwen_agent_on_demand"
+        "uptime_seconds": round(time.time() - START_TIME, 1)
+    }
+
+@app.get("/ready", tags=["General"])
+async def ready():
+    """Readiness: every critical subsystem has started. Also reports which optional ones are warm."""
+    is_ready = startup_manager.is_ready()
+    content = {
+        "status": "ready" if is_ready else "starting",
+        "timestamp": datetime.datetime.now(timezone.utc).isoformat(),
+        "subsystems": startup_manager.status(),
+        "warm": {
+            "stt": voice_providers.stt_model_instance is not None,
+            "tts": voice_providers.tts_model_instance is not None,
         }
     }
+    return JSONResponse(status_code=200 if is_ready else 503, content=content)
 
 END_TIME = time.time()
 print(f"[{datetime.datetime.now()}] [APP_PY_LOADED] Main Server app.py loaded in {END_TIME - START_TIME:.2f} seconds.")
@@ -193,4 +200,4 @@ if __name__ == "__main__":
     log_config = uvicorn.config.LOGGING_CONFIG.copy()
     log_config["formatters"]["access"]["fmt"] = '%(asctime)s %(levelname)s %(client_addr)s - "[MAIN_SERVER_ACCESS] %(request_line)s" %(status_code)s'
     log_config["formatters"]["default"]["fmt"] = '%(asctime)s %(levelname)s [%(name)s] [MAIN_SERVER_DEFAULT] %(message)s'
-    uvicorn.run("main.app:app", host="127.0.0.1", port=APP_SERVER_PORT, lifespan="on", reload=False, workers=1, log_config=log_config)
\ No newline at end of file
+    uvicorn.run("main.app:app", host="127.0.0.1", port=APP_SERVER_PORT, lifespan="on", reload=False, workers=APP_SERVER_WORKERS, log_config=log_config)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+class JWKSManager:
+    """
+    Keeps the identity provider's signing keys indexed by `kid`. Keys are refreshed in the
+    background, and a token signed with an unknown key triggers an early re-fetch, so key
+    rotation needs no restart. Re-fetches are rate-limited so unknown kids cannot flood the provider.
+    """
+
+    def __init__(self, jwks_url: str, refresh_interval_seconds: float, min_refetch_interval_seconds: float, timeout: float = 10):
+        self.jwks_url = jwks_url
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.min_refetch_interval_seconds = min_refetch_interval_seconds
+        self.timeout = timeout
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._last_fetch_attempt: Optional[float] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+    @staticmethod
+    def _index_keys(jwks: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        keys = {}
+        for key_entry in jwks.get("keys", []):
+            if not isinstance(key_entry, dict) or not key_entry.get("kid") or key_entry.get("use", "sig") != "sig":
+                continue
+            rsa_key_data = {comp: key_entry[comp] for comp in ["kty", "kid", "use", "n", "e"] if comp in key_entry}
+            if all(k in rsa_key_data for k in ["kty", "n", "e"]):
+                keys[key_entry["kid"]] = rsa_key_data
+        return keys
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Re-fetches the key set unless it was attempted too recently. Returns whether keys were loaded."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            if not force and self._last_fetch_attempt is not None and now - self._last_fetch_attempt < self.min_refetch_interval_seconds:
+                return False
+            self._last_fetch_attempt = now
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                    keys = self._index_keys(response.json())
+            except Exception as e:
+                print(f"[{datetime.datetime.now()}] [JWKSManager_ERROR] Could not fetch JWKS from {self.jwks_url}: {e}")
+                return False
+            if not keys:
+                print(f"[{datetime.datetime.now()}] [JWKSManager_ERROR] JWKS from {self.jwks_url} contained no usable signing keys.")
+                return False
+            self._keys = keys
+            print(f"[{datetime.datetime.now()}] [JWKSManager] Loaded {len(keys)} signing key(s).")
+            return True
+
+    async def get_key(self, kid: str) -> Optional[Dict[str, Any]]:
+        key = self._keys.get(kid)
+        if key is None:
+            # Possibly a rotated key; the re-fetch is rate-limited.
+            await self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            await self.refresh(force=True)
+
+    async def start(self):
+        """Loads the keys and starts the background refresh. Call from the app's startup."""
+        await self.refresh(force=True)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        # The lock belongs to the loop that is shutting down.
+        self._lock = None
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified token payloads, keyed by the token's SHA-256 so raw tokens are not kept.
+    An entry is used until the token's `exp`, capped at `max_age_seconds`.
+    """
+
+    def __init__(self, max_size: int, max_age_seconds: float):
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # Callers add fields to the payload, so each gets its own copy.
+        return dict(payload)
+
+    def put(self, token: str, payload: Dict[str, Any]):
+        expires_at = time.time() + self.max_age_seconds
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, payload["exp"])
+        if expires_at <= time.time():
+            return
+        key = self._key(token)
+        self._entries[key] = (expires_at, dict(payload))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
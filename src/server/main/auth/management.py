@@ -0,0 +1,230 @@
+import asyncio
+import datetime
+import email.utils
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+class Auth0ManagementError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class Auth0ManagementClient:
+    """
+    Async client for the Auth0 Management API. The client-credentials token is cached and renewed
+    `refresh_margin_seconds` before it expires; concurrent callers share a single renewal. Requests
+    go through one pooled HTTP client, and 429 responses are retried after the delay Auth0 asks for.
+    `base_url` defaults to the tenant, and can point at a local fake server in tests. With a
+    `token_store` (main/shared_state.py) the token is shared by every server process.
+    """
+
+    # Auth0 user search rejects very long queries, so id lookups are split into chunks of this size.
+    USER_SEARCH_CHUNK_SIZE = 50
+
+    def __init__(self, domain: str, client_id: str, client_secret: str, base_url: Optional[str] = None,
+                 refresh_margin_seconds: float = 300, max_retries: int = 3, max_concurrency: int = 5,
+                 timeout: float = 10, http_client: Optional[httpx.AsyncClient] = None, token_store=None):
+        self.base_url = (base_url or f"https://{domain}").rstrip("/")
+        self.audience = f"https://{domain}/api/v2/"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._http_client = http_client
+        self.token_store = token_store
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_refresh: Optional[asyncio.Future] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.timeout, limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._http_client
+
+    async def close(self):
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+
+    # --- Token ---
+
+    async def get_token(self) -> str:
+        now = time.monotonic()
+        if self._token and now < self._token_expires_at - self.refresh_margin_seconds:
+            return self._token
+        # Single flight: callers arriving during a renewal share it instead of starting their own.
+        if self._token_refresh is None or self._token_refresh.done():
+            self._token_refresh = asyncio.ensure_future(self._fetch_token())
+            self._token_refresh.add_done_callback(self._log_refresh_failure)
+        # Inside the margin the current token is still valid, so it is used while the renewal runs.
+        if self._token and now < self._token_expires_at:
+            return self._token
+        return await asyncio.shield(self._token_refresh)
+
+    @staticmethod
+    def _log_refresh_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            print(f"[{datetime.datetime.now()}] [Auth0Management_ERROR] Management token renewal failed: {future.exception()}")
+
+    async def invalidate_token(self):
+        self._token = None
+        self._token_expires_at = 0.0
+        if self.token_store is not None:
+            await self.token_store.delete("management_token")
+
+    async def _fetch_token(self) -> str:
+        if self.token_store is not None:
+            shared = await self.token_store.get("management_token")
+            # expires_at is wall-clock time here, since it is compared across processes.
+            if shared and shared.get("expires_at", 0) - time.time() > self.refresh_margin_seconds:
+                self._token = shared["access_token"]
+                self._token_expires_at = time.monotonic() + shared["expires_at"] - time.time()
+                return self._token
+
+        response = await self._send_with_retries("POST", "/oauth/token", data={
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "audience": self.audience,
+        })
+        token_data = response.json()
+        access_token = token_data.get("access_token")
+        if not access_token:
+            raise Auth0ManagementError("Invalid token response from Auth0 Mgmt API.")
+        expires_in = float(token_data.get("expires_in", 86400))
+        self._token = access_token
+        self._token_expires_at = time.monotonic() + expires_in
+        if self.token_store is not None:
+            await self.token_store.set(
+                "management_token", {"access_token": access_token, "expires_at": time.time() + expires_in}, ttl_seconds=expires_in
+            )
+        print(f"[{datetime.datetime.now()}] [Auth0Management] Obtained management token valid for {token_data.get('expires_in', 86400)}s.")
+        return access_token
+
+    # --- Requests ---
+
+    @staticmethod
+    def _retry_after_seconds(response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(retry_after)
+                return max(0.0, (parsed - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        # Auth0 sends the epoch second at which the rate limit bucket refills.
+        reset = response.headers.get("x-ratelimit-reset")
+        if reset:
+            try:
+                return max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+        return min(2 ** attempt, 30)
+
+    async def _send_with_retries(self, method: str, path: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client().request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+            except httpx.HTTPError as e:
+                raise Auth0ManagementError(f"Auth0 Management API request {method} {path} failed: {e}") from e
+            if response.status_code == 429 and attempt < self.max_retries:
+                delay = self._retry_after_seconds(response, attempt)
+                print(f"[{datetime.datetime.now()}] [Auth0Management] Rate limited on {method} {path}, retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            if response.status_code >= 400:
+                raise Auth0ManagementError(
+                    f"Auth0 Management API {method} {path} returned {response.status_code}: {response.text[:200]}",
+                    status_code=response.status_code
+                )
+            return response
+
+    async def request(self, method: str, path: str, **kwargs) -> Any:
+        """Calls a Management API path (e.g. "/api/v2/users/...") and returns the decoded JSON body, or None."""
+        for attempt in range(2):
+            token = await self.get_token()
+            try:
+                response = await self._send_with_retries(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            except Auth0ManagementError as e:
+                # A token revoked or rotated early: renew once and try again.
+                if e.status_code == 401 and attempt == 0:
+                    await self.invalidate_token()
+                    continue
+                raise
+            return response.json() if response.content else None
+
+    # --- Users ---
+
+    async def get_user(self, user_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        params = {"fields": ",".join(fields), "include_fields": "true"} if fields else None
+        return await self.request("GET", f"/api/v2/users/{_quote(user_id)}", params=params)
+
+    async def get_users(self, user_ids: Iterable[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetches many users with one search request per chunk of ids instead of one request per user."""
+        unique_ids = list(dict.fromkeys(user_ids))
+        chunks = [unique_ids[i:i + self.USER_SEARCH_CHUNK_SIZE] for i in range(0, len(unique_ids), self.USER_SEARCH_CHUNK_SIZE)]
+        if fields and "user_id" not in fields:
+            fields = [*fields, "user_id"]
+
+        async def search(chunk: List[str]) -> List[Dict[str, Any]]:
+            query = " OR ".join(f'"{_escape_query(user_id)}"' for user_id in chunk)
+            params = {"q": f"user_id:({query})", "search_engine": "v3", "per_page": len(chunk)}
+            if fields:
+                params.update({"fields": ",".join(fields), "include_fields": "true"})
+            return await self.request("GET", "/api/v2/users", params=params) or []
+
+        results = await self._gather_limited([search(chunk) for chunk in chunks])
+        return {user["user_id"]: user for users in results for user in users}
+
+    async def update_user_metadata(self, user_id: str, app_metadata: Optional[Dict[str, Any]] = None,
+                                   user_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Merges the given keys into the user's metadata (Auth0 merges top-level metadata keys on PATCH)."""
+        body = {}
+        if app_metadata:
+            body["app_metadata"] = app_metadata
+        if user_metadata:
+            body["user_metadata"] = user_metadata
+        if not body:
+            return {}
+        return await self.request("PATCH", f"/api/v2/users/{_quote(user_id)}", json=body)
+
+    async def update_users_metadata(self, updates: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Applies many metadata updates, each a dict with `user_id` and `app_metadata` and/or
+        `user_metadata`. The API has no bulk user update, so updates for the same user are merged
+        into one PATCH and the PATCHes run with bounded concurrency.
+        Returns each user's result, or the exception raised for that user.
+        """
+        merged: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for update in updates:
+            entry = merged.setdefault(update["user_id"], {"app_metadata": {}, "user_metadata": {}})
+            entry["app_metadata"].update(update.get("app_metadata") or {})
+            entry["user_metadata"].update(update.get("user_metadata") or {})
+
+        user_ids = list(merged)
+        results = await self._gather_limited(
+            [self.update_user_metadata(user_id, **merged[user_id]) for user_id in user_ids], return_exceptions=True
+        )
+        return dict(zip(user_ids, results))
+
+    async def _gather_limited(self, coroutines: List, return_exceptions: bool = False) -> List:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*[run(coroutine) for coroutine in coroutines], return_exceptions=return_exceptions)
+
+def _quote(user_id: str) -> str:
+    # Auth0 ids contain "|" (e.g. "google-oauth2|123"), which must be escaped in the path.
+    return quote(user_id, safe="")
+
+def _escape_query(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
@@ -4,11 +4,7 @@ import json
 import traceback
 from typing import Optional, Dict, Any, List, Tuple
 
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
-import base64
-import requests
+from contextvars import ContextVar
 
 from jose import jwt, JWTError
 from jose.exceptions import JOSEError
@@ -18,34 +14,48 @@ from json_extractor import JsonExtractor
 
 from main.config import (
     ENVIRONMENT, SELF_HOST_AUTH_SECRET,
-    AES_SECRET_KEY, AES_IV, AUTH0_SCOPE, AUTH0_NAMESPACE,
+    AUTH0_SCOPE, AUTH0_NAMESPACE,
     AUTH0_DOMAIN, AUTH0_AUDIENCE, ALGORITHMS,
-    AUTH0_MANAGEMENT_CLIENT_ID, AUTH0_MANAGEMENT_CLIENT_SECRET
+    AUTH0_MANAGEMENT_CLIENT_ID, AUTH0_MANAGEMENT_CLIENT_SECRET,
+    AUTH0_MANAGEMENT_TOKEN_REFRESH_MARGIN_SECONDS, AUTH0_MANAGEMENT_MAX_RETRIES,
+    JWKS_REFRESH_INTERVAL_SECONDS, JWKS_MIN_REFETCH_INTERVAL_SECONDS,
+    AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_MAX_SECONDS
 )
-
-# --- JWKS Fetching ---
-jwks = None
+from main.auth.jwks import JWKSManager, VerifiedTokenCache
+from main.auth.management import Auth0ManagementClient, Auth0ManagementError
+from main.shared_state import create_shared_store
+# Re-exported: routes and integrations still import the ciphers from here.
+from main.encryption import aes_encrypt, aes_decrypt  # noqa: F401
+
+# --- JWKS ---
+jwks_manager: Optional[JWKSManager] = None
 if AUTH0_DOMAIN:
-    jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-    try:
-        print(f"[{datetime.datetime.now()}] [AuthUtils] Fetching JWKS from {jwks_url}...")
-        jwks_response = requests.get(jwks_url, timeout=10)
-        jwks_response.raise_for_status()
-        jwks = jwks_response.json()
-        print(f"[{datetime.datetime.now()}] [AuthUtils] JWKS fetched successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"[{datetime.datetime.now()}] [AuthUtils_FATAL_ERROR] Could not fetch JWKS: {e}")
-        jwks = None
-    except Exception as e:
-        print(f"[{datetime.datetime.now()}] [AuthUtils_FATAL_ERROR] Error processing JWKS: {e}")
-        jwks = None
+    jwks_manager = JWKSManager(
+        f"https://{AUTH0_DOMAIN}/.well-known/jwks.json",
+        refresh_interval_seconds=JWKS_REFRESH_INTERVAL_SECONDS,
+        min_refetch_interval_seconds=JWKS_MIN_REFETCH_INTERVAL_SECONDS
+    )
 else:
     print(f"[{datetime.datetime.now()}] [AuthUtils_FATAL_ERROR] AUTH0_DOMAIN not set. Cannot fetch JWKS.")
 
+verified_token_cache = VerifiedTokenCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_MAX_SECONDS)
+
+# The token verified during the current request. Each request runs in its own task and context,
+# so the several auth dependencies of one route verify the token only once.
+_request_verified_token: ContextVar[Optional[Tuple[str, dict]]] = ContextVar("request_verified_token", default=None)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class AuthHelper:
     async def _validate_token_and_get_payload(self, token: str) -> dict:
+        memo = _request_verified_token.get()
+        if memo and memo[0] == token:
+            return dict(memo[1])
+        payload = await self._verify_token(token)
+        _request_verified_token.set((token, payload))
+        return dict(payload)
+
+    async def _verify_token(self, token: str) -> dict:
         if ENVIRONMENT == "selfhost":
             if not SELF_HOST_AUTH_SECRET:
                 print(f"[{datetime.datetime.now()}] [AuthHelper_FATAL_ERROR] selfhost mode is active but SELF_HOST_AUTH_SECRET is not set.")
@@ -59,7 +69,11 @@ class AuthHelper:
                 }
             else:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid self-host token")
-        if not jwks:
+        cached_payload = verified_token_cache.get(token)
+        if cached_payload is not None:
+            return cached_payload
+
+        if not jwks_manager:
             print(f"[{datetime.datetime.now()}] [AuthHelper_VALIDATION_ERROR] JWKS not available.")
             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Auth service config error (JWKS).")
 
@@ -73,19 +87,18 @@ class AuthHelper:
             if not token_kid:
                 raise credentials_exception
 
-            rsa_key_data = {}
-            for key_entry in jwks.get("keys", []):
-                if isinstance(key_entry, dict) and key_entry.get("kid") == token_kid:
-                    rsa_key_data = {comp: key_entry[comp] for comp in ["kty", "kid", "use", "n", "e"] if comp in key_entry}
-                    if all(k in rsa_key_data for k in ["kty", "n", "e"]): break
-            
-            if not rsa_key_data or not all(k in rsa_key_data for k in ["kty", "n", "e"]):
+            rsa_key_data = await jwks_manager.get_key(token_kid)
+            if not rsa_key_data:
+                if not jwks_manager.has_keys:
+                    print(f"[{datetime.datetime.now()}] [AuthHelper_VALIDATION_ERROR] JWKS not available.")
+                    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Auth service config error (JWKS).")
                 raise credentials_exception
 
             payload = jwt.decode(
                 token, rsa_key_data, algorithms=ALGORITHMS,
                 audience=AUTH0_AUDIENCE, issuer=f"https://{AUTH0_DOMAIN}/"
             )
+            verified_token_cache.put(token, payload)
             return payload
         except JWTError as e:
             print(f"[{datetime.datetime.now()}] [AuthHelper_VALIDATION_ERROR] JWT Error: {e}")
@@ -201,55 +214,26 @@ class PermissionChecker:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Missing permissions: {', '.join(missing)}")
         return user_id
 
-# --- AES Encryption/Decryption ---
-def aes_encrypt(data: str) -> str:
-    if not AES_SECRET_KEY or not AES_IV:
-        raise ValueError("AES encryption keys are not configured.")
-    backend = default_backend()
-    cipher = Cipher(algorithms.AES(AES_SECRET_KEY), modes.CBC(AES_IV), backend=backend)
-    encryptor = cipher.encryptor()
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(data.encode()) + padder.finalize()
-    encrypted = encryptor.update(padded_data) + encryptor.finalize()
-    return base64.b64encode(encrypted).decode()
-
-def aes_decrypt(encrypted_data: str) -> str:
-    if not AES_SECRET_KEY or not AES_IV:
-        raise ValueError("AES encryption keys are not configured.")
-    backend = default_backend()
-    cipher = Cipher(algorithms.AES(AES_SECRET_KEY), modes.CBC(AES_IV), backend=backend)
-    decryptor = cipher.decryptor()
-    encrypted_bytes = base64.b64decode(encrypted_data)
-    decrypted = decryptor.update(encrypted_bytes) + decryptor.finalize()
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    unpadded_data = unpadder.update(decrypted) + unpadder.finalize()
-    return unpadded_data.decode()
-
-# --- Auth0 Management API Token ---
-def get_management_token() -> str:
-    if not all([AUTH0_DOMAIN, AUTH0_MANAGEMENT_CLIENT_ID, AUTH0_MANAGEMENT_CLIENT_SECRET]):
+# --- Auth0 Management API ---
+auth0_management_client: Optional[Auth0ManagementClient] = None
+if AUTH0_DOMAIN and AUTH0_MANAGEMENT_CLIENT_ID and AUTH0_MANAGEMENT_CLIENT_SECRET:
+    auth0_management_client = Auth0ManagementClient(
+        AUTH0_DOMAIN, AUTH0_MANAGEMENT_CLIENT_ID, AUTH0_MANAGEMENT_CLIENT_SECRET,
+        refresh_margin_seconds=AUTH0_MANAGEMENT_TOKEN_REFRESH_MARGIN_SECONDS,
+        max_retries=AUTH0_MANAGEMENT_MAX_RETRIES,
+        token_store=create_shared_store("auth0")
+    )
+
+def get_management_client() -> Auth0ManagementClient:
+    if auth0_management_client is None:
         print(f"[{datetime.datetime.now()}] [AuthUtils_MGMT_TOKEN_ERROR] Auth0 Management API credentials not fully configured.")
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Auth0 Management API config error.")
-    
-    url = f"https://{AUTH0_DOMAIN}/oauth/token"
-    payload = {
-        "grant_type": "client_credentials",
-        "client_id": AUTH0_MANAGEMENT_CLIENT_ID,
-        "client_secret": AUTH0_MANAGEMENT_CLIENT_SECRET,
-        "audience": f"https://{AUTH0_DOMAIN}/api/v2/",
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    return auth0_management_client
+
+async def get_management_token() -> str:
+    """Returns a cached Management API token, renewed shortly before it expires."""
     try:
-        response = requests.post(url, data=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        token_data = response.json()
-        access_token = token_data.get("access_token")
-        if not access_token:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Invalid token response from Auth0 Mgmt API.")
-        return access_token
-    except requests.exceptions.RequestException as e:
+        return await get_management_client().get_token()
+    except Auth0ManagementError as e:
         print(f"[{datetime.datetime.now()}] [AuthUtils_MGMT_TOKEN_ERROR] Failed to get management token: {e}")
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Failed to get management token: {e}")
-    except Exception as e:
-        print(f"[{datetime.datetime.now()}] [AuthUtils_MGMT_TOKEN_ERROR] Error processing management token response: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error processing management token response.")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Failed to get management token: {e}")
\ No newline at end of file
@@ -12,6 +12,7 @@ from main.chat.utils import generate_chat_llm_stream, parse_assistant_response
 from main.auth.utils import PermissionChecker, AuthHelper
 from main.dependencies import mongo_manager, auth_helper
 from main.plans import PLAN_LIMITS
+from main.usage import usage_meter
 
 router = APIRouter(
     prefix="/chat",
@@ -29,29 +30,32 @@ async def chat_endpoint(
     if not any(msg.get("role") == "user" for msg in request_body.messages):
         raise HTTPException(status_code=400, detail="No user message found in the request.")
 
-    # --- Check Usage Limit ---
-    usage = await mongo_manager.get_or_create_daily_usage(user_id)
+    # New user messages are those since the last assistant message
+    new_user_messages = []
+    for msg in reversed(request_body.messages):
+        if msg.get("role") == "assistant":
+            break
+        if msg.get("role") == "user":
+            new_user_messages.append(msg)
+
+    # --- Check and Count Usage ---
     limit = PLAN_LIMITS[plan].get("text_messages_daily", 0)
-    current_count = usage.get("text_messages", 0)
+    allowed, _ = await usage_meter.check_and_increment(user_id, "text_messages", limit, amount=len(new_user_messages))
 
-    if current_count >= limit:
+    if not allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"You have reached your daily message limit of {limit}. Please upgrade or try again tomorrow."
         )
 
-    # 2. Save all new user messages since the last assistant message
-    for msg in reversed(request_body.messages):
-        if msg.get("role") == "assistant":
-            break
-        if msg.get("role") == "user":
-            await mongo_manager.add_message(
-                user_id=user_id,
-                role="user",
-                content=msg.get("content", ""),
-                message_id=msg.get("id")
-            )
-            await mongo_manager.increment_daily_usage(user_id, "text_messages")
+    # 2. Save all new user messages
+    for msg in new_user_messages:
+        await mongo_manager.add_message(
+            user_id=user_id,
+            role="user",
+            content=msg.get("content", ""),
+            message_id=msg.get("id")
+        )
 
     # 3. Fetch clean history from DB
     db_history = await mongo_manager.get_message_history(user_id, limit=30)
@@ -21,6 +21,46 @@ elif ENVIRONMENT == 'selfhost':
 
 # --- Server ---
 APP_SERVER_PORT = int(os.getenv("APP_SERVER_PORT", 5000))
+# uvicorn's own variable, so `uvicorn main.app:app` and `python -m main.app` run the same number of workers.
+APP_SERVER_WORKERS = int(os.getenv("WEB_CONCURRENCY", 1))
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL"))
+# "memory" keeps cross-request state (RTC tokens, the Auth0 management token) in this process;
+# "redis" shares it between server processes. Required when running more than one worker.
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")
+# How often the "memory" backend drops expired entries in the background.
+SHARED_STATE_SWEEP_INTERVAL_SECONDS = int(os.getenv("SHARED_STATE_SWEEP_INTERVAL_SECONDS", 60))
+
+# --- WebSockets ---
+# "memory" delivers only to sockets held by this process; "redis" fans messages out to every
+# server process over a pub/sub channel, so the server can run with several workers.
+WEBSOCKET_BACKPLANE = os.getenv("WEBSOCKET_BACKPLANE", "memory")
+WEBSOCKET_BACKPLANE_CHANNEL = os.getenv("WEBSOCKET_BACKPLANE_CHANNEL", "sentient:websocket")
+WEBSOCKET_SEND_TIMEOUT_SECONDS = float(os.getenv("WEBSOCKET_SEND_TIMEOUT_SECONDS", 5))
+# Tabs and devices a user may have connected at once; the oldest is closed beyond this.
+WEBSOCKET_MAX_CONNECTIONS_PER_USER = int(os.getenv("WEBSOCKET_MAX_CONNECTIONS_PER_USER", 5))
+
+# --- Worker Events ---
+# Events published by workers on a Redis stream, read here through a consumer group so each is
+# handled by one server process and a restarted process resumes where the group left off.
+WORKER_EVENTS_ENABLED = os.getenv("WORKER_EVENTS_ENABLED", "true").lower() == "true"
+WORKER_EVENT_STREAM = os.getenv("WORKER_EVENT_STREAM", "sentient:worker_events")
+WORKER_EVENT_CONSUMER_GROUP = os.getenv("WORKER_EVENT_CONSUMER_GROUP", "main-server")
+# Events left unacknowledged this long (a crashed consumer, or a failed attempt) are retried.
+WORKER_EVENT_CLAIM_IDLE_SECONDS = int(os.getenv("WORKER_EVENT_CLAIM_IDLE_SECONDS", 60))
+WORKER_EVENT_MAX_ATTEMPTS = int(os.getenv("WORKER_EVENT_MAX_ATTEMPTS", 5))
+
+# --- Usage Metering ---
+# "redis" shares daily quota counters between all server processes; "local" keeps them in this
+# process only, which is enough for a single-process self-host. Both are flushed to Mongo.
+USAGE_METER_BACKEND = os.getenv("USAGE_METER_BACKEND", "redis")
+USAGE_FLUSH_INTERVAL_SECONDS = int(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", 30))
+
+# --- Notifications ---
+# Each notification is its own document, removed by a TTL index once it is this old.
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 30))
+NOTIFICATION_PAGE_SIZE = int(os.getenv("NOTIFICATION_PAGE_SIZE", 50))
+# The unread counter is recounted this often, since TTL deletions do not decrement it.
+NOTIFICATION_COUNTER_RECONCILE_SECONDS = int(os.getenv("NOTIFICATION_COUNTER_RECONCILE_SECONDS", 60 * 60))
 
 # --- Auth ---
 AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN")
@@ -31,6 +71,15 @@ AUTH0_NAMESPACE = os.getenv("AUTH0_NAMESPACE")
 SELF_HOST_AUTH_SECRET = os.getenv("SELF_HOST_AUTH_SECRET")
 AUTH0_MANAGEMENT_CLIENT_ID = os.getenv("AUTH0_MANAGEMENT_CLIENT_ID")
 AUTH0_MANAGEMENT_CLIENT_SECRET = os.getenv("AUTH0_MANAGEMENT_CLIENT_SECRET")
+# Management API tokens are renewed this long before they expire; rate-limited calls are retried this many times.
+AUTH0_MANAGEMENT_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("AUTH0_MANAGEMENT_TOKEN_REFRESH_MARGIN_SECONDS", 5 * 60))
+AUTH0_MANAGEMENT_MAX_RETRIES = int(os.getenv("AUTH0_MANAGEMENT_MAX_RETRIES", 3))
+# Signing keys are re-fetched this often, and at most this often when a token names an unknown key.
+JWKS_REFRESH_INTERVAL_SECONDS = int(os.getenv("JWKS_REFRESH_INTERVAL_SECONDS", 6 * 60 * 60))
+JWKS_MIN_REFETCH_INTERVAL_SECONDS = int(os.getenv("JWKS_MIN_REFETCH_INTERVAL_SECONDS", 60))
+# Verified tokens are remembered until they expire, but no longer than this.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000))
+AUTH_TOKEN_CACHE_MAX_SECONDS = int(os.getenv("AUTH_TOKEN_CACHE_MAX_SECONDS", 10 * 60))
 
 # --- Database ---
 MONGO_URI = os.getenv("MONGO_URI")
@@ -56,6 +105,16 @@ COMPOSIO_API_KEY = os.getenv("COMPOSIO_API_KEY")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "models/gemini-embedding-001")
 
 # --- Voice ---
+# Text-only deployments can turn voice off entirely; its routes and libraries are then not loaded.
+VOICE_ENABLED = os.getenv("VOICE_ENABLED", "true").lower() == "true"
+# "background" loads the STT/TTS models after the server starts serving, "lazy" on the first
+# voice turn, and "eager" before the server serves.
+VOICE_MODEL_LOADING = os.getenv("VOICE_MODEL_LOADING", "background")
+# When set, STT/TTS run in the voice inference process at this URL instead of in every server worker.
+VOICE_INFERENCE_URL = os.getenv("VOICE_INFERENCE_URL")
+VOICE_INFERENCE_PORT = int(os.getenv("VOICE_INFERENCE_PORT", 5010))
+# Lifetime of the single-use token a client gets from /voice/initiate to open its voice stream.
+RTC_TOKEN_TTL_SECONDS = int(os.getenv("RTC_TOKEN_TTL_SECONDS", 600))
 STT_PROVIDER = os.getenv("STT_PROVIDER", "FASTER_WHISPER")
 TTS_PROVIDER = os.getenv("TTS_PROVIDER", "ORPHEUS")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
@@ -67,6 +126,14 @@ ORPHEUS_MODEL_PATH = os.getenv("ORPHEUS_MODEL_PATH")
 ORPHEUS_N_GPU_LAYERS = int(os.getenv("ORPHEUS_N_GPU_LAYERS", 0))
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+# --- Proactivity ---
+# Negative feedback on a suggestion type pauses suggestions of that type for this long.
+PROACTIVE_NEGATIVE_FEEDBACK_COOLDOWN_SECONDS = int(os.getenv("PROACTIVE_NEGATIVE_FEEDBACK_COOLDOWN_SECONDS", 2 * 24 * 60 * 60))
+
+# --- Vector DB ---
+# Connects to Chroma in the background at startup instead of on the first request that needs it.
+CHROMA_WARMUP_ON_STARTUP = os.getenv("CHROMA_WARMUP_ON_STARTUP", "false").lower() == "true"
+
 # --- File Management ---
 FILE_MANAGEMENT_TEMP_DIR = os.getenv("FILE_MANAGEMENT_TEMP_DIR", "/tmp/sentient_files")
 
@@ -5,68 +5,117 @@ import uuid
 import json
 import logging
 import motor.motor_asyncio
-from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
 from bson import ObjectId
 from pymongo.errors import DuplicateKeyError
 from typing import Dict, List, Optional, Any, Tuple
 
 # Import config from the current 'main' directory
-from main.config import MONGO_URI, MONGO_DB_NAME, ENVIRONMENT
-from main.auth.utils import aes_encrypt, aes_decrypt
+from main.config import (MONGO_URI, MONGO_DB_NAME, ENVIRONMENT, NOTIFICATION_COUNTER_RECONCILE_SECONDS, NOTIFICATION_PAGE_SIZE,
+                         NOTIFICATION_RETENTION_DAYS)
+from main.encryption import decrypt_document_lazily, decrypt_documents, decrypt_fields, decrypt_value, encrypt_fields, encrypt_value
 
 DB_ENCRYPTION_ENABLED = ENVIRONMENT == 'stag'
 
-def _datetime_serializer(obj):
-    """JSON serializer for objects not serializable by default json code, like datetime."""
-    if isinstance(obj, datetime.datetime):
-        return obj.isoformat()
-    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
-
 def _encrypt_field(data: Any) -> Any:
-    if not DB_ENCRYPTION_ENABLED or data is None:
+    if not DB_ENCRYPTION_ENABLED:
         return data
-    data_str = json.dumps(data, default=_datetime_serializer)
-    return aes_encrypt(data_str)
+    return encrypt_value(data)
 
 def _decrypt_field(data: Any) -> Any:
-    if not DB_ENCRYPTION_ENABLED or data is None or not isinstance(data, str):
-        return data
-    try:
-        decrypted_str = aes_decrypt(data)
-        return json.loads(decrypted_str)
-    except Exception:
+    if not DB_ENCRYPTION_ENABLED:
         return data
+    return decrypt_value(data)
 
 def _encrypt_doc(doc: Dict, fields: List[str]):
-    if not DB_ENCRYPTION_ENABLED or not doc:
-        return
-    for field in fields:
-        if field in doc and doc[field] is not None:
-            doc[field] = _encrypt_field(doc[field])
+    if DB_ENCRYPTION_ENABLED:
+        encrypt_fields(doc, fields)
 
 def _decrypt_doc(doc: Optional[Dict], fields: List[str]):
-    if not DB_ENCRYPTION_ENABLED or not doc:
-        return
-    for field in fields:
-        if field in doc and doc[field] is not None:
-            doc[field] = _decrypt_field(doc[field])
+    if DB_ENCRYPTION_ENABLED:
+        decrypt_fields(doc, fields)
 
 def _decrypt_docs(docs: List[Dict], fields: List[str]):
-    if not DB_ENCRYPTION_ENABLED or not docs:
-        return
-    for doc in docs:
-        _decrypt_doc(doc, fields)
+    if DB_ENCRYPTION_ENABLED and docs:
+        decrypt_documents(docs, fields)
+
+def _decrypt_doc_lazily(doc: Optional[Dict], fields: List[str]) -> Optional[Dict]:
+    """Like `_decrypt_doc`, but each field is only decrypted when it is first read."""
+    if not DB_ENCRYPTION_ENABLED:
+        return doc
+    return decrypt_document_lazily(doc, fields)
 
 USER_PROFILES_COLLECTION = "user_profiles" 
 NOTIFICATIONS_COLLECTION = "notifications" 
+NOTIFICATION_COUNTERS_COLLECTION = "notification_counters"
 POLLING_STATE_COLLECTION = "polling_state_store" 
 DAILY_USAGE_COLLECTION = "daily_usage"
 PROCESSED_ITEMS_COLLECTION = "processed_items_log" 
 TASK_COLLECTION = "tasks"
 MESSAGES_COLLECTION = "messages"
+SWARM_ITEM_RESULTS_COLLECTION = "swarm_item_results"
+SWARM_RUN_PROGRESS_COLLECTION = "swarm_run_progress"
+PLAN_CACHE_COLLECTION = "plan_cache"
+POLLER_REPLICAS_COLLECTION = "poller_replicas"
+PROACTIVE_METRICS_COLLECTION = "proactive_pipeline_metrics"
+SUGGESTION_TEMPLATES_COLLECTION = "proactive_suggestion_templates"
+SUGGESTION_LOG_COLLECTION = "proactive_suggestion_log"
 
 logger = logging.getLogger(__name__)
 
+SENSITIVE_NOTIFICATION_FIELDS = ["message", "suggestion_payload"]
+
+def _as_utc(value: Any) -> Optional[datetime.datetime]:
+    """Reads a stored timestamp (a naive UTC datetime from Mongo, or a legacy ISO string) as an aware UTC datetime."""
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    return value.replace(tzinfo=datetime.timezone.utc) if value.tzinfo is None else value.astimezone(datetime.timezone.utc)
+
+def _notification_cursor(notification: Dict) -> str:
+    timestamp = _as_utc(notification["timestamp"])
+    return f"{int(timestamp.timestamp() * 1000)}_{notification['id']}"
+
+def _parse_notification_cursor(cursor: str) -> Tuple[datetime.datetime, str]:
+    """Raises ValueError for a malformed cursor."""
+    millis, _, notification_id = cursor.partition("_")
+    if not notification_id:
+        raise ValueError(f"Invalid notification cursor: {cursor}")
+    return datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(milliseconds=int(millis)), notification_id
+
+def _serialize_notification(notification: Dict) -> Dict:
+    # Timestamps go out as ISO strings with an explicit UTC offset, as they were stored before.
+    timestamp = _as_utc(notification.get("timestamp"))
+    if timestamp:
+        notification["timestamp"] = timestamp.isoformat()
+    return notification
+
+# Task fields whose change can start or stop a user's triggered workflows.
+TRIGGER_RELEVANT_TASK_FIELDS = ("status", "schedule", "enabled")
+
+async def refresh_trigger_flags(db, user_id: str):
+    """
+    Recomputes `has_active_triggers` on a user's polling states from their tasks, so the pollers
+    can find due users without joining the tasks collection. The flag is derived from the tasks
+    on every change rather than incremented, so it converges whatever order concurrent writers finish in.
+    """
+    if not user_id:
+        return
+    try:
+        sources = await db[TASK_COLLECTION].distinct(
+            "schedule.source", {"user_id": user_id, "status": "active", "schedule.type": "triggered"}
+        )
+        await db[POLLING_STATE_COLLECTION].update_many(
+            {"user_id": user_id},
+            [{"$set": {"has_active_triggers": {"$in": ["$service_name", sources]}}}]
+        )
+    except Exception as e:
+        logger.error(f"Failed to refresh trigger flags for user {user_id}: {e}", exc_info=True)
+
 class MongoManager:
     def __init__(self):
         self.client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
@@ -74,11 +123,19 @@ class MongoManager:
         
         self.user_profiles_collection = self.db[USER_PROFILES_COLLECTION]
         self.notifications_collection = self.db[NOTIFICATIONS_COLLECTION]
+        self.notification_counters_collection = self.db[NOTIFICATION_COUNTERS_COLLECTION]
         self.polling_state_collection = self.db[POLLING_STATE_COLLECTION]
         self.daily_usage_collection = self.db[DAILY_USAGE_COLLECTION]
         self.processed_items_collection = self.db[PROCESSED_ITEMS_COLLECTION]
         self.task_collection = self.db[TASK_COLLECTION]
         self.messages_collection = self.db[MESSAGES_COLLECTION]
+        self.swarm_item_results_collection = self.db[SWARM_ITEM_RESULTS_COLLECTION]
+        self.swarm_run_progress_collection = self.db[SWARM_RUN_PROGRESS_COLLECTION]
+        self.plan_cache_collection = self.db[PLAN_CACHE_COLLECTION]
+        self.poller_replicas_collection = self.db[POLLER_REPLICAS_COLLECTION]
+        self.proactive_metrics_collection = self.db[PROACTIVE_METRICS_COLLECTION]
+        self.suggestion_templates_collection = self.db[SUGGESTION_TEMPLATES_COLLECTION]
+        self.suggestion_log_collection = self.db[SUGGESTION_LOG_COLLECTION]
         
         print(f"[{datetime.datetime.now()}] [MainServer_MongoManager] Initialized. Database: {MONGO_DB_NAME}")
 
@@ -95,7 +152,16 @@ class MongoManager:
             ],
             self.notifications_collection: [
                 IndexModel([("user_id", ASCENDING)], name="notification_user_id_idx"),
-                IndexModel([("user_id", ASCENDING), ("notifications.timestamp", DESCENDING)], name="notification_timestamp_idx", sparse=True)
+                # Newest first, with the id as tie-breaker, so each page is one range scan from the cursor
+                IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="notification_user_feed_idx"),
+                IndexModel([("user_id", ASCENDING), ("read", ASCENDING)], name="notification_user_read_idx"),
+                IndexModel([("id", ASCENDING)], unique=True, sparse=True, name="notification_id_unique_idx"),
+                IndexModel([("timestamp", ASCENDING)], name="notification_expiry_idx", expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 24 * 60 * 60),
+                # Only the legacy one-document-per-user arrays have `created_at`; finds those still waiting to be split up
+                IndexModel([("created_at", ASCENDING)], name="notification_legacy_doc_idx", sparse=True)
+            ],
+            self.notification_counters_collection: [
+                IndexModel([("user_id", ASCENDING)], unique=True, name="notification_counter_user_unique_idx")
             ],
             self.polling_state_collection: [
                 IndexModel([("user_id", ASCENDING), ("service_name", ASCENDING), ("poll_type", ASCENDING)], unique=True, name="polling_user_service_type_unique_idx"),
@@ -103,7 +169,13 @@ class MongoManager:
                     ("is_enabled", ASCENDING), ("next_scheduled_poll_time", ASCENDING),
                     ("is_currently_polling", ASCENDING), ("error_backoff_until_timestamp", ASCENDING)
                 ], name="polling_due_tasks_idx"),
-                IndexModel([("is_currently_polling", ASCENDING), ("last_attempted_poll_timestamp", ASCENDING)], name="polling_stale_locks_idx")
+                # Equality fields first, so the pollers' due-poll query is one range scan on next_scheduled_poll_time
+                IndexModel([
+                    ("service_name", ASCENDING), ("poll_type", ASCENDING), ("has_active_triggers", ASCENDING),
+                    ("is_currently_polling", ASCENDING), ("next_scheduled_poll_time", ASCENDING)
+                ], name="polling_due_triggers_idx"),
+                IndexModel([("is_currently_polling", ASCENDING), ("last_attempted_poll_timestamp", ASCENDING)], name="polling_stale_locks_idx"),
+                IndexModel([("service_name", ASCENDING), ("poll_type", ASCENDING), ("is_currently_polling", ASCENDING), ("lease_expires_at", ASCENDING)], name="polling_expired_leases_idx")
             ],
             self.daily_usage_collection: [
                 IndexModel([("user_id", ASCENDING), ("date", DESCENDING)], unique=True, name="usage_user_date_unique_idx"),
@@ -124,9 +196,46 @@ class MongoManager:
                 IndexModel([("message_id", ASCENDING)], unique=True, name="message_id_unique_idx"),
                 IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="message_user_timestamp_idx"),
                 IndexModel([("content", "text")], name="message_content_text_idx"),
+                IndexModel([("is_summarized", ASCENDING), ("user_id", ASCENDING), ("timestamp", ASCENDING)], name="message_summarization_backlog_idx"),
+            ],
+            self.swarm_item_results_collection: [
+                IndexModel([("task_id", ASCENDING), ("run_id", ASCENDING), ("group_id", ASCENDING), ("item_index", ASCENDING)], unique=True, name="swarm_result_group_item_unique_idx"),
+                IndexModel([("completed_at", ASCENDING)], name="swarm_result_expiry_idx", expireAfterSeconds=7 * 24 * 60 * 60)
+            ],
+            self.swarm_run_progress_collection: [
+                IndexModel([("task_id", ASCENDING), ("run_id", ASCENDING)], unique=True, name="swarm_run_unique_idx"),
+                IndexModel([("aggregated_at", ASCENDING), ("deadline_at", ASCENDING)], name="swarm_run_deadline_idx"),
+                IndexModel([("created_at", ASCENDING)], name="swarm_run_expiry_idx", expireAfterSeconds=7 * 24 * 60 * 60)
+            ],
+            self.poller_replicas_collection: [
+                IndexModel([("service_name", ASCENDING), ("expires_at", ASCENDING)], name="poller_replica_service_idx"),
+                IndexModel([("expires_at", ASCENDING)], name="poller_replica_expiry_idx", expireAfterSeconds=0)
+            ],
+            self.proactive_metrics_collection: [
+                IndexModel([("verdict", ASCENDING), ("created_at", DESCENDING)], name="proactive_metrics_verdict_idx"),
+                IndexModel([("created_at", ASCENDING)], name="proactive_metrics_expiry_idx", expireAfterSeconds=30 * 24 * 60 * 60)
+            ],
+            self.suggestion_templates_collection: [
+                IndexModel([("type_name", ASCENDING)], name="suggestion_template_type_idx", unique=True)
+            ],
+            self.suggestion_log_collection: [
+                IndexModel([("user_id", ASCENDING), ("suggestion_type", ASCENDING), ("created_at", DESCENDING)], name="suggestion_log_type_idx"),
+                IndexModel([("user_id", ASCENDING), ("dedupe_key", ASCENDING), ("created_at", DESCENDING)], name="suggestion_log_dedupe_idx"),
+                IndexModel([("created_at", ASCENDING)], name="suggestion_log_expiry_idx", expireAfterSeconds=7 * 24 * 60 * 60)
+            ],
+            self.plan_cache_collection: [
+                IndexModel([("user_id", ASCENDING)], name="plan_cache_user_idx"),
+                IndexModel([("created_at", ASCENDING)], name="plan_cache_expiry_idx", expireAfterSeconds=14 * 24 * 60 * 60)
             ],
         }
 
+        try:
+            # Superseded by swarm_result_group_item_unique_idx; it allowed one result per item across all groups.
+            if "swarm_result_item_unique_idx" in await self.swarm_item_results_collection.index_information():
+                await self.swarm_item_results_collection.drop_index("swarm_result_item_unique_idx")
+        except Exception as e:
+            print(f"[{datetime.datetime.now()}] [MainServer_DB_ERROR] Dropping legacy swarm result index: {e}")
+
         for collection, indexes in collections_with_indexes.items():
             try:
                 await collection.create_indexes(indexes)
@@ -134,6 +243,16 @@ class MongoManager:
             except Exception as e:
                 print(f"[{datetime.datetime.now()}] [MainServer_DB_ERROR] Index creation for {collection.name}: {e}")
 
+        try:
+            await self.migrate_legacy_notifications()
+        except Exception as e:
+            print(f"[{datetime.datetime.now()}] [MainServer_DB_ERROR] Notification migration: {e}")
+
+        try:
+            await self.backfill_trigger_flags()
+        except Exception as e:
+            print(f"[{datetime.datetime.now()}] [MainServer_DB_ERROR] Trigger flag backfill: {e}")
+
 
     # --- User Profile Methods ---
     async def get_user_profile(self, user_id: str) -> Optional[Dict]:
@@ -209,6 +328,26 @@ class MongoManager:
         )
         return result.matched_count > 0 or result.upserted_id is not None
 
+    async def update_proactive_preference_score(self, user_id: str, suggestion_type: str, increment: int) -> bool:
+        """Adjusts the user's feedback score for a proactive suggestion type."""
+        if not user_id or not suggestion_type or "." in suggestion_type or suggestion_type.startswith("$"):
+            return False
+        result = await self.user_profiles_collection.update_one(
+            {"user_id": user_id},
+            {"$inc": {f"userData.proactive_preferences.{suggestion_type}": increment}}
+        )
+        return result.matched_count > 0
+
+    async def set_proactive_type_cooldown(self, user_id: str, suggestion_type: str, until: datetime.datetime) -> bool:
+        """Stops proactive suggestions of this type for the user until the given time."""
+        if not user_id or not suggestion_type or "." in suggestion_type or suggestion_type.startswith("$"):
+            return False
+        result = await self.user_profiles_collection.update_one(
+            {"user_id": user_id},
+            {"$set": {f"userData.proactive_cooldowns.{suggestion_type}": until}}
+        )
+        return result.matched_count > 0
+
     # --- Usage Tracking Methods ---
     async def get_or_create_daily_usage(self, user_id: str) -> Dict[str, Any]:
         today_str = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
@@ -228,74 +367,100 @@ class MongoManager:
             upsert=True
         )
 
-    # --- Notification Methods ---
-    async def get_notifications(self, user_id: str) -> List[Dict]:
-        if not user_id: return []
-        user_doc = await self.notifications_collection.find_one( # noqa: E501
-            {"user_id": user_id}, {"notifications": 1}
-        )
-        notifications_list = user_doc.get("notifications", []) if user_doc else []
+    async def get_daily_usage(self, user_id: str, date_str: str) -> Optional[Dict[str, Any]]:
+        return await self.daily_usage_collection.find_one({"user_id": user_id, "date": date_str}, {"_id": 0})
 
-        if DB_ENCRYPTION_ENABLED:
-            SENSITIVE_NOTIFICATION_FIELDS = ["message", "suggestion_payload"]
-            for notification in notifications_list:
-                for field in SENSITIVE_NOTIFICATION_FIELDS:
-                    if field in notification and notification[field] is not None:
-                        notification[field] = _decrypt_field(notification[field])
-
-        # Serialize datetime objects before returning, as they are not JSON-serializable by default.
-        for notification in notifications_list:
-            if isinstance(notification.get("timestamp"), datetime.datetime):
-                notification["timestamp"] = notification["timestamp"].isoformat()
-        return notifications_list
+    async def merge_daily_usage(self, user_id: str, date_str: str, counts: Dict[str, int], version: int):
+        """
+        Writes a snapshot of the usage meter's counters. It only replaces the stored snapshot if its
+        version is newer, so a repeated or out-of-order flush is a no-op, while a refund that lowered
+        a counter still reaches Mongo.
+        """
+        if not counts:
+            return
+        try:
+            await self.daily_usage_collection.update_one(
+                {"user_id": user_id, "date": date_str, "$or": [{"_version": {"$lt": version}}, {"_version": {"$exists": False}}]},
+                {"$set": {**counts, "_version": version}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The document exists with a newer snapshot, so the filter missed and the upsert collided.
+            pass
+
+    # --- Notification Methods ---
+    # One document per notification. Reads page through (user_id, timestamp, id) with an opaque
+    # cursor, retention is a TTL index, and a per-user counter document tracks the unread count.
+    async def get_notifications(self, user_id: str, limit: int = NOTIFICATION_PAGE_SIZE, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Returns a page of notifications, newest first, and the cursor for the next page (None on the last one)."""
+        if not user_id: return [], None
+        query: Dict[str, Any] = {"user_id": user_id}
+        if cursor:
+            timestamp, notification_id = _parse_notification_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "id": {"$lt": notification_id}}
+            ]
+        # One extra document tells us whether there is a next page without a count query.
+        docs = await self.notifications_collection.find(query, {"_id": 0, "user_id": 0}) \
+            .sort([("timestamp", DESCENDING), ("id", DESCENDING)]).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = _notification_cursor(docs[limit - 1]) if len(docs) > limit else None
+        notifications = docs[:limit]
+        _decrypt_docs(notifications, SENSITIVE_NOTIFICATION_FIELDS)
+        return [_serialize_notification(doc) for doc in notifications], next_cursor
 
     async def add_notification(self, user_id: str, notification_data: Dict) -> Optional[Dict]:
         if not user_id or not notification_data: return None
-        # Store timestamp as an ISO 8601 string to ensure timezone correctness
-        # across all database and application layers.
-        notification_data["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        notification_data["id"] = str(uuid.uuid4())
-
-        if DB_ENCRYPTION_ENABLED:
-            SENSITIVE_NOTIFICATION_FIELDS = ["message", "suggestion_payload"]
-            for field in SENSITIVE_NOTIFICATION_FIELDS:
-                if field in notification_data and notification_data[field] is not None:
-                    notification_data[field] = _encrypt_field(notification_data[field])
-
-        result = await self.notifications_collection.update_one(
-            {"user_id": user_id},
-            {"$push": {
-                "notifications": {
-                    "$each": [notification_data],
-                    "$position": 0, # Add to the beginning of the array
-                    "$slice": -50
-                }
-            },
-             "$setOnInsert": {"user_id": user_id, "created_at": datetime.datetime.now(datetime.timezone.utc)}},
-            upsert=True
-        )
-        if result.matched_count > 0 or result.upserted_id is not None:
-            return notification_data
-        return None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # Mongo keeps milliseconds, so truncate here to keep the returned timestamp and cursors exact.
+        notification = {
+            **notification_data,
+            "id": str(uuid.uuid4()),
+            "timestamp": now.replace(microsecond=now.microsecond // 1000 * 1000),
+            "read": bool(notification_data.get("read", False)),
+        }
+        doc = {**notification, "user_id": user_id}
+        _encrypt_doc(doc, SENSITIVE_NOTIFICATION_FIELDS)
+        await self.notifications_collection.insert_one(doc)
+        if not notification["read"]:
+            await self._increment_unread_notifications(user_id, 1)
+        return notification
+
+    async def get_unread_notification_count(self, user_id: str) -> int:
+        if not user_id: return 0
+        counter = await self.notification_counters_collection.find_one({"user_id": user_id})
+        reconciled_at = _as_utc(counter.get("reconciled_at")) if counter else None
+        if not reconciled_at or (datetime.datetime.now(datetime.timezone.utc) - reconciled_at).total_seconds() > NOTIFICATION_COUNTER_RECONCILE_SECONDS:
+            return await self._recount_unread_notifications(user_id)
+        return max(0, counter.get("unread", 0))
+
+    async def mark_notifications_read(self, user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+        """Marks the given notifications, or all of them when no ids are given, as read. Returns how many changed."""
+        if not user_id: return 0
+        query: Dict[str, Any] = {"user_id": user_id, "read": False}
+        if notification_ids is not None:
+            if not notification_ids: return 0
+            query["id"] = {"$in": notification_ids}
+        result = await self.notifications_collection.update_many(query, {"$set": {"read": True}})
+        await self._increment_unread_notifications(user_id, -result.modified_count)
+        return result.modified_count
 
     async def delete_notification(self, user_id: str, notification_id: str) -> bool:
         if not user_id or not notification_id: return False
-        result = await self.notifications_collection.update_one(
-            {"user_id": user_id},
-            {"$pull": {"notifications": {"id": notification_id}}}
+        deleted = await self.notifications_collection.find_one_and_delete(
+            {"user_id": user_id, "id": notification_id}, projection={"read": 1}
         )
-        return result.modified_count > 0
+        if deleted and not deleted.get("read"):
+            await self._increment_unread_notifications(user_id, -1)
+        return deleted is not None
 
     async def delete_all_notifications(self, user_id: str):
-        """Deletes all notifications for a user by emptying the notifications array."""
+        """Deletes all notifications for a user."""
         if not user_id:
             return
-        # This operation is idempotent. If the user has no notification document,
-        # it does nothing, which is the desired outcome.
-        await self.notifications_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"notifications": []}}
-        )
+        await self.notifications_collection.delete_many({"user_id": user_id})
+        # Recount rather than zero the counter, so a notification added meanwhile is still counted.
+        await self._recount_unread_notifications(user_id)
 
     async def find_and_action_suggestion_notification(self, user_id: str, notification_id: str) -> Optional[Dict]:
         """
@@ -305,20 +470,55 @@ class MongoManager:
         if not user_id or not notification_id:
             return None
 
-        # Find the document containing the notification
-        user_notif_doc = await self.notifications_collection.find_one(
-            {"user_id": user_id, "notifications.id": notification_id}
+        notification = await self.notifications_collection.find_one_and_update(
+            {"user_id": user_id, "id": notification_id, "is_actioned": False},
+            {"$set": {"is_actioned": True}},
+            projection={"_id": 0, "user_id": 0}
         )
-        if not user_notif_doc:
+        if not notification:
             return None
+        _decrypt_doc(notification, SENSITIVE_NOTIFICATION_FIELDS)
+        return _serialize_notification(notification)
 
-        # Atomically update the specific notification inside the array
-        result = await self.notifications_collection.find_one_and_update(
-            {"user_id": user_id, "notifications.id": notification_id, "notifications.is_actioned": False},
-            {"$set": {"notifications.$.is_actioned": True}},
+    async def _increment_unread_notifications(self, user_id: str, amount: int):
+        if not amount:
+            return
+        await self.notification_counters_collection.update_one(
+            {"user_id": user_id}, {"$inc": {"unread": amount}}, upsert=True
         )
 
-        return user_notif_doc if result else None
+    async def _recount_unread_notifications(self, user_id: str) -> int:
+        unread = await self.notifications_collection.count_documents({"user_id": user_id, "read": False})
+        await self.notification_counters_collection.update_one(
+            {"user_id": user_id},
+            {"$set": {"unread": unread, "reconciled_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True
+        )
+        return unread
+
+    async def migrate_legacy_notifications(self):
+        """Splits the old one-document-per-user notification arrays into one document per notification."""
+        migrated_users = 0
+        async for legacy_doc in self.notifications_collection.find({"created_at": {"$exists": True}, "id": {"$exists": False}}):
+            user_id = legacy_doc.get("user_id")
+            operations = []
+            for notification in legacy_doc.get("notifications", []):
+                if not notification.get("id"):
+                    continue
+                # Fields stay as stored, so encrypted values are carried over without re-encryption.
+                doc = {**notification, "user_id": user_id, "read": bool(notification.get("read", False))}
+                doc["timestamp"] = _as_utc(notification.get("timestamp")) or legacy_doc.get("created_at") or datetime.datetime.now(datetime.timezone.utc)
+                operations.append(UpdateOne({"id": doc["id"]}, {"$setOnInsert": doc}, upsert=True))
+            if operations:
+                await self.notifications_collection.bulk_write(operations, ordered=False)
+            await self.notifications_collection.delete_one({"_id": legacy_doc["_id"]})
+            await self._recount_unread_notifications(user_id)
+            migrated_users += 1
+        # Superseded by notification_user_feed_idx.
+        if "notification_timestamp_idx" in await self.notifications_collection.index_information():
+            await self.notifications_collection.drop_index("notification_timestamp_idx")
+        if migrated_users:
+            print(f"[{datetime.datetime.now()}] [MainServer_DB_INIT] Migrated notifications of {migrated_users} users to per-notification documents.")
 
     # --- Polling State Store Methods ---
     async def get_polling_state(self, user_id: str, service_name: str) -> Optional[Dict[str, Any]]:
@@ -347,8 +547,18 @@ class MongoManager:
             {"$set": state_data, "$setOnInsert": {"created_at": now_utc, "user_id": user_id, "service_name": service_name, "poll_type": poll_type}},
             upsert=True
         )
+        if result.upserted_id is not None:
+            await self.refresh_trigger_flags(user_id)
         return result.matched_count > 0 or result.upserted_id is not None
 
+    async def backfill_trigger_flags(self):
+        """Computes `has_active_triggers` for polling states created before the flag existed."""
+        user_ids = await self.polling_state_collection.distinct("user_id", {"has_active_triggers": {"$exists": False}})
+        for user_id in user_ids:
+            await self.refresh_trigger_flags(user_id)
+        if user_ids:
+            print(f"[{datetime.datetime.now()}] [MainServer_DB_INIT] Backfilled trigger flags for {len(user_ids)} users.")
+
     async def delete_polling_state_by_service(self, user_id: str, service_name: str) -> int:
         """Deletes all polling state documents for a user and a specific service."""
         if not user_id or not service_name:
@@ -403,8 +613,7 @@ class MongoManager:
         """Fetches a single task by its ID, ensuring it belongs to the user."""
         doc = await self.task_collection.find_one({"task_id": task_id, "user_id": user_id})
         SENSITIVE_TASK_FIELDS = ["name", "description", "plan", "runs", "original_context", "chat_history", "error", "clarifying_questions", "result", "swarm_details"]
-        _decrypt_doc(doc, SENSITIVE_TASK_FIELDS)
-        return doc
+        return _decrypt_doc_lazily(doc, SENSITIVE_TASK_FIELDS)
 
     async def get_all_tasks_for_user(self, user_id: str) -> List[Dict]:
         """Fetches all tasks for a given user."""
@@ -423,8 +632,15 @@ class MongoManager:
             {"task_id": task_id},
             {"$set": updates}
         )
+        if result.modified_count > 0 and any(field in updates for field in TRIGGER_RELEVANT_TASK_FIELDS):
+            task = await self.task_collection.find_one({"task_id": task_id}, {"user_id": 1})
+            if task:
+                await self.refresh_trigger_flags(task["user_id"])
         return result.modified_count > 0
 
+    async def refresh_trigger_flags(self, user_id: str):
+        await refresh_trigger_flags(self.db, user_id)
+
     async def add_answers_to_task(self, task_id: str, answers: List[Dict], user_id: str) -> bool:
         """Finds a task and updates its clarifying questions with user answers."""
         task = await self.get_task(task_id, user_id)
@@ -452,6 +668,8 @@ class MongoManager:
     async def delete_task(self, task_id: str, user_id: str) -> str:
         """Deletes a task."""
         result = await self.task_collection.delete_one({"task_id": task_id, "user_id": user_id})
+        if result.deleted_count > 0:
+            await self.refresh_trigger_flags(user_id)
         return "Task deleted successfully." if result.deleted_count > 0 else None
 
     async def decline_task(self, task_id: str, user_id: str) -> str:
@@ -469,6 +687,8 @@ class MongoManager:
         query = {"user_id": user_id, "runs.plan.tool": tool_name}
         result = await self.task_collection.delete_many(query)
         logger.info(f"Deleted {result.deleted_count} tasks for user {user_id} using tool '{tool_name}'.")
+        if result.deleted_count > 0:
+            await self.refresh_trigger_flags(user_id)
         return result.deleted_count
 
     async def cancel_latest_run(self, task_id: str) -> bool:
@@ -480,17 +700,18 @@ class MongoManager:
             },
             "$pop": {"runs": 1}  # Removes the last element from the 'runs' array
         }
-        result = await self.task_collection.update_one({"task_id": task_id}, update_payload) # noqa: E501
-        return result.modified_count > 0
+        task = await self.task_collection.find_one_and_update({"task_id": task_id}, update_payload, projection={"user_id": 1}) # noqa: E501
+        if task:
+            await self.refresh_trigger_flags(task["user_id"])
+        return task is not None
 
     async def delete_notifications_for_task(self, user_id: str, task_id: str):
         """Deletes all notifications associated with a specific task_id for a user."""
         if not user_id or not task_id:
             return
-        await self.notifications_collection.update_one(
-            {"user_id": user_id},
-            {"$pull": {"notifications": {"task_id": task_id}}}
-        )
+        unread = await self.notifications_collection.delete_many({"user_id": user_id, "task_id": task_id, "read": False})
+        await self._increment_unread_notifications(user_id, -unread.deleted_count)
+        await self.notifications_collection.delete_many({"user_id": user_id, "task_id": task_id})
         logger.info(f"Deleted notifications for task {task_id} for user {user_id}.")
 
     async def rerun_task(self, original_task_id: str, user_id: str) -> Optional[str]:
@@ -0,0 +1,244 @@
+# src/server/main/encryption.py
+"""
+Field encryption shared by the main server and the workers.
+
+Two ciphertext formats are read:
+- legacy: base64 of AES-256-CBC with the static AES_IV and PKCS7 padding (no prefix);
+- "v1:": base64 of a random 12-byte nonce followed by AES-256-GCM ciphertext and tag, under a
+  key derived from AES_SECRET_KEY.
+Base64 never contains ':', so the prefix tells the formats apart. New values are written in the
+ENCRYPTION_WRITE_VERSION format, which lets stored data move to v1 without downtime: deploy
+readers first, then switch writes, then re-encrypt old values with `needs_migration`.
+"""
+import base64
+import copy
+import datetime
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+LEGACY_VERSION = "v0"
+AEAD_VERSION = "v1"
+AEAD_PREFIX = "v1:"
+NONCE_SIZE = 12
+_AEAD_KEY_INFO = b"sentient-field-encryption-v1"
+
+def _datetime_serializer(obj):
+    """JSON serializer for objects not serializable by default json code, like datetime."""
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+class FieldCipher:
+    """Holds the key material and cipher objects, built once and reused for every value."""
+
+    def __init__(self, key: Optional[bytes], iv: Optional[bytes], write_version: str = LEGACY_VERSION):
+        if write_version not in (LEGACY_VERSION, AEAD_VERSION):
+            raise ValueError(f"Unknown encryption write version: {write_version}")
+        self.write_version = write_version
+        self._cbc = Cipher(algorithms.AES(key), modes.CBC(iv)) if key and iv else None
+        self._aead = None
+        if key:
+            aead_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=_AEAD_KEY_INFO).derive(key)
+            self._aead = AESGCM(aead_key)
+
+    @classmethod
+    def from_env(cls) -> "FieldCipher":
+        key_hex = os.getenv("AES_SECRET_KEY")
+        iv_hex = os.getenv("AES_IV")
+        key = bytes.fromhex(key_hex) if key_hex and len(key_hex) == 64 else None
+        iv = bytes.fromhex(iv_hex) if iv_hex and len(iv_hex) == 32 else None
+        return cls(key, iv, os.getenv("ENCRYPTION_WRITE_VERSION", LEGACY_VERSION))
+
+    def _require(self, cipher):
+        if cipher is None:
+            raise ValueError("AES encryption keys are not configured.")
+        return cipher
+
+    def encrypt(self, plaintext: str) -> str:
+        data = plaintext.encode()
+        if self.write_version == AEAD_VERSION:
+            nonce = os.urandom(NONCE_SIZE)
+            return AEAD_PREFIX + base64.b64encode(nonce + self._require(self._aead).encrypt(nonce, data, None)).decode()
+        encryptor = self._require(self._cbc).encryptor()
+        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        padded_data = padder.update(data) + padder.finalize()
+        return base64.b64encode(encryptor.update(padded_data) + encryptor.finalize()).decode()
+
+    def decrypt(self, ciphertext: str) -> str:
+        if ciphertext.startswith(AEAD_PREFIX):
+            raw = base64.b64decode(ciphertext[len(AEAD_PREFIX):])
+            return self._require(self._aead).decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], None).decode()
+        decryptor = self._require(self._cbc).decryptor()
+        decrypted = decryptor.update(base64.b64decode(ciphertext)) + decryptor.finalize()
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        return (unpadder.update(decrypted) + unpadder.finalize()).decode()
+
+    def needs_migration(self, ciphertext: str) -> bool:
+        """Whether a stored value is in another format than the one new values are written in."""
+        return ciphertext.startswith(AEAD_PREFIX) != (self.write_version == AEAD_VERSION)
+
+_cipher: Optional[FieldCipher] = None
+_cipher_lock = threading.Lock()
+
+def get_cipher() -> FieldCipher:
+    """The process-wide cipher, built from the environment on first use."""
+    global _cipher
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                _cipher = FieldCipher.from_env()
+    return _cipher
+
+def reset_cipher():
+    """Drops the cached cipher so the next call re-reads the keys from the environment."""
+    global _cipher
+    _cipher = None
+
+def aes_encrypt(data: str) -> str:
+    return get_cipher().encrypt(data)
+
+def aes_decrypt(encrypted_data: str) -> str:
+    return get_cipher().decrypt(encrypted_data)
+
+# --- Field and document helpers ---
+
+def encrypt_value(value: Any) -> Any:
+    """JSON-encodes and encrypts a field value. None is stored as is."""
+    if value is None:
+        return value
+    return get_cipher().encrypt(json.dumps(value, default=_datetime_serializer))
+
+def decrypt_value(value: Any) -> Any:
+    """Decrypts and JSON-decodes a field value. Values that are not ciphertexts are returned unchanged."""
+    if value is None or not isinstance(value, str):
+        return value
+    try:
+        return json.loads(get_cipher().decrypt(value))
+    except Exception:
+        return value
+
+def encrypt_fields(doc: Optional[Dict], fields: Iterable[str]):
+    if not doc:
+        return
+    for field in fields:
+        if doc.get(field) is not None:
+            doc[field] = encrypt_value(doc[field])
+
+def decrypt_fields(doc: Optional[Dict], fields: Iterable[str]):
+    if not doc:
+        return
+    for field in fields:
+        if doc.get(field) is not None:
+            doc[field] = decrypt_value(doc[field])
+
+def decrypt_documents(docs: List[Dict], fields: Iterable[str]):
+    fields = list(fields)
+    for doc in docs:
+        decrypt_fields(doc, fields)
+
+class LazyDecryptedDocument(dict):
+    """
+    A document whose encrypted fields are decrypted on first access instead of up front.
+    Reading a field by key decrypts only that field; iterating over values or items (as JSON
+    encoding, FastAPI and copies do) decrypts whatever is still pending first.
+    """
+
+    def __init__(self, doc: Dict, fields: Iterable[str]):
+        super().__init__(doc)
+        self._pending = {field for field in fields if dict.get(self, field) is not None}
+
+    def _materialize(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            dict.__setitem__(self, key, decrypt_value(dict.__getitem__(self, key)))
+
+    def _materialize_all(self):
+        for key in list(self._pending):
+            self._materialize(key)
+
+    def __getitem__(self, key):
+        self._materialize(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._materialize(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._pending.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._materialize(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self._materialize(key)
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        # dict.update writes without going through __setitem__, so the written keys are no longer pending.
+        written = dict(*args, **kwargs)
+        self._pending.difference_update(written)
+        dict.update(self, written)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def __ror__(self, other):
+        merged = dict(other)
+        merged.update(self.copy())
+        return merged
+
+    def clear(self):
+        self._pending.clear()
+        dict.clear(self)
+
+    def popitem(self):
+        self._materialize_all()
+        return dict.popitem(self)
+
+    def __iter__(self):
+        # Overriding __iter__ makes dict(doc) and {**doc} go through __getitem__.
+        return dict.__iter__(self)
+
+    def values(self):
+        self._materialize_all()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize_all()
+        return dict.items(self)
+
+    def copy(self) -> Dict:
+        self._materialize_all()
+        return dict(dict.items(self))
+
+    def __copy__(self) -> Dict:
+        return self.copy()
+
+    def __deepcopy__(self, memo) -> Dict:
+        return copy.deepcopy(self.copy(), memo)
+
+    def __reduce_ex__(self, protocol):
+        return (dict, (self.copy(),))
+
+def decrypt_document_lazily(doc: Optional[Dict], fields: Iterable[str]) -> Optional[Dict]:
+    return LazyDecryptedDocument(doc, fields) if doc else doc
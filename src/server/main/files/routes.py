@@ -3,9 +3,10 @@ import re
 from typing import Tuple
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse, FileResponse
-from main.dependencies import auth_helper, mongo_manager
+from main.dependencies import auth_helper
 from main.plans import PLAN_LIMITS
 from main.plans import PLAN_LIMITS
+from main.usage import usage_meter
 from main.config import FILE_MANAGEMENT_TEMP_DIR # Import the base directory constant
 from .utils import get_user_temp_dir
 
@@ -32,11 +33,11 @@ async def upload_file(
     user_id, plan = user_id_and_plan
 
     # --- Check Usage Limit ---
-    usage = await mongo_manager.get_or_create_daily_usage(user_id)
+    # The upload is counted up front, atomically, and given back if the file cannot be saved.
     limit = PLAN_LIMITS[plan].get("file_uploads_daily", 0)
-    current_count = usage.get("file_uploads", 0)
+    allowed, _ = await usage_meter.check_and_increment(user_id, "file_uploads", limit)
 
-    if current_count >= limit:
+    if not allowed:
         raise HTTPException(
             status_code=429,
             detail=f"You have reached your daily file upload limit of {limit}. Please upgrade or try again tomorrow."
@@ -56,10 +57,8 @@ async def upload_file(
     try:
         with open(file_path, "wb") as buffer:
             buffer.write(await file.read())
-
-        # Increment usage after successful save
-        await mongo_manager.increment_daily_usage(user_id, "file_uploads")
     except Exception as e:
+        await usage_meter.refund(user_id, "file_uploads")
         return JSONResponse(status_code=500, content={"error": f"Failed to save file: {e}"})
     
     # Return only the filename, not the full path with user_id
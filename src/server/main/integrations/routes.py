@@ -254,17 +254,19 @@ async def connect_oauth_integration(
             raise HTTPException(status_code=500, detail="Failed to save integration credentials.")
         
         if service_name in ['gmail', 'gcalendar']:
-            await mongo_manager.update_polling_state(
-                user_id,
-                service_name,
-                "triggers",
-                {
-                    "is_enabled": True,
-                    "is_currently_polling": False,
-                    "next_scheduled_poll_time": datetime.datetime.now(datetime.timezone.utc), # Poll immediately
-                    "last_successful_poll_timestamp_unix": None,
-                }
-            )
+            polling_state = {
+                "is_enabled": True,
+                "is_currently_polling": False,
+                "next_scheduled_poll_time": datetime.datetime.now(datetime.timezone.utc), # Poll immediately
+                "last_successful_poll_timestamp_unix": None,
+            }
+            if service_name == 'gmail':
+                polling_state["history_id"] = None # A reconnected mailbox starts with a full sync
+            else:
+                # A reconnected calendar account starts with a full sync of a fresh calendar list
+                polling_state["calendar_sync_state"] = None
+                polling_state["calendar_list_synced_at"] = None
+            await mongo_manager.update_polling_state(user_id, service_name, "triggers", polling_state)
 
         return JSONResponse(content={"message": f"{service_name} connected successfully."})
 
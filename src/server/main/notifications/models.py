@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class CreateNotificationRequest(BaseModel):
     user_id: str
@@ -11,3 +11,7 @@ class CreateNotificationRequest(BaseModel):
 class DeleteNotificationRequest(BaseModel):
     notification_id: Optional[str] = None
     delete_all: Optional[bool] = False
+
+class MarkNotificationsReadRequest(BaseModel):
+    notification_ids: Optional[List[str]] = None
+    mark_all: Optional[bool] = False
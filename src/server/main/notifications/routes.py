@@ -1,8 +1,10 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import JSONResponse
 
-from main.notifications.models import CreateNotificationRequest, DeleteNotificationRequest
+from main.config import NOTIFICATION_PAGE_SIZE
+from main.notifications.models import CreateNotificationRequest, DeleteNotificationRequest, MarkNotificationsReadRequest
 from main.notifications.utils import create_and_push_notification
 from main.dependencies import mongo_manager, auth_helper
 from main.auth.utils import PermissionChecker
@@ -28,10 +30,32 @@ async def create_notification_internal(request: CreateNotificationRequest):
         logger.error(f"Internal notification creation failed for user {request.user_id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-@router.get("", summary="Get All User Notifications")
-async def get_notifications(user_id: str = Depends(PermissionChecker(required_permissions=["read:notifications"]))):
-    notifications = await mongo_manager.get_notifications(user_id)
-    return JSONResponse(content={"notifications": notifications})
+@router.get("", summary="Get User Notifications")
+async def get_notifications(
+    limit: int = Query(NOTIFICATION_PAGE_SIZE, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="The next_cursor of the previous page."),
+    user_id: str = Depends(PermissionChecker(required_permissions=["read:notifications"]))
+):
+    try:
+        notifications, next_cursor = await mongo_manager.get_notifications(user_id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+    unread_count = await mongo_manager.get_unread_notification_count(user_id)
+    return JSONResponse(content={"notifications": notifications, "next_cursor": next_cursor, "unread_count": unread_count})
+
+@router.post("/read", summary="Mark User Notifications as Read")
+async def mark_notifications_read(
+    request: MarkNotificationsReadRequest,
+    user_id: str = Depends(PermissionChecker(required_permissions=["write:notifications"]))
+):
+    if not request.mark_all and not request.notification_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either 'notification_ids' or 'mark_all' must be provided."
+        )
+    updated = await mongo_manager.mark_notifications_read(user_id, None if request.mark_all else request.notification_ids)
+    unread_count = await mongo_manager.get_unread_notification_count(user_id)
+    return JSONResponse(content={"updated": updated, "unread_count": unread_count})
 
 @router.post("/delete", summary="Delete a User Notification")
 async def delete_notification(
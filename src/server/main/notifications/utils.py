@@ -8,10 +8,13 @@ from main.notifications.whatsapp_client import send_whatsapp_message # Import th
 
 logger = logging.getLogger(__name__)
 
-async def create_and_push_notification(user_id: str, message: str, task_id: Optional[str] = None, notification_type: str = "general", payload: Optional[Dict[str, Any]] = None):
+async def create_and_push_notification(user_id: str, message: str, task_id: Optional[str] = None, notification_type: str = "general", payload: Optional[Dict[str, Any]] = None, raise_on_save_error: bool = False):
     """
     Saves a notification to the database, pushes it via WebSocket, and sends it via WhatsApp if configured.
     Handles different notification types.
+    Delivery is best-effort. A failed save is logged and swallowed, unless `raise_on_save_error`
+    is set by a caller that retries (the worker event consumer). Once the notification is saved,
+    errors never propagate, so a retry cannot store it twice.
     """
 
     notification_data = {}
@@ -24,13 +27,18 @@ async def create_and_push_notification(user_id: str, message: str, task_id: Opti
         "read": False
     }
 
+    # 1. Save to DB
     try:
-        # 1. Save to DB
         new_notification = await mongo_manager.add_notification(user_id, notification_data)
         if not new_notification:
-            logger.error(f"Failed to save notification to DB for user {user_id}")
-            return
+            raise RuntimeError("add_notification returned no document")
+    except Exception as e:
+        if raise_on_save_error:
+            raise
+        logger.error(f"Failed to save notification to DB for user {user_id}: {e}", exc_info=True)
+        return
 
+    try:
         # Convert datetime to string for JSON serialization before pushing
         if isinstance(new_notification.get("timestamp"), datetime.datetime):
             new_notification["timestamp"] = new_notification["timestamp"].isoformat()
@@ -1,5 +1,7 @@
 # src/server/main/proactivity/learning.py
+import datetime
 import logging
+from main.config import PROACTIVE_NEGATIVE_FEEDBACK_COOLDOWN_SECONDS
 from main.dependencies import mongo_manager
 
 logger = logging.getLogger(__name__)
@@ -7,7 +9,7 @@ logger = logging.getLogger(__name__)
 async def record_user_feedback(user_id: str, suggestion_type: str, feedback: str):
     """
     Records user feedback to adjust preferences for proactive suggestions.
-    'feedback' should be "positive" or "negative".
+    'feedback' should be "positive" or "negative". Negative feedback also pauses the type for a while.
     """
     if not all([user_id, suggestion_type, feedback]):
         logger.warning("Missing arguments for record_user_feedback.")
@@ -15,4 +17,7 @@ async def record_user_feedback(user_id: str, suggestion_type: str, feedback: str
 
     increment_value = 1 if feedback == "positive" else -1
     await mongo_manager.update_proactive_preference_score(user_id, suggestion_type, increment_value)
-    logger.info(f"Recorded '{feedback}' feedback for user '{user_id}' on suggestion type '{suggestion_type}'.")
+    if feedback != "positive":
+        cooldown_until = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=PROACTIVE_NEGATIVE_FEEDBACK_COOLDOWN_SECONDS)
+        await mongo_manager.set_proactive_type_cooldown(user_id, suggestion_type, cooldown_until)
+    logger.info(f"Recorded '{feedback}' feedback for user '{user_id}' on suggestion type '{suggestion_type}'.")
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Key-value state that has to be visible to every main server process.
+
+Process-local state in the main server, and how each piece behaves with several workers:
+- WebSocket connections stay in the process that accepted them; messages reach them from any
+  process through the backplane (WEBSOCKET_BACKPLANE=redis, main/websocket.py).
+- RTC voice tokens are issued by one worker and redeemed by another: kept in a shared store here.
+- The Auth0 management token is shared here too, so workers do not each fetch their own.
+- Daily usage counters: the usage meter (USAGE_METER_BACKEND=redis, main/usage.py).
+- STT/TTS models: one copy per process unless served by the voice inference process
+  (VOICE_INFERENCE_URL, main/voice/inference_server.py).
+- Worker events are consumed once per event through a consumer group (main/worker_events.py).
+- The Mongo and Postgres clients, JWKS keys, verified-token cache, field cipher and LLM clients
+  are per-process connection pools or caches of data that is the same everywhere, so they
+  need no sharing.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from main.config import REDIS_URL, SHARED_STATE_BACKEND, SHARED_STATE_SWEEP_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class InMemorySharedStore:
+    """
+    A store for a single process. Expiry times are kept in a heap, so expired entries are dropped
+    in order without scanning the store: a little on every write, and all of them every
+    `sweep_interval_seconds` once started, so an idle process does not hold on to them either.
+    """
+
+    def __init__(self, sweep_interval_seconds: float = 60):
+        self._entries: Dict[str, Tuple[Optional[float], Any]] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _live(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        entry = self._entries.get(key)
+        if entry and entry[0] is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """Drops expired entries, oldest first, up to `limit` of them. Returns how many were dropped."""
+        now, dropped = time.monotonic(), 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now and (limit is None or dropped < limit):
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            # Heap entries of keys that were since deleted or overwritten are just discarded.
+            if entry and entry[0] == expires_at:
+                del self._entries[key]
+                dropped += 1
+        return dropped
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        # Each write retires a couple of expired entries, which keeps the store bounded without the sweeper.
+        self.sweep(limit=2)
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+        self._entries[key] = (expires_at, value)
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+    async def get(self, key: str) -> Any:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def pop(self, key: str) -> Any:
+        """Returns and removes the value in one step."""
+        entry = self._live(key)
+        if entry:
+            del self._entries[key]
+        return entry[1] if entry else None
+
+    async def delete(self, key: str) -> bool:
+        return await self.pop(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _run_sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            dropped = self.sweep()
+            if dropped:
+                logger.debug(f"Dropped {dropped} expired shared state entries.")
+
+    async def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._run_sweeper())
+
+    async def stop(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+class RedisSharedStore:
+    """A store shared by every process through Redis; values are JSON and TTLs are Redis expiries."""
+
+    def __init__(self, url: Optional[str] = None, namespace: str = "default", client=None):
+        self.url = url
+        self.prefix = f"sentient:state:{namespace}:"
+        self._client = client
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        await self._get_client().set(self.prefix + key, json.dumps(value), px=int(ttl_seconds * 1000) if ttl_seconds else None)
+
+    async def get(self, key: str) -> Any:
+        raw = await self._get_client().get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def pop(self, key: str) -> Any:
+        """Returns and removes the value in one step (GETDEL), so only one process can take it."""
+        raw = await self._get_client().getdel(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self._get_client().delete(self.prefix + key))
+
+    async def start(self):
+        # Redis expires keys itself; nothing to sweep.
+        pass
+
+    async def stop(self):
+        pass
+
+def create_shared_store(namespace: str):
+    if SHARED_STATE_BACKEND == "redis":
+        if not REDIS_URL:
+            raise ValueError("SHARED_STATE_BACKEND is 'redis' but neither REDIS_URL nor CELERY_BROKER_URL is set.")
+        return RedisSharedStore(REDIS_URL, namespace)
+    return InMemorySharedStore(sweep_interval_seconds=SHARED_STATE_SWEEP_INTERVAL_SECONDS)
@@ -0,0 +1,174 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+Hook = Callable[[], Any]
+
+class Subsystem:
+    """
+    One piece of the server that has to be started (and possibly stopped).
+
+    `background` subsystems start after the server begins accepting requests, so heavy loads
+    (models, index builds) do not hold up the process; foreground ones finish before it serves.
+    `blocking` start hooks are synchronous and slow, and run in a thread. Only `critical`
+    subsystems decide whether the server is ready.
+    """
+
+    def __init__(self, name: str, start: Optional[Hook] = None, stop: Optional[Hook] = None,
+                 depends_on: Sequence[str] = (), background: bool = False, blocking: bool = False, critical: bool = True):
+        self.name = name
+        self.start_hook = start
+        self.stop_hook = stop
+        self.depends_on = list(depends_on)
+        self.background = background
+        self.blocking = blocking
+        self.critical = critical
+        self.state = "pending"
+        self.duration_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def status(self) -> Dict[str, Any]:
+        status = {"state": self.state, "critical": self.critical, "background": self.background}
+        if self.duration_seconds is not None:
+            status["duration_seconds"] = round(self.duration_seconds, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+async def _call(hook: Hook, blocking: bool = False):
+    if blocking:
+        return await asyncio.to_thread(hook)
+    result = hook()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+class StartupManager:
+    """
+    Starts subsystems in dependency order, foreground ones before the server serves and background
+    ones concurrently afterwards, and stops them in reverse order. Keeps per-subsystem state and
+    timings for the readiness probe and logs a startup-time breakdown.
+    """
+
+    def __init__(self):
+        self.subsystems: Dict[str, Subsystem] = {}
+        self._done: Dict[str, asyncio.Future] = {}
+        self._background_tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+
+    def register(self, subsystem: Subsystem) -> Subsystem:
+        if subsystem.name in self.subsystems:
+            raise ValueError(f"Subsystem '{subsystem.name}' is already registered.")
+        self.subsystems[subsystem.name] = subsystem
+        return subsystem
+
+    def _ordered(self) -> List[Subsystem]:
+        """Topological order of the registered subsystems; raises on unknown or cyclic dependencies."""
+        ordered, visiting, visited = [], set(), set()
+
+        def visit(name: str, path: List[str]):
+            if name in visited:
+                return
+            if name not in self.subsystems:
+                raise ValueError(f"Subsystem '{path[-1]}' depends on unknown subsystem '{name}'.")
+            if name in visiting:
+                raise ValueError(f"Dependency cycle between subsystems: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            subsystem = self.subsystems[name]
+            for dependency in subsystem.depends_on:
+                if not subsystem.background and self.subsystems.get(dependency) and self.subsystems[dependency].background:
+                    raise ValueError(f"Foreground subsystem '{name}' cannot depend on background subsystem '{dependency}'.")
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+            ordered.append(subsystem)
+
+        for name in self.subsystems:
+            visit(name, [])
+        return ordered
+
+    async def _start_one(self, subsystem: Subsystem):
+        try:
+            for dependency in subsystem.depends_on:
+                if not await self._done[dependency]:
+                    subsystem.state = "skipped"
+                    subsystem.error = f"Dependency '{dependency}' did not start."
+                    logger.error(f"Not starting {subsystem.name}: dependency '{dependency}' did not start.")
+                    return False
+            subsystem.state = "starting"
+            started = time.perf_counter()
+            try:
+                if subsystem.start_hook:
+                    await _call(subsystem.start_hook, subsystem.blocking)
+                subsystem.state = "ready"
+            except asyncio.CancelledError:
+                subsystem.state = "cancelled"
+                raise
+            except Exception as e:
+                subsystem.state = "failed"
+                subsystem.error = str(e)
+                logger.error(f"Subsystem {subsystem.name} failed to start: {e}", exc_info=True)
+            finally:
+                subsystem.duration_seconds = time.perf_counter() - started
+            if subsystem.state == "ready":
+                logger.info(f"Subsystem {subsystem.name} ready in {subsystem.duration_seconds:.2f}s.")
+            return subsystem.state == "ready"
+        finally:
+            if not self._done[subsystem.name].done():
+                self._done[subsystem.name].set_result(subsystem.state == "ready")
+
+    async def start(self):
+        """Starts the foreground subsystems and schedules the background ones. Returns once the server may serve."""
+        self._started_at = time.perf_counter()
+        ordered = self._ordered()
+        loop = asyncio.get_running_loop()
+        self._done = {subsystem.name: loop.create_future() for subsystem in ordered}
+        for subsystem in ordered:
+            if not subsystem.background:
+                await self._start_one(subsystem)
+        for subsystem in ordered:
+            if subsystem.background:
+                self._background_tasks.append(asyncio.create_task(self._start_one(subsystem)))
+        foreground = sum(s.duration_seconds or 0 for s in ordered if not s.background)
+        logger.info(f"Foreground startup took {foreground:.2f}s; {len(self._background_tasks)} subsystem(s) loading in the background.")
+        if self._background_tasks:
+            self._background_tasks.append(asyncio.create_task(self._log_breakdown_when_done()))
+        else:
+            self.log_breakdown()
+
+    async def _log_breakdown_when_done(self):
+        await asyncio.gather(*self._done.values())
+        self.log_breakdown()
+
+    def log_breakdown(self):
+        total = time.perf_counter() - self._started_at if self._started_at else 0.0
+        lines = [f"Startup breakdown ({total:.2f}s until every subsystem settled):"]
+        for subsystem in sorted(self.subsystems.values(), key=lambda s: -(s.duration_seconds or 0)):
+            timing = f"{subsystem.duration_seconds:.2f}s" if subsystem.duration_seconds is not None else "-"
+            mode = "background" if subsystem.background else "foreground"
+            lines.append(f"  {subsystem.name:<20} {subsystem.state:<10} {timing:>8}  {mode}")
+        logger.info("\n".join(lines))
+
+    def is_ready(self) -> bool:
+        return all(s.state == "ready" for s in self.subsystems.values() if s.critical)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: subsystem.status() for name, subsystem in self.subsystems.items()}
+
+    async def stop(self):
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+        # Reverse dependency order: dependents stop before what they depend on.
+        for subsystem in reversed(self._ordered()):
+            if subsystem.stop_hook and subsystem.state not in ("pending", "skipped"):
+                try:
+                    await _call(subsystem.stop_hook)
+                except Exception as e:
+                    logger.error(f"Subsystem {subsystem.name} failed to stop cleanly: {e}", exc_info=True)
+            subsystem.state = "stopped"
@@ -36,4 +36,10 @@ class ProgressUpdateRequest(BaseModel):
     user_id: str
     task_id: str
     run_id: str
-    message: Any # Changed from str to Any to allow structured updates
\ No newline at end of file
+    message: Any # Changed from str to Any to allow structured updates
+
+class ProgressUpdateBatchRequest(BaseModel):
+    user_id: str
+    task_id: str
+    run_id: str
+    updates: List[Dict[str, Any]] # Each item has 'message' and 'timestamp'
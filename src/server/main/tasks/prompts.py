@@ -23,9 +23,9 @@ Instructions:
         - `frequency` can be "daily" or "weekly". YOU CANNOT use "monthly" or "yearly". DO NOT use "hourly", "every minute" or "every second" as a frequency - if the user mentions a short timeframe like this, use "daily" by default.
         - `time` MUST be in "HH:MM" 24-hour format. If no time is specified, default to `09:00`.
         - For "weekly" frequency, `days` MUST be a list of full day names (e.g., ["Monday", "Wednesday"]). If no day is specified, default to `["Monday"]`.
-    - Triggered Workflows: Triggered workflows are supported for new calendar events and new emails. If the user tells you to do something "on every new email", use the `triggered` type.
+    - Triggered Workflows: Triggered workflows are supported for new, updated and cancelled calendar events and new emails. If the user tells you to do something "on every new email", use the `triggered` type.
         - `source`: The service that triggers the workflow (e.g., "gmail", "gcalendar").
-        - `event`: The specific event (e.g., "new_email", "new_event").
+        - `event`: The specific event (e.g., "new_email", "new_event", "updated_event", "cancelled_event").
         - `filter`: A dictionary of conditions to match (e.g., `{{"from": "boss@example.com"}}`).
     - CRUCIAL DISTINCTION: Differentiate between the *task's execution time* (`run_at`) and the *event's time* mentioned in the prompt. A task to arrange a future event (e.g., 'book a flight for next month', 'schedule a meeting for Friday') should be executed *now* to make the arrangement. Therefore, its `run_at` should be null, since setting run_at to null makes the task run immediately. The future date belongs in the task `description`.
     - Ambiguity: Phrases like "weekly hourly" are ambiguous. Interpret "weekly" as the frequency and ignore "hourly".
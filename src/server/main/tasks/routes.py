@@ -7,11 +7,13 @@ from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import uuid
 from typing import Tuple
 from main.dependencies import auth_helper
-from main.dependencies import mongo_manager, websocket_manager
+from main.dependencies import mongo_manager
 from main.auth.utils import PermissionChecker
+from main.worker_events import push_task_progress_updates, push_task_list_updated
 from workers.tasks import generate_plan_from_context, execute_task_plan, calculate_next_run, process_task_change_request, refine_task_details, refine_and_plan_ai_task, cud_memory_task, orchestrate_swarm_task
 from main.plans import PLAN_LIMITS
-from .models import AddTaskRequest, UpdateTaskRequest, TaskIdRequest, TaskActionRequest, TaskChatRequest, ProgressUpdateRequest
+from main.usage import usage_meter
+from .models import AddTaskRequest, UpdateTaskRequest, TaskIdRequest, TaskActionRequest, TaskChatRequest, ProgressUpdateRequest, ProgressUpdateBatchRequest
 from main.llm import run_agent
 from main.tasks.models import AddTaskRequest, UpdateTaskRequest, TaskIdRequest, TaskActionRequest, TaskChatRequest, ProgressUpdateRequest
 from workers.tasks import generate_plan_from_context, execute_task_plan, calculate_next_run, refine_and_plan_ai_task, orchestrate_swarm_task
@@ -94,18 +96,18 @@ async def add_task(
     user_id_and_plan: Tuple[str, str] = Depends(auth_helper.get_current_user_id_and_plan)
 ):
     user_id, plan = user_id_and_plan
-    usage = await mongo_manager.get_or_create_daily_usage(user_id)
 
     if request.is_swarm:
+        if not request.prompt:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A prompt describing the goal and items is required for swarm tasks.")
+
         # --- Check Swarm Task Limits ---
+        # The slot is reserved atomically here and given back if the task cannot be created.
         limit = PLAN_LIMITS[plan].get("swarm_tasks_daily", 0)
-        current_count = usage.get("swarm_tasks", 0)
-        if current_count >= limit:
+        allowed, _ = await usage_meter.check_and_increment(user_id, "swarm_tasks", limit)
+        if not allowed:
             raise HTTPException(status_code=429, detail=f"You have reached your daily limit of {limit} Swarm tasks.")
 
-        if not request.prompt:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A prompt describing the goal and items is required for swarm tasks.")
-
         task_data = {
             "name": request.prompt,
             "description": f"Swarm task to achieve the goal: {request.prompt}",
@@ -123,14 +125,16 @@ async def add_task(
         }
         task_id = await mongo_manager.add_task(user_id, task_data)
         if not task_id:
+            await usage_meter.refund(user_id, "swarm_tasks")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create swarm task.")
 
-        await mongo_manager.increment_daily_usage(user_id, "swarm_tasks")
         orchestrate_swarm_task.delay(task_id, user_id)
         return {"message": "Swarm task initiated! I'll start planning it out.", "task_id": task_id}
     else:
         # --- Check Single Task Limits ---
         # This requires parsing the schedule first to determine the type
+        if not request.prompt:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prompt is required for single tasks.")
         is_recurring = "every" in request.prompt.lower() or "recurring" in request.prompt.lower()
         is_triggered = "when" in request.prompt.lower() or "if" in request.prompt.lower() or "on every" in request.prompt.lower()
 
@@ -145,17 +149,12 @@ async def add_task(
             if active_count >= limit:
                 raise HTTPException(status_code=429, detail=f"You have reached your limit of {limit} active triggered workflows.")
         else: # One-time task
+            # Reserved atomically, so concurrent requests cannot overshoot the limit; given back below if creation fails.
             limit = PLAN_LIMITS[plan].get("one_time_tasks_daily", 0)
-            current_count = usage.get("one_time_tasks", 0)
-            if current_count >= limit:
+            allowed, _ = await usage_meter.check_and_increment(user_id, "one_time_tasks", limit)
+            if not allowed:
                 raise HTTPException(status_code=429, detail=f"You have reached your daily limit of {limit} one-time tasks.")
 
-            # We will increment the count after the task is successfully created
-            # To avoid race conditions, this should ideally be part of a transaction with the task creation
-            # For now, we'll increment after successful DB insertion.
-
-        if not request.prompt:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prompt is required for single tasks.")
         task_data = {
             "name": request.prompt,
             "description": request.prompt,
@@ -166,11 +165,10 @@ async def add_task(
         }
         task_id = await mongo_manager.add_task(user_id, task_data)
         if not task_id:
+            if not is_recurring and not is_triggered:
+                await usage_meter.refund(user_id, "one_time_tasks")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create task.")
 
-        # Increment usage for one-time tasks
-        if not is_recurring and not is_triggered:
-            await mongo_manager.increment_daily_usage(user_id, "one_time_tasks")
         refine_and_plan_ai_task.delay(task_id, user_id)
         return {"message": "Task accepted! I'll start planning it out.", "task_id": task_id}
 
@@ -408,6 +406,7 @@ async def task_chat(
             "$push": {"chat_history": new_message}
         }
     )
+    await mongo_manager.refresh_trigger_flags(user_id)
 
     # Re-trigger the planner for the same task
     generate_plan_from_context.delay(task_id, user_id)
@@ -419,27 +418,28 @@ async def internal_progress_update(request: ProgressUpdateRequest):
     # No auth check is performed, relying on network security (internal calls only).
     logger.info(f"Received internal progress update for task {request.task_id}")
     try:
-        await websocket_manager.send_personal_json_message(
-            {
-                "type": "task_progress_update",
-                "payload": {
-                    "task_id": request.task_id,
-                    "run_id": request.run_id,
-                    "update": {
-                        "message": request.message,
-                        "timestamp": datetime.now(timezone.utc).isoformat()
-                    }
-                }
-            },
-            request.user_id,
-            connection_type="notifications" # Use the existing notifications channel
-        )
+        await push_task_progress_updates(request.user_id, request.task_id, request.run_id, [{"message": request.message}])
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Failed to push progress update via websocket for task {request.task_id}: {e}", exc_info=True)
         # Don't fail the worker, just log it.
         return {"status": "error", "detail": str(e)}
 
+@router.post("/internal/progress-update-batch", include_in_schema=False)
+async def internal_progress_update_batch(request: ProgressUpdateBatchRequest):
+    """
+    Internal endpoint for workers that buffer progress updates. Each update is
+    forwarded to the client in order, using the same message shape as the
+    single-update endpoint so the frontend doesn't need to change.
+    """
+    logger.info(f"Received internal batch of {len(request.updates)} progress updates for task {request.task_id}")
+    try:
+        await push_task_progress_updates(request.user_id, request.task_id, request.run_id, request.updates)
+        return {"status": "success"}
+    except Exception as e:
+        logger.error(f"Failed to push progress update batch via websocket for task {request.task_id}: {e}", exc_info=True)
+        return {"status": "error", "detail": str(e)}
+
 @router.post("/internal/task-update-push", include_in_schema=False)
 async def internal_task_update_push(request: ProgressUpdateRequest): # Reusing model for convenience
     """
@@ -448,11 +448,7 @@ async def internal_task_update_push(request: ProgressUpdateRequest): # Reusing m
     """
     logger.info(f"Received internal request to push task list update for user {request.user_id}")
     try:
-        await websocket_manager.send_personal_json_message(
-            {"type": "task_list_updated"},
-            request.user_id,
-            connection_type="notifications"
-        )
+        await push_task_list_updated(request.user_id)
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Failed to push task list update via websocket for user {request.user_id}: {e}", exc_info=True)
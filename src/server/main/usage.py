@@ -0,0 +1,372 @@
+import asyncio
+import datetime
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from main.config import REDIS_URL, USAGE_FLUSH_INTERVAL_SECONDS, USAGE_METER_BACKEND
+from main.dependencies import mongo_manager
+
+logger = logging.getLogger(__name__)
+
+# Counters live for two days so yesterday's can still be flushed after midnight UTC.
+COUNTER_TTL_SECONDS = 2 * 24 * 60 * 60
+SEEDED_FIELD = "_seeded"
+# Bumped on every change to a (user, day)'s counters. It is flushed with them, and a flush only
+# replaces the Mongo snapshot if its version is newer.
+VERSION_FIELD = "_version"
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+def _counts(raw: Dict) -> Dict[str, int]:
+    return {field: int(value) for field, value in raw.items() if field != SEEDED_FIELD}
+
+# --- Stores ---
+# A store keeps one counter hash per (user, UTC day) and remembers which ones changed since
+# the last flush. `check_and_increment` returns None when the counters have not been seeded from
+# Mongo yet (first use, or lost in a crash or Redis restart), so the meter seeds and retries.
+# `get` returns the counters together with their VERSION_FIELD.
+
+class LocalUsageStore:
+    """Counters held in this process. Each method runs without awaiting, so it is atomic on the event loop."""
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._dirty: Set[Tuple[str, str]] = set()
+
+    async def check_and_increment(self, user_id: str, date: str, feature: str, amount: int, limit: Optional[int]) -> Optional[Tuple[bool, int]]:
+        counters = self._counters.get((date, user_id))
+        if counters is None:
+            return None
+        current = counters.get(feature, 0)
+        if limit is not None and current >= limit:
+            return False, current
+        counters[feature] = current + amount
+        counters[VERSION_FIELD] = counters.get(VERSION_FIELD, 0) + 1
+        self._dirty.add((date, user_id))
+        return True, counters[feature]
+
+    async def get(self, user_id: str, date: str) -> Optional[Dict[str, int]]:
+        counters = self._counters.get((date, user_id))
+        return dict(counters) if counters is not None else None
+
+    async def seed(self, user_id: str, date: str, counts: Dict[str, int], version: int, seeded_at: float):
+        if (date, user_id) not in self._counters:
+            self._counters[(date, user_id)] = {**counts, VERSION_FIELD: version}
+
+    async def add(self, user_id: str, date: str, feature: str, amount: int, written_at: float):
+        # Counters held in this process are never unreachable, so the meter never has Mongo-only usage to add.
+        counters = self._counters.get((date, user_id))
+        if counters is not None:
+            counters[feature] = counters.get(feature, 0) + amount
+            counters[VERSION_FIELD] = counters.get(VERSION_FIELD, 0) + 1
+            self._dirty.add((date, user_id))
+
+    async def pop_dirty(self, count: int) -> List[Tuple[str, str]]:
+        popped = []
+        while self._dirty and len(popped) < count:
+            popped.append(self._dirty.pop())
+        # Days that can no longer change are dropped once flushed.
+        today = _today()
+        for key in [key for key in self._counters if key[0] < today and key not in self._dirty and key not in popped]:
+            del self._counters[key]
+        return popped
+
+    async def mark_dirty(self, keys: List[Tuple[str, str]]):
+        self._dirty.update(keys)
+
+    async def all_keys(self) -> List[Tuple[str, str]]:
+        return list(self._counters)
+
+_CHECK_AND_INCREMENT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[5]) == 0 then
+    return {-1, 0}
+end
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local limit = tonumber(ARGV[3])
+if limit >= 0 and current >= limit then
+    return {0, current}
+end
+local updated = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HINCRBY', KEYS[1], '""" + VERSION_FIELD + """', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[6])
+return {1, updated}
+"""
+
+# Only the first seed of a (user, day) is applied: a later one would overwrite counters that
+# have moved on since. SEEDED_FIELD holds the time Mongo was read, for _ADD below.
+_SEED = """
+if redis.call('HEXISTS', KEYS[1], '""" + SEEDED_FIELD + """') == 1 then
+    return 0
+end
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('HSET', KEYS[1], '""" + VERSION_FIELD + """', ARGV[3], '""" + SEEDED_FIELD + """', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Adds usage that was written to Mongo while Redis was unreachable. It is skipped if the counters
+# are not seeded yet, or were seeded from a Mongo read made after the write, since the seed has it.
+_ADD = """
+local seeded_at = redis.call('HGET', KEYS[1], '""" + SEEDED_FIELD + """')
+if not seeded_at or tonumber(seeded_at) > tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HINCRBY', KEYS[1], '""" + VERSION_FIELD + """', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[5])
+return 1
+"""
+
+class RedisUsageStore:
+    """Counters shared by every server process. Check-and-increment is one Lua script, so concurrent requests cannot overshoot a limit."""
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "sentient:usage", client=None):
+        self.url = url
+        self.prefix = prefix
+        self._client = client
+        self._check_and_increment = None
+        self._seed = None
+        self._add = None
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis.from_url(self.url, decode_responses=True)
+        if self._check_and_increment is None:
+            self._check_and_increment = self._client.register_script(_CHECK_AND_INCREMENT)
+            self._seed = self._client.register_script(_SEED)
+            self._add = self._client.register_script(_ADD)
+        return self._client
+
+    def _key(self, user_id: str, date: str) -> str:
+        return f"{self.prefix}:{date}:{user_id}"
+
+    @property
+    def _dirty_key(self) -> str:
+        return f"{self.prefix}:dirty"
+
+    async def check_and_increment(self, user_id: str, date: str, feature: str, amount: int, limit: Optional[int]) -> Optional[Tuple[bool, int]]:
+        self._get_client()
+        allowed, value = await self._check_and_increment(
+            keys=[self._key(user_id, date), self._dirty_key],
+            args=[feature, amount, -1 if limit is None else limit, COUNTER_TTL_SECONDS, SEEDED_FIELD, f"{date}|{user_id}"]
+        )
+        if allowed == -1:
+            return None
+        return allowed == 1, int(value)
+
+    async def get(self, user_id: str, date: str) -> Optional[Dict[str, int]]:
+        raw = await self._get_client().hgetall(self._key(user_id, date))
+        return _counts(raw) if raw.get(SEEDED_FIELD) else None
+
+    async def seed(self, user_id: str, date: str, counts: Dict[str, int], version: int, seeded_at: float):
+        self._get_client()
+        args = [COUNTER_TTL_SECONDS, seeded_at, version]
+        for field, value in counts.items():
+            args.extend([field, value])
+        await self._seed(keys=[self._key(user_id, date)], args=args)
+
+    async def add(self, user_id: str, date: str, feature: str, amount: int, written_at: float):
+        self._get_client()
+        await self._add(
+            keys=[self._key(user_id, date), self._dirty_key],
+            args=[feature, amount, COUNTER_TTL_SECONDS, written_at, f"{date}|{user_id}"]
+        )
+
+    async def pop_dirty(self, count: int) -> List[Tuple[str, str]]:
+        # SPOP hands each member to one process, so concurrent flushers split the work.
+        members = await self._get_client().spop(self._dirty_key, count) or []
+        return [tuple(member.split("|", 1)) for member in members]
+
+    async def mark_dirty(self, keys: List[Tuple[str, str]]):
+        if keys:
+            await self._get_client().sadd(self._dirty_key, *[f"{date}|{user_id}" for date, user_id in keys])
+
+    async def all_keys(self) -> List[Tuple[str, str]]:
+        keys = []
+        async for key in self._get_client().scan_iter(match=f"{self.prefix}:*", count=1000):
+            if key != self._dirty_key:
+                date, user_id = key[len(self.prefix) + 1:].split(":", 1)
+                keys.append((date, user_id))
+        return keys
+
+def create_usage_store():
+    if USAGE_METER_BACKEND == "redis":
+        if REDIS_URL:
+            return RedisUsageStore(REDIS_URL)
+        logger.warning("USAGE_METER_BACKEND is 'redis' but neither REDIS_URL nor CELERY_BROKER_URL is set; counting usage in this process only.")
+    return LocalUsageStore()
+
+# --- Meter ---
+
+class UsageMeter:
+    """
+    Enforces the daily PLAN_LIMITS counters (text_messages, voice_chat_seconds, one_time_tasks,
+    swarm_tasks, file_uploads) without a Mongo round trip per request.
+
+    Counters are seeded from `daily_usage` the first time a (user, day) is touched, which is also
+    how they are rebuilt after a crash or a Redis restart. A background task writes changed
+    counters back as a versioned snapshot, so flushes can repeat, arrive out of order and run in
+    every process at once, and refunds still lower the stored counter.
+    If the store is unreachable, the meter falls back to reading and incrementing Mongo directly,
+    and adds that usage to the store's counters once it answers again.
+    """
+
+    def __init__(self, store=None, flush_interval_seconds: float = USAGE_FLUSH_INTERVAL_SECONDS, batch_size: int = 500):
+        self.store = store if store is not None else create_usage_store()
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        # (user_id, date, feature, amount, written_at) for usage metered in Mongo while the store was down.
+        self._fallback_usage = deque()
+
+    async def _seed(self, user_id: str, date: str):
+        seeded_at = time.time()
+        usage_doc = await mongo_manager.get_daily_usage(user_id, date) or {}
+        version = int(usage_doc.get(VERSION_FIELD, 0))
+        counts = {
+            field: int(value) for field, value in usage_doc.items()
+            if field != VERSION_FIELD and isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+        await self.store.seed(user_id, date, counts, version, seeded_at)
+
+    async def _add_fallback_usage(self):
+        """Adds usage metered in Mongo while the store was unreachable to the store's counters."""
+        while self._fallback_usage:
+            # Taken off the queue first so concurrent callers never add the same write twice.
+            write = self._fallback_usage.popleft()
+            try:
+                await self.store.add(*write)
+            except Exception:
+                self._fallback_usage.appendleft(write)
+                raise
+
+    async def check_and_increment(self, user_id: str, feature: str, limit: float, amount: int = 1) -> Tuple[bool, int]:
+        """
+        Atomically adds `amount` to today's counter unless it has already reached `limit`.
+        Returns whether it was added and the counter value (after adding, or the current one if refused).
+        """
+        date = _today()
+        store_limit = None if math.isinf(limit) else int(limit)
+        try:
+            if self._fallback_usage:
+                await self._add_fallback_usage()
+            result = await self.store.check_and_increment(user_id, date, feature, amount, store_limit)
+            if result is None:
+                await self._seed(user_id, date)
+                result = await self.store.check_and_increment(user_id, date, feature, amount, store_limit)
+            if result is not None:
+                return result
+        except Exception as e:
+            logger.error(f"Usage store unavailable, metering '{feature}' for user {user_id} in Mongo: {e}")
+        usage = await mongo_manager.get_or_create_daily_usage(user_id)
+        current = usage.get(feature, 0)
+        if current >= limit:
+            return False, current
+        await mongo_manager.increment_daily_usage(user_id, feature, amount)
+        # Without this, the next flush from the store would overwrite the increment in Mongo.
+        self._fallback_usage.append((user_id, date, feature, amount, time.time()))
+        return True, current + amount
+
+    async def increment(self, user_id: str, feature: str, amount: int = 1) -> int:
+        """Adds usage that has already happened, without a limit check."""
+        return (await self.check_and_increment(user_id, feature, float("inf"), amount))[1]
+
+    async def refund(self, user_id: str, feature: str, amount: int = 1):
+        """Gives back usage reserved by `check_and_increment` for an action that then failed."""
+        await self.increment(user_id, feature, -amount)
+
+    async def get_usage(self, user_id: str, feature: str) -> int:
+        date = _today()
+        try:
+            counts = await self.store.get(user_id, date)
+            if counts is None:
+                await self._seed(user_id, date)
+                counts = await self.store.get(user_id, date) or {}
+            return counts.get(feature, 0)
+        except Exception as e:
+            logger.error(f"Usage store unavailable, reading '{feature}' for user {user_id} from Mongo: {e}")
+            usage = await mongo_manager.get_or_create_daily_usage(user_id)
+            return usage.get(feature, 0)
+
+    async def flush(self) -> int:
+        """Writes every counter changed since the last flush to `daily_usage`. Returns how many were written."""
+        flushed = 0
+        if self._fallback_usage:
+            try:
+                await self._add_fallback_usage()
+            except Exception as e:
+                logger.error(f"Usage store still unavailable, keeping {len(self._fallback_usage)} Mongo-only usage writes: {e}")
+        while True:
+            keys = await self.store.pop_dirty(self.batch_size)
+            if not keys:
+                return flushed
+            failed = []
+            for date, user_id in keys:
+                try:
+                    counts = await self.store.get(user_id, date)
+                    if counts:
+                        version = counts.pop(VERSION_FIELD, 0)
+                        await mongo_manager.merge_daily_usage(user_id, date, counts, version)
+                    flushed += 1
+                except Exception as e:
+                    logger.error(f"Failed to flush usage for user {user_id} on {date}: {e}")
+                    failed.append((date, user_id))
+            if failed:
+                # Retried on the next flush rather than in this loop, which would spin while Mongo is down.
+                await self.store.mark_dirty(failed)
+                return flushed
+
+    async def reconcile(self) -> int:
+        """
+        Marks every counter in the store for flushing and flushes. Used at startup, since a process
+        that crashed after taking counters off the dirty set never wrote them back.
+        """
+        await self.store.mark_dirty(await self.store.all_keys())
+        return await self.flush()
+
+    async def _run(self):
+        try:
+            reconciled = await self.reconcile()
+            if reconciled:
+                logger.info(f"Reconciled usage counters for {reconciled} user-days.")
+        except Exception as e:
+            logger.error(f"Usage reconciliation failed: {e}", exc_info=True)
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                flushed = await self.flush()
+                if flushed:
+                    logger.debug(f"Flushed usage counters for {flushed} user-days.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}", exc_info=True)
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        logger.info(f"Usage meter started with the {type(self.store).__name__}, flushing every {self.flush_interval_seconds}s.")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final usage flush failed: {e}", exc_info=True)
+
+usage_meter = UsageMeter()
@@ -1,7 +1,5 @@
 import os
-import chromadb
 import logging
-from chromadb.utils.embedding_functions import GoogleGenerativeAiEmbeddingFunction
 from dotenv import load_dotenv
 
 
@@ -31,6 +29,9 @@ def get_chroma_client():
     """
     global _client
     if _client is None:
+        # chromadb is imported here rather than at module level: it is slow to import, and most
+        # processes that import this module never touch the vector DB.
+        import chromadb
         try:
             logger.info(f"Initializing ChromaDB client for host={CHROMA_HOST}, port={CHROMA_PORT}")
             _client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
@@ -54,6 +55,7 @@ def get_embedding_function():
             raise ValueError("GEMINI_API_KEY is not configured.")
         
         logger.info(f"Initializing Google Generative AI embedding model: {EMBEDDING_MODEL_NAME}")
+        from chromadb.utils.embedding_functions import GoogleGenerativeAiEmbeddingFunction
         try:
             _embedding_function = GoogleGenerativeAiEmbeddingFunction(
                 api_key=GEMINI_API_KEY,
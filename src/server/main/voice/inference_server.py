@@ -0,0 +1,63 @@
+"""
+Optional standalone process that holds the STT/TTS models, so main server workers do not each
+load their own copy. Run it with `python -m main.voice.inference_server` and point the main
+server at it with VOICE_INFERENCE_URL.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from main.config import VOICE_INFERENCE_PORT
+from main.voice.providers import initialize_local_stt, initialize_local_tts
+from main.voice.remote import encode_audio_frame, to_pcm_int16
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+models: Dict[str, Any] = {"stt": None, "tts": None}
+
+class TTSRequest(BaseModel):
+    text: str
+    options: Optional[Dict[str, Any]] = None
+
+@asynccontextmanager
+async def lifespan(app_instance: FastAPI):
+    models["stt"], models["tts"] = await asyncio.gather(
+        asyncio.to_thread(initialize_local_stt), asyncio.to_thread(initialize_local_tts)
+    )
+    logger.info(f"Voice inference ready (stt={'loaded' if models['stt'] else 'unavailable'}, tts={'loaded' if models['tts'] else 'unavailable'}).")
+    yield
+
+app = FastAPI(title="Sentient Voice Inference", lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "stt": models["stt"] is not None, "tts": models["tts"] is not None}
+
+@app.post("/stt")
+async def speech_to_text(request: Request, sample_rate: int):
+    if not models["stt"]:
+        raise HTTPException(status_code=503, detail="STT model is not loaded.")
+    return {"text": await models["stt"].transcribe(await request.body(), sample_rate=sample_rate)}
+
+@app.post("/tts")
+async def text_to_speech(request: TTSRequest):
+    if not models["tts"]:
+        raise HTTPException(status_code=503, detail="TTS model is not loaded.")
+
+    async def frames():
+        async for chunk in models["tts"].stream_tts(request.text, request.options):
+            sample_rate, pcm = to_pcm_int16(chunk)
+            if pcm:
+                yield encode_audio_frame(sample_rate, pcm)
+
+    return StreamingResponse(frames(), media_type="application/octet-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=VOICE_INFERENCE_PORT)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Optional
+
+from main.config import (
+    VOICE_INFERENCE_URL, STT_PROVIDER, TTS_PROVIDER, ELEVENLABS_API_KEY, DEEPGRAM_API_KEY,
+    FASTER_WHISPER_MODEL_SIZE, FASTER_WHISPER_DEVICE, FASTER_WHISPER_COMPUTE_TYPE, ORPHEUS_MODEL_PATH, ORPHEUS_N_GPU_LAYERS
+)
+from main.voice.stt.base import BaseSTT
+from main.voice.tts.base import BaseTTS
+
+logger = logging.getLogger(__name__)
+
+# Loaded at startup in the background, or on the first voice turn when VOICE_MODEL_LOADING is "lazy".
+stt_model_instance: Optional[BaseSTT] = None
+tts_model_instance: Optional[BaseTTS] = None
+
+_load_locks = {}
+_load_attempted = set()
+
+def initialize_stt() -> Optional[BaseSTT]:
+    if VOICE_INFERENCE_URL:
+        from main.voice.remote import RemoteSTT
+        logger.info(f"Using the voice inference process at {VOICE_INFERENCE_URL} for STT.")
+        return RemoteSTT(VOICE_INFERENCE_URL)
+    return initialize_local_stt()
+
+def initialize_tts() -> Optional[BaseTTS]:
+    if VOICE_INFERENCE_URL:
+        from main.voice.remote import RemoteTTS
+        logger.info(f"Using the voice inference process at {VOICE_INFERENCE_URL} for TTS.")
+        return RemoteTTS(VOICE_INFERENCE_URL)
+    return initialize_local_tts()
+
+def initialize_local_stt() -> Optional[BaseSTT]:
+    # Heavy model libraries are imported only for the provider that is selected.
+    logger.info(f"Initializing STT model provider: {STT_PROVIDER}")
+    if STT_PROVIDER == "FASTER_WHISPER":
+        try:
+            from main.voice.stt.faster_whisper import FasterWhisperSTT
+            return FasterWhisperSTT(
+                model_size=FASTER_WHISPER_MODEL_SIZE, device=FASTER_WHISPER_DEVICE,
+                compute_type=FASTER_WHISPER_COMPUTE_TYPE
+            )
+        except Exception as e:
+            logger.error(f"Failed to initialize FasterWhisper STT: {e}", exc_info=True)
+    elif STT_PROVIDER == "ELEVENLABS":
+        if not ELEVENLABS_API_KEY:
+            logger.error("ELEVENLABS_API_KEY not set for STT.")
+        else:
+            from main.voice.stt.elevenlabs import ElevenLabsSTT
+            return ElevenLabsSTT()
+    elif STT_PROVIDER == "DEEPGRAM":
+        if not DEEPGRAM_API_KEY:
+            logger.error("DEEPGRAM_API_KEY not set for STT.")
+        else:
+            from main.voice.stt.deepgram import DeepgramSTT
+            return DeepgramSTT()
+    else:
+        logger.warning(f"Invalid STT_PROVIDER: '{STT_PROVIDER}'. No STT model loaded.")
+    return None
+
+def initialize_local_tts() -> Optional[BaseTTS]:
+    logger.info(f"Initializing TTS model provider: {TTS_PROVIDER}")
+    if TTS_PROVIDER == "ORPHEUS":
+        try:
+            from main.voice.tts.orpheus import OrpheusTTS
+            return OrpheusTTS(model_path=ORPHEUS_MODEL_PATH, n_gpu_layers=ORPHEUS_N_GPU_LAYERS)
+        except Exception as e:
+            logger.error(f"Failed to initialize OrpheusTTS: {e}", exc_info=True)
+    elif TTS_PROVIDER == "ELEVENLABS":
+        if not ELEVENLABS_API_KEY:
+            logger.error("ELEVENLABS_API_KEY not set for TTS.")
+        else:
+            from main.voice.tts.elevenlabs import ElevenLabsTTS
+            return ElevenLabsTTS()
+    else:
+        logger.warning(f"Invalid TTS_PROVIDER: '{TTS_PROVIDER}'. No TTS model loaded.")
+    return None
+
+async def _load(kind: str, initialize):
+    global stt_model_instance, tts_model_instance
+    lock = _load_locks.setdefault(kind, asyncio.Lock())
+    async with lock:
+        # A failed load is not retried on every voice turn; it needs a configuration fix and a restart.
+        if kind not in _load_attempted:
+            _load_attempted.add(kind)
+            # Model construction reads weights from disk for seconds, so it stays off the event loop.
+            instance = await asyncio.to_thread(initialize)
+            if kind == "stt":
+                stt_model_instance = instance
+            else:
+                tts_model_instance = instance
+    return stt_model_instance if kind == "stt" else tts_model_instance
+
+async def load_stt() -> Optional[BaseSTT]:
+    return await _load("stt", initialize_stt)
+
+async def load_tts() -> Optional[BaseTTS]:
+    return await _load("tts", initialize_tts)
+
+async def get_stt_model() -> Optional[BaseSTT]:
+    return stt_model_instance or await load_stt()
+
+async def get_tts_model() -> Optional[BaseTTS]:
+    return tts_model_instance or await load_tts()
@@ -0,0 +1,68 @@
+import logging
+import struct
+from typing import AsyncGenerator, Optional, Tuple, Union
+
+import httpx
+import numpy as np
+
+from .stt.base import BaseSTT
+from .tts.base import BaseTTS, TTSOptionsBase
+
+logger = logging.getLogger(__name__)
+
+# Each synthesized chunk is framed as sample rate and byte length (two big-endian uint32),
+# followed by mono int16 PCM.
+FRAME_HEADER = struct.Struct(">II")
+
+def encode_audio_frame(sample_rate: int, pcm_int16: bytes) -> bytes:
+    return FRAME_HEADER.pack(sample_rate, len(pcm_int16)) + pcm_int16
+
+def to_pcm_int16(chunk: Union[bytes, Tuple[int, np.ndarray]], default_sample_rate: int = 16000) -> Tuple[int, bytes]:
+    """Normalises a TTS chunk (raw 16-bit PCM bytes, or a (sample_rate, array) tuple) to (sample_rate, int16 bytes)."""
+    if isinstance(chunk, bytes):
+        return default_sample_rate, chunk
+    sample_rate, audio = chunk
+    audio = np.asarray(audio).reshape(-1)
+    if audio.dtype != np.int16:
+        audio = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    return sample_rate, audio.tobytes()
+
+class _RemoteClient:
+    def __init__(self, base_url: str, timeout: float = 60):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+class RemoteSTT(_RemoteClient, BaseSTT):
+    """Transcribes through the voice inference process (main/voice/inference_server.py)."""
+
+    async def transcribe(self, audio_bytes: bytes, sample_rate: int) -> str:
+        response = await self._http().post(
+            "/stt", content=audio_bytes, params={"sample_rate": sample_rate},
+            headers={"Content-Type": "application/octet-stream"}
+        )
+        response.raise_for_status()
+        return response.json().get("text", "")
+
+class RemoteTTS(_RemoteClient, BaseTTS):
+    """Streams synthesized audio from the voice inference process as (sample_rate, int16 array) chunks."""
+
+    async def stream_tts(self, text: str, options: TTSOptionsBase = None) -> AsyncGenerator[Tuple[int, np.ndarray], None]:
+        async with self._http().stream("POST", "/tts", json={"text": text, "options": dict(options or {})}) as response:
+            response.raise_for_status()
+            buffer = b""
+            async for data in response.aiter_bytes():
+                buffer += data
+                while len(buffer) >= FRAME_HEADER.size:
+                    sample_rate, length = FRAME_HEADER.unpack_from(buffer)
+                    if len(buffer) < FRAME_HEADER.size + length:
+                        break
+                    pcm = buffer[FRAME_HEADER.size:FRAME_HEADER.size + length]
+                    buffer = buffer[FRAME_HEADER.size + length:]
+                    if pcm:
+                        yield sample_rate, np.frombuffer(pcm, dtype=np.int16)
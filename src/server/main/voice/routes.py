@@ -2,8 +2,6 @@ import asyncio
 import json
 import logging
 from pydantic import BaseModel
-import uuid
-import time
 from typing import AsyncGenerator, Dict, Any, Tuple
 import re
 import numpy as np
@@ -15,14 +13,17 @@ from fastrtc.utils import audio_to_float32, get_current_context
 from main.auth.utils import AuthHelper
 from main.dependencies import mongo_manager, auth_helper
 from main.chat.utils import process_voice_command
-from main.config import ENVIRONMENT, HF_TOKEN
+from main.config import ENVIRONMENT, HF_TOKEN, RTC_TOKEN_TTL_SECONDS
 from main.plans import PLAN_LIMITS
+from main.voice.providers import get_stt_model, get_tts_model
+from main.usage import usage_meter
+from main.voice.tokens import create_rtc_token_store
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/voice", tags=["Voice"])
 
-rtc_token_cache: Dict[str, Dict] = {}
-TOKEN_EXPIRATION_SECONDS = 600
+# Shared by every server process: the token may be issued by one worker and used on another.
+rtc_token_store = create_rtc_token_store(RTC_TOKEN_TTL_SECONDS)
 
 # Define the Pydantic model for voice usage request
 class VoiceUsageRequest(BaseModel):
@@ -39,9 +40,8 @@ async def initiate_voice_session(
     user_id, plan = user_id_and_plan
 
     # --- Check Usage Limit ---
-    usage = await mongo_manager.get_or_create_daily_usage(user_id)
     limit_seconds = PLAN_LIMITS[plan].get("voice_chat_daily_seconds", 0)
-    used_seconds = usage.get("voice_chat_seconds", 0)
+    used_seconds = await usage_meter.get_usage(user_id, "voice_chat_seconds")
 
     if used_seconds >= limit_seconds:
         raise HTTPException(
@@ -50,16 +50,8 @@ async def initiate_voice_session(
         )
     # --- End Limit Check ---
 
-    # Clean up expired tokens to prevent the cache from growing indefinitely
-    now = time.time()
-    expired_tokens = [token for token, data in rtc_token_cache.items() if data["expires_at"] < now]
-    for token in expired_tokens:
-        del rtc_token_cache[token]
-
-    # Generate a new token
-    rtc_token = str(uuid.uuid4())
-    expires_at = now + TOKEN_EXPIRATION_SECONDS
-    rtc_token_cache[rtc_token] = {"user_id": user_id, "expires_at": expires_at}
+    # Single-use; expires after RTC_TOKEN_TTL_SECONDS if the stream never opens
+    rtc_token = await rtc_token_store.issue(user_id)
     
     if ENVIRONMENT in ["dev-local", "selfhost"]:
         logger.info(f"Initiated voice session for user {user_id} in dev-local mode with token {rtc_token}")
@@ -97,6 +89,9 @@ class MyVoiceChatHandler(ReplyOnPause):
             ),
             can_interrupt=False, # Set to False to prevent user interruption while bot is speaking
         )
+        # The stream this handler has authenticated; its token is spent after the first turn.
+        self.authenticated_webrtc_id = None
+        self.user_id = None
 
     def copy(self):
         """Creates a new instance of the handler for each new connection."""
@@ -107,25 +102,26 @@ class MyVoiceChatHandler(ReplyOnPause):
         Main callback for FastRTC. Handles STT, LLM, and TTS streaming.
         This function is a generator, yielding audio chunks back to the client.
         """
-        from main.app import stt_model_instance, tts_model_instance
-
         context = get_current_context()
         webrtc_id = context.webrtc_id
 
-        # Authenticate the stream using the webrtc_id as the RTC token
-        rtc_token = webrtc_id
-        token_info = rtc_token_cache.get(rtc_token, None)
-
-        if not token_info or time.time() > token_info["expires_at"]:
-            logger.error(f"Invalid or expired RTC token received: {rtc_token}. Terminating stream.")
-            await self.send_message(json.dumps({"type": "error", "message": "Authentication failed. Please refresh."}))
-            return
-
-        user_id = token_info["user_id"]
-        logger.info(f"WebRTC stream authenticated for user {user_id} via token {rtc_token}")
+        # Authenticate the stream using the webrtc_id as the RTC token. It is redeemed on the
+        # first turn; later turns of the same connection reuse the user it resolved to.
+        if self.authenticated_webrtc_id != webrtc_id:
+            rtc_token = webrtc_id
+            user_id = await rtc_token_store.redeem(rtc_token)
+            if not user_id:
+                logger.error(f"Invalid, expired or already used RTC token received: {rtc_token}. Terminating stream.")
+                await self.send_message(json.dumps({"type": "error", "message": "Authentication failed. Please refresh."}))
+                return
+            self.authenticated_webrtc_id, self.user_id = webrtc_id, user_id
+            logger.info(f"WebRTC stream authenticated for user {user_id} via token {rtc_token}")
+        user_id = self.user_id
 
         try:
             # 1. Speech-to-Text (STT)
+            # Loads the model on the first voice turn when it was not loaded at startup.
+            stt_model_instance = await get_stt_model()
             if not stt_model_instance:
                 raise Exception("STT model is not initialized.")
             
@@ -162,6 +158,7 @@ class MyVoiceChatHandler(ReplyOnPause):
             await self.send_message(json.dumps({"type": "llm_result", "text": full_response_buffer, "messageId": assistant_message_id}))
 
             # 3. Text-to-Speech (TTS) per sentence
+            tts_model_instance = await get_tts_model()
             if not tts_model_instance:
                 raise Exception("TTS model is not initialized.")
             if not full_response_buffer:
@@ -234,8 +231,8 @@ else:
 
 @router.post("/end", summary="End voice chat session")
 async def end_voice_session(rtc_token: str):
-    if rtc_token in rtc_token_cache:
-        del rtc_token_cache[rtc_token]
+    # Revokes a token whose stream has not started yet; a redeemed token is already spent.
+    if await rtc_token_store.revoke(rtc_token):
         return {"status": "terminated"}
     return {"status": "not_found"}
 
@@ -247,5 +244,5 @@ async def update_voice_usage(
     if request.duration_seconds < 0:
         raise HTTPException(status_code=400, detail="Invalid duration.")
     
-    await mongo_manager.increment_daily_usage(user_id, "voice_chat_seconds", request.duration_seconds)
+    await usage_meter.increment(user_id, "voice_chat_seconds", request.duration_seconds)
     return {"message": "Usage updated successfully."}
\ No newline at end of file
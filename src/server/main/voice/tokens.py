@@ -0,0 +1,38 @@
+import uuid
+from typing import Optional
+
+from main.shared_state import create_shared_store
+
+class RTCTokenStore:
+    """
+    Short-lived, single-use tokens that authenticate a voice stream. A token is issued by
+    /voice/initiate and redeemed when the stream's first audio arrives; redemption removes it
+    atomically, so a token cannot open two streams even when they land on different workers.
+    Unredeemed tokens expire after `ttl_seconds`.
+    """
+
+    def __init__(self, store, ttl_seconds: float = 600):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    async def issue(self, user_id: str) -> str:
+        token = str(uuid.uuid4())
+        await self.store.set(token, {"user_id": user_id}, ttl_seconds=self.ttl_seconds)
+        return token
+
+    async def redeem(self, token: str) -> Optional[str]:
+        """Returns the user the token was issued to and invalidates it, or None if it is unknown, expired or used."""
+        token_info = await self.store.pop(token)
+        return token_info["user_id"] if token_info else None
+
+    async def revoke(self, token: str) -> bool:
+        return await self.store.delete(token)
+
+    async def start(self):
+        await self.store.start()
+
+    async def stop(self):
+        await self.store.stop()
+
+def create_rtc_token_store(ttl_seconds: float) -> RTCTokenStore:
+    return RTCTokenStore(create_shared_store("rtc_tokens"), ttl_seconds)
@@ -1,97 +1,225 @@
+import asyncio
 import datetime
-import logging 
-from typing import Dict, Any, List
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
 from fastapi import WebSocket, status, WebSocketDisconnect
-from starlette.websockets import WebSocketState 
+from starlette.websockets import WebSocketState
 
-logger = logging.getLogger(__name__) 
+from main.config import (REDIS_URL, WEBSOCKET_BACKPLANE, WEBSOCKET_BACKPLANE_CHANNEL,
+                         WEBSOCKET_MAX_CONNECTIONS_PER_USER, WEBSOCKET_SEND_TIMEOUT_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+BackplaneHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# --- Backplanes ---
+# A backplane carries messages to the other server processes, each of which delivers them to
+# the sockets it holds. The sending process always delivers to its own sockets directly.
+
+class InMemoryBackplane:
+    """For a single server process: there is nobody else to reach."""
+
+    async def start(self, on_message: BackplaneHandler):
+        pass
+
+    async def publish(self, envelope: Dict[str, Any]):
+        pass
+
+    async def stop(self):
+        pass
+
+class RedisBackplane:
+    """Fans messages out to every server process through a Redis pub/sub channel."""
+
+    def __init__(self, url: Optional[str] = None, channel: str = WEBSOCKET_BACKPLANE_CHANNEL, client=None):
+        self.url = url
+        self.channel = channel
+        self.instance_id = uuid.uuid4().hex
+        self._client = client
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis.from_url(self.url)
+        return self._client
+
+    async def start(self, on_message: BackplaneHandler):
+        self._pubsub = self._get_client().pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(on_message))
+        logger.info(f"WebSocket backplane subscribed to Redis channel '{self.channel}' as {self.instance_id}.")
+
+    async def _listen(self, on_message: BackplaneHandler):
+        while True:
+            try:
+                async for raw in self._pubsub.listen():
+                    if raw.get("type") != "message":
+                        continue
+                    envelope = json.loads(raw["data"])
+                    # This process already delivered its own messages.
+                    if envelope.get("origin") == self.instance_id:
+                        continue
+                    await on_message(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket backplane listener error, resubscribing: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, envelope: Dict[str, Any]):
+        try:
+            data = json.dumps({**envelope, "origin": self.instance_id}, default=str)
+            await self._get_client().publish(self.channel, data)
+        except Exception as e:
+            logger.error(f"Failed to publish WebSocket message to the backplane: {e}")
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel)
+                # redis-py renamed close() to aclose() in 5.0.1.
+                close = getattr(self._pubsub, "aclose", None) or self._pubsub.close
+                await close()
+            except Exception as e:
+                logger.warning(f"Error closing WebSocket backplane subscription: {e}")
+            self._pubsub = None
+
+def create_backplane():
+    if WEBSOCKET_BACKPLANE == "redis":
+        if not REDIS_URL:
+            raise ValueError("WEBSOCKET_BACKPLANE is 'redis' but neither REDIS_URL nor CELERY_BROKER_URL is set.")
+        return RedisBackplane(REDIS_URL)
+    return InMemoryBackplane()
+
+# --- Manager ---
 
 class MainWebSocketManager:
-    def __init__(self):
-        self.voice_connections: Dict[str, WebSocket] = {}
-        self.notification_connections: Dict[str, WebSocket] = {}
-        logger.info(f"[{datetime.datetime.now()}] [MainServer_WebSocketManager] Initialized.")
+    def __init__(self, backplane=None, send_timeout_seconds: float = WEBSOCKET_SEND_TIMEOUT_SECONDS,
+                 max_connections_per_user: int = WEBSOCKET_MAX_CONNECTIONS_PER_USER):
+        self.backplane = backplane if backplane is not None else create_backplane()
+        self.send_timeout_seconds = send_timeout_seconds
+        # user_id -> sockets in connection order (a dict used as an ordered set).
+        self.voice_connections: Dict[str, Dict[WebSocket, None]] = {}
+        self.notification_connections: Dict[str, Dict[WebSocket, None]] = {}
+        # A voice session holds the microphone, so a new one replaces the old.
+        self.max_connections = {"notifications": max_connections_per_user, "voice": 1}
+        # socket -> (user_id, connection_type), so a disconnect needs no scan.
+        self._socket_owners: Dict[WebSocket, Tuple[str, str]] = {}
+        logger.info(f"[{datetime.datetime.now()}] [MainServer_WebSocketManager] Initialized with {type(self.backplane).__name__}.")
+
+    async def start(self):
+        await self.backplane.start(self._on_backplane_message)
+
+    async def stop(self):
+        await self.backplane.stop()
+
+    def _connections(self, connection_type: str) -> Dict[str, Dict[WebSocket, None]]:
+        return self.notification_connections if connection_type == "notifications" else self.voice_connections
+
+    def connection_count(self, connection_type: str) -> int:
+        return sum(len(sockets) for sockets in self._connections(connection_type).values())
+
+    async def _connect(self, websocket: WebSocket, user_id: str, connection_type: str):
+        sockets = self._connections(connection_type).setdefault(user_id, {})
+        while len(sockets) >= self.max_connections[connection_type]:
+            oldest = next(iter(sockets))
+            self._remove(oldest)
+            if oldest.client_state == WebSocketState.CONNECTED:
+                try:
+                    await oldest.close(code=status.WS_1000_NORMAL_CLOSURE, reason=f"New {connection_type} connection by same user.")
+                    logger.info(f"[{datetime.datetime.now()}] [WS_MGR] Closed oldest {connection_type} WebSocket for user: {user_id}")
+                except Exception as e:
+                    logger.error(f"[{datetime.datetime.now()}] [WS_MGR_ERROR] Closing old {connection_type} WS for {user_id}: {e}")
+            sockets = self._connections(connection_type).setdefault(user_id, {})
+
+        sockets[websocket] = None
+        self._socket_owners[websocket] = (user_id, connection_type)
+        logger.info(f"[{datetime.datetime.now()}] [WS_MGR] {connection_type} WebSocket connected for user: {user_id} ({len(sockets)} for this user). Total {connection_type} connections: {self.connection_count(connection_type)}")
+
+    def _remove(self, websocket: WebSocket) -> Optional[str]:
+        owner = self._socket_owners.pop(websocket, None)
+        if owner is None:
+            return None
+        user_id, connection_type = owner
+        connections = self._connections(connection_type)
+        sockets = connections.get(user_id)
+        if sockets is not None:
+            sockets.pop(websocket, None)
+            if not sockets:
+                del connections[user_id]
+        return user_id
 
     async def connect_voice(self, websocket: WebSocket, user_id: str):
-        if user_id in self.voice_connections:
-            old_ws = self.voice_connections.pop(user_id, None)
-            if old_ws and old_ws.client_state == WebSocketState.CONNECTED:
-                try: 
-                    await old_ws.close(code=status.WS_1000_NORMAL_CLOSURE, reason="New voice connection by same user.")
-                    logger.info(f"[{datetime.datetime.now()}] [WS_VOICE_MGR] Closed old voice WebSocket for user: {user_id}")
-                except Exception as e: 
-                    logger.error(f"[{datetime.datetime.now()}] [WS_VOICE_MGR_ERROR] Closing old voice WS for {user_id}: {e}")
-        
-        self.voice_connections[user_id] = websocket
-        logger.info(f"[{datetime.datetime.now()}] [WS_VOICE_MGR] Voice WebSocket connected for user: {user_id}. Total voice connections: {len(self.voice_connections)}")
+        await self._connect(websocket, user_id, "voice")
 
     async def disconnect_voice(self, websocket: WebSocket):
-        uid_to_remove = None
-        for uid, ws in self.voice_connections.items():
-            if ws == websocket:
-                uid_to_remove = uid
-                break
-        
-        if uid_to_remove and uid_to_remove in self.voice_connections:
-            del self.voice_connections[uid_to_remove]
-            logger.info(f"[{datetime.datetime.now()}] [WS_VOICE_MGR] Voice WebSocket disconnected for user: {uid_to_remove}. Total voice connections: {len(self.voice_connections)}")
+        user_id = self._remove(websocket)
+        if user_id:
+            logger.info(f"[{datetime.datetime.now()}] [WS_VOICE_MGR] Voice WebSocket disconnected for user: {user_id}. Total voice connections: {self.connection_count('voice')}")
 
     async def connect_notifications(self, websocket: WebSocket, user_id: str):
-        if user_id in self.notification_connections:
-            old_ws = self.notification_connections.pop(user_id, None)
-            if old_ws and old_ws.client_state == WebSocketState.CONNECTED:
-                try: 
-                    await old_ws.close(code=status.WS_1000_NORMAL_CLOSURE, reason="New notification connection by same user.")
-                    logger.info(f"[{datetime.datetime.now()}] [WS_NOTIF_MGR] Closed old notification WebSocket for user: {user_id}")
-                except Exception as e: 
-                    logger.error(f"[{datetime.datetime.now()}] [WS_NOTIF_MGR_ERROR] Closing old notif WS for {user_id}: {e}")
-
-        self.notification_connections[user_id] = websocket
-        logger.info(f"[{datetime.datetime.now()}] [WS_NOTIF_MGR] Notification WebSocket connected for user: {user_id}. Total notification connections: {len(self.notification_connections)}")
+        await self._connect(websocket, user_id, "notifications")
 
     async def disconnect_notifications(self, websocket: WebSocket):
-        uid_to_remove = None
-        for uid, ws in self.notification_connections.items():
-            if ws == websocket:
-                uid_to_remove = uid
-                break
-        
-        if uid_to_remove and uid_to_remove in self.notification_connections:
-            del self.notification_connections[uid_to_remove]
-            logger.info(f"[{datetime.datetime.now()}] [WS_NOTIF_MGR] Notification WebSocket disconnected for user: {uid_to_remove}. Total notification connections: {len(self.notification_connections)}")
+        user_id = self._remove(websocket)
+        if user_id:
+            logger.info(f"[{datetime.datetime.now()}] [WS_NOTIF_MGR] Notification WebSocket disconnected for user: {user_id}. Total notification connections: {self.connection_count('notifications')}")
+
+    async def _send(self, websocket: WebSocket, message_data: Dict[str, Any]):
+        owner = self._socket_owners.get(websocket, ("unknown", "unknown"))
+        if websocket.client_state != WebSocketState.CONNECTED:
+            logger.warning(f"Attempted to send to user {owner[0]} ({owner[1]}) but WebSocket state is {websocket.client_state}. Cleaning up.")
+            self._remove(websocket)
+            return
+        try:
+            await asyncio.wait_for(websocket.send_json(message_data), timeout=self.send_timeout_seconds)
+        except (WebSocketDisconnect, RuntimeError, asyncio.TimeoutError) as e:
+            # A socket that timed out may hold a half-written frame, so it is dropped as well.
+            logger.warning(f"Failed to send to {owner[0]} ({owner[1]}), disconnecting. Error: {e!r}")
+            self._remove(websocket)
+        except Exception as e:
+            # Anything else is contained to this socket, so one bad connection cannot fail a broadcast.
+            logger.error(f"Unexpected error sending to {owner[0]} ({owner[1]}), disconnecting: {e!r}", exc_info=True)
+            self._remove(websocket)
+
+    async def _send_all(self, sockets: Iterable[WebSocket], message_data: Dict[str, Any]):
+        await asyncio.gather(*(self._send(websocket, message_data) for websocket in list(sockets)))
+
+    async def _deliver_local(self, envelope: Dict[str, Any]):
+        if envelope["kind"] == "broadcast":
+            sockets = [ws for user_sockets in self.notification_connections.values() for ws in user_sockets]
+        else:
+            sockets = self._connections(envelope["connection_type"]).get(envelope["user_id"], {})
+        await self._send_all(sockets, envelope["message"])
+
+    async def _on_backplane_message(self, envelope: Dict[str, Any]):
+        try:
+            await self._deliver_local(envelope)
+        except Exception as e:
+            logger.error(f"Failed to deliver backplane message: {e}", exc_info=True)
 
     async def send_personal_json_message(self, message_data: Dict[str, Any], user_id: str, connection_type: str = "notifications"):
-        connections_dict = self.notification_connections if connection_type == "notifications" else self.voice_connections
-        websocket = connections_dict.get(user_id)
-        
-        if websocket and websocket.client_state == WebSocketState.CONNECTED:
-            try:
-                await websocket.send_json(message_data)
-            except (WebSocketDisconnect, RuntimeError) as e:
-                logger.warning(f"Failed to send to {user_id} ({connection_type}), disconnecting. Error: {e}")
-                await self.disconnect_by_type(websocket, connection_type)
-        elif websocket:
-            logger.warning(f"Attempted to send to user {user_id} ({connection_type}) but WebSocket state is {websocket.client_state}. Cleaning up.")
-            await self.disconnect_by_type(websocket, connection_type)
+        """Sends to every connection the user has, in this process and, through the backplane, in the others."""
+        envelope = {"kind": "user", "user_id": user_id, "connection_type": connection_type, "message": message_data}
+        await asyncio.gather(self._deliver_local(envelope), self.backplane.publish(envelope))
 
     async def broadcast_json_to_all_notifications(self, message_data: Dict[str, Any]):
-        sockets_to_remove: List[WebSocket] = []
-        
-        for user_id, websocket in list(self.notification_connections.items()): 
-            if websocket.client_state == WebSocketState.CONNECTED:
-                try:
-                    await websocket.send_json(message_data)
-                except (WebSocketDisconnect, RuntimeError) as e:
-                    logger.warning(f"Failed to broadcast to {user_id}, disconnecting. Error: {e}")
-                    sockets_to_remove.append(websocket)
-            else:
-                sockets_to_remove.append(websocket)
-
-        for ws_to_remove in sockets_to_remove:
-            await self.disconnect_notifications(ws_to_remove)
+        envelope = {"kind": "broadcast", "message": message_data}
+        await asyncio.gather(self._deliver_local(envelope), self.backplane.publish(envelope))
 
     async def disconnect_by_type(self, websocket: WebSocket, connection_type: str):
         if connection_type == "notifications":
             await self.disconnect_notifications(websocket)
         else:
-            await self.disconnect_voice(websocket)
\ No newline at end of file
+            await self.disconnect_voice(websocket)
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from main.config import (REDIS_URL, WORKER_EVENTS_ENABLED, WORKER_EVENT_CLAIM_IDLE_SECONDS, WORKER_EVENT_CONSUMER_GROUP,
+                         WORKER_EVENT_MAX_ATTEMPTS, WORKER_EVENT_STREAM)
+from main.dependencies import websocket_manager
+from main.notifications.utils import create_and_push_notification
+from workers.utils.events import EVENT_NOTIFICATION, EVENT_TASK_LIST_UPDATED, EVENT_TASK_PROGRESS
+
+logger = logging.getLogger(__name__)
+
+# --- Client pushes shared by the event consumer and the internal HTTP endpoints ---
+
+async def push_task_progress_updates(user_id: str, task_id: str, run_id: str, updates: List[Dict[str, Any]]):
+    """Forwards progress updates to the client in order, one message per update."""
+    for update in updates:
+        await websocket_manager.send_personal_json_message(
+            {
+                "type": "task_progress_update",
+                "payload": {
+                    "task_id": task_id,
+                    "run_id": run_id,
+                    "update": {
+                        "message": update.get("message"),
+                        "timestamp": update.get("timestamp") or datetime.now(timezone.utc).isoformat()
+                    }
+                }
+            },
+            user_id,
+            connection_type="notifications"
+        )
+
+async def push_task_list_updated(user_id: str):
+    await websocket_manager.send_personal_json_message({"type": "task_list_updated"}, user_id, connection_type="notifications")
+
+async def handle_worker_event(event_type: str, user_id: str, data: Dict[str, Any]):
+    if event_type == EVENT_NOTIFICATION:
+        await create_and_push_notification(
+            user_id, data["message"], data.get("task_id"), data.get("notification_type") or "general", data.get("payload"),
+            raise_on_save_error=True
+        )
+    elif event_type == EVENT_TASK_PROGRESS:
+        await push_task_progress_updates(user_id, data["task_id"], data["run_id"], data.get("updates", []))
+    elif event_type == EVENT_TASK_LIST_UPDATED:
+        await push_task_list_updated(user_id)
+    else:
+        logger.warning(f"Ignoring worker event of unknown type '{event_type}' for user {user_id}.")
+
+# --- Stream consumer ---
+
+class WorkerEventConsumer:
+    """
+    Reads worker events from a Redis stream through a consumer group. An event is acknowledged
+    only after it has been handled, so delivery is at-least-once: entries left pending by a
+    failed attempt or a crashed process are claimed again once idle for `claim_idle_seconds`.
+    The group keeps the stream position, so a restarted server resumes where it left off.
+    """
+
+    def __init__(self, client=None, url: Optional[str] = REDIS_URL, stream: str = WORKER_EVENT_STREAM,
+                 group: str = WORKER_EVENT_CONSUMER_GROUP, consumer: Optional[str] = None,
+                 claim_idle_seconds: float = WORKER_EVENT_CLAIM_IDLE_SECONDS, max_attempts: int = WORKER_EVENT_MAX_ATTEMPTS,
+                 batch_size: int = 100, block_ms: int = 5000):
+        self.url = url
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or os.getenv("WORKER_EVENT_CONSUMER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_seconds = claim_idle_seconds
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self._client = client
+        self._attempts: Dict[str, int] = {}
+        self._last_claim = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+            self._client = aioredis.Redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    async def _ensure_group(self):
+        from redis.exceptions import ResponseError
+        try:
+            # Starting from "0" means events published before the group existed are not lost.
+            await self._get_client().xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _handle(self, entry_id: str, fields: Dict[str, str]):
+        try:
+            await handle_worker_event(fields.get("type"), fields.get("user_id"), json.loads(fields.get("data") or "{}"))
+        except Exception as e:
+            attempts = self._attempts[entry_id] = self._attempts.get(entry_id, 0) + 1
+            if attempts < self.max_attempts:
+                logger.warning(f"Worker event {entry_id} ({fields.get('type')}) failed on attempt {attempts}, will retry: {e}")
+                return
+            logger.error(f"Dropping worker event {entry_id} ({fields.get('type')}) after {attempts} attempts: {e}", exc_info=True)
+        self._attempts.pop(entry_id, None)
+        await self._get_client().xack(self.stream, self.group, entry_id)
+
+    async def _claim_stale(self):
+        if time.monotonic() - self._last_claim < self.claim_idle_seconds / 2:
+            return
+        self._last_claim = time.monotonic()
+        response = await self._get_client().xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=int(self.claim_idle_seconds * 1000), start_id="0-0", count=self.batch_size
+        )
+        for entry_id, fields in response[1]:
+            if fields:  # Entries trimmed from the stream come back empty.
+                await self._handle(entry_id, fields)
+            else:
+                await self._get_client().xack(self.stream, self.group, entry_id)
+
+    async def process_batch(self, start_id: str = ">") -> List[str]:
+        """Reads and handles one batch. ">" reads new events; an ID re-reads this consumer's own pending events after it."""
+        response = await self._get_client().xreadgroup(
+            self.group, self.consumer, {self.stream: start_id}, count=self.batch_size, block=self.block_ms if start_id == ">" else None
+        )
+        entries = response[0][1] if response else []
+        for entry_id, fields in entries:
+            await self._handle(entry_id, fields)
+        return [entry_id for entry_id, _ in entries]
+
+    async def _run(self):
+        # First whatever this consumer read but never acknowledged before a restart, then new events.
+        pending_from: Optional[str] = "0"
+        while True:
+            try:
+                await self._claim_stale()
+                if pending_from is not None:
+                    entry_ids = await self.process_batch(pending_from)
+                    pending_from = entry_ids[-1] if entry_ids else None
+                else:
+                    await self.process_batch(">")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Worker event consumer error: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def start(self):
+        await self._ensure_group()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        logger.info(f"Consuming worker events from '{self.stream}' as '{self.consumer}' in group '{self.group}'.")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+worker_event_consumer: Optional[WorkerEventConsumer] = WorkerEventConsumer() if WORKER_EVENTS_ENABLED and REDIS_URL else None
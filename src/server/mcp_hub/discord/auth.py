@@ -1,15 +1,13 @@
 import os
 import json
-import base64
-from typing import Dict, Optional
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import padding
-from cryptography.hazmat.backends import default_backend
+from typing import Dict
 import motor.motor_asyncio
 from fastmcp import Context
 from fastmcp.exceptions import ToolError
 from dotenv import load_dotenv
 
+from main.encryption import aes_decrypt
+
 # Load .env file for 'dev-local' environment.
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'dev-local')
 if ENVIRONMENT == 'dev-local':
@@ -19,25 +17,8 @@ if ENVIRONMENT == 'dev-local':
 
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
-AES_SECRET_KEY_HEX = os.getenv("AES_SECRET_KEY")
-AES_IV_HEX = os.getenv("AES_IV")
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
-AES_SECRET_KEY: Optional[bytes] = bytes.fromhex(AES_SECRET_KEY_HEX) if AES_SECRET_KEY_HEX and len(AES_SECRET_KEY_HEX) == 64 else None
-AES_IV: Optional[bytes] = bytes.fromhex(AES_IV_HEX) if AES_IV_HEX and len(AES_IV_HEX) == 32 else None
-
-def aes_decrypt(encrypted_data: str) -> str:
-    if not AES_SECRET_KEY or not AES_IV:
-        raise ValueError("AES encryption keys are not configured.")
-    backend = default_backend()
-    cipher = Cipher(algorithms.AES(AES_SECRET_KEY), modes.CBC(AES_IV), backend=backend)
-    decryptor = cipher.decryptor()
-    encrypted_bytes = base64.b64decode(encrypted_data)
-    decrypted = decryptor.update(encrypted_bytes) + decryptor.finalize()
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    unpadded_data = unpadder.update(decrypted) + unpadder.finalize()
-    return unpadded_data.decode()
-
 client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
 db = client[MONGO_DB_NAME]
 users_collection = db["user_profiles"]
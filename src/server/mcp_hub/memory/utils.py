@@ -125,28 +125,32 @@ def _get_normalized_embedding(text: str, task_type: str) -> np.ndarray:
     normalized_embedding = embedding_np / norm
     return normalized_embedding
 
-async def search_memory(user_id: str, query: str) -> str: # noqa: E501
-    """Searches memory by performing a semantic search, filtering for relevance, and summarizing results."""
-    logger.info(f"Executing search_memory for user_id='{user_id}' with query: '{query}'")
+async def search_memory_facts(user_id: str, query: str, limit: int = 5) -> List[str]:
+    """
+    Returns the raw facts closest to the query by vector similarity, without the LLM
+    relevance check and summarization that `search_memory` performs.
+    """
     pool = await db.get_db_pool()
     async with pool.acquire() as conn:
         await register_vector(conn)
-        
-        logger.info("Step 1/4: Performing semantic search in database.")
         query_embedding = _get_normalized_embedding(query, task_type="RETRIEVAL_QUERY")
-        
         records = await conn.fetch(
             """
             SELECT DISTINCT f.id, f.content, 1 - (f.embedding <=> $2) AS similarity
             FROM facts f
             WHERE f.user_id = $1
             ORDER BY similarity DESC
-            LIMIT 5;
-            """, user_id, query_embedding
+            LIMIT $3;
+            """, user_id, query_embedding, limit
         )
-    
-        found_facts = [r['content'] for r in records]
-        logger.info(f"Found {len(found_facts)} potentially relevant facts from vector search.")
+    return [r['content'] for r in records]
+
+async def search_memory(user_id: str, query: str) -> str: # noqa: E501
+    """Searches memory by performing a semantic search, filtering for relevance, and summarizing results."""
+    logger.info(f"Executing search_memory for user_id='{user_id}' with query: '{query}'")
+    logger.info("Step 1/4: Performing semantic search in database.")
+    found_facts = await search_memory_facts(user_id, query, limit=5)
+    logger.info(f"Found {len(found_facts)} potentially relevant facts from vector search.")
 
     if not found_facts:
         logger.info("No facts found from vector search. Returning.")
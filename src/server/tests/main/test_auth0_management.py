@@ -0,0 +1,68 @@
+import asyncio
+import json
+import httpx
+import pytest
+
+from main.auth.management import Auth0ManagementClient
+
+class FakeAuth0:
+    """A minimal stand-in for the tenant: a token endpoint and the users endpoints."""
+
+    def __init__(self, rate_limited_requests: int = 0):
+        self.token_requests = 0
+        self.rate_limited_requests = rate_limited_requests
+        self.requests = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/oauth/token":
+            self.token_requests += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"access_token": f"token-{self.token_requests}", "expires_in": 86400})
+        assert request.headers["authorization"].startswith("Bearer token-")
+        if self.rate_limited_requests:
+            self.rate_limited_requests -= 1
+            return httpx.Response(429, headers={"retry-after": "0"})
+        self.requests.append(request)
+        if request.method == "PATCH":
+            return httpx.Response(200, json={"user_id": request.url.path.rsplit("/", 1)[-1], **json.loads(request.content)})
+        return httpx.Response(200, json=[{"user_id": "auth0|1"}, {"user_id": "auth0|2"}])
+
+def make_client(fake: FakeAuth0) -> Auth0ManagementClient:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handler))
+    return Auth0ManagementClient("tenant.example.com", "id", "secret", base_url="http://fake-auth0", http_client=http_client)
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_token_request():
+    fake = FakeAuth0()
+    client = make_client(fake)
+
+    tokens = await asyncio.gather(*[client.get_token() for _ in range(10)])
+    await client.get_token()
+
+    assert set(tokens) == {"token-1"}
+    assert fake.token_requests == 1
+
+@pytest.mark.asyncio
+async def test_rate_limited_request_is_retried():
+    fake = FakeAuth0(rate_limited_requests=2)
+    client = make_client(fake)
+
+    users = await client.get_users(["auth0|1", "auth0|2"])
+
+    assert set(users) == {"auth0|1", "auth0|2"}
+    assert len(fake.requests) == 1
+
+@pytest.mark.asyncio
+async def test_updates_for_the_same_user_are_merged_into_one_patch():
+    fake = FakeAuth0()
+    client = make_client(fake)
+
+    results = await client.update_users_metadata([
+        {"user_id": "auth0|1", "app_metadata": {"plan": "pro"}},
+        {"user_id": "auth0|1", "user_metadata": {"timezone": "UTC"}},
+        {"user_id": "auth0|2", "app_metadata": {"plan": "free"}},
+    ])
+
+    assert len(fake.requests) == 2
+    assert results["auth0|1"]["app_metadata"] == {"plan": "pro"}
+    assert results["auth0|1"]["user_metadata"] == {"timezone": "UTC"}
@@ -0,0 +1,56 @@
+import time
+import pytest
+from unittest.mock import AsyncMock
+
+from main.auth import utils as auth_utils
+from main.auth.jwks import JWKSManager, VerifiedTokenCache
+
+# --- Test the verified-token cache ---
+
+def test_cached_payload_expires_with_token_and_is_copied():
+    cache = VerifiedTokenCache(max_size=2, max_age_seconds=600)
+    cache.put("token-a", {"sub": "user-a", "exp": time.time() + 60})
+    cache.put("token-expired", {"sub": "user-b", "exp": time.time() - 1})
+
+    payload = cache.get("token-a")
+    payload["plan"] = "pro"
+    assert cache.get("token-a") == {"sub": "user-a", "exp": payload["exp"]}
+    assert cache.get("token-expired") is None
+
+    cache.put("token-c", {"sub": "user-c"})
+    cache.put("token-d", {"sub": "user-d"})
+    assert cache.get("token-a") is None
+
+# --- Test JWKS refresh ---
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refetches_at_most_once_per_interval(mocker):
+    manager = JWKSManager("https://example.test/jwks.json", refresh_interval_seconds=3600, min_refetch_interval_seconds=60)
+    responses = [
+        {"keys": [{"kid": "old", "kty": "RSA", "use": "sig", "n": "n1", "e": "AQAB"}]},
+        {"keys": [{"kid": "new", "kty": "RSA", "use": "sig", "n": "n2", "e": "AQAB"}]},
+    ]
+    client = mocker.patch("main.auth.jwks.httpx.AsyncClient")
+    get = client.return_value.__aenter__.return_value.get = AsyncMock(side_effect=[
+        mocker.MagicMock(json=mocker.MagicMock(return_value=response)) for response in responses
+    ])
+
+    assert (await manager.get_key("old"))["n"] == "n1"
+    # Rotated key: unknown, but the last fetch was too recent to try again.
+    assert await manager.get_key("new") is None
+    manager._last_fetch_attempt -= 61
+    assert (await manager.get_key("new"))["n"] == "n2"
+    assert get.await_count == 2
+
+# --- Test request-scoped memoisation ---
+
+@pytest.mark.asyncio
+async def test_token_is_verified_once_per_request(mocker):
+    helper = auth_utils.AuthHelper()
+    verify = mocker.patch.object(helper, "_verify_token", new_callable=AsyncMock, return_value={"sub": "user-1", "permissions": []})
+
+    await helper.get_current_user_id_plan_and_permissions(token="token-a")
+    payload = await helper.get_decoded_payload_with_claims(token="token-a")
+
+    assert payload["user_id"] == "user-1"
+    verify.assert_awaited_once_with("token-a")
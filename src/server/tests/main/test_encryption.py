@@ -0,0 +1,61 @@
+import copy
+import json
+import pytest
+
+from main import encryption
+from main.encryption import FieldCipher, LazyDecryptedDocument
+
+KEY = bytes(range(32))
+IV = bytes(range(16))
+
+@pytest.fixture
+def cipher(mocker):
+    """Installs a v1-writing cipher as the shared one."""
+    field_cipher = FieldCipher(KEY, IV, write_version="v1")
+    mocker.patch.object(encryption, "_cipher", field_cipher)
+    return field_cipher
+
+# --- Test the ciphertext formats ---
+
+def test_reads_legacy_and_v1_ciphertexts(cipher):
+    legacy = FieldCipher(KEY, IV).encrypt("hello")
+    assert ":" not in legacy and cipher.needs_migration(legacy)
+    assert cipher.decrypt(legacy) == "hello"
+
+    first, second = cipher.encrypt("hello"), cipher.encrypt("hello")
+    assert first.startswith("v1:") and first != second  # fresh nonce per record
+    assert cipher.decrypt(first) == "hello" and not cipher.needs_migration(first)
+
+def test_tampered_v1_ciphertext_is_left_undecrypted(cipher):
+    stored = encryption.encrypt_value({"plan": [1, 2]})
+    tampered = stored[:-4] + ("AAAA" if not stored.endswith("AAAA") else "BBBB")
+    assert encryption.decrypt_value(stored) == {"plan": [1, 2]}
+    assert encryption.decrypt_value(tampered) == tampered
+
+# --- Test lazy decryption ---
+
+def test_lazy_document_decrypts_only_what_is_read(cipher, mocker):
+    doc = {"task_id": "t1", "name": "Plan trip", "runs": [{"status": "done"}]}
+    encryption.encrypt_fields(doc, ["name", "runs"])
+    decrypt = mocker.spy(encryption, "decrypt_value")
+
+    lazy = LazyDecryptedDocument(doc, ["name", "runs"])
+    assert lazy["name"] == "Plan trip"
+    assert decrypt.call_count == 1
+
+    # Serialising or copying the document decrypts the remaining fields.
+    assert json.loads(json.dumps(lazy))["runs"] == [{"status": "done"}]
+    assert copy.deepcopy(lazy) == {"task_id": "t1", "name": "Plan trip", "runs": [{"status": "done"}]}
+    assert decrypt.call_count == 2
+
+def test_lazy_document_does_not_decrypt_values_written_by_update(cipher, mocker):
+    doc = {"task_id": "t1", "name": "Plan trip", "description": "Old"}
+    encryption.encrypt_fields(doc, ["name", "description"])
+    lazy = LazyDecryptedDocument(doc, ["name", "description"])
+    decrypt = mocker.spy(encryption, "decrypt_value")
+
+    lazy.update({"name": "Refined name"})
+    lazy |= {"description": "New"}
+
+    assert lazy["name"] == "Refined name" and lazy["description"] == "New"
+    decrypt.assert_not_called()
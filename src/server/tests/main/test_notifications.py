@@ -0,0 +1,18 @@
+import datetime
+
+from main.db import _notification_cursor, _parse_notification_cursor, _serialize_notification
+
+# --- Test notification cursors ---
+
+def test_cursor_round_trips_a_stored_notification():
+    # Mongo hands back naive UTC datetimes with millisecond precision.
+    stored = {"id": "n-1", "timestamp": datetime.datetime(2025, 3, 1, 12, 30, 5, 123000)}
+
+    timestamp, notification_id = _parse_notification_cursor(_notification_cursor(stored))
+
+    assert notification_id == "n-1"
+    assert timestamp == datetime.datetime(2025, 3, 1, 12, 30, 5, 123000, tzinfo=datetime.timezone.utc)
+
+def test_legacy_string_timestamps_are_serialized_with_utc_offset():
+    notification = _serialize_notification({"id": "n-1", "timestamp": "2025-03-01T12:30:05+00:00"})
+    assert notification["timestamp"] == "2025-03-01T12:30:05+00:00"
@@ -0,0 +1,31 @@
+import asyncio
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from main.shared_state import InMemorySharedStore, RedisSharedStore
+from main.voice.tokens import RTCTokenStore
+
+@pytest.fixture(params=["memory", "redis"])
+def token_store(request):
+    store = InMemorySharedStore() if request.param == "memory" else RedisSharedStore(namespace="rtc", client=FakeRedis(decode_responses=True))
+    return RTCTokenStore(store, ttl_seconds=60)
+
+@pytest.mark.asyncio
+async def test_token_is_redeemed_only_once(token_store):
+    token = await token_store.issue("user-1")
+
+    results = await asyncio.gather(*[token_store.redeem(token) for _ in range(5)])
+
+    assert results.count("user-1") == 1 and results.count(None) == 4
+
+@pytest.mark.asyncio
+async def test_expired_and_revoked_tokens_are_rejected(token_store):
+    token_store.ttl_seconds = 0.01
+    expired = await token_store.issue("user-1")
+    token_store.ttl_seconds = 60
+    revoked = await token_store.issue("user-1")
+    await asyncio.sleep(0.02)
+
+    assert await token_store.revoke(revoked) is True
+    assert await token_store.redeem(expired) is None
+    assert await token_store.redeem(revoked) is None
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from main.shared_state import InMemorySharedStore, RedisSharedStore
+
+def store_factories():
+    client = FakeRedis(decode_responses=True)
+    # Two Redis stores on one server stand in for two worker processes.
+    return [
+        pytest.param((InMemorySharedStore(),) * 2, id="memory"),
+        pytest.param((RedisSharedStore(namespace="t", client=client), RedisSharedStore(namespace="t", client=client)), id="redis"),
+    ]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stores", store_factories())
+async def test_value_set_by_one_worker_is_read_and_taken_once_by_another(stores):
+    issuing, redeeming = stores
+    await issuing.set("token", {"user_id": "user-1"}, ttl_seconds=60)
+
+    assert await redeeming.get("token") == {"user_id": "user-1"}
+    taken = await asyncio.gather(redeeming.pop("token"), issuing.pop("token"))
+    assert sorted(taken, key=bool) == [None, {"user_id": "user-1"}]
+
+@pytest.mark.asyncio
+async def test_memory_store_sweeps_expired_entries_in_the_background():
+    store = InMemorySharedStore(sweep_interval_seconds=0.01)
+    for i in range(100):
+        await store.set(f"abandoned-{i}", i, ttl_seconds=0.01)
+    await store.set("kept", 1)
+    await store.start()
+    await asyncio.sleep(0.05)
+    await store.stop()
+
+    # Nothing read the abandoned entries again; the sweeper alone dropped them.
+    assert len(store) == 1
+    assert await store.get("kept") == 1
+
+@pytest.mark.asyncio
+async def test_overwritten_entry_is_not_dropped_by_its_old_expiry():
+    store = InMemorySharedStore()
+    await store.set("key", "old", ttl_seconds=0.01)
+    await store.set("key", "new", ttl_seconds=60)
+    await asyncio.sleep(0.02)
+
+    assert store.sweep() == 0
+    assert await store.get("key") == "new"
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+
+from main.startup import StartupManager, Subsystem
+
+@pytest.mark.asyncio
+async def test_subsystems_start_in_dependency_order_and_stop_in_reverse():
+    events = []
+    model_loaded = asyncio.Event()
+
+    async def load_model():
+        await model_loaded.wait()
+        events.append("start model")
+
+    manager = StartupManager()
+    manager.register(Subsystem("consumer", start=lambda: events.append("start consumer"), stop=lambda: events.append("stop consumer"),
+                               depends_on=["database"], background=True))
+    manager.register(Subsystem("database", start=lambda: events.append("start database"), stop=lambda: events.append("stop database")))
+    manager.register(Subsystem("model", start=load_model, background=True, critical=False))
+
+    await manager.start()
+    await asyncio.sleep(0)
+    # The optional model is still loading, but the server is already ready.
+    assert manager.is_ready()
+    assert manager.status()["model"]["state"] == "starting"
+
+    model_loaded.set()
+    await asyncio.sleep(0.01)
+    await manager.stop()
+    assert events == ["start database", "start consumer", "start model", "stop consumer", "stop database"]
+
+@pytest.mark.asyncio
+async def test_failed_critical_subsystem_keeps_server_unready_and_skips_dependents():
+    def fail():
+        raise RuntimeError("mongo unreachable")
+
+    manager = StartupManager()
+    manager.register(Subsystem("database", start=fail, background=True))
+    manager.register(Subsystem("consumer", depends_on=["database"], background=True))
+
+    await manager.start()
+    await asyncio.sleep(0.01)
+
+    assert not manager.is_ready()
+    assert manager.status()["database"]["error"] == "mongo unreachable"
+    assert manager.status()["consumer"]["state"] == "skipped"
+    await manager.stop()
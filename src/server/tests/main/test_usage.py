@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from fakeredis.aioredis import FakeRedis
+
+from main import usage
+from main.usage import LocalUsageStore, RedisUsageStore, UsageMeter
+
+@pytest.fixture
+def mongo(mocker):
+    mock = mocker.patch.object(usage, "mongo_manager")
+    mock.get_daily_usage = AsyncMock(return_value={"user_id": "user-1", "date": "2025-01-01", "text_messages": 3})
+    mock.merge_daily_usage = AsyncMock()
+    return mock
+
+# --- Test limit enforcement ---
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store_factory", [LocalUsageStore, lambda: RedisUsageStore(client=FakeRedis(decode_responses=True))])
+async def test_concurrent_requests_cannot_overshoot_the_limit(mongo, store_factory):
+    meter = UsageMeter(store=store_factory())
+
+    results = await asyncio.gather(*[meter.check_and_increment("user-1", "text_messages", 5) for _ in range(10)])
+
+    # Seeded with the 3 messages already recorded in Mongo, so only 2 more fit.
+    assert sum(allowed for allowed, _ in results) == 2
+    assert await meter.get_usage("user-1", "text_messages") == 5
+
+# --- Test flushing ---
+
+@pytest.mark.asyncio
+async def test_reconcile_flushes_counters_left_by_a_crashed_process(mongo):
+    client = FakeRedis(decode_responses=True)
+    crashed = UsageMeter(store=RedisUsageStore(client=client))
+    await crashed.check_and_increment("user-1", "text_messages", 25)
+    # The crashed process took the counter off the dirty set but never wrote it.
+    await crashed.store.pop_dirty(100)
+
+    restarted = UsageMeter(store=RedisUsageStore(client=client))
+    assert await restarted.reconcile() == 1
+
+    user_id, _, counts, _ = mongo.merge_daily_usage.await_args.args
+    assert user_id == "user-1" and counts == {"text_messages": 4}
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store_factory", [LocalUsageStore, lambda: RedisUsageStore(client=FakeRedis(decode_responses=True))])
+async def test_refund_is_flushed_with_a_newer_version(mongo, store_factory):
+    meter = UsageMeter(store=store_factory())
+    await meter.check_and_increment("user-1", "text_messages", 25)
+    await meter.flush()
+    _, _, counts, version = mongo.merge_daily_usage.await_args.args
+    assert counts == {"text_messages": 4}
+
+    await meter.refund("user-1", "text_messages")
+    await meter.flush()
+
+    _, _, counts, refunded_version = mongo.merge_daily_usage.await_args.args
+    assert counts == {"text_messages": 3} and refunded_version > version
+
+# --- Test the Mongo fallback ---
+
+@pytest.mark.asyncio
+async def test_usage_metered_in_mongo_is_added_once_the_store_answers(mongo):
+    mongo.get_or_create_daily_usage = AsyncMock(return_value={"user_id": "user-1", "text_messages": 4})
+    mongo.increment_daily_usage = AsyncMock()
+    meter = UsageMeter(store=RedisUsageStore(client=FakeRedis(decode_responses=True)))
+    await meter.check_and_increment("user-1", "text_messages", 25)
+
+    check_and_increment = meter.store.check_and_increment
+    meter.store.check_and_increment = AsyncMock(side_effect=ConnectionError("Redis is down"))
+    assert await meter.check_and_increment("user-1", "text_messages", 25) == (True, 5)
+    mongo.increment_daily_usage.assert_awaited_once_with("user-1", "text_messages", 1)
+    meter.store.check_and_increment = check_and_increment
+
+    # The store never saw the message counted in Mongo, so it is added before the next increment.
+    assert await meter.check_and_increment("user-1", "text_messages", 25) == (True, 6)
+    await meter.flush()
+    _, _, counts, _ = mongo.merge_daily_usage.await_args.args
+    assert counts == {"text_messages": 6}
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from starlette.websockets import WebSocketState
+
+from main.websocket import MainWebSocketManager, RedisBackplane
+
+def make_socket():
+    websocket = MagicMock()
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.send_json = AsyncMock()
+    websocket.close = AsyncMock()
+    return websocket
+
+# --- Test connection tracking ---
+
+@pytest.mark.asyncio
+async def test_user_keeps_several_connections_up_to_the_limit():
+    manager = MainWebSocketManager(max_connections_per_user=2)
+    first, second, third = make_socket(), make_socket(), make_socket()
+    for websocket in (first, second, third):
+        await manager.connect_notifications(websocket, "user-1")
+
+    first.close.assert_awaited_once()
+    await manager.send_personal_json_message({"type": "ping"}, "user-1")
+    second.send_json.assert_awaited_once_with({"type": "ping"})
+    third.send_json.assert_awaited_once_with({"type": "ping"})
+
+    await manager.disconnect_notifications(second)
+    await manager.disconnect_notifications(third)
+    assert manager.notification_connections == {} and manager._socket_owners == {}
+
+@pytest.mark.asyncio
+async def test_slow_socket_is_dropped_without_delaying_the_others():
+    manager = MainWebSocketManager(send_timeout_seconds=0.05)
+    slow, fast = make_socket(), make_socket()
+
+    async def stalled_send(message):
+        await asyncio.sleep(1)
+    slow.send_json = stalled_send
+    await manager.connect_notifications(slow, "user-1")
+    await manager.connect_notifications(fast, "user-2")
+
+    await asyncio.wait_for(manager.broadcast_json_to_all_notifications({"type": "announcement"}), timeout=0.5)
+
+    fast.send_json.assert_awaited_once_with({"type": "announcement"})
+    assert "user-1" not in manager.notification_connections
+
+@pytest.mark.asyncio
+async def test_socket_raising_unexpected_error_does_not_fail_the_broadcast():
+    manager = MainWebSocketManager()
+    broken, healthy = make_socket(), make_socket()
+    broken.send_json = AsyncMock(side_effect=OSError("connection reset"))
+    await manager.connect_notifications(broken, "user-1")
+    await manager.connect_notifications(healthy, "user-2")
+
+    await manager.broadcast_json_to_all_notifications({"type": "announcement"})
+
+    healthy.send_json.assert_awaited_once_with({"type": "announcement"})
+    assert "user-1" not in manager.notification_connections
+
+# --- Test the Redis backplane ---
+
+@pytest.mark.asyncio
+async def test_message_reaches_socket_held_by_another_process():
+    server = FakeServer()
+    sender = MainWebSocketManager(backplane=RedisBackplane(client=FakeRedis(server=server)))
+    receiver = MainWebSocketManager(backplane=RedisBackplane(client=FakeRedis(server=server)))
+    await sender.start()
+    await receiver.start()
+    websocket = make_socket()
+    await receiver.connect_notifications(websocket, "user-1")
+    try:
+        await sender.send_personal_json_message({"type": "new_notification"}, "user-1")
+        for _ in range(50):
+            if websocket.send_json.await_count:
+                break
+            await asyncio.sleep(0.02)
+        websocket.send_json.assert_awaited_once_with({"type": "new_notification"})
+    finally:
+        await sender.stop()
+        await receiver.stop()
@@ -0,0 +1,50 @@
+import json
+import pytest
+from unittest.mock import AsyncMock
+from fakeredis.aioredis import FakeRedis
+
+from main import worker_events
+from main.worker_events import WorkerEventConsumer
+
+STREAM = "test:worker_events"
+
+async def add_event(client, event_type, data):
+    return await client.xadd(STREAM, {"type": event_type, "user_id": "user-1", "data": json.dumps(data)})
+
+@pytest.mark.asyncio
+async def test_event_is_acknowledged_only_after_it_is_handled(mocker):
+    client = FakeRedis(decode_responses=True)
+    handler = mocker.patch.object(worker_events, "handle_worker_event", new_callable=AsyncMock)
+    handler.side_effect = [RuntimeError("mongo down"), None]
+    consumer = WorkerEventConsumer(client=client, stream=STREAM, group="main", consumer="c1", block_ms=10)
+    await consumer._ensure_group()
+    await add_event(client, "task_list_updated", {"task_id": "t1"})
+
+    await consumer.process_batch(">")
+    assert (await client.xpending(STREAM, "main"))["pending"] == 1
+
+    # After a restart the consumer picks up its own unacknowledged events first.
+    restarted = WorkerEventConsumer(client=client, stream=STREAM, group="main", consumer="c1", block_ms=10)
+    await restarted.process_batch("0")
+    handler.assert_awaited_with("task_list_updated", "user-1", {"task_id": "t1"})
+    assert (await client.xpending(STREAM, "main"))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_progress_event_is_forwarded_to_the_user(mocker):
+    send = mocker.patch.object(worker_events.websocket_manager, "send_personal_json_message", new_callable=AsyncMock)
+    await worker_events.handle_worker_event("task_progress", "user-1", {
+        "task_id": "t1", "run_id": "r1", "updates": [{"message": "step 1", "timestamp": "2025-01-01T00:00:00+00:00"}]
+    })
+    message = send.await_args.args[0]
+    assert message["type"] == "task_progress_update"
+    assert message["payload"]["update"] == {"message": "step 1", "timestamp": "2025-01-01T00:00:00+00:00"}
+
+@pytest.mark.asyncio
+async def test_notification_save_failure_reaches_the_consumer_for_retry(mocker):
+    from main.notifications import utils as notification_utils
+    mocker.patch.object(notification_utils.mongo_manager, "add_notification", new_callable=AsyncMock, side_effect=RuntimeError("mongo down"))
+
+    with pytest.raises(RuntimeError):
+        await worker_events.handle_worker_event("notification", "user-1", {"message": "Task done"})
+    # Direct callers keep best-effort behaviour.
+    await notification_utils.create_and_push_notification("user-1", "Task done")
@@ -0,0 +1,187 @@
+"""In-memory stand-ins for the Google API clients used by the pollers."""
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def make_http_error(status: int) -> HttpError:
+    return HttpError(resp=httplib2.Response({"status": status}), content=b"{}")
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class FakeGmailService:
+    """
+    Mimics `build('gmail', 'v1')` for a single mailbox. Messages are added with `add_message`,
+    each addition creating a history record. History older than `oldest_history_id` is
+    treated as expired, like Gmail does after roughly a week.
+    """
+
+    def __init__(self, history_page_size: int = 2):
+        self.history_page_size = history_page_size
+        self.mailbox = {}
+        self.history = []
+        self.history_id = 100
+        self.oldest_history_id = 100
+        self.calls = []
+
+    def add_message(self, message_id: str, labels=("INBOX", "UNREAD"), subject: str = "Hello", internal_date: int = 0):
+        self.history_id += 1
+        message = {
+            "id": message_id, "threadId": f"thread-{message_id}", "labelIds": list(labels),
+            "snippet": f"Snippet of {message_id}", "internalDate": str(internal_date),
+            "payload": {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": subject}, {"name": "From", "value": "a@example.com"}]}
+        }
+        self.mailbox[message_id] = message
+        self.history.append({
+            "id": str(self.history_id),
+            "messages": [{"id": message_id}],
+            "messagesAdded": [{"message": {"id": message_id, "threadId": message["threadId"], "labelIds": list(labels)}}]
+        })
+
+    def users(self):
+        return _Resource(
+            getProfile=self.getProfile,
+            history=lambda: _Resource(list=self.history_list),
+            messages=lambda: _Resource(list=self.messages_list, get=self.messages_get),
+        )
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def getProfile(self, userId):
+        self.calls.append("getProfile")
+        return _Request(lambda: {"emailAddress": "me@example.com", "historyId": str(self.history_id)})
+
+    def history_list(self, userId, startHistoryId, historyTypes=None, maxResults=100, pageToken=None):
+        self.calls.append("history.list")
+
+        def run():
+            if int(startHistoryId) < self.oldest_history_id:
+                raise make_http_error(404)
+            records = [r for r in self.history if int(r["id"]) > int(startHistoryId)]
+            page_size = min(maxResults, self.history_page_size)
+            offset = int(pageToken or 0)
+            response = {"history": records[offset:offset + page_size], "historyId": str(self.history_id)}
+            if offset + page_size < len(records):
+                response["nextPageToken"] = str(offset + page_size)
+            if not response["history"]:
+                del response["history"]
+            return response
+        return _Request(run)
+
+    def messages_list(self, userId, q=None, maxResults=100, pageToken=None):
+        self.calls.append("messages.list")
+
+        def run():
+            unread = [m for m in reversed(list(self.mailbox.values())) if "UNREAD" in m["labelIds"]]
+            offset = int(pageToken or 0)
+            response = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in unread[offset:offset + maxResults]]}
+            if offset + maxResults < len(unread):
+                response["nextPageToken"] = str(offset + maxResults)
+            return response
+        return _Request(run)
+
+    def messages_get(self, userId, id, format=None, fields=None):
+        def run():
+            if id not in self.mailbox:
+                raise make_http_error(404)
+            return self.mailbox[id]
+        return _Request(run)
+
+
+class FakeCalendarService:
+    """
+    Mimics `build('calendar', 'v3')`. Every change to an event is appended to a change log,
+    and sync tokens are positions in that log. Tokens older than `oldest_valid_seq` are
+    rejected with 410 Gone, like Google does once a token expires.
+    """
+
+    def __init__(self, page_size: int = 2):
+        self.page_size = page_size
+        self.calendar_list = [{"id": "me@example.com", "primary": True, "selected": True}]
+        self.calendar_events = {}
+        self.changes = []
+        self.oldest_valid_seq = 0
+        self.calls = []
+
+    def add_calendar(self, calendar_id: str, selected: bool = True):
+        self.calendar_list.append({"id": calendar_id, "selected": selected})
+
+    def put_event(self, calendar_id: str, event_id: str, created: str, updated: str = None, summary: str = "Meeting", status: str = "confirmed",
+                  start: str = None):
+        event = {"id": event_id, "status": status, "summary": summary, "created": created, "updated": updated or created}
+        if start:
+            event["start"] = {"dateTime": start}
+        self.calendar_events.setdefault(calendar_id, {})[event_id] = event
+        self.changes.append((calendar_id, event_id))
+
+    def cancel_event(self, calendar_id: str, event_id: str):
+        self.calendar_events[calendar_id][event_id] = {"id": event_id, "status": "cancelled"}
+        self.changes.append((calendar_id, event_id))
+
+    def calendarList(self):
+        return _Resource(list=self.calendar_list_list)
+
+    def events(self):
+        return _Resource(list=self.events_list)
+
+    def calendar_list_list(self, minAccessRole=None, pageToken=None):
+        self.calls.append("calendarList.list")
+        return _Request(lambda: {"items": list(self.calendar_list)})
+
+    def events_list(self, calendarId, maxResults=250, showDeleted=False, pageToken=None, syncToken=None, timeMin=None, singleEvents=None):
+        self.calls.append(f"events.list({calendarId})")
+
+        def run():
+            if calendarId not in self.calendar_events and calendarId not in {c["id"] for c in self.calendar_list}:
+                raise make_http_error(404)
+            if syncToken is not None:
+                since = int(syncToken.split("-")[1])
+                if since < self.oldest_valid_seq:
+                    raise make_http_error(410)
+                changed_ids = [event_id for calendar, event_id in self.changes[since:] if calendar == calendarId]
+                items = [self.calendar_events[calendarId][event_id] for event_id in dict.fromkeys(changed_ids)]
+            else:
+                items = [e for e in self.calendar_events.get(calendarId, {}).values() if showDeleted or e["status"] != "cancelled"]
+            offset = int(pageToken or 0)
+            page_size = min(maxResults, self.page_size)
+            response = {"items": items[offset:offset + page_size]}
+            if offset + page_size < len(items):
+                response["nextPageToken"] = str(offset + page_size)
+            else:
+                response["nextSyncToken"] = f"sync-{len(self.changes)}"
+            return response
+        return _Request(run)
+
+
+class _FakeBatch:
+    """Mimics `BatchHttpRequest`: requests run on `execute()`, each result goes to the callback."""
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service.calls.append(f"batch({len(self._requests)})")
+        for request_id, request in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except Exception as e:
+                self._callback(request_id, None, e)
+
+
+class _Resource:
+    def __init__(self, **methods):
+        for name, method in methods.items():
+            setattr(self, name, method)
+
@@ -1,56 +1,127 @@
+import asyncio
+import json
+import datetime
 import pytest
-from unittest.mock import AsyncMock, patch
-from workers.tasks import async_refine_and_plan_ai_task, cud_memory
+from unittest.mock import AsyncMock, MagicMock, patch
+from workers.tasks import (async_refine_and_plan_ai_task, async_generate_plan, async_summarize_user_conversations,
+                           async_summarize_conversations, _summary_id_for_chunk, cud_memory)
+from workers.planner.db import get_plan_cache_key
 from mcp_hub.memory.utils import initialize_embedding_model, initialize_agents
 
 # --- Test refine_and_plan_ai_task ---
 
-@pytest.mark.asyncio
-async def test_refine_and_plan_ai_task_success(mocker):
-    # Mock DB manager
+def _mock_planner_db(mocker, mock_task):
     mock_db = AsyncMock()
-    mock_task = {
-        "_id": "some_id",
-        "task_id": "task-123",
-        "user_id": "test-user-123",
-        "description": "raw user prompt",
-        "assignee": "ai"
-    }
     mock_db.get_task.return_value = mock_task
-    mock_db.user_profiles_collection.find_one.return_value = {
+    mock_db.user_profiles_collection = MagicMock()
+    mock_db.user_profiles_collection.find_one = AsyncMock(return_value={
         "userData": {"personalInfo": {"name": "Tester", "timezone": "UTC"}}
-    }
+    })
+    mock_db.get_cached_plan.return_value = None
+    mock_db.get_user_preferences.return_value = {"response_style": "brief"}
     mocker.patch('workers.tasks.PlannerMongoManager', return_value=mock_db)
+    mocker.patch('workers.tasks._fetch_relevant_memories', new_callable=AsyncMock, return_value=["Tester prefers email"])
+    mocker.patch('workers.tasks.notify_user', new_callable=AsyncMock)
+    mocker.patch('workers.tasks.push_task_list_update', new_callable=AsyncMock)
+    mocker.patch('workers.tasks.capture_event')
+    return mock_db
 
-    # Mock LLM call
+def _mock_llm_responses(mocker, *responses):
+    """Each call to the mocked agent returns the next response as JSON."""
+    remaining = list(responses)
+    def mock_run_agent(*args, **kwargs):
+        yield [{"role": "assistant", "content": f"```json\n{json.dumps(remaining.pop(0))}\n```"}]
+    return mocker.patch('workers.tasks.run_main_agent', side_effect=mock_run_agent)
+
+@pytest.mark.asyncio
+async def test_refine_and_plan_ai_task_single_call(mocker):
+    mock_task = {"task_id": "task-123", "user_id": "test-user-123", "description": "raw user prompt", "assignee": "ai"}
+    mock_db = _mock_planner_db(mocker, mock_task)
     refined_details = {
         "name": "Refined Task Name",
         "description": "Refined description.",
         "priority": 1,
-        "schedule": {"type": "once", "run_at": "2024-01-01T12:00:00"}
+        "schedule": {"type": "once", "run_at": "2024-01-01T12:00:00"},
+        "plan": [{"tool": "gmail", "description": "Send the email."}]
     }
-    async def mock_run_agent(*args, **kwargs):
-        yield [{"role": "assistant", "content": f"```json\n{json.dumps(refined_details)}\n```"}]
-
-    mocker.patch('workers.tasks.run_main_agent_with_fallback', new_callable=lambda: mock_run_agent)
+    mock_llm = _mock_llm_responses(mocker, refined_details)
 
-    # Mock Celery task call
-    mock_planner_delay = mocker.patch('workers.tasks.generate_plan_from_context.delay')
+    await async_refine_and_plan_ai_task("task-123", "test-user-123")
 
-    # Run the async function
-    await async_refine_and_plan_ai_task("task-123")
-
-    # Assertions
-    mock_db.get_task.assert_called_once_with("task-123")
-    mock_db.update_task_field.assert_called_once()
+    mock_llm.assert_called_once()
     update_args = mock_db.update_task_field.call_args[0]
     assert update_args[0] == "task-123"
     assert update_args[1]["name"] == "Refined Task Name"
     assert update_args[1]["schedule"]["timezone"] == "UTC" # Check if timezone was injected
+    assert "plan" not in update_args[1]
 
-    mock_planner_delay.assert_called_once_with("task-123")
+    plan_data = mock_db.update_task_with_plan.call_args[0][1]
+    assert plan_data["plan"] == refined_details["plan"]
+    # The combined call sees the prefetched memories and preferences, and the plan is cached under the raw request.
+    user_prompt = mock_llm.call_args.kwargs["messages"][0]["content"]
+    assert "Tester prefers email" in user_prompt and "response_style: brief" in user_prompt
+    cache_key = mock_db.get_cached_plan.call_args[0][0]
+    assert mock_db.cache_plan.call_args[0][0] == cache_key
     mock_db.close.assert_called_once()
 
+@pytest.mark.asyncio
+async def test_refine_and_plan_ai_task_reuses_plan_cached_for_raw_request(mocker):
+    mock_task = {"task_id": "task-123", "user_id": "test-user-123", "description": "raw user prompt", "assignee": "ai"}
+    mock_db = _mock_planner_db(mocker, mock_task)
+    cached_plan = {"name": "Old name", "description": "Old description.", "plan": [{"tool": "gmail", "description": "Send the email."}]}
+    mock_db.get_cached_plan.return_value = cached_plan
+    mock_llm = _mock_llm_responses(mocker, {"name": "Refined Task Name", "description": "Refined description.", "schedule": None})
+    # Memory retrieval never finishes, so awaiting it on a cache hit would time out.
+    async def never_retrieved(*args):
+        await asyncio.Event().wait()
+    mocker.patch('workers.tasks._fetch_relevant_memories', new=never_retrieved)
+
+    await asyncio.wait_for(async_refine_and_plan_ai_task("task-123", "test-user-123"), timeout=5)
+
+    # One refinement-only call, without the planner prompt.
+    mock_llm.assert_called_once()
+    assert "raw user prompt" == mock_llm.call_args.kwargs["messages"][0]["content"]
+    plan_data = mock_db.update_task_with_plan.call_args[0][1]
+    assert plan_data == {"name": "Refined Task Name", "description": "Refined description.", "plan": cached_plan["plan"]}
+    mock_db.cache_plan.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_refine_and_plan_ai_task_plans_separately_when_ambiguous(mocker):
+    mock_task = {"task_id": "task-123", "user_id": "test-user-123", "description": "raw user prompt", "assignee": "ai"}
+    mock_db = _mock_planner_db(mocker, mock_task)
+    refined_details = {"name": "Refined Task Name", "description": "Refined description.", "priority": 1, "schedule": None, "plan": None}
+    plan = {"name": "Refined Task Name", "description": "Refined description.", "plan": [{"tool": "memory", "description": "Look it up."}]}
+    mock_llm = _mock_llm_responses(mocker, refined_details, plan)
+
+    await async_refine_and_plan_ai_task("task-123", "test-user-123")
+
+    assert mock_llm.call_count == 2
+    # The separate planning call sees the refined description and the prefetched memories
+    planner_prompt = mock_llm.call_args.kwargs["messages"][0]["content"]
+    assert "Refined description." in planner_prompt and "Tester prefers email" in planner_prompt
+    assert mock_db.update_task_with_plan.call_args[0][1] == plan
+
+@pytest.mark.asyncio
+async def test_generate_plan_reuses_cached_plan(mocker):
+    mock_task = {"task_id": "task-123", "user_id": "test-user-123", "description": "Send the weekly report",
+                 "status": "planning", "runs": []}
+    mock_db = _mock_planner_db(mocker, mock_task)
+    cached_plan = {"name": "Weekly report", "description": "Send it.", "plan": [{"tool": "gmail", "description": "Send it."}]}
+    mock_db.get_cached_plan.return_value = cached_plan
+    mock_llm = _mock_llm_responses(mocker)
+
+    await async_generate_plan("task-123", "test-user-123")
+
+    mock_llm.assert_not_called()
+    mock_db.update_task_with_plan.assert_called_once_with("task-123", cached_plan, False)
+
+def test_plan_cache_key_depends_on_request_and_tools():
+    tools = {"gmail": "Email", "memory": "Memory"}
+    key = get_plan_cache_key("test-user-123", ["Send the  weekly report"], tools)
+    assert key == get_plan_cache_key("test-user-123", ["send the weekly report"], dict(reversed(list(tools.items()))))
+    assert key != get_plan_cache_key("test-user-123", ["Send the weekly report"], {"gmail": "Email"})
+    assert key != get_plan_cache_key("another-user", ["Send the weekly report"], tools)
+
 
 # --- Test cud_memory_task ---
 
@@ -92,4 +163,82 @@ async def test_cud_memory_add_action(mocker):
     mock_run_agent.assert_called_once()
     # Check that the insert was called
     mock_conn.fetchval.assert_called()
-    assert "INSERT INTO facts" in mock_conn.fetchval.call_args[0][0]
\ No newline at end of file
+    assert "INSERT INTO facts" in mock_conn.fetchval.call_args[0][0]
+
+
+# --- Test summarize_user_conversations ---
+
+def _make_messages(count):
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        {"_id": f"oid-{i}", "message_id": f"msg-{i}", "role": "user" if i % 2 == 0 else "assistant",
+         "content": f"message {i}", "timestamp": base + datetime.timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+def _mock_summarization_db(mocker, messages):
+    mock_db = MagicMock()
+    mock_db.close = AsyncMock()
+    cursor = MagicMock()
+    cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=messages)
+    mock_db.messages_collection.find.return_value = cursor
+    mock_db.messages_collection.bulk_write = AsyncMock()
+    mock_db.messages_collection.count_documents = AsyncMock(return_value=0)
+    mocker.patch('workers.tasks.PlannerMongoManager', return_value=mock_db)
+    mocker.patch('workers.tasks.capture_event')
+    return mock_db
+
+@pytest.mark.asyncio
+async def test_summarize_conversations_reports_backlog_without_lone_messages(mocker):
+    mock_db = _mock_summarization_db(mocker, [])
+    mock_db.messages_collection.aggregate.return_value.to_list = AsyncMock(return_value=[
+        {"_id": "user-a", "pending_messages": 40}, {"_id": "user-b", "pending_messages": 3}
+    ])
+    mock_group = mocker.patch('workers.tasks.group')
+    mock_capture = mocker.patch('workers.tasks.capture_event')
+
+    await async_summarize_conversations()
+
+    pipeline = mock_db.messages_collection.aggregate.call_args[0][0]
+    assert {"$match": {"pending_messages": {"$gte": 2}}} in pipeline
+    mock_group.return_value.apply_async.assert_called_once()
+    _, event, properties = mock_capture.call_args[0]
+    assert event == "summarization_backlog_measured"
+    assert properties["pending_messages"] == 43 and properties["users_dispatched"] == 2
+
+@pytest.mark.asyncio
+async def test_summarize_user_conversations_batches_chroma_write(mocker):
+    messages = _make_messages(45)  # Two chunks: 30 + 15
+    mock_db = _mock_summarization_db(mocker, messages)
+
+    mock_collection = MagicMock()
+    mock_collection.get.return_value = {"ids": []}
+    mocker.patch('workers.tasks.get_conversation_summaries_collection', return_value=mock_collection)
+    mock_llm = mocker.patch('workers.tasks._summarize_conversation_text', return_value="A summary.")
+
+    await async_summarize_user_conversations("test-user-123")
+
+    assert mock_llm.call_count == 2
+    mock_collection.upsert.assert_called_once()
+    assert len(mock_collection.upsert.call_args.kwargs["ids"]) == 2
+    operations = mock_db.messages_collection.bulk_write.call_args[0][0]
+    assert len(operations) == 2
+    mock_db.close.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_summarize_user_conversations_skips_already_stored_chunks(mocker):
+    messages = _make_messages(30)
+    mock_db = _mock_summarization_db(mocker, messages)
+
+    # Simulates a crash after the ChromaDB write but before the messages were marked.
+    stored_id = _summary_id_for_chunk("test-user-123", messages)
+    mock_collection = MagicMock()
+    mock_collection.get.return_value = {"ids": [stored_id]}
+    mocker.patch('workers.tasks.get_conversation_summaries_collection', return_value=mock_collection)
+    mock_llm = mocker.patch('workers.tasks._summarize_conversation_text', return_value="A summary.")
+
+    await async_summarize_user_conversations("test-user-123")
+
+    mock_llm.assert_not_called()
+    mock_collection.upsert.assert_not_called()
+    mock_db.messages_collection.bulk_write.assert_called_once()
@@ -0,0 +1,109 @@
+import datetime
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from workers.poller.gcalendar.config import GCAL_FULL_SYNC_MAX_EVENTS
+from workers.poller.gcalendar.utils import sync_calendars, classify_event_change, processed_item_key
+from tests.workers.fake_google import FakeCalendarService
+
+CREATED = "2026-01-01T10:00:00.000Z"
+EDITED = "2026-01-02T09:30:00.000Z"
+
+def _in_hours(hours):
+    return (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=hours)).isoformat()
+
+def _change_types(changes):
+    return [(change["event"]["id"], change["change_type"]) for change in changes]
+
+# --- Test incremental Google Calendar sync ---
+
+def test_first_sync_lists_calendars_and_stores_a_token_per_calendar():
+    service = FakeCalendarService()
+    service.add_calendar("team@group.calendar.google.com")
+    service.add_calendar("holidays@group.v.calendar.google.com", selected=False)
+    service.put_event("me@example.com", "e1", CREATED, start=_in_hours(5))
+    service.put_event("team@group.calendar.google.com", "e2", CREATED, EDITED, start=_in_hours(2))
+    service.put_event("me@example.com", "past", CREATED, start=_in_hours(-3))
+    service.put_event("me@example.com", "far-off", CREATED, start=_in_hours(24 * 60))
+
+    changes, sync_state = sync_calendars(service, [], refresh_calendar_list=False)
+
+    # Only upcoming events are reported, soonest first.
+    assert _change_types(changes) == [("e2", "created"), ("e1", "created")]
+    assert [entry["calendar_id"] for entry in sync_state] == ["me@example.com", "team@group.calendar.google.com"]
+    assert all(entry["sync_token"] == "sync-4" for entry in sync_state)
+
+def test_incremental_sync_reports_created_updated_and_cancelled_events():
+    service = FakeCalendarService()
+    service.put_event("me@example.com", "e1", CREATED)
+    service.put_event("me@example.com", "e2", CREATED)
+    _, sync_state = sync_calendars(service, [], refresh_calendar_list=True)
+
+    service.put_event("me@example.com", "e1", CREATED, EDITED, summary="Moved")
+    service.cancel_event("me@example.com", "e2")
+    service.put_event("me@example.com", "e3", EDITED)
+    service.calls.clear()
+    changes, sync_state = sync_calendars(service, sync_state, refresh_calendar_list=False)
+
+    assert _change_types(changes) == [("e1", "updated"), ("e2", "cancelled"), ("e3", "created")]
+    assert sync_state == [{"calendar_id": "me@example.com", "sync_token": "sync-5"}]
+    # Two pages of changes, and no calendar list call.
+    assert service.calls == ["events.list(me@example.com)", "events.list(me@example.com)"]
+
+def test_expired_sync_token_falls_back_to_full_resync():
+    service = FakeCalendarService()
+    service.put_event("me@example.com", "e1", CREATED, start=_in_hours(1))
+    service.put_event("me@example.com", "e2", CREATED, start=_in_hours(1))
+    service.cancel_event("me@example.com", "e2")
+    service.oldest_valid_seq = 2
+
+    changes, sync_state = sync_calendars(service, [{"calendar_id": "me@example.com", "sync_token": "sync-1"}], refresh_calendar_list=False)
+
+    # The full resync reports upcoming events that exist now; cancelled events are not replayed.
+    assert _change_types(changes) == [("e1", "created")]
+    assert sync_state == [{"calendar_id": "me@example.com", "sync_token": "sync-3"}]
+
+def test_deleted_calendar_is_dropped_from_sync_state():
+    service = FakeCalendarService()
+
+    changes, sync_state = sync_calendars(service, [
+        {"calendar_id": "me@example.com", "sync_token": "sync-0"},
+        {"calendar_id": "gone@group.calendar.google.com", "sync_token": "sync-0"},
+    ], refresh_calendar_list=False)
+
+    assert changes == []
+    assert sync_state == [{"calendar_id": "me@example.com", "sync_token": "sync-0"}]
+
+def test_each_kind_of_change_is_deduplicated_separately():
+    created = {"id": "e1", "status": "confirmed", "created": CREATED, "updated": CREATED}
+    updated = {**created, "updated": EDITED}
+
+    assert classify_event_change(updated) == "updated"
+    assert processed_item_key(created, "created") == "e1"
+    assert processed_item_key(updated, "updated") != processed_item_key({**updated, "updated": "2026-01-03T00:00:00Z"}, "updated")
+    assert processed_item_key({"id": "e1", "status": "cancelled"}, "cancelled") == "e1:cancelled"
+
+# --- Test the first poll of a calendar ---
+
+@pytest.mark.asyncio
+async def test_first_poll_of_a_busy_calendar_dispatches_a_bounded_number_of_triggers(mocker):
+    from workers.poller.gcalendar import service as gcal_service
+    calendar = FakeCalendarService(page_size=50)
+    for i in range(200):
+        calendar.put_event("me@example.com", f"e{i}", CREATED, start=_in_hours(i - 99.5))
+    mocker.patch.object(gcal_service, "get_gcalendar_credentials", AsyncMock(return_value=MagicMock()))
+    mocker.patch.object(gcal_service, "fetch_event_changes", AsyncMock(
+        side_effect=lambda creds, sync_state, refresh, user_id=None: sync_calendars(calendar, sync_state, refresh)
+    ))
+    mocker.patch("workers.proactive.utils.event_pre_filter", return_value=True)
+    execute_triggered_task = mocker.patch("workers.tasks.execute_triggered_task")
+    db_manager = AsyncMock()
+    db_manager.get_user_profile.return_value = {"userData": {}}
+    db_manager.get_processed_item_ids.return_value = set()
+
+    await gcal_service.GCalendarPollingService(db_manager)._run_single_user_poll_cycle("user-1", {}, "triggers")
+
+    # 200 events, 100 of them upcoming, but only the next few become triggers.
+    dispatched = [call.kwargs["event_data"]["id"] for call in execute_triggered_task.delay.call_args_list]
+    assert dispatched == [f"e{i}" for i in range(100, 100 + GCAL_FULL_SYNC_MAX_EVENTS)]
+    assert db_manager.update_polling_state.await_args.args[3]["calendar_sync_state"] == [{"calendar_id": "me@example.com", "sync_token": "sync-200"}]
@@ -0,0 +1,115 @@
+import pytest
+from workers.poller.gmail.utils import sync_new_message_ids, fetch_emails, fetch_message_details
+from tests.workers.fake_google import FakeGmailService, make_http_error
+
+# --- Test incremental Gmail sync ---
+
+def test_first_sync_is_a_full_sync_and_returns_a_cursor():
+    service = FakeGmailService()
+    service.add_message("m1")
+    service.add_message("m2")
+
+    message_ids, history_id = sync_new_message_ids(service, None)
+
+    assert message_ids == ["m1", "m2"]
+    assert history_id == "102"
+    assert "history.list" not in service.calls
+
+def test_quiet_mailbox_costs_a_single_history_call():
+    service = FakeGmailService()
+    service.add_message("m1")
+
+    message_ids, history_id = sync_new_message_ids(service, "101")
+
+    assert message_ids == []
+    assert history_id == "101"
+    assert service.calls == ["history.list"]
+
+def test_incremental_sync_paginates_and_skips_read_and_spam():
+    service = FakeGmailService(history_page_size=2)
+    for i in range(5):
+        service.add_message(f"m{i}")
+    service.add_message("read", labels=("INBOX",))
+    service.add_message("spam", labels=("SPAM", "UNREAD"))
+
+    message_ids, history_id = sync_new_message_ids(service, "100")
+
+    assert message_ids == ["m0", "m1", "m2", "m3", "m4"]
+    assert history_id == "107"
+    assert service.calls.count("history.list") == 4
+
+def test_large_burst_is_split_across_cycles():
+    service = FakeGmailService(history_page_size=3)
+    for i in range(5):
+        service.add_message(f"m{i}")
+
+    first_ids, cursor = sync_new_message_ids(service, "100", max_messages=3)
+    second_ids, cursor = sync_new_message_ids(service, cursor, max_messages=3)
+
+    assert first_ids == ["m0", "m1", "m2"]
+    assert second_ids == ["m3", "m4"]
+    assert cursor == "105"
+
+def test_expired_cursor_falls_back_to_full_resync():
+    service = FakeGmailService()
+    service.add_message("m1")
+    service.oldest_history_id = 101
+
+    message_ids, history_id = sync_new_message_ids(service, "50")
+
+    assert message_ids == ["m1"]
+    assert history_id == "101"
+    assert service.calls == ["history.list", "getProfile", "messages.list"]
+
+# --- Test message detail fetching ---
+
+def test_message_details_are_fetched_in_batches_in_order():
+    service = FakeGmailService()
+    for i in range(5):
+        service.add_message(f"m{i}", subject=f"Subject {i}")
+
+    emails = fetch_message_details(service, ["m4", "m0", "m2", "m1", "m3"], batch_size=2)
+
+    assert [email["id"] for email in emails] == ["m4", "m0", "m2", "m1", "m3"]
+    assert emails[0]["subject"] == "Subject 4"
+    assert service.calls == ["batch(2)", "batch(2)", "batch(1)"]
+
+@pytest.mark.asyncio
+async def test_fetch_emails_skips_messages_deleted_before_fetch(mocker):
+    service = FakeGmailService()
+    service.add_message("m1", subject="Kept")
+    service.add_message("m2")
+    del service.mailbox["m2"]
+    mocker.patch('workers.poller.gmail.utils.get_google_service', return_value=service)
+
+    emails, history_id = await fetch_emails(object(), "100", user_id="test-user-123")
+
+    assert [email["subject"] for email in emails] == ["Kept"]
+    assert history_id == "102"
+
+@pytest.mark.asyncio
+async def test_fetch_emails_keeps_cursor_on_transient_errors(mocker):
+    service = FakeGmailService()
+    service.add_message("m1")
+    mocker.patch('workers.poller.gmail.utils.get_google_service', return_value=service)
+    mocker.patch.object(service, 'messages_get', side_effect=make_http_error(500))
+
+    emails, history_id = await fetch_emails(object(), "100", user_id="test-user-123")
+
+    assert emails == []
+    assert history_id == "100"
+
+# --- Test the API client cache ---
+
+def test_google_service_is_reused_until_credentials_are_refreshed(mocker):
+    from workers.utils import google_services
+    mock_build = mocker.patch('workers.utils.google_services.build', side_effect=lambda *args, **kwargs: object())
+    creds = mocker.Mock(token="token-1")
+
+    first = google_services.get_google_service('gmail', 'v1', creds, "cache-test-user")
+    assert google_services.get_google_service('gmail', 'v1', creds, "cache-test-user") is first
+    assert mock_build.call_args.kwargs["static_discovery"] is True
+
+    creds.token = "token-2"
+    assert google_services.get_google_service('gmail', 'v1', creds, "cache-test-user") is not first
+    assert mock_build.call_count == 2
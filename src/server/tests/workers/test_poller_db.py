@@ -0,0 +1,76 @@
+import pytest
+from collections import OrderedDict
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import BulkWriteError
+
+from workers.poller.gmail.db import PollerMongoManager
+
+def _make_manager():
+    manager = PollerMongoManager.__new__(PollerMongoManager)
+    manager.processed_items_collection = MagicMock()
+    manager.processed_items_collection.bulk_write = AsyncMock()
+    manager._processed_cache = OrderedDict()
+    return manager
+
+# --- Test bulk processed-item deduplication ---
+
+@pytest.mark.asyncio
+async def test_processed_lookup_is_one_query_and_cached():
+    manager = _make_manager()
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[{"item_id": "m1"}])
+    manager.processed_items_collection.find.return_value = cursor
+
+    processed = await manager.get_processed_item_ids("user-1", "gmail", ["m1", "m2", "m1"], "triggers")
+    assert processed == {"m1"}
+    query = manager.processed_items_collection.find.call_args.args[0]
+    assert query["item_id"] == {"$in": ["m1", "m2"]}
+
+    # m1 is now known in-process, so only m2 is looked up again.
+    await manager.get_processed_item_ids("user-1", "gmail", ["m1", "m2"], "triggers")
+    assert manager.processed_items_collection.find.call_args.args[0]["item_id"] == {"$in": ["m2"]}
+
+@pytest.mark.asyncio
+async def test_bulk_log_is_unordered_and_tolerates_duplicates():
+    manager = _make_manager()
+    manager.processed_items_collection.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]}
+    )
+
+    assert await manager.log_processed_items("user-1", "gmail", ["m1", "m2", "m2"], "triggers") is True
+
+    operations = manager.processed_items_collection.bulk_write.call_args.args[0]
+    assert len(operations) == 2
+    assert manager.processed_items_collection.bulk_write.call_args.kwargs["ordered"] is False
+    assert await manager.get_processed_item_ids("user-1", "gmail", ["m1", "m2"], "triggers") == {"m1", "m2"}
+
+# --- Test the due-poll query ---
+
+@pytest.mark.asyncio
+async def test_due_polls_are_found_without_joining_tasks():
+    manager = _make_manager()
+    manager.polling_state_collection = MagicMock()
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[{"user_id": "user-1"}])
+    manager.polling_state_collection.find.return_value = cursor
+
+    due = await manager.get_due_polling_tasks_for_service("gmail", "triggers")
+
+    assert due == [{"user_id": "user-1"}]
+    assert manager.polling_state_collection.find.call_args.args[0]["has_active_triggers"] is True
+    manager.polling_state_collection.aggregate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_trigger_flags_are_derived_from_active_triggered_tasks():
+    from main.db import refresh_trigger_flags
+    db = {"tasks": MagicMock(), "polling_state_store": MagicMock()}
+    db["tasks"].distinct = AsyncMock(return_value=["gmail"])
+    db["polling_state_store"].update_many = AsyncMock()
+
+    await refresh_trigger_flags(db, "user-1")
+
+    task_query = db["tasks"].distinct.call_args.args[1]
+    assert task_query == {"user_id": "user-1", "status": "active", "schedule.type": "triggered"}
+    update = db["polling_state_store"].update_many.call_args.args[1]
+    assert update == [{"$set": {"has_active_triggers": {"$in": ["$service_name", ["gmail"]]}}}]
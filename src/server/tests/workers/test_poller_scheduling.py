@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from workers.utils.poller_scheduling import HashRing, compute_next_poll_interval
+from workers.poller.gmail.db import PollerMongoManager
+
+# --- Test user sharding ---
+
+def test_hash_ring_splits_users_and_moves_few_on_scale_out():
+    user_ids = [f"user-{i}" for i in range(1000)]
+    two = HashRing(["replica-a", "replica-b"])
+    three = HashRing(["replica-a", "replica-b", "replica-c"])
+
+    owned = {replica: two.filter_owned(replica, user_ids) for replica in ["replica-a", "replica-b"]}
+    assert sum(len(ids) for ids in owned.values()) == len(user_ids)
+    assert all(300 < len(ids) < 700 for ids in owned.values())
+
+    moved = [user_id for user_id in user_ids if two.owner(user_id) != three.owner(user_id)]
+    assert all(three.owner(user_id) == "replica-c" for user_id in moved)
+    assert len(moved) < 500
+
+def test_empty_ring_lets_any_replica_claim():
+    assert HashRing([]).owns("replica-a", "user-1")
+
+# --- Test adaptive poll intervals ---
+
+def test_poll_interval_stretches_while_idle_and_resets_on_activity():
+    interval = compute_next_poll_interval(None, 0, 60, 600, 2)
+    assert interval == 60
+    for _ in range(5):
+        interval = compute_next_poll_interval(interval, 0, 60, 600, 2)
+    assert interval == 600
+    assert compute_next_poll_interval(interval, 3, 60, 600, 2) == 60
+
+# --- Test lease fencing ---
+
+@pytest.mark.asyncio
+async def test_state_write_is_fenced_by_lease_token():
+    manager = PollerMongoManager.__new__(PollerMongoManager)
+    manager.polling_state_collection = MagicMock()
+    manager.polling_state_collection.update_one = AsyncMock(return_value=MagicMock(matched_count=0, upserted_id=None))
+
+    saved = await manager.update_polling_state("user-1", "gmail", "triggers", {"is_currently_polling": False, "lease_token": 4}, lease_token=4)
+
+    assert saved is False
+    query, update = manager.polling_state_collection.update_one.call_args.args
+    assert query["lease_token"] == 4
+    assert "lease_token" not in update["$set"]
+    assert manager.polling_state_collection.update_one.call_args.kwargs["upsert"] is False
+
+@pytest.mark.asyncio
+async def test_poll_cycle_dispatches_nothing_after_losing_its_lease(mocker):
+    from workers.poller.gmail import service as gmail_service
+    mocker.patch.object(gmail_service, "POLL_LEASE_RENEW_SECONDS", 0)
+    mocker.patch.object(gmail_service, "get_gmail_credentials", AsyncMock(return_value=MagicMock()))
+    mocker.patch.object(gmail_service, "event_pre_filter", return_value=True)
+    execute_triggered_task = mocker.patch("workers.tasks.execute_triggered_task")
+
+    async def fetch_emails_while_lease_expires(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return [{"id": "email-1", "subject": "Hi", "body": "", "from": "a@example.com", "timestamp_ms": 1000}], "history-2"
+    mocker.patch.object(gmail_service, "fetch_emails", fetch_emails_while_lease_expires)
+
+    db_manager = AsyncMock()
+    db_manager.get_user_profile.return_value = {"userData": {}}
+    db_manager.get_processed_item_ids.return_value = set()
+    db_manager.renew_polling_lease.return_value = False
+    db_manager.update_polling_state.return_value = False
+    service = gmail_service.GmailPollingService(db_manager)
+
+    await service._run_single_user_poll_cycle("user-1", {"lease_token": 3, "history_id": "history-1"}, "triggers")
+
+    execute_triggered_task.delay.assert_not_called()
+    db_manager.log_processed_items.assert_not_awaited()
+    # The state write is still attempted, fenced by the token, so the cursor is not advanced by this replica.
+    assert db_manager.update_polling_state.await_args.kwargs["lease_token"] == 3
@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import time
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock
+
+from workers.proactive import main as proactive
+from workers.proactive import retrieval
+from workers.proactive.suggestion_types import SuggestionTemplateCache
+from workers.proactive.suppression import suppression_reason
+
+EVENT = {"id": "m1", "subject": "Lunch on Friday?", "snippet": "Are you free at noon?"}
+
+@pytest.fixture
+def db_manager(mocker):
+    manager = mocker.MagicMock()
+    manager.get_user_proactive_feedback = AsyncMock(return_value={"preferences": {"draft_reply": 2, "book_travel": -4}, "cooldowns": {}})
+    manager.has_recent_proactive_suggestion = AsyncMock(return_value=False)
+    manager.get_recent_proactive_suggestion_times = AsyncMock(return_value=[])
+    manager.record_proactive_pipeline_metrics = AsyncMock()
+    manager.close = AsyncMock()
+    mocker.patch.object(proactive, "PlannerMongoManager", return_value=manager)
+    mocker.patch.object(proactive, "capture_event")
+    return manager
+
+# --- Test the proactive pipeline ---
+
+@pytest.mark.asyncio
+async def test_triage_discards_event_before_context_is_gathered(mocker, db_manager):
+    mocker.patch.object(proactive, "_run_llm", return_value='{"relevant": false, "reason": "newsletter"}')
+    get_context = mocker.patch.object(proactive, "get_universal_context", new_callable=AsyncMock)
+
+    await proactive.run_proactive_pipeline_logic("user-1", "gmail", EVENT)
+
+    get_context.assert_not_called()
+    metrics = db_manager.record_proactive_pipeline_metrics.call_args.args[0]
+    assert metrics["verdict"] == "discarded_by_triage"
+    assert metrics["llm_calls"] == 1
+
+@pytest.mark.asyncio
+async def test_relevant_event_runs_full_pipeline_and_records_cost(mocker, db_manager):
+    responses = iter([
+        '{"relevant": true, "reason": "a question"}',
+        '{"availability": "calendar on Friday at noon"}',
+        '{"actionable": false, "confidence_score": 0.2}',
+    ])
+    mocker.patch.object(proactive, "_run_llm", side_effect=lambda *args: next(responses))
+    get_context = mocker.patch.object(proactive, "get_universal_context", new_callable=AsyncMock, return_value={})
+
+    await proactive.run_proactive_pipeline_logic("user-1", "gmail", EVENT)
+
+    get_context.assert_awaited_once_with("user-1", {"availability": "calendar on Friday at noon"}, db_manager)
+    metrics = db_manager.record_proactive_pipeline_metrics.call_args.args[0]
+    assert metrics["verdict"] == "not_actionable"
+    assert metrics["llm_calls"] == 3
+    assert set(metrics["stage_seconds"]) == {"triage", "query_formulation", "context", "reasoner"}
+
+@pytest.mark.asyncio
+async def test_unwanted_likely_suggestion_is_suppressed_before_context(mocker, db_manager):
+    mocker.patch.object(proactive, "_run_llm", return_value='{"relevant": true, "reason": "trip", "likely_action": "book a flight"}')
+    mocker.patch.object(proactive, "match_known_suggestion_type", new_callable=AsyncMock, return_value="book_travel")
+    get_context = mocker.patch.object(proactive, "get_universal_context", new_callable=AsyncMock)
+
+    await proactive.run_proactive_pipeline_logic("user-1", "gmail", EVENT)
+
+    get_context.assert_not_called()
+    metrics = db_manager.record_proactive_pipeline_metrics.call_args.args[0]
+    assert (metrics["verdict"], metrics["suppressed_by"]) == ("suppressed", "negative_feedback")
+
+def test_suggestion_types_are_rate_limited_and_cooled_down():
+    now = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    def hours_ago(*hours):
+        return [now - datetime.timedelta(hours=h) for h in hours]
+
+    feedback = {"preferences": {}, "cooldowns": {"draft_reply": now + datetime.timedelta(days=1)}}
+
+    assert suppression_reason("draft_reply", feedback, [], now) == "feedback_cooldown"
+    assert suppression_reason("schedule_meeting", feedback, hours_ago(0.5), now) == "type_cooldown"
+    assert suppression_reason("schedule_meeting", feedback, hours_ago(2, 5, 8), now) == "rate_limited"
+    assert suppression_reason("schedule_meeting", feedback, hours_ago(2, 5, 30), now) is None
+
+# --- Test suggestion type standardization ---
+
+def _template_db(mocker):
+    manager = mocker.MagicMock()
+    manager.get_all_proactive_suggestion_templates = AsyncMock(return_value=[
+        {"type_name": "draft_reply", "description": "Draft a reply", "embedding": [1.0, 0.0]},
+        {"type_name": "schedule_meeting", "description": "Schedule a meeting", "embedding": [0.0, 1.0]},
+    ])
+    manager.add_proactive_suggestion_template = AsyncMock()
+    return manager
+
+@pytest.mark.asyncio
+async def test_close_embedding_match_skips_llm(mocker):
+    mocker.patch.object(proactive, "suggestion_template_cache", SuggestionTemplateCache())
+    mocker.patch.object(proactive, "embed_text", new_callable=AsyncMock, return_value=np.array([0.99, 0.14]))
+    run_llm = mocker.patch.object(proactive, "_run_llm")
+
+    assert await proactive.standardize_suggestion_type("reply to the email", _template_db(mocker)) == "draft_reply"
+    run_llm.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_ambiguous_match_asks_llm_with_top_candidates_and_saves_new_type(mocker):
+    cache = SuggestionTemplateCache()
+    mocker.patch.object(proactive, "suggestion_template_cache", cache)
+    mocker.patch.object(proactive, "PROACTIVE_SUGGESTION_TYPE_CANDIDATES", 1)
+    mocker.patch.object(proactive, "embed_text", new_callable=AsyncMock, return_value=np.array([0.6, 0.8]))
+    run_llm = mocker.patch.object(proactive, "_run_llm", return_value="book_travel")
+    db_manager = _template_db(mocker)
+
+    assert await proactive.standardize_suggestion_type("book a flight", db_manager) == "book_travel"
+
+    prompt = run_llm.call_args.args[1]
+    assert "schedule_meeting" in prompt and "draft_reply" not in prompt
+    assert db_manager.add_proactive_suggestion_template.await_args.args[0] == "book_travel"
+    assert not cache.is_fresh()
+
+# --- Test retrieval-only context ---
+
+def test_overlapping_queries_are_looked_up_once():
+    groups = retrieval.dedupe_queries({
+        "sender": "Who is Alice Smith?",
+        "sender_again": "who is alice smith",
+        "deadline": "Q3 report deadline",
+    })
+    assert groups == {"Who is Alice Smith?": ["sender", "sender_again"], "Q3 report deadline": ["deadline"]}
+
+@pytest.mark.asyncio
+async def test_slow_source_is_dropped_and_partial_context_returned(mocker):
+    async def slow_search(query):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(retrieval, "_connected_sources", new_callable=AsyncMock, return_value={
+        "memory": AsyncMock(return_value=["Alice is the user's manager"]),
+        "gmail": slow_search,
+    })
+
+    context = await retrieval.retrieve_context("user-1", {"sender": "Alice", "sender_2": "alice"}, timeout_seconds=0.05)
+
+    assert context["universal_search_results"] == {
+        "sender": {"memory": ["Alice is the user's manager"]},
+        "sender_2": {"memory": ["Alice is the user's manager"]},
+    }
+    assert context["retrieval_status"] == {"memory": "ok", "gmail": "timed_out"}
+
+@pytest.mark.asyncio
+async def test_google_lookups_never_share_a_client_across_threads(mocker):
+    from workers.utils import google_services
+    build = mocker.patch.object(google_services, "build_google_service", return_value=object())
+    active, overlaps = [], []
+
+    def search_sync(service, query):
+        overlaps.append(bool(active))
+        active.append(query)
+        time.sleep(0.01)
+        active.remove(query)
+        return [query]
+
+    search = await retrieval._google_search("user-1", None, AsyncMock(return_value="creds"), "gmail", "v1", search_sync)
+    results = await asyncio.gather(*[search(f"q{i}") for i in range(5)])
+
+    assert results == [[f"q{i}"] for i in range(5)]
+    assert not any(overlaps)
+    build.assert_called_once()
@@ -0,0 +1,101 @@
+import pytest
+from collections import OrderedDict
+from unittest.mock import AsyncMock, MagicMock
+from workers.utils import progress as progress_module
+from workers.utils.progress import ProgressAggregator, SwarmProgressAggregator
+
+
+def _mock_db():
+    db = MagicMock()
+    db.tasks.update_one = AsyncMock()
+    db.tasks_blocks_collection.update_one = AsyncMock()
+    return db
+
+# --- Test ProgressAggregator ---
+
+@pytest.mark.asyncio
+async def test_progress_aggregator_flushes_batch_in_order(mocker):
+    mock_push = mocker.patch('workers.utils.progress.push_progress_updates', new_callable=AsyncMock)
+    db = _mock_db()
+    progress = ProgressAggregator(db, "task-1", "run-1", "test-user-123", flush_interval=60, max_batch_size=3)
+
+    progress.add({"type": "info", "content": "one"})
+    progress.add({"type": "tool_call", "tool_name": "gmail"})
+    await progress.flush_if_due()
+    db.tasks.update_one.assert_not_called()  # Neither the size nor the time window is reached yet
+
+    progress.add({"type": "info", "content": "three"})
+    await progress.flush_if_due()
+
+    db.tasks.update_one.assert_called_once()
+    pushed = db.tasks.update_one.call_args[0][1]["$push"]["runs.$[run].progress_updates"]["$each"]
+    assert [u["message"].get("content") for u in pushed] == ["one", None, "three"]
+    mock_push.assert_called_once()
+    assert progress.pending == 0
+
+@pytest.mark.asyncio
+async def test_progress_aggregator_verbosity_and_final_flush(mocker):
+    mocker.patch('workers.utils.progress.push_progress_updates', new_callable=AsyncMock)
+    db = _mock_db()
+
+    async with ProgressAggregator(db, "task-1", "run-1", "test-user-123", block_id="block-1", verbosity="minimal") as progress:
+        assert progress.add({"type": "tool_result", "result": "ok"}) is False
+        assert progress.add({"type": "thought", "content": "hmm"}) is False
+        assert progress.add({"type": "error", "content": "boom"}) is True
+
+    db.tasks.update_one.assert_called_once()
+    db.tasks_blocks_collection.update_one.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_progress_aggregator_requeues_batch_on_write_failure(mocker):
+    mocker.patch('workers.utils.progress.push_progress_updates', new_callable=AsyncMock)
+    db = _mock_db()
+    db.tasks.update_one.side_effect = [Exception("db down"), None]
+    progress = ProgressAggregator(db, "task-1", "run-1", "test-user-123")
+
+    progress.add({"type": "info", "content": "first"})
+    await progress.flush()
+    assert progress.pending == 1
+
+    progress.add({"type": "info", "content": "second"})
+    await progress.flush()
+    pushed = db.tasks.update_one.call_args[0][1]["$push"]["runs.$[run].progress_updates"]["$each"]
+    assert [u["message"]["content"] for u in pushed] == ["first", "second"]
+
+# --- Test SwarmProgressAggregator ---
+
+@pytest.mark.asyncio
+async def test_swarm_progress_aggregator_coalesces_writes(mocker):
+    mock_push = mocker.patch('workers.utils.progress.push_task_list_update', new_callable=AsyncMock)
+    db = _mock_db()
+
+    progress = SwarmProgressAggregator(db, "swarm-task-1", "test-user-123", "worker-1")
+    progress.add("processing", "Starting work")
+    progress.add("completed", "Finished work")
+    await progress.close()
+
+    db.tasks.update_one.assert_called_once()
+    update = db.tasks.update_one.call_args[0][1]
+    assert len(update["$push"]["swarm_details.progress_updates"]["$each"]) == 2
+    assert update["$inc"] == {"swarm_details.completed_agents": 1}
+    mock_push.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_verbose_progress_still_drops_thoughts():
+    progress = ProgressAggregator(_mock_db(), "task-1", "run-1", "test-user-123", verbosity="verbose")
+
+    assert progress.add({"type": "thought", "content": "hmm"}) is False
+    assert progress.add({"type": "tool_result", "result": "ok"}) is True
+
+@pytest.mark.asyncio
+async def test_swarm_push_times_do_not_outlive_the_push_interval(mocker):
+    mocker.patch('workers.utils.progress.push_task_list_update', new_callable=AsyncMock)
+    mocker.patch.object(progress_module, "_last_swarm_push_times", OrderedDict())
+
+    for i in range(50):
+        progress = SwarmProgressAggregator(_mock_db(), f"swarm-task-{i}", "test-user-123", "worker-1", push_interval=0)
+        progress.add("completed", "Finished work")
+        await progress.close()
+
+    # Every earlier entry had already stopped throttling by the time the next swarm pushed.
+    assert list(progress_module._last_swarm_push_times) == ["swarm-task-49"]
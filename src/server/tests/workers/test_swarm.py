@@ -0,0 +1,130 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from workers.executor import tasks as executor_tasks
+from workers.executor.swarm import (build_context_section, build_swarm_context, claim_run_aggregation, compute_group_size,
+                                    parse_batch_results, resolve_execution_mode, split_into_groups, store_item_results)
+
+# --- Test swarm grouping helpers ---
+
+def test_compute_group_size_without_observations():
+    assert compute_group_size(100, "agent", None) == 1
+    assert compute_group_size(100, "batched", None) == 25
+    # Small swarms are never collapsed below the minimum parallelism
+    assert compute_group_size(8, "batched", None) == 2
+
+def test_compute_group_size_adapts_to_latency():
+    assert compute_group_size(200, "agent", 6.0) == 10  # 60s target / 6s, capped by max group size
+    assert compute_group_size(200, "agent", 20.0) == 3
+    assert compute_group_size(200, "agent", 120.0) == 1
+
+def test_split_into_groups():
+    assert split_into_groups([0, 1, 2, 3, 4], 2) == [[0, 1], [2, 3], [4]]
+
+def test_resolve_execution_mode():
+    assert resolve_execution_mode({"execution_mode": "batched", "required_tools": []}) == "batched"
+    assert resolve_execution_mode({"execution_mode": "batched", "required_tools": ["gmail"]}) == "agent"
+    assert resolve_execution_mode({"execution_mode": "unknown"}) == "agent"
+    assert resolve_execution_mode({}) == "agent"
+
+def test_parse_batch_results_ignores_unexpected_and_missing_entries():
+    indexed_items = [(0, "a"), (1, "b"), (2, "c")]
+    response = json.dumps([
+        {"index": 0, "result": "A"},
+        {"index": 2, "result": None},
+        {"index": 7, "result": "not requested"}
+    ])
+    assert parse_batch_results(f"```json\n{response}\n```", indexed_items) == {0: "A", 2: None}
+    assert parse_batch_results("not json", indexed_items) == {}
+
+# --- Test swarm context ---
+
+def test_build_swarm_context_keeps_only_connection_flags():
+    user_profile = {"userData": {
+        "personalInfo": {"name": "Test User", "timezone": "Europe/Berlin"},
+        "preferences": {"proactivityEnabled": True},
+        "integrations": {
+            "gmail": {"connected": True, "credentials": "encrypted-secret"},
+            "github": {"connected": False, "credentials": "encrypted-secret"}
+        }
+    }}
+    context = build_swarm_context("test-user-123", user_profile, ["gmail", "memory"], ["Prefers short emails"])
+
+    assert context["integrations"] == {"gmail": {"connected": True}}
+    assert "encrypted-secret" not in json.dumps(context)
+    assert context["timezone"] == "Europe/Berlin"
+
+    section = build_context_section(context)
+    assert "Test User" in section and "Prefers short emails" in section
+    assert build_context_section(None) == ""
+
+# --- Test result storage ---
+
+@pytest.mark.asyncio
+async def test_store_item_results_keeps_results_of_overlapping_groups():
+    db = MagicMock()
+    db.swarm_item_results.bulk_write = AsyncMock()
+    db.tasks.update_one = AsyncMock()
+
+    await store_item_results(db, "task-1", "run-1", "group-a", {3: "from a"})
+    await store_item_results(db, "task-1", "run-1", "group-b", {3: "from b"})
+
+    filters = [call.args[0][0]._filter for call in db.swarm_item_results.bulk_write.await_args_list]
+    assert filters[0] != filters[1]
+    assert {f["group_id"] for f in filters} == {"group-a", "group-b"}
+
+@pytest.mark.asyncio
+async def test_store_item_results_publishes_results_to_the_task_as_they_land():
+    db = MagicMock()
+    db.swarm_item_results.bulk_write = AsyncMock()
+    db.tasks.update_one = AsyncMock()
+
+    await store_item_results(db, "task-1", "run-1", "group-a", {0: "$5.99", 1: None})
+
+    task_filter, pipeline = db.tasks.update_one.await_args.args
+    assert task_filter == {"task_id": "task-1"}
+    kept_entries, new_entries = pipeline[0]["$set"]["swarm_details.aggregated_results"]["$concatArrays"]
+    assert [(e["run_id"], e["group_id"], e["item_index"], e["result"]) for e in new_entries["$literal"]] == [
+        ("run-1", "group-a", 0, "$5.99"), ("run-1", "group-a", 1, None)
+    ]
+    # Only this run's entries survive, minus the ones this group is replacing.
+    assert {"$eq": ["$$entry.run_id", {"$literal": "run-1"}]} in kept_entries["$filter"]["cond"]["$and"]
+
+@pytest.mark.asyncio
+async def test_store_item_results_survives_a_failed_publish():
+    db = MagicMock()
+    db.swarm_item_results.bulk_write = AsyncMock()
+    db.tasks.update_one = AsyncMock(side_effect=Exception("write conflict"))
+
+    await store_item_results(db, "task-1", "run-1", "group-a", {0: "A"})
+
+    db.swarm_item_results.bulk_write.assert_awaited_once()
+
+# --- Test run deadline ---
+
+@pytest.mark.asyncio
+async def test_claim_run_aggregation_only_succeeds_for_the_first_caller():
+    db = MagicMock()
+    db.swarm_run_progress.update_one = AsyncMock(side_effect=[MagicMock(modified_count=1), MagicMock(modified_count=0)])
+
+    assert await claim_run_aggregation(db, "task-1", "run-1") is True
+    assert await claim_run_aggregation(db, "task-1", "run-1") is False
+    assert db.swarm_run_progress.update_one.await_args.args[0] == {"task_id": "task-1", "run_id": "run-1", "aggregated_at": None}
+
+@pytest.mark.asyncio
+async def test_overdue_run_is_aggregated_with_the_results_it_has(mocker):
+    overdue_runs = [
+        {"task_id": "task-1", "run_id": "run-1", "user_id": "user-1", "total_groups": 4, "completed_group_ids": ["g1", "g2", "g3"]},
+        {"task_id": "task-2", "run_id": "run-2", "user_id": "user-2", "total_groups": 2, "completed_group_ids": ["g1", "g2"]},
+    ]
+    mocker.patch.object(executor_tasks, "get_db_client")
+    mocker.patch.object(executor_tasks, "find_overdue_runs", AsyncMock(return_value=overdue_runs))
+    # The second run was completed by its last group in the meantime.
+    mocker.patch.object(executor_tasks, "claim_run_aggregation", AsyncMock(side_effect=[True, False]))
+    mocker.patch.object(executor_tasks, "collect_item_results", AsyncMock(return_value=["A", "B", {"error": "boom"}]))
+    delay = mocker.patch.object(executor_tasks.aggregate_results_callback, "delay")
+
+    await executor_tasks.async_finalize_overdue_swarm_runs()
+
+    delay.assert_called_once_with(["A", "B", {"error": "boom"}], parent_task_id="task-1", user_id="user-1",
+                                  parent_run_id="run-1", missing_groups=1)
@@ -58,6 +58,10 @@ celery_app.conf.update(
         'summarize-old-conversations-hourly': {
             'task': 'summarize_old_conversations',
             'schedule': 3600.0, # Run every hour
+        },
+        'finalize-overdue-swarm-runs': {
+            'task': 'finalize_overdue_swarm_runs',
+            'schedule': 300.0,
         }
     }
 )
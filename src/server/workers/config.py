@@ -9,4 +9,57 @@ if ENVIRONMENT == 'dev-local':
     if os.path.exists(dotenv_local_path):
         load_dotenv(dotenv_path=dotenv_local_path)
 MEMORY_MCP_SERVER_URL = os.getenv("MEMORY_MCP_SERVER_URL", "http://localhost:8001/sse")
-SUPPORTED_POLLING_SERVICES = ["gmail", "gcalendar"]
\ No newline at end of file
+SUPPORTED_POLLING_SERVICES = ["gmail", "gcalendar"]
+
+# --- Conversation Summarization ---
+SUMMARIZATION_CHUNK_SIZE = 30
+# Shorter trailing chunks wait until newer messages age enough to fill them.
+SUMMARIZATION_MIN_CHUNK_MESSAGES = 2
+# Only messages older than this (default one day) are summarized.
+SUMMARIZATION_MIN_MESSAGE_AGE_SECONDS = int(os.getenv("SUMMARIZATION_MIN_MESSAGE_AGE_SECONDS", 86400))
+# Concurrent LLM calls within a single per-user summarization task.
+SUMMARIZATION_MAX_CONCURRENT_LLM_CALLS = int(os.getenv("SUMMARIZATION_MAX_CONCURRENT_LLM_CALLS", 4))
+# Caps the work done by one per-user task; larger backlogs are re-queued.
+SUMMARIZATION_MAX_CHUNKS_PER_USER_RUN = int(os.getenv("SUMMARIZATION_MAX_CHUNKS_PER_USER_RUN", 10))
+# Caps how many per-user tasks a single hourly run fans out.
+SUMMARIZATION_MAX_USERS_PER_RUN = int(os.getenv("SUMMARIZATION_MAX_USERS_PER_RUN", 1000))
+
+# --- Planning ---
+# Memories retrieved for a task and given to the planner up front.
+PLANNING_MEMORY_LIMIT = int(os.getenv("PLANNING_MEMORY_LIMIT", 5))
+
+# --- Proactive Pipeline ---
+# A short LLM call that discards irrelevant events before any context is gathered.
+PROACTIVE_TRIAGE_ENABLED = os.getenv("PROACTIVE_TRIAGE_ENABLED", "true").lower() == "true"
+# Event text beyond this is cut from the triage prompt.
+PROACTIVE_TRIAGE_MAX_EVENT_CHARS = int(os.getenv("PROACTIVE_TRIAGE_MAX_EVENT_CHARS", 1500))
+# A suggestion type this similar (cosine) to a known type is matched without an LLM call.
+PROACTIVE_SUGGESTION_TYPE_MATCH_THRESHOLD = float(os.getenv("PROACTIVE_SUGGESTION_TYPE_MATCH_THRESHOLD", 0.88))
+# Nearest known types shown to the LLM when the match is ambiguous.
+PROACTIVE_SUGGESTION_TYPE_CANDIDATES = int(os.getenv("PROACTIVE_SUGGESTION_TYPE_CANDIDATES", 5))
+# Templates written by other processes are picked up after this long.
+PROACTIVE_SUGGESTION_TEMPLATE_CACHE_SECONDS = int(os.getenv("PROACTIVE_SUGGESTION_TEMPLATE_CACHE_SECONDS", 600))
+# "retrieval" looks context up directly in each source; "agent" runs the full unified search agent per query.
+PROACTIVE_CONTEXT_MODE = os.getenv("PROACTIVE_CONTEXT_MODE", "retrieval")
+# Context lookups still running after this long are dropped and the pipeline continues with what it has.
+PROACTIVE_RETRIEVAL_SOURCE_TIMEOUT_SECONDS = float(os.getenv("PROACTIVE_RETRIEVAL_SOURCE_TIMEOUT_SECONDS", 8))
+PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE = int(os.getenv("PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE", 5))
+# Formulated queries whose words overlap this much (Jaccard) are looked up once.
+PROACTIVE_RETRIEVAL_DUPLICATE_QUERY_SIMILARITY = float(os.getenv("PROACTIVE_RETRIEVAL_DUPLICATE_QUERY_SIMILARITY", 0.8))
+# Suggestion types whose feedback score is at or below this are no longer suggested.
+PROACTIVE_SUPPRESS_SCORE = int(os.getenv("PROACTIVE_SUPPRESS_SCORE", -3))
+PROACTIVE_MAX_SUGGESTIONS_PER_TYPE_PER_DAY = int(os.getenv("PROACTIVE_MAX_SUGGESTIONS_PER_TYPE_PER_DAY", 3))
+# Minimum gap between two suggestions of the same type for a user.
+PROACTIVE_TYPE_COOLDOWN_SECONDS = int(os.getenv("PROACTIVE_TYPE_COOLDOWN_SECONDS", 60 * 60))
+# A thread or calendar event that got a suggestion gets no other one within this window.
+PROACTIVE_DEDUPE_WINDOW_SECONDS = int(os.getenv("PROACTIVE_DEDUPE_WINDOW_SECONDS", 12 * 60 * 60))
+
+# --- Worker Events ---
+# "stream" appends client-facing events (notifications, progress, task list changes) to a Redis
+# stream read by the main server; "http" calls the main server's internal endpoints instead.
+# The HTTP path is also the fallback whenever the stream cannot be written.
+WORKER_EVENT_TRANSPORT = os.getenv("WORKER_EVENT_TRANSPORT", "stream")
+WORKER_EVENT_REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL"))
+WORKER_EVENT_STREAM = os.getenv("WORKER_EVENT_STREAM", "sentient:worker_events")
+# Approximate cap on stream length; consumed events beyond it are trimmed.
+WORKER_EVENT_STREAM_MAXLEN = int(os.getenv("WORKER_EVENT_STREAM_MAXLEN", 100000))
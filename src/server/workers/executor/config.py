@@ -213,4 +213,34 @@ INTEGRATIONS_CONFIG = {
             "url": os.getenv("TASKS_MCP_SERVER_URL", "http://localhost:9018/sse/")
         }
     }
-}
\ No newline at end of file
+}
+
+# --- Progress Update Batching ---
+# Buffered progress updates are flushed when either limit is reached.
+PROGRESS_FLUSH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_FLUSH_INTERVAL_SECONDS", 1.0))
+PROGRESS_FLUSH_MAX_BATCH_SIZE = int(os.getenv("PROGRESS_FLUSH_MAX_BATCH_SIZE", 20))
+# One of 'minimal', 'normal' or 'verbose'. See workers/utils/progress.py.
+PROGRESS_VERBOSITY = os.getenv("PROGRESS_VERBOSITY", "normal")
+# Minimum gap between swarm 'task list changed' pushes from a single worker process.
+SWARM_PROGRESS_PUSH_INTERVAL_SECONDS = float(os.getenv("SWARM_PROGRESS_PUSH_INTERVAL_SECONDS", 2.0))
+
+# --- Swarm Execution ---
+# Groups are sized so one worker spends roughly this long on its items.
+SWARM_TARGET_GROUP_SECONDS = float(os.getenv("SWARM_TARGET_GROUP_SECONDS", 60))
+# Upper bound on items handled sequentially by one agent-mode worker.
+SWARM_MAX_GROUP_SIZE = int(os.getenv("SWARM_MAX_GROUP_SIZE", 10))
+# Upper bound on items sent in a single batched LLM call.
+SWARM_MAX_BATCH_SIZE = int(os.getenv("SWARM_MAX_BATCH_SIZE", 25))
+# Grouping never reduces a swarm to fewer parallel workers than this.
+SWARM_MIN_PARALLEL_GROUPS = int(os.getenv("SWARM_MIN_PARALLEL_GROUPS", 4))
+# Sub-agents kept warm per worker process, keyed by user, tools and prompt.
+SWARM_WARM_AGENT_CACHE_SIZE = int(os.getenv("SWARM_WARM_AGENT_CACHE_SIZE", 8))
+# A run still waiting on groups this long after dispatch is aggregated with the results it has.
+SWARM_RUN_TIMEOUT_SECONDS = int(os.getenv("SWARM_RUN_TIMEOUT_SECONDS", 60 * 60))
+
+# --- Swarm Context ---
+# The user context shared by all workers of a swarm run is cached here once per run.
+SWARM_CONTEXT_CACHE_URL = os.getenv("SWARM_CONTEXT_CACHE_URL", os.getenv("CELERY_BROKER_URL"))
+SWARM_CONTEXT_TTL_SECONDS = int(os.getenv("SWARM_CONTEXT_TTL_SECONDS", 6 * 60 * 60))
+# Memories retrieved for the swarm goal and shared with every worker.
+SWARM_CONTEXT_MEMORY_LIMIT = int(os.getenv("SWARM_CONTEXT_MEMORY_LIMIT", 5))
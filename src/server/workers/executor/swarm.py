@@ -0,0 +1,296 @@
+import datetime
+import json
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from json_extractor import JsonExtractor
+from pymongo import ReturnDocument, UpdateOne
+from qwen_agent.agents import Assistant
+
+from workers.executor.config import (INTEGRATIONS_CONFIG, SWARM_MAX_BATCH_SIZE, SWARM_MAX_GROUP_SIZE,
+                                     SWARM_MIN_PARALLEL_GROUPS, SWARM_TARGET_GROUP_SECONDS,
+                                     SWARM_WARM_AGENT_CACHE_SIZE)
+from workers.utils.text_utils import clean_llm_output
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_MODES = ["agent", "batched"]
+
+SUB_AGENT_SYSTEM_PROMPT = (
+    "You are an autonomous sub-agent. Your goal is to complete a specific task given to you as part of a larger parallel operation. "
+    "You have access to a specific, limited suite of tools. Follow the user's prompt precisely. "
+    "Your final output should be a single, concise result (e.g., a string, a number, a JSON object, or null). Do not add conversational filler. "
+    "If you generate a final answer, wrap it in <answer> tags."
+)
+
+BATCH_WORKER_SYSTEM_PROMPT = (
+    "You are a data-processing sub-agent working on many inputs at once as part of a larger parallel operation. "
+    "You will receive a task and a JSON array of inputs, each with an `index` and an `item`. Apply the task to every input independently. "
+    "Your entire response MUST be a single, valid JSON array with exactly one object per input, in the same order, shaped like "
+    "{\"index\": <the input's index>, \"result\": <a single, concise result: a string, a number, a JSON object, or null>}. "
+    "Do not add any text outside the JSON array."
+)
+
+# --- Warm Sub-Agents ---
+# Building an Assistant connects to its MCP servers and loads their tool schemas, so
+# agents are reused across the items and tasks a worker process handles.
+_warm_agents: "OrderedDict[str, Assistant]" = OrderedDict()
+
+def get_warm_agent(llm_cfg: Dict, tools_config: List[Dict], system_prompt: str) -> Assistant:
+    """Returns a cached Assistant for this tool configuration, creating one if needed."""
+    key = json.dumps([tools_config, system_prompt], sort_keys=True)
+    agent = _warm_agents.get(key)
+    if agent is not None:
+        _warm_agents.move_to_end(key)
+        return agent
+
+    agent = Assistant(llm=llm_cfg, function_list=tools_config, system_message=system_prompt)
+    _warm_agents[key] = agent
+    while len(_warm_agents) > SWARM_WARM_AGENT_CACHE_SIZE:
+        _warm_agents.popitem(last=False)
+    return agent
+
+def build_worker_tools_config(user_id: str, worker_tools: List[str], user_integrations: Dict) -> List[Dict]:
+    """Maps the tool names chosen by the Resource Manager to the MCP servers available to this user."""
+    active_mcp_servers = {}
+    for tool_name in worker_tools:
+        config = INTEGRATIONS_CONFIG.get(tool_name)
+        if not config:
+            logger.warning(f"Worker for user {user_id} requested unknown tool '{tool_name}'.")
+            continue
+
+        mcp_config = config.get("mcp_server_config")
+        if not mcp_config:
+            continue
+
+        is_builtin = config.get("auth_type") == "builtin"
+        is_connected = user_integrations.get(tool_name, {}).get("connected", False)
+
+        if is_builtin or is_connected:
+            active_mcp_servers[mcp_config["name"]] = {"url": mcp_config["url"], "headers": {"X-User-ID": user_id}}
+        else:
+            logger.warning(f"Worker for user {user_id} needs tool '{tool_name}' but it is not connected/available.")
+
+    return [{"mcpServers": active_mcp_servers}]
+
+def build_item_prompt(worker_prompt: str, item: Any, context_section: str = "") -> str:
+    item_context = json.dumps(item, indent=2, default=str)
+    return f"{context_section}**Task:**\n{worker_prompt}\n\n**Input Data for this Task:**\n```json\n{item_context}\n```"
+
+def parse_sub_agent_result(final_content: str, final_response_list: List[Dict]) -> Any:
+    """Extracts a sub-agent's result from its <answer> tag, its last tool result, or its raw output."""
+    answer_match = re.search(r'<answer>([\s\S]*?)</answer>', final_content or "", re.DOTALL)
+    if answer_match:
+        result_str = answer_match.group(1).strip()
+        parsed_result = JsonExtractor.extract_valid_json(result_str)
+        if parsed_result is not None:
+            return parsed_result
+        if result_str.lower() == 'null':
+            return None
+        return result_str
+
+    last_message = final_response_list[-1] if final_response_list else {}
+    if last_message.get("role") == "function":
+        tool_result = JsonExtractor.extract_valid_json(last_message.get("content", "{}"))
+        if isinstance(tool_result, dict):
+            return tool_result.get("result")
+        return last_message.get("content")
+
+    cleaned_content = clean_llm_output(final_content or "")
+    if cleaned_content.lower() == 'null':
+        return None
+    return cleaned_content
+
+# --- Shared Swarm Context ---
+def build_swarm_context(user_id: str, user_profile: Optional[Dict], available_tools: List[str], memories: List[str]) -> Dict[str, Any]:
+    """
+    Assembles the user context every worker of a swarm run needs, once per run.
+    Only connection flags are kept from the integrations, never their credentials.
+    """
+    user_data = user_profile.get("userData", {}) if user_profile else {}
+    personal_info = user_data.get("personalInfo", {}) or {}
+    integrations = user_data.get("integrations", {}) or {}
+    return {
+        "user_id": user_id,
+        "user_name": personal_info.get("name", user_id),
+        "timezone": personal_info.get("timezone", "UTC"),
+        "preferences": user_data.get("preferences", {}) or {},
+        "integrations": {name: {"connected": True} for name, details in integrations.items()
+                         if isinstance(details, dict) and details.get("connected")},
+        "available_tools": available_tools,
+        "memories": memories,
+    }
+
+def swarm_context_cache_key(task_id: str, run_id: str) -> str:
+    return f"swarm_context:{task_id}:{run_id}"
+
+def build_context_section(swarm_context: Optional[Dict]) -> str:
+    """Renders the user context as a short prompt preamble. Empty when there is no context."""
+    if not swarm_context:
+        return ""
+    lines = [f"- Name: {swarm_context.get('user_name')}", f"- Timezone: {swarm_context.get('timezone')}"]
+    memories = swarm_context.get("memories") or []
+    if memories:
+        lines.append("- Relevant facts about the user:")
+        lines.extend(f"  - {fact}" for fact in memories)
+    return "**About the User:**\n" + "\n".join(lines) + "\n\n"
+
+# --- Batched Execution ---
+def build_batch_prompt(worker_prompt: str, indexed_items: List[Tuple[int, Any]], context_section: str = "") -> str:
+    inputs = [{"index": index, "item": item} for index, item in indexed_items]
+    return f"{context_section}**Task:**\n{worker_prompt}\n\n**Inputs:**\n```json\n{json.dumps(inputs, indent=2, default=str)}\n```"
+
+def parse_batch_results(response_str: str, indexed_items: List[Tuple[int, Any]]) -> Dict[int, Any]:
+    """
+    Maps item index to result for every input the batched response answered.
+    Inputs missing from the response are left out so the caller can retry them individually.
+    """
+    parsed = JsonExtractor.extract_valid_json(clean_llm_output(response_str or ""))
+    if not isinstance(parsed, list):
+        return {}
+    expected_indices = {index for index, _ in indexed_items}
+    results = {}
+    for entry in parsed:
+        if isinstance(entry, dict) and entry.get("index") in expected_indices and "result" in entry:
+            results[entry["index"]] = entry["result"]
+    return results
+
+def resolve_execution_mode(worker_config: Dict) -> str:
+    """Validates the mode chosen by the Resource Manager. Tool-using work always runs as an agent."""
+    mode = worker_config.get("execution_mode", "agent")
+    if mode not in EXECUTION_MODES:
+        return "agent"
+    if mode == "batched" and worker_config.get("required_tools"):
+        return "agent"
+    return mode
+
+# --- Adaptive Group Sizing ---
+def latency_stats_key(execution_mode: str, worker_tools: List[str]) -> str:
+    return f"{execution_mode}:{','.join(sorted(worker_tools))}"
+
+async def get_average_item_seconds(db, stats_key: str) -> Optional[float]:
+    doc = await db.swarm_worker_stats.find_one({"_id": stats_key})
+    return doc.get("avg_item_seconds") if doc else None
+
+async def record_item_latency(db, stats_key: str, seconds_per_item: float, weight: float = 0.2):
+    """Folds an observed per-item latency into an exponential moving average."""
+    await db.swarm_worker_stats.update_one(
+        {"_id": stats_key},
+        [{"$set": {
+            "avg_item_seconds": {"$add": [
+                {"$multiply": [{"$ifNull": ["$avg_item_seconds", seconds_per_item]}, 1 - weight]},
+                seconds_per_item * weight
+            ]},
+            "samples": {"$add": [{"$ifNull": ["$samples", 0]}, 1]},
+            "updated_at": datetime.datetime.now(datetime.timezone.utc)
+        }}],
+        upsert=True
+    )
+
+def compute_group_size(item_count: int, execution_mode: str, avg_item_seconds: Optional[float]) -> int:
+    """
+    Picks how many items one worker handles. Groups are sized so a worker spends about
+    SWARM_TARGET_GROUP_SECONDS on them, without dropping below SWARM_MIN_PARALLEL_GROUPS workers.
+    """
+    if item_count <= 0:
+        return 1
+    max_size = SWARM_MAX_BATCH_SIZE if execution_mode == "batched" else SWARM_MAX_GROUP_SIZE
+    if avg_item_seconds is None:
+        # Without observations, agents run one item each and batches start at full size.
+        size = max_size if execution_mode == "batched" else 1
+    else:
+        size = int(SWARM_TARGET_GROUP_SECONDS // max(avg_item_seconds, 0.001))
+    size = min(size, max_size, math.ceil(item_count / SWARM_MIN_PARALLEL_GROUPS))
+    return max(1, size)
+
+def split_into_groups(indices: List[int], group_size: int) -> List[List[int]]:
+    return [indices[i:i + group_size] for i in range(0, len(indices), group_size)]
+
+# --- Streaming Aggregation ---
+async def store_item_results(db, task_id: str, run_id: str, group_id: str, results: Dict[int, Any]):
+    """
+    Persists item results as they finish, so they are usable before the whole swarm completes.
+    Results are keyed by group as well as item: two worker configurations may cover the same item,
+    and each of their results is kept. A retried group overwrites only its own results.
+    The results are also published to the task (see `publish_partial_results`).
+    """
+    if not results:
+        return
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await db.swarm_item_results.bulk_write([
+        UpdateOne(
+            {"task_id": task_id, "run_id": run_id, "group_id": group_id, "item_index": index},
+            {"$set": {"result": result, "completed_at": now}},
+            upsert=True
+        ) for index, result in results.items()
+    ], ordered=False)
+    try:
+        await publish_partial_results(db, task_id, run_id, group_id, results, now)
+    except Exception as e:
+        # swarm_item_results is what gets aggregated, so a failed publish only delays what the client sees.
+        logger.warning(f"Failed to publish partial results of group {group_id} for task {task_id}: {e}")
+
+async def publish_partial_results(db, task_id: str, run_id: str, group_id: str, results: Dict[int, Any], completed_at: datetime.datetime):
+    """
+    Appends item results to the task's `swarm_details.aggregated_results`, which the client shows
+    while the run is in progress. Entries of earlier runs and of this group's earlier attempt are replaced.
+    """
+    entries = [{"run_id": run_id, "group_id": group_id, "item_index": index, "result": result, "completed_at": completed_at}
+               for index, result in results.items()]
+    kept_entries = {"$filter": {
+        "input": {"$ifNull": ["$swarm_details.aggregated_results", []]},
+        "as": "entry",
+        "cond": {"$and": [
+            {"$eq": ["$$entry.run_id", {"$literal": run_id}]},
+            {"$not": [{"$and": [
+                {"$eq": ["$$entry.group_id", {"$literal": group_id}]},
+                {"$in": ["$$entry.item_index", {"$literal": list(results)}]}
+            ]}]}
+        ]}
+    }}
+    # Results are arbitrary values, so they are wrapped in $literal to keep strings like "$5" from being read as field paths.
+    await db.tasks.update_one(
+        {"task_id": task_id},
+        [{"$set": {"swarm_details.aggregated_results": {"$concatArrays": [kept_entries, {"$literal": entries}]}}}]
+    )
+
+async def collect_item_results(db, task_id: str, run_id: str) -> List[Any]:
+    cursor = db.swarm_item_results.find({"task_id": task_id, "run_id": run_id}).sort([("item_index", 1), ("group_id", 1)])
+    return [doc.get("result") for doc in await cursor.to_list(length=None)]
+
+async def mark_group_completed(db, task_id: str, run_id: str, group_id: str) -> bool:
+    """
+    Records that a worker group has finished. Returns True only for the call that completes
+    the last outstanding group. A retried group is counted once.
+    """
+    doc = await db.swarm_run_progress.find_one_and_update(
+        {"task_id": task_id, "run_id": run_id, "completed_group_ids": {"$ne": group_id}},
+        {"$addToSet": {"completed_group_ids": group_id}},
+        projection={"total_groups": 1, "completed_group_ids": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not doc:
+        return False
+    return len(doc.get("completed_group_ids", [])) == doc.get("total_groups")
+
+async def claim_run_aggregation(db, task_id: str, run_id: str) -> bool:
+    """
+    Marks a run as aggregated. Returns True only for the first caller, so the group that completes
+    the run and the deadline sweep never both aggregate it.
+    """
+    result = await db.swarm_run_progress.update_one(
+        {"task_id": task_id, "run_id": run_id, "aggregated_at": None},
+        {"$set": {"aggregated_at": datetime.datetime.now(datetime.timezone.utc)}}
+    )
+    return result.modified_count == 1
+
+async def find_overdue_runs(db, now: datetime.datetime) -> List[Dict]:
+    """Returns the runs that passed their deadline without being aggregated."""
+    cursor = db.swarm_run_progress.find(
+        {"aggregated_at": None, "deadline_at": {"$lte": now}},
+        {"task_id": 1, "run_id": 1, "user_id": 1, "total_groups": 1, "completed_group_ids": 1}
+    )
+    return await cursor.to_list(length=None)
@@ -4,21 +4,30 @@ import os
 import json
 import datetime
 import asyncio
+import time
 import motor.motor_asyncio
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import re
 from json_extractor import JsonExtractor
 
 from main.analytics import capture_event
-from qwen_agent.agents import Assistant
 from workers.celery_app import celery_app
 from workers.executor.prompts import RESULT_GENERATOR_SYSTEM_PROMPT # noqa: E501
-from workers.utils.api_client import notify_user, push_progress_update, push_task_list_update
+from workers.utils.api_client import notify_user, push_task_list_update
+from workers.utils.progress import ProgressAggregator, SwarmProgressAggregator
+from workers.executor.swarm import (SUB_AGENT_SYSTEM_PROMPT, BATCH_WORKER_SYSTEM_PROMPT, get_warm_agent,
+                                    build_worker_tools_config, build_item_prompt, build_batch_prompt,
+                                    parse_sub_agent_result, parse_batch_results, latency_stats_key,
+                                    record_item_latency, store_item_results, collect_item_results,
+                                    mark_group_completed, claim_run_aggregation, find_overdue_runs,
+                                    build_context_section)
+from workers.utils.cache import cache_get_json
 from workers.utils.text_utils import clean_llm_output
 from celery import chord, group
 from main.llm import run_agent as run_main_agent, LLMProviderDownError
+from main.db import refresh_trigger_flags
 
 # Load environment variables for the worker from its own config
 from workers.executor.config import (MONGO_URI, MONGO_DB_NAME,
@@ -88,26 +97,6 @@ async def update_task_run_status(db, task_id: str, run_id: str, status: str, use
         notification_type = "taskCompleted" if status == "completed" else "taskFailed"
         await notify_user(user_id, notification_message, task_id, notification_type=notification_type)
 
-async def add_progress_update(db, task_id: str, run_id: str, user_id: str, message: Any, block_id: Optional[str] = None):
-    logger.info(f"Adding progress update to task {task_id}: '{message}'")
-    # The 'message' is now the structured JSON object for the update
-    progress_update = {"message": message, "timestamp": datetime.datetime.now(datetime.timezone.utc)}
-    
-    # 1. Push to frontend via WebSocket in real-time by calling the main server
-    await push_progress_update(user_id, task_id, run_id, message)
-
-    # 2. Save to DB for persistence, targeting the correct run in the array
-    await db.tasks.update_one(
-        {"task_id": task_id, "user_id": user_id},
-        {"$push": {"runs.$[run].progress_updates": progress_update}},
-        array_filters=[{"run.run_id": run_id}]
-    )
-    if block_id:
-        await db.tasks_blocks_collection.update_one(
-            {"block_id": block_id, "user_id": user_id},
-            {"$push": {"task_progress": progress_update}}
-        )
-
 @celery_app.task(name="execute_task_plan")
 def execute_task_plan(task_id: str, user_id: str, run_id: str):
     logger.info(f"Celery worker received task 'execute_task_plan' for task_id: {task_id}, run_id: {run_id}")
@@ -220,7 +209,9 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
 
     logger.info(f"Executor started processing task {task_id} (block_id: {block_id}) for user {user_id}.")
     await update_task_run_status(db, task_id, run_id, "processing", user_id, block_id=block_id)
-    await add_progress_update(db, task_id, run_id, user_id, {"type": "info", "content": "Executor has picked up the task and is starting execution."}, block_id=block_id)
+    progress = ProgressAggregator(db, task_id, run_id, user_id, block_id=block_id)
+    progress.add({"type": "info", "content": "Executor has picked up the task and is starting execution."})
+    await progress.flush()
 
     user_profile = await db.user_profiles.find_one({"user_id": user_id})
     personal_info = user_profile.get("userData", {}).get("personalInfo", {}) if user_profile else {}
@@ -331,11 +322,11 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
                     })
                 
                 for update in updates_to_push:
-                    if update.get("type") != "thought":
-                        # Use asyncio.create_task to send updates without blocking the agent loop
-                        asyncio.create_task(add_progress_update(db, task_id, run_id, user_id, update, block_id))
+                    progress.add(update)
 
             last_history_len = len(current_history)
+            # Buffered updates go out as one batch once the flush window or batch size is reached
+            await progress.flush_if_due()
 
         if not final_history:
             raise Exception("Agent run produced no history, indicating an immediate failure.")
@@ -351,7 +342,8 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
         if not has_final_answer:
             error_message = "Agent finished execution without providing a final answer as required by its instructions. The task may be incomplete."
             logger.error(f"Task {task_id}: {error_message}. Final history: {final_history}")
-            await add_progress_update(db, task_id, run_id, user_id, {"type": "error", "content": error_message}, block_id=block_id)
+            progress.add({"type": "error", "content": error_message})
+            await progress.flush()
             await update_task_run_status(db, task_id, run_id, "error", user_id, details={"error": error_message}, block_id=block_id)
             
             from workers.tasks import calculate_next_run
@@ -361,13 +353,15 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
                 await db.tasks.update_one({"_id": task["_id"]}, {"$set": {"status": "active", "next_execution_at": next_run_time}})
             elif schedule_type == 'triggered':
                 await db.tasks.update_one({"_id": task["_id"]}, {"$set": {"status": "active", "next_execution_at": None}})
+                await refresh_trigger_flags(db, user_id)
             else:
                 await db.tasks.update_one({"_id": task["_id"]}, {"$set": {"status": "error", "next_execution_at": None}})
             return {"status": "error", "message": error_message}
 
         # If we have a final answer, the execution was successful.
         logger.info(f"Task {task_id} execution phase completed. Dispatching to result generator.")
-        await add_progress_update(db, task_id, run_id, user_id, {"type": "info", "content": "Execution finished. Generating final report..."}, block_id=block_id)
+        progress.add({"type": "info", "content": "Execution finished. Generating final report..."})
+        await progress.flush()
         await update_task_run_status(db, task_id, run_id, "completed", user_id, block_id=block_id)
         capture_event(user_id, "task_execution_succeeded", {"task_id": task_id, "run_id": run_id})
 
@@ -388,6 +382,7 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
                 {"_id": task["_id"]},
                 {"$set": {"status": "active", "next_execution_at": None}}
             )
+            await refresh_trigger_flags(db, user_id)
             logger.info(f"Executor: Reset triggered task {task_id} to 'active' state.")
         else: # One-off task
             await db.tasks.update_one(
@@ -400,12 +395,14 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
     except LLMProviderDownError as e:
         error_message = "Sorry, our AI provider is currently down. Please try again later."
         logger.error(f"Task {task_id}: LLM provider down: {e}", exc_info=True)
-        await add_progress_update(db, task_id, run_id, user_id, {"type": "error", "content": error_message}, block_id=block_id)
+        progress.add({"type": "error", "content": error_message})
+        await progress.flush()
         await update_task_run_status(db, task_id, run_id, "error", user_id, details={"error": error_message}, block_id=block_id)
     except Exception as e:
         error_message = f"Executor agent failed: {str(e)}"
         logger.error(f"Task {task_id}: {error_message}", exc_info=True)
-        await add_progress_update(db, task_id, run_id, user_id, {"type": "error", "content": f"An error occurred during execution: {error_message}"}, block_id=block_id)
+        progress.add({"type": "error", "content": f"An error occurred during execution: {error_message}"})
+        await progress.flush()
         await update_task_run_status(db, task_id, run_id, "error", user_id, details={"error": error_message}, block_id=block_id)
         
         # Also update parent task status on failure
@@ -425,6 +422,7 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
                 {"_id": task["_id"]},
                 {"$set": {"status": "active", "next_execution_at": None}}
             )
+            await refresh_trigger_flags(db, user_id)
             logger.info(f"Executor: Reset failed triggered task {task_id} to 'active' state.")
         else:
             await db.tasks.update_one(
@@ -432,25 +430,34 @@ async def async_execute_task_plan(task_id: str, user_id: str, run_id: str):
                 {"$set": {"status": "error", "next_execution_at": None}}
             )
         return {"status": "error", "message": error_message}
+    finally:
+        # Final flush for any path that returned without one
+        await progress.close()
 
 @celery_app.task(name="aggregate_results_callback")
-def aggregate_results_callback(results, parent_task_id: str, user_id: str, parent_run_id: str):
-    """Celery callback task to aggregate results from a swarm chord."""
+def aggregate_results_callback(results, parent_task_id: str, user_id: str, parent_run_id: str, missing_groups: int = 0):
+    """
+    Celery callback task to aggregate results from a swarm run.
+    `missing_groups` counts the worker groups that never reported back before the run deadline.
+    """
     logger.info(f"Aggregating results for swarm task {parent_task_id}. Received {len(results)} results.")
-    run_async(async_aggregate_results(results, parent_task_id, user_id, parent_run_id))
+    run_async(async_aggregate_results(results, parent_task_id, user_id, parent_run_id, missing_groups))
 
-async def async_aggregate_results(results, parent_task_id: str, user_id: str, parent_run_id: str):
+async def async_aggregate_results(results, parent_task_id: str, user_id: str, parent_run_id: str, missing_groups: int = 0):
     db = get_db_client()
     try:
         # Check for errors in results
         failed_count = sum(1 for r in results if isinstance(r, dict) and 'error' in r)
-        final_status = "completed_with_errors" if failed_count > 0 else "completed"
+        final_status = "completed_with_errors" if failed_count > 0 or missing_groups else "completed"
 
+        message = f"All {len(results)} agents have completed. Generating final report."
+        if missing_groups:
+            message = f"{missing_groups} worker groups did not finish before the run deadline. Generating final report from {len(results)} results."
         progress_update = {
             "worker_id": "aggregator",
             "timestamp": datetime.datetime.now(datetime.timezone.utc),
             "status": "aggregating",
-            "message": f"All {len(results)} agents have completed. Generating final report."
+            "message": message
         }
 
         await db.tasks.update_one(
@@ -463,6 +470,8 @@ async def async_aggregate_results(results, parent_task_id: str, user_id: str, pa
             },
             array_filters=[{"run.run_id": parent_run_id}]
         )
+        # Sub-agents throttle their list refreshes, so make sure the client sees the final swarm state.
+        await push_task_list_update(user_id, parent_task_id, parent_run_id)
         
         generate_task_result.delay(parent_task_id, parent_run_id, user_id, aggregated_results=results)
         task = await db.tasks.find_one({"task_id": parent_task_id}, {"name": 1})
@@ -478,6 +487,28 @@ async def async_aggregate_results(results, parent_task_id: str, user_id: str, pa
             {"$set": {"status": "error", "error": f"Failed during result aggregation: {str(e)}"}}
         )
 
+@celery_app.task(name="finalize_overdue_swarm_runs")
+def finalize_overdue_swarm_runs():
+    """
+    Aggregates swarm runs that passed their deadline with groups outstanding, e.g. because a
+    worker was killed before it could report. Whatever results were stored are used.
+    """
+    run_async(async_finalize_overdue_swarm_runs())
+
+async def async_finalize_overdue_swarm_runs():
+    db = get_db_client()
+    for run in await find_overdue_runs(db, datetime.datetime.now(datetime.timezone.utc)):
+        task_id, run_id = run["task_id"], run["run_id"]
+        try:
+            if not await claim_run_aggregation(db, task_id, run_id):
+                continue
+            missing_groups = run.get("total_groups", 0) - len(run.get("completed_group_ids", []))
+            logger.warning(f"Swarm run {run_id} of task {task_id} passed its deadline with {missing_groups} groups outstanding. Aggregating the results it has.")
+            results = await collect_item_results(db, task_id, run_id)
+            aggregate_results_callback.delay(results, parent_task_id=task_id, user_id=run["user_id"], parent_run_id=run_id, missing_groups=missing_groups)
+        except Exception as e:
+            logger.error(f"Failed to finalize overdue swarm run {run_id} of task {task_id}: {e}", exc_info=True)
+
 @celery_app.task(name="generate_task_result")
 def generate_task_result(task_id: str, run_id: str, user_id: str, aggregated_results: Optional[List[Any]] = None):
     """
@@ -554,115 +585,166 @@ def run_single_item_worker(self, parent_task_id: str, user_id: str, item: Any, w
     
     return loop.run_until_complete(async_run_single_item_worker(parent_task_id, user_id, item, worker_prompt, worker_tools, worker_id))
 
+async def _run_sub_agent_on_item(agent, worker_prompt: str, item: Any, progress: SwarmProgressAggregator, context_section: str = "") -> Any:
+    """Runs a (warm) sub-agent on a single item and returns its parsed result."""
+    messages = [{'role': 'user', 'content': build_item_prompt(worker_prompt, item, context_section)}]
+    final_content = ""
+    final_response_list = []
+    for response in agent.run(messages=messages):
+        if isinstance(response, list) and response and response[-1].get("role") == "assistant":
+            final_content = response[-1].get("content", "")
+        final_response_list = response
+        await progress.flush_if_due()
+    return parse_sub_agent_result(final_content, final_response_list)
+
 async def async_run_single_item_worker(parent_task_id: str, user_id: str, item: Any, worker_prompt: str, worker_tools: List[str], worker_id: str):
     """
     Async logic for the single item worker.
     """
     db = get_db_client()
-
-    async def push_update(status: str, message: str):
-        update = {
-            "worker_id": worker_id,
-            "timestamp": datetime.datetime.now(datetime.timezone.utc),
-            "status": status,
-            "message": message
-        }
-        await db.tasks.update_one(
-            {"task_id": parent_task_id},
-            {
-                "$push": {"swarm_details.progress_updates": update},
-                "$inc": {"swarm_details.completed_agents": 1 if status in ["completed", "error"] else 0}
-            }
-        )
-        await push_task_list_update(user_id, parent_task_id, "swarm_progress")
+    progress = SwarmProgressAggregator(db, parent_task_id, user_id, worker_id)
 
     try:
-        # 1. Get user context
-        user_profile = await db.user_profiles.find_one({"user_id": user_id})
+        # 1. Get user context and configure tools for the sub-agent
+        user_profile = await db.user_profiles.find_one({"user_id": user_id}, {"userData.integrations": 1})
         user_integrations = user_profile.get("userData", {}).get("integrations", {}) if user_profile else {}
+        tools_config = build_worker_tools_config(user_id, worker_tools, user_integrations)
 
-        # 2. Configure tools for the sub-agent based on the provided list
-        active_mcp_servers = {}
-        for tool_name in worker_tools:
-            config = INTEGRATIONS_CONFIG.get(tool_name)
-            if not config:
-                logger.warning(f"Worker for user {user_id} requested unknown tool '{tool_name}'.")
-                continue
-            
-            mcp_config = config.get("mcp_server_config")
-            if not mcp_config: continue
-
-            is_builtin = config.get("auth_type") == "builtin"
-            is_connected = user_integrations.get(tool_name, {}).get("connected", False)
-
-            if is_builtin or is_connected:
-                active_mcp_servers[mcp_config["name"]] = {"url": mcp_config["url"], "headers": {"X-User-ID": user_id}}
-            else:
-                logger.warning(f"Worker for user {user_id} needs tool '{tool_name}' but it is not connected/available.")
-
-        tools_config = [{"mcpServers": active_mcp_servers}]
-
-        # 3. Construct prompts for the sub-agent
-        system_prompt = (
-            "You are an autonomous sub-agent. Your goal is to complete a specific task given to you as part of a larger parallel operation. "
-            "You have access to a specific, limited suite of tools. Follow the user's prompt precisely. "
-            "Your final output should be a single, concise result (e.g., a string, a number, a JSON object, or null). Do not add conversational filler. "
-            "If you generate a final answer, wrap it in <answer> tags."
-        )
-        
-        item_context = json.dumps(item, indent=2, default=str)
-        full_worker_prompt = f"**Task:**\n{worker_prompt}\n\n**Input Data for this Task:**\n```json\n{item_context}\n```"
-        
-        messages = [{'role': 'user', 'content': full_worker_prompt}]
+        progress.add("processing", f"Starting work on item: {str(item)[:100]}")
 
-        await push_update("processing", f"Starting work on item: {str(item)[:100]}")
+        # 2. Run the agent and parse its result
+        agent = get_warm_agent(llm_cfg, tools_config, SUB_AGENT_SYSTEM_PROMPT)
+        final_result = await _run_sub_agent_on_item(agent, worker_prompt, item, progress)
 
-        # 4. Run the agent
-        agent = Assistant(llm=llm_cfg, function_list=tools_config, system_message=system_prompt)
-        
-        final_content = ""
-        final_response_list = []
-        for response in agent.run(messages=messages):
-            if isinstance(response, list) and response and response[-1].get("role") == "assistant":
-                final_content = response[-1].get("content", "")
-            final_response_list = response
-
-        # 5. Parse and return the result
-        answer_match = re.search(r'<answer>([\s\S]*?)</answer>', final_content, re.DOTALL)
-        if answer_match:
-            result_str = answer_match.group(1).strip()
-            parsed_result = JsonExtractor.extract_valid_json(result_str)
-            if parsed_result is not None:
-                final_result = parsed_result
-            elif result_str.lower() == 'null':
-                final_result = None
-            else:
-                final_result = result_str
-        else:
-            last_message = final_response_list[-1] if final_response_list else {}
-            if last_message.get("role") == "function":
-                tool_result = JsonExtractor.extract_valid_json(last_message.get("content", "{}"))
-                if isinstance(tool_result, dict):
-                    final_result = tool_result.get("result")
-                else:
-                    final_result = last_message.get("content")
-            else:
-                cleaned_content = clean_llm_output(final_content)
-                if cleaned_content.lower() == 'null':
-                    final_result = None
-                else:
-                    final_result = cleaned_content
-        
-        await push_update("completed", f"Finished work. Result: {str(final_result)[:100]}")
+        progress.add("completed", f"Finished work. Result: {str(final_result)[:100]}")
         return final_result
 
     except LLMProviderDownError as e:
         error_str = "Sorry, our AI provider is currently down. Please try again later."
         logger.error(f"LLM provider down in single item worker {worker_id} for task {parent_task_id}: {e}", exc_info=True)
-        await push_update("error", error_str)
+        progress.add("error", error_str)
         return {"error": error_str, "item": item}
     except Exception as e:
         error_str = str(e)
         logger.error(f"Error in single item worker {worker_id} for task {parent_task_id}: {e}", exc_info=True)
-        await push_update("error", f"An error occurred: {error_str}")
-        return {"error": error_str, "item": item}
\ No newline at end of file
+        progress.add("error", f"An error occurred: {error_str}")
+        return {"error": error_str, "item": item}
+    finally:
+        await progress.close()
+
+@celery_app.task(name="run_swarm_item_group", bind=True)
+def run_swarm_item_group(self, parent_task_id: str, user_id: str, parent_run_id: str, group_id: str, indexed_items: List[List[Any]], worker_prompt: str, worker_tools: List[str], execution_mode: str = "agent", swarm_context_key: Optional[str] = None, swarm_context: Optional[Dict] = None):
+    """
+    A Celery worker that executes a swarm sub-task for a group of `[index, item]` pairs.
+    Results are stored as soon as each item finishes, and the group that finishes last
+    dispatches the aggregation, so there is no terminal chord waiting on the slowest worker.
+    The user context is read from the run's cache entry (`swarm_context_key`) or passed inline.
+    """
+    worker_id = self.request.id
+    logger.info(f"Running swarm group {group_id} ({len(indexed_items)} items, mode '{execution_mode}') for parent task {parent_task_id}")
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+    return loop.run_until_complete(async_run_swarm_item_group(parent_task_id, user_id, parent_run_id, group_id, indexed_items, worker_prompt, worker_tools, execution_mode, worker_id, swarm_context_key, swarm_context))
+
+def _run_batched_llm_call(worker_prompt: str, indexed_items: List[Tuple[int, Any]], context_section: str = "") -> str:
+    """Blocking structured LLM call that processes a whole batch of items at once."""
+    messages = [{'role': 'user', 'content': build_batch_prompt(worker_prompt, indexed_items, context_section)}]
+    response_str = ""
+    for chunk in run_main_agent(system_message=BATCH_WORKER_SYSTEM_PROMPT, function_list=[], messages=messages):
+        if isinstance(chunk, list) and chunk and chunk[-1].get("role") == "assistant":
+            response_str = chunk[-1].get("content", "")
+    return response_str
+
+async def async_run_swarm_item_group(parent_task_id: str, user_id: str, parent_run_id: str, group_id: str, indexed_items: List[List[Any]], worker_prompt: str, worker_tools: List[str], execution_mode: str, worker_id: str, swarm_context_key: Optional[str] = None, swarm_context: Optional[Dict] = None):
+    db = get_db_client()
+    progress = SwarmProgressAggregator(db, parent_task_id, user_id, worker_id)
+    pending = [(index, item) for index, item in indexed_items]
+    stats_key = latency_stats_key(execution_mode, worker_tools)
+    started_at = time.monotonic()
+    items_done = 0
+
+    if swarm_context is None and swarm_context_key:
+        swarm_context = cache_get_json(swarm_context_key)
+        if swarm_context is None:
+            logger.warning(f"Swarm context '{swarm_context_key}' is not cached. Group {group_id} falls back to the user profile.")
+    context_section = build_context_section(swarm_context)
+
+    try:
+        # 1. Batched mode: one structured LLM call for the whole group
+        if execution_mode == "batched":
+            progress.add("processing", f"Processing a batch of {len(pending)} items.")
+            try:
+                response_str = await asyncio.to_thread(_run_batched_llm_call, worker_prompt, pending, context_section)
+                batch_results = parse_batch_results(response_str, pending)
+            except LLMProviderDownError:
+                raise
+            except Exception as e:
+                logger.warning(f"Batched call failed for swarm group {group_id}, falling back to per-item agents: {e}")
+                batch_results = {}
+
+            await store_item_results(db, parent_task_id, parent_run_id, group_id, batch_results)
+            for index, result in batch_results.items():
+                progress.add("completed", f"Finished item {index}. Result: {str(result)[:100]}")
+            items_done += len(batch_results)
+            if batch_results:
+                await record_item_latency(db, stats_key, (time.monotonic() - started_at) / len(batch_results))
+
+            pending = [(index, item) for index, item in pending if index not in batch_results]
+            if pending:
+                logger.warning(f"Batched call for swarm group {group_id} left {len(pending)} items unanswered. Running them individually.")
+
+        # 2. Agent mode (and batch leftovers): one warm agent processes the items in turn
+        if pending:
+            if swarm_context is not None:
+                user_integrations = swarm_context.get("integrations", {})
+            else:
+                user_profile = await db.user_profiles.find_one({"user_id": user_id}, {"userData.integrations": 1})
+                user_integrations = user_profile.get("userData", {}).get("integrations", {}) if user_profile else {}
+            tools_config = build_worker_tools_config(user_id, worker_tools, user_integrations)
+            agent = get_warm_agent(llm_cfg, tools_config, SUB_AGENT_SYSTEM_PROMPT)
+
+            while pending:
+                index, item = pending[0]
+                item_started_at = time.monotonic()
+                progress.add("processing", f"Starting work on item: {str(item)[:100]}")
+                try:
+                    result = await _run_sub_agent_on_item(agent, worker_prompt, item, progress, context_section)
+                    progress.add("completed", f"Finished work. Result: {str(result)[:100]}")
+                except LLMProviderDownError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error in swarm group {group_id} on item {index} for task {parent_task_id}: {e}", exc_info=True)
+                    result = {"error": str(e), "item": item}
+                    progress.add("error", f"An error occurred: {str(e)}")
+                await store_item_results(db, parent_task_id, parent_run_id, group_id, {index: result})
+                pending.pop(0)
+                items_done += 1
+                if execution_mode == "agent":
+                    await record_item_latency(db, stats_key, time.monotonic() - item_started_at)
+
+    except LLMProviderDownError as e:
+        error_str = "Sorry, our AI provider is currently down. Please try again later."
+        logger.error(f"LLM provider down in swarm group {group_id} for task {parent_task_id}: {e}", exc_info=True)
+        await _fail_pending_items(db, parent_task_id, parent_run_id, group_id, pending, error_str, progress)
+    except Exception as e:
+        logger.error(f"Error in swarm group {group_id} for task {parent_task_id}: {e}", exc_info=True)
+        await _fail_pending_items(db, parent_task_id, parent_run_id, group_id, pending, str(e), progress)
+    finally:
+        await progress.close()
+        logger.info(f"Swarm group {group_id} finished {items_done}/{len(indexed_items)} items in {time.monotonic() - started_at:.1f}s.")
+        if await mark_group_completed(db, parent_task_id, parent_run_id, group_id) and await claim_run_aggregation(db, parent_task_id, parent_run_id):
+            results = await collect_item_results(db, parent_task_id, parent_run_id)
+            aggregate_results_callback.delay(results, parent_task_id=parent_task_id, user_id=user_id, parent_run_id=parent_run_id)
+
+async def _fail_pending_items(db, task_id: str, run_id: str, group_id: str, pending: List[Tuple[int, Any]], error_str: str, progress: SwarmProgressAggregator):
+    """Records an error result for every item the group could not process."""
+    for _ in pending:
+        progress.add("error", error_str)
+    try:
+        await store_item_results(db, task_id, run_id, group_id, {index: {"error": error_str, "item": item} for index, item in pending})
+    except Exception as e:
+        logger.error(f"Failed to store error results for task {task_id}: {e}", exc_info=True)
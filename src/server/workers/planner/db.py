@@ -1,5 +1,7 @@
 import uuid
 import datetime
+import functools
+import hashlib
 import logging
 import motor.motor_asyncio
 import logging
@@ -9,38 +11,33 @@ import json
 import uuid
 
 from workers.planner.config import MONGO_URI, MONGO_DB_NAME, INTEGRATIONS_CONFIG, ENVIRONMENT
-from workers.utils.crypto import aes_encrypt, aes_decrypt
+from workers.utils.crypto import decrypt_document_lazily, decrypt_fields, decrypt_value, encrypt_fields, encrypt_value
 
 DB_ENCRYPTION_ENABLED = ENVIRONMENT == 'stag'
 
 def _encrypt_field(data: Any) -> Any:
-    if not DB_ENCRYPTION_ENABLED or data is None:
+    if not DB_ENCRYPTION_ENABLED:
         return data
-    data_str = json.dumps(data)
-    return aes_encrypt(data_str)
+    return encrypt_value(data)
 
 def _decrypt_field(data: Any) -> Any:
-    if not DB_ENCRYPTION_ENABLED or data is None or not isinstance(data, str):
-        return data
-    try:
-        decrypted_str = aes_decrypt(data)
-        return json.loads(decrypted_str)
-    except Exception:
+    if not DB_ENCRYPTION_ENABLED:
         return data
+    return decrypt_value(data)
 
 def _encrypt_doc(doc: Dict, fields: List[str]):
-    if not DB_ENCRYPTION_ENABLED or not doc:
-        return
-    for field in fields:
-        if field in doc and doc[field] is not None:
-            doc[field] = _encrypt_field(doc[field])
+    if DB_ENCRYPTION_ENABLED:
+        encrypt_fields(doc, fields)
 
 def _decrypt_doc(doc: Optional[Dict], fields: List[str]):
-    if not DB_ENCRYPTION_ENABLED or not doc:
-        return
-    for field in fields:
-        if field in doc and doc[field] is not None:
-            doc[field] = _decrypt_field(doc[field])
+    if DB_ENCRYPTION_ENABLED:
+        decrypt_fields(doc, fields)
+
+def _decrypt_doc_lazily(doc: Optional[Dict], fields: List[str]) -> Optional[Dict]:
+    """Like `_decrypt_doc`, but each field is only decrypted when it is first read."""
+    if not DB_ENCRYPTION_ENABLED:
+        return doc
+    return decrypt_document_lazily(doc, fields)
 
 
 logger = logging.getLogger(__name__)
@@ -54,10 +51,11 @@ def get_date_from_text(text: str) -> str:
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=1)
 def get_all_mcp_descriptions() -> Dict[str, str]:
     """
     Creates a dictionary of all available services and their high-level descriptions
-    from the main server's integration config.
+    from the main server's integration config. The config is static, so it is built once per process.
     """
     if not INTEGRATIONS_CONFIG:
         logging.warning("INTEGRATIONS_CONFIG is empty. No tools will be available to the planner.")
@@ -77,6 +75,14 @@ def get_all_mcp_descriptions() -> Dict[str, str]:
             
     return mcp_descriptions
 
+def get_plan_cache_key(user_id: str, action_items: List[str], available_tools: Dict[str, str]) -> str:
+    """
+    Identifies a plan by the user, the normalized action items and the tool set it was made with.
+    Changing either the request or the available tools produces a different key.
+    """
+    normalized_items = [" ".join(str(item).lower().split()) for item in action_items]
+    payload = json.dumps([user_id, normalized_items, sorted(available_tools.items())], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 class PlannerMongoManager:  # noqa: E501
     """A MongoDB manager for the planner worker."""
@@ -86,6 +92,10 @@ class PlannerMongoManager:  # noqa: E501
         self.user_profiles_collection = self.db["user_profiles"]
         self.tasks_collection = self.db["tasks"]
         self.messages_collection = self.db["messages"]
+        self.plan_cache_collection = self.db["plan_cache"]
+        self.suggestion_templates_collection = self.db["proactive_suggestion_templates"]
+        self.proactive_metrics_collection = self.db["proactive_pipeline_metrics"]
+        self.suggestion_log_collection = self.db["proactive_suggestion_log"]
         logger.info("PlannerMongoManager initialized.")
 
     async def create_initial_task(self, user_id: str, name: str, description: str, action_items: list, topics: list, original_context: dict, source_event_id: str) -> Dict:
@@ -167,8 +177,7 @@ class PlannerMongoManager:  # noqa: E501
         """Fetches a single task by its ID."""
         doc = await self.tasks_collection.find_one({"task_id": task_id})
         SENSITIVE_TASK_FIELDS = ["name", "description", "plan", "runs", "original_context", "chat_history", "error", "clarifying_questions", "result", "swarm_details"]
-        _decrypt_doc(doc, SENSITIVE_TASK_FIELDS)
-        return doc
+        return _decrypt_doc_lazily(doc, SENSITIVE_TASK_FIELDS)
 
     async def update_task_status(self, task_id: str, status: str, details: Optional[Dict] = None):
         """Updates the status and optionally other fields of a task."""
@@ -210,6 +219,86 @@ class PlannerMongoManager:  # noqa: E501
         logger.info(f"Saved new plan with task_id: {task_id} for user: {user_id}")
         return task_id
 
+    async def get_cached_plan(self, cache_key: str) -> Optional[Dict]:
+        """Returns a previously generated plan for this key, if it has not expired."""
+        doc = await self.plan_cache_collection.find_one({"_id": cache_key})
+        if not doc:
+            return None
+        _decrypt_doc(doc, ["plan_data"])
+        return doc.get("plan_data")
+
+    async def cache_plan(self, cache_key: str, user_id: str, plan_data: Dict):
+        doc = {"user_id": user_id, "plan_data": plan_data, "created_at": datetime.datetime.now(datetime.timezone.utc)}
+        _encrypt_doc(doc, ["plan_data"])
+        await self.plan_cache_collection.update_one({"_id": cache_key}, {"$set": doc}, upsert=True)
+
+    async def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Returns only the user's integrations, which is all the Google credential helpers read."""
+        return await self.user_profiles_collection.find_one({"user_id": user_id}, {"userData.integrations": 1})
+
+    async def get_user_preferences(self, user_id: str) -> Dict[str, Any]:
+        """Returns the preferences the user set in their settings."""
+        doc = await self.user_profiles_collection.find_one({"user_id": user_id}, {"userData.preferences": 1})
+        return (doc or {}).get("userData", {}).get("preferences") or {}
+
+    async def get_user_proactive_feedback(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the user's feedback score and cooldown per proactive suggestion type."""
+        doc = await self.user_profiles_collection.find_one(
+            {"user_id": user_id}, {"userData.proactive_preferences": 1, "userData.proactive_cooldowns": 1}
+        )
+        user_data = (doc or {}).get("userData", {})
+        return {
+            "preferences": user_data.get("proactive_preferences") or {},
+            "cooldowns": user_data.get("proactive_cooldowns") or {}
+        }
+
+    async def get_recent_proactive_suggestion_times(self, user_id: str, suggestion_type: str, since: datetime.datetime) -> List[datetime.datetime]:
+        cursor = self.suggestion_log_collection.find(
+            {"user_id": user_id, "suggestion_type": suggestion_type, "created_at": {"$gte": since}},
+            {"_id": 0, "created_at": 1}
+        )
+        return [doc["created_at"] for doc in await cursor.to_list(length=None)]
+
+    async def has_recent_proactive_suggestion(self, user_id: str, dedupe_key: str, since: datetime.datetime) -> bool:
+        doc = await self.suggestion_log_collection.find_one(
+            {"user_id": user_id, "dedupe_key": dedupe_key, "created_at": {"$gte": since}}, {"_id": 1}
+        )
+        return doc is not None
+
+    async def log_proactive_suggestion(self, user_id: str, suggestion_type: str, dedupe_key: Optional[str]):
+        """Remembers a suggestion shown to the user, for rate limits and deduplication."""
+        await self.suggestion_log_collection.insert_one({
+            "user_id": user_id,
+            "suggestion_type": suggestion_type,
+            "dedupe_key": dedupe_key,
+            "created_at": datetime.datetime.now(datetime.timezone.utc)
+        })
+
+    async def get_all_proactive_suggestion_templates(self) -> List[Dict[str, Any]]:
+        cursor = self.suggestion_templates_collection.find({}, {"_id": 0, "type_name": 1, "description": 1, "embedding": 1})
+        return await cursor.to_list(length=None)
+
+    async def add_proactive_suggestion_template(self, type_name: str, description: str, embedding: Optional[List[float]] = None) -> bool:
+        """Registers a new canonical suggestion type. Returns False if the type already existed."""
+        result = await self.suggestion_templates_collection.update_one(
+            {"type_name": type_name},
+            {"$setOnInsert": {
+                "type_name": type_name,
+                "description": description,
+                "embedding": embedding,
+                "created_at": datetime.datetime.now(datetime.timezone.utc)
+            }},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def set_proactive_suggestion_template_embedding(self, type_name: str, embedding: List[float]):
+        await self.suggestion_templates_collection.update_one({"type_name": type_name}, {"$set": {"embedding": embedding}})
+
+    async def record_proactive_pipeline_metrics(self, metrics: Dict[str, Any]):
+        """Stores the cost and verdict of one proactive pipeline run, for tuning the pipeline's stages."""
+        await self.proactive_metrics_collection.insert_one(metrics)
+
     async def update_chat(self, user_id: str, chat_id: str, updates: Dict) -> bool:
         """Updates fields of a chat document, like the title."""
         updates["updated_at"] = datetime.datetime.now(datetime.timezone.utc)
@@ -65,3 +65,16 @@ Final Instructions:
 - Do not include any text outside of the JSON object. Your response must begin with `{{` and end with `}}`.
 - ALWAYS RETURN THE JSON OBJECT.
 """
+
+# Appended after the task creation and planner prompts when a new task is refined and planned in one call.
+REFINE_AND_PLAN_OUTPUT_INSTRUCTIONS = """
+Combined Task Creation and Planning:
+You are performing both jobs described above in a single response: first extract the task details from the user's prompt, then create the plan for it. These output instructions replace the output formats described above.
+
+Your output MUST be a single, valid JSON object with the keys "name", "description", "priority", "schedule" and "plan":
+- "name", "description", "priority" and "schedule" follow the task creation instructions.
+- "plan" is the list of steps (each with "tool" and "description") following the planner instructions, for a single run of the task.
+- If the prompt is ambiguous, depends on information you do not have, or you are not confident about the plan, set "plan" to null. The task details are still required. A separate planning step will then take over.
+
+Do not include any text outside of the JSON object.
+"""
@@ -31,4 +31,33 @@ RECENTLY_ACTIVE_THRESHOLD_HOURS_WORKER = int(os.getenv("WORKER_RECENT_THRESHOLD_
 PEAK_HOURS_START_WORKER = int(os.getenv("WORKER_PEAK_HOURS_START", 8))
 PEAK_HOURS_END_WORKER = int(os.getenv("WORKER_PEAK_HOURS_END", 22))
 
+# Incremental sync (events.list with syncToken)
+GCAL_EVENTS_PAGE_SIZE = int(os.getenv("GCAL_EVENTS_PAGE_SIZE", 250))
+# How far back a full sync (first poll, or after the sync token expired) looks.
+GCAL_FULL_SYNC_LOOKBACK_DAYS = int(os.getenv("GCAL_FULL_SYNC_LOOKBACK_DAYS", 14))
+# A full sync lists the whole calendar rather than what changed, so it mainly seeds the sync token.
+# Only events starting within the next GCAL_FULL_SYNC_UPCOMING_DAYS are reported, soonest first,
+# and at most GCAL_FULL_SYNC_MAX_EVENTS of them per sync.
+GCAL_FULL_SYNC_UPCOMING_DAYS = int(os.getenv("GCAL_FULL_SYNC_UPCOMING_DAYS", 14))
+GCAL_FULL_SYNC_MAX_EVENTS = int(os.getenv("GCAL_FULL_SYNC_MAX_EVENTS", 10))
+# Calendars synced per user: the primary one plus the ones selected in the user's calendar list.
+GCAL_SYNC_MAX_CALENDARS = int(os.getenv("GCAL_SYNC_MAX_CALENDARS", 10))
+GCAL_CALENDAR_LIST_REFRESH_SECONDS = int(os.getenv("GCAL_CALENDAR_LIST_REFRESH_SECONDS", 6 * 60 * 60))
+# An event whose last update is this close to its creation is reported as created rather than updated.
+GCAL_CREATED_UPDATE_TOLERANCE_SECONDS = int(os.getenv("GCAL_CREATED_UPDATE_TOLERANCE_SECONDS", 60))
+
+# Processed item ids remembered in-process, so items seen again skip the processed items lookup.
+PROCESSED_ITEMS_CACHE_SIZE = int(os.getenv("POLLER_PROCESSED_ITEMS_CACHE_SIZE", 10000))
+
+# Poll scheduling across replicas
+# A claimed user is leased for POLL_LEASE_SECONDS and the lease is renewed every POLL_LEASE_RENEW_SECONDS while polling.
+POLL_LEASE_SECONDS = int(os.getenv("POLL_LEASE_SECONDS", 90))
+POLL_LEASE_RENEW_SECONDS = int(os.getenv("POLL_LEASE_RENEW_SECONDS", 30))
+POLLER_MAX_CONCURRENT_POLLS = int(os.getenv("POLLER_MAX_CONCURRENT_POLLS", 20))
+POLLER_REPLICA_TTL_SECONDS = int(os.getenv("POLLER_REPLICA_TTL_SECONDS", 90))
+# Trigger polling interval: back to the minimum whenever new items are found, stretched on every idle poll.
+TRIGGER_POLL_MIN_SECONDS = int(os.getenv("TRIGGER_POLL_MIN_SECONDS", 60))
+TRIGGER_POLL_MAX_SECONDS = int(os.getenv("TRIGGER_POLL_MAX_SECONDS", 10 * 60))
+TRIGGER_POLL_IDLE_BACKOFF_FACTOR = float(os.getenv("TRIGGER_POLL_IDLE_BACKOFF_FACTOR", 1.5))
+
 print(f"[{datetime.datetime.now()}] [GCalendarPoller_Config] Config loaded.")
\ No newline at end of file
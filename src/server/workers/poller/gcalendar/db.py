@@ -1,28 +1,25 @@
 import motor.motor_asyncio
-from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
-from pymongo.errors import DuplicateKeyError
-from typing import Dict, List, Optional, Any
+from collections import OrderedDict
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import Dict, Iterable, List, Optional, Any, Set, Tuple
 import datetime
 from datetime import timezone # Ensure timezone imported
-import json
 
-from workers.poller.gcalendar.config import MONGO_URI, MONGO_DB_NAME, ENVIRONMENT # Import from local config
-from workers.utils.crypto import aes_decrypt
+from workers.poller.gcalendar.config import MONGO_URI, MONGO_DB_NAME, ENVIRONMENT, PROCESSED_ITEMS_CACHE_SIZE, POLL_LEASE_SECONDS # Import from local config
+from workers.utils.crypto import decrypt_value
 
 DB_ENCRYPTION_ENABLED = ENVIRONMENT == 'stag'
 
 def _decrypt_field(data: Any) -> Any:
-    if not DB_ENCRYPTION_ENABLED or data is None or not isinstance(data, str):
-        return data
-    try:
-        decrypted_str = aes_decrypt(data)
-        return json.loads(decrypted_str)
-    except Exception:
+    if not DB_ENCRYPTION_ENABLED:
         return data
+    return decrypt_value(data)
 
 USER_PROFILES_COLLECTION = "user_profiles"
 POLLING_STATE_COLLECTION = "polling_state_store"
 PROCESSED_ITEMS_COLLECTION = "processed_items_log"
+POLLER_REPLICAS_COLLECTION = "poller_replicas"
 
 class PollerMongoManager:
     def __init__(self):
@@ -31,6 +28,9 @@ class PollerMongoManager:
         self.user_profiles_collection = self.db[USER_PROFILES_COLLECTION]
         self.polling_state_collection = self.db[POLLING_STATE_COLLECTION]
         self.processed_items_collection = self.db[PROCESSED_ITEMS_COLLECTION]
+        self.poller_replicas_collection = self.db[POLLER_REPLICAS_COLLECTION]
+        # (user_id, service_name, processor, item_id) of items known to be processed, in front of Mongo
+        self._processed_cache: "OrderedDict[Tuple[str, str, str, str], None]" = OrderedDict()
         print(f"[{datetime.datetime.now()}] [GCalendarPoller_MongoManager] Initialized for poller.")
 
     async def initialize_indices_if_needed(self):
@@ -50,7 +50,12 @@ class PollerMongoManager:
     async def get_polling_state(self, user_id: str, service_name: str, poll_type: str) -> Optional[Dict[str, Any]]:
         return await self.polling_state_collection.find_one({"user_id": user_id, "service_name": service_name, "poll_type": poll_type})
 
-    async def update_polling_state(self, user_id: str, service_name: str, poll_type: str, state_data: Dict[str, Any]) -> bool:
+    async def update_polling_state(self, user_id: str, service_name: str, poll_type: str, state_data: Dict[str, Any],
+                                   lease_token: Optional[int] = None) -> bool:
+        """
+        Saves a polling state. With `lease_token`, the write is fenced: it only applies while that
+        lease is still the current one, so a poller that lost its lease cannot overwrite the state.
+        """
         if not user_id or not service_name or state_data is None: return False
         for key, value in state_data.items():
             if isinstance(value, datetime.datetime):
@@ -70,78 +75,104 @@ class PollerMongoManager:
         if 'created_at' in state_data:
             del state_data['created_at']
 
+        if 'lease_token' in state_data: # Only ever changed when a lease is claimed
+            del state_data['lease_token']
+
+        query = {"user_id": user_id, "service_name": service_name, "poll_type": poll_type}
+        if lease_token is not None:
+            query["lease_token"] = lease_token
         result = await self.polling_state_collection.update_one(
-            {"user_id": user_id, "service_name": service_name, "poll_type": poll_type},
+            query,
             {"$set": state_data, "$setOnInsert": {"created_at": now_utc, "user_id": user_id, "service_name": service_name, "poll_type": poll_type}},
-            upsert=True
+            upsert=lease_token is None
         )
         return result.matched_count > 0 or result.upserted_id is not None
 
     async def get_due_polling_tasks_for_service(self, service_name: str, poll_type: str) -> List[Dict[str, Any]]:
         now_utc = datetime.datetime.now(timezone.utc)
 
-        pipeline = [
-            # Stage 1: Find due polling states for triggers
-            {
-                "$match": {
-                    "service_name": service_name,
-                    "poll_type": "triggers",
-                    "is_enabled": True,
-                    "next_scheduled_poll_time": {"$lte": now_utc},
-                    "is_currently_polling": False,
-                    "$or": [
-                        {"error_backoff_until_timestamp": None},
-                        {"error_backoff_until_timestamp": {"$lte": now_utc}}
-                    ]
-                }
-            },
-            # Stage 2: Join with tasks to find users with active triggered tasks
-            {
-                "$lookup": {
-                    "from": "tasks",
-                    "localField": "user_id",
-                    "foreignField": "user_id",
-                    "as": "user_tasks"
-                }
-            },
-            # Stage 3: Filter for users who have at least one active triggered task for this service
-            {
-                "$match": {
-                    "user_tasks": {
-                        "$elemMatch": {
-                            "status": "active",
-                            "schedule.type": "triggered",
-                            "schedule.source": service_name
-                        }
-                    }
-                }
-            },
-            {"$sort": {"next_scheduled_poll_time": ASCENDING}}
-        ]
-        cursor = self.polling_state_collection.aggregate(pipeline)
+        # `has_active_triggers` is kept up to date by the main server and workers whenever a user's
+        # triggered tasks change, so no join with the tasks collection is needed here.
+        query = {
+            "service_name": service_name,
+            "poll_type": "triggers",
+            "has_active_triggers": True,
+            "is_currently_polling": False,
+            "next_scheduled_poll_time": {"$lte": now_utc},
+            "is_enabled": True,
+            "$or": [
+                {"error_backoff_until_timestamp": None},
+                {"error_backoff_until_timestamp": {"$lte": now_utc}}
+            ]
+        }
+        cursor = self.polling_state_collection.find(query, projection={"user_id": 1}).sort("next_scheduled_poll_time", ASCENDING)
         return await cursor.to_list(length=None)
 
-    async def set_polling_status_and_get(self, user_id: str, service_name: str, poll_type: str) -> Optional[Dict[str, Any]]:
+    async def set_polling_status_and_get(self, user_id: str, service_name: str, poll_type: str, owner_id: Optional[str] = None,
+                                         lease_seconds: int = POLL_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Claims a due polling state with a lease. Every claim increments `lease_token`, the fencing
+        token the holder passes to later writes. A lease that was not renewed in time can be claimed
+        again straight away, so a crashed poller delays its users by one lease, not a lock timeout.
+        """
         now_utc = datetime.datetime.now(timezone.utc)
         doc = await self.polling_state_collection.find_one_and_update(
-            {"user_id": user_id, "service_name": service_name, "poll_type": poll_type, "is_enabled": True, 
-             "next_scheduled_poll_time": {"$lte": now_utc}, "is_currently_polling": False,
-             "$or": [{"error_backoff_until_timestamp": None}, {"error_backoff_until_timestamp": {"$lte": now_utc}}]},
-            {"$set": {"is_currently_polling": True, "last_attempted_poll_timestamp": now_utc}},
+            {"user_id": user_id, "service_name": service_name, "poll_type": poll_type, "is_enabled": True,
+             "next_scheduled_poll_time": {"$lte": now_utc},
+             "$and": [
+                 {"$or": [{"is_currently_polling": False}, {"lease_expires_at": {"$lt": now_utc}}]},
+                 {"$or": [{"error_backoff_until_timestamp": None}, {"error_backoff_until_timestamp": {"$lte": now_utc}}]}
+             ]},
+            {"$set": {"is_currently_polling": True, "last_attempted_poll_timestamp": now_utc, "lease_owner": owner_id,
+                      "lease_expires_at": now_utc + datetime.timedelta(seconds=lease_seconds)},
+             "$inc": {"lease_token": 1}},
             return_document=ReturnDocument.AFTER
         )
         return doc
-    
+
+    async def renew_polling_lease(self, user_id: str, service_name: str, poll_type: str, lease_token: int,
+                                  lease_seconds: int = POLL_LEASE_SECONDS) -> bool:
+        """Extends a held lease. Returns False if the lease was lost to another poller."""
+        result = await self.polling_state_collection.update_one(
+            {"user_id": user_id, "service_name": service_name, "poll_type": poll_type,
+             "lease_token": lease_token, "is_currently_polling": True},
+            {"$set": {"lease_expires_at": datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=lease_seconds)}}
+        )
+        return result.matched_count > 0
+
     async def reset_stale_polling_locks(self, service_name: str, poll_type: str, timeout_minutes: int = 30):
-        stale_threshold = datetime.datetime.now(timezone.utc) - datetime.timedelta(minutes=timeout_minutes)
+        """Releases expired leases, and locks taken before leases existed that are older than `timeout_minutes`."""
+        now_utc = datetime.datetime.now(timezone.utc)
+        stale_threshold = now_utc - datetime.timedelta(minutes=timeout_minutes)
         result = await self.polling_state_collection.update_many(
-            {"service_name": service_name, "poll_type": poll_type, "is_currently_polling": True, "last_attempted_poll_timestamp": {"$lt": stale_threshold}},
-            {"$set": {"is_currently_polling": False, "last_successful_poll_status_message": "Reset stale lock.",
-                      "next_scheduled_poll_time": datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=60)}}
+            {"service_name": service_name, "poll_type": poll_type, "is_currently_polling": True,
+             "$or": [
+                 {"lease_expires_at": {"$lt": now_utc}},
+                 {"lease_expires_at": {"$exists": False}, "last_attempted_poll_timestamp": {"$lt": stale_threshold}}
+             ]},
+            {"$set": {"is_currently_polling": False, "lease_owner": None, "lease_expires_at": None,
+                      "last_successful_poll_status_message": "Reset stale lock.", "next_scheduled_poll_time": now_utc}}
         )
         if result.modified_count > 0:
             print(f"[{datetime.datetime.now()}] [GCalendarPoller_MongoManager] Reset {result.modified_count} stale {service_name.upper()} polling locks.")
 
+    async def register_replica(self, service_name: str, replica_id: str, ttl_seconds: int):
+        """Records that this poller replica is alive. Replicas that stop heartbeating drop out after `ttl_seconds`."""
+        now_utc = datetime.datetime.now(timezone.utc)
+        await self.poller_replicas_collection.update_one(
+            {"_id": f"{service_name}:{replica_id}"},
+            {"$set": {"service_name": service_name, "replica_id": replica_id, "heartbeat_at": now_utc,
+                      "expires_at": now_utc + datetime.timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+
+    async def deregister_replica(self, service_name: str, replica_id: str):
+        await self.poller_replicas_collection.delete_one({"_id": f"{service_name}:{replica_id}"})
+
+    async def get_live_replica_ids(self, service_name: str) -> List[str]:
+        now_utc = datetime.datetime.now(timezone.utc)
+        return await self.poller_replicas_collection.distinct("replica_id", {"service_name": service_name, "expires_at": {"$gt": now_utc}})
+
     async def log_processed_item(self, user_id: str, service_name: str, item_id: str, processor: str) -> bool:
         """Logs that an item has been processed by a specific system (e.g., 'proactivity', 'triggers')."""
         try:
@@ -170,6 +201,62 @@ class PollerMongoManager:
             return True
         return False
 
+    def _remember_processed(self, user_id: str, service_name: str, processor: str, item_ids: Iterable[str]):
+        for item_id in item_ids:
+            key = (user_id, service_name, processor, item_id)
+            self._processed_cache[key] = None
+            self._processed_cache.move_to_end(key)
+        while len(self._processed_cache) > PROCESSED_ITEMS_CACHE_SIZE:
+            self._processed_cache.popitem(last=False)
+
+    async def get_processed_item_ids(self, user_id: str, service_name: str, item_ids: List[str], processor: str) -> Set[str]:
+        """Returns which of `item_ids` were already processed by `processor`, in at most one query."""
+        processed = {item_id for item_id in item_ids if (user_id, service_name, processor, item_id) in self._processed_cache}
+        unknown_ids = list(dict.fromkeys(item_id for item_id in item_ids if item_id not in processed))
+        if not unknown_ids:
+            return processed
+
+        cursor = self.processed_items_collection.find(
+            {"user_id": user_id, "service_name": service_name, "item_id": {"$in": unknown_ids}, "processed_by": processor},
+            projection={"item_id": 1, "_id": 0}
+        )
+        found_ids = [doc["item_id"] for doc in await cursor.to_list(length=None)]
+        self._remember_processed(user_id, service_name, processor, found_ids)
+        return processed | set(found_ids)
+
+    async def log_processed_items(self, user_id: str, service_name: str, item_ids: List[str], processor: str) -> bool:
+        """
+        Logs several processed items in one unordered bulk write. Each item upserts into the
+        (user_id, service_name, item_id) unique index; duplicate-key races with a concurrent
+        poller are ignored, since the item is logged either way.
+        """
+        item_ids = list(dict.fromkeys(item_ids))
+        if not item_ids:
+            return True
+        now_utc = datetime.datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "service_name": service_name, "item_id": item_id},
+                {
+                    "$addToSet": {"processed_by": processor},
+                    "$setOnInsert": {"user_id": user_id, "service_name": service_name, "item_id": item_id, "processing_timestamp": now_utc}
+                },
+                upsert=True
+            ) for item_id in item_ids
+        ]
+        try:
+            await self.processed_items_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            other_errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if other_errors:
+                print(f"[{datetime.datetime.now()}] [GCalendarPoller_DB_ERROR] Logging {len(other_errors)} processed items for {user_id}/{service_name} by {processor}: {other_errors[0].get('errmsg')}")
+                return False
+        except Exception as e:
+            print(f"[{datetime.datetime.now()}] [GCalendarPoller_DB_ERROR] Logging processed items for {user_id}/{service_name} by {processor}: {e}")
+            return False
+        self._remember_processed(user_id, service_name, processor, item_ids)
+        return True
+
     async def close(self):
         if self.client:
             self.client.close()
@@ -4,9 +4,14 @@ from datetime import timezone
 import traceback
 import logging
 
-from workers.poller.gcalendar.config import POLLING_INTERVALS_WORKER as POLL_CFG
+from workers.poller.gcalendar.config import (POLLING_INTERVALS_WORKER as POLL_CFG, GCAL_CALENDAR_LIST_REFRESH_SECONDS,
+                                             POLL_LEASE_SECONDS, POLL_LEASE_RENEW_SECONDS, POLLER_MAX_CONCURRENT_POLLS,
+                                             POLLER_REPLICA_TTL_SECONDS, TRIGGER_POLL_MIN_SECONDS, TRIGGER_POLL_MAX_SECONDS,
+                                             TRIGGER_POLL_IDLE_BACKOFF_FACTOR)
 from workers.poller.gcalendar.db import PollerMongoManager
-from workers.poller.gcalendar.utils import get_gcalendar_credentials, fetch_events # noqa
+from workers.poller.gcalendar.utils import (get_gcalendar_credentials, fetch_event_changes, processed_item_key, # noqa
+                                            CHANGE_EVENT_TYPES)
+from workers.utils.poller_scheduling import HashRing, PollLeaseLostError, compute_next_poll_interval, make_replica_id
 from googleapiclient.errors import HttpError
 
 logger = logging.getLogger(__name__)
@@ -15,6 +20,8 @@ class GCalendarPollingService:
     def __init__(self, db_manager: PollerMongoManager):
         self.db_manager = db_manager
         self.service_name = "gcalendar"
+        self.replica_id = make_replica_id()
+        self._in_flight_polls = set()
         logger.info("GCalendarPollingService Initialized.")
 
     async def _handle_poll_failure(self, user_id: str, polling_state: dict, error_message: str):
@@ -29,9 +36,23 @@ class GCalendarPollingService:
         polling_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=backoff_seconds)
         logger.warning(f"GCalendar user {user_id} experiencing {failures} failures. Backing off for {backoff_seconds}s.")
 
+    async def _renew_lease_periodically(self, user_id: str, mode: str, lease_token: int, lease_lost: asyncio.Event):
+        """Heartbeats the poll lease until cancelled. Sets `lease_lost` and stops once the lease is lost."""
+        while True:
+            await asyncio.sleep(POLL_LEASE_RENEW_SECONDS)
+            if not await self.db_manager.renew_polling_lease(user_id, self.service_name, mode, lease_token, POLL_LEASE_SECONDS):
+                logger.warning(f"Lost the GCalendar polling lease for user {user_id} (token {lease_token}).")
+                lease_lost.set()
+                return
+
     async def _run_single_user_poll_cycle(self, user_id: str, polling_state: dict, mode: str):
         logger.info(f"Starting GCalendar poll cycle for user {user_id} in mode '{mode}'")
         updated_state = polling_state.copy()
+        lease_token = polling_state.get("lease_token")
+        # Once set, another replica may own the user, so nothing more is dispatched or logged.
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._renew_lease_periodically(user_id, mode, lease_token, lease_lost)) if lease_token is not None else None
+        found_count = 0
 
         try:
             user_profile = await self.db_manager.get_user_profile(user_id)
@@ -61,16 +82,26 @@ class GCalendarPollingService:
                 updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=1)
                 return
 
-            fetched_events = await fetch_events(creds, max_results=10)
-            
-            processed_count = 0
-            for event in fetched_events:
+            sync_state = polling_state.get("calendar_sync_state") or []
+            calendar_list_synced_at = polling_state.get("calendar_list_synced_at")
+            if calendar_list_synced_at and calendar_list_synced_at.tzinfo is None:
+                calendar_list_synced_at = calendar_list_synced_at.replace(tzinfo=timezone.utc)
+            now = datetime.datetime.now(timezone.utc)
+            refresh_calendar_list = not calendar_list_synced_at or \
+                (now - calendar_list_synced_at).total_seconds() >= GCAL_CALENDAR_LIST_REFRESH_SECONDS
+
+            changes, new_sync_state = await fetch_event_changes(creds, sync_state, refresh_calendar_list, user_id=user_id)
+            found_count = len(changes)
+
+            candidates = []
+            for change in changes:
+                event = change["event"]
+                change_type = change["change_type"]
                 event_id = event["id"]
 
                 content_to_check = (event.get("summary", "") + " " + event.get("description", "")).lower()
                 if any(word.lower() in content_to_check for word in keyword_filters):
                     logger.info(f"Skipping event {event_id} for user {user_id} due to privacy filter match.")
-                    # Log as processed to avoid re-checking
                     continue
 
                 if email_filters:
@@ -79,33 +110,58 @@ class GCalendarPollingService:
                         attendee_emails = {attendee.get("email", "").lower() for attendee in attendees if attendee.get("email")}
                         if any(blocked_email in attendee_emails for blocked_email in email_filters):
                             logger.info(f"Skipping event {event_id} for user {user_id} due to attendee filter match.")
+                            continue
+
+                # Run the main pre-filter here, before dispatching any tasks.
+                # Cancelled events only carry their id, so there is nothing to filter on.
+                if change_type != "cancelled":
+                    from workers.proactive.utils import event_pre_filter
+                    if not event_pre_filter(event, self.service_name, user_profile.get("userData", {}).get("personalInfo", {}).get("email")):
+                        logger.info(f"Event {event_id} for user {user_id} was discarded by the main pre-filter.")
+                        continue
+
+                candidates.append((processed_item_key(event, change_type), change))
+
+            # One lookup and one bulk write per cycle, however many events changed.
+            already_processed = await self.db_manager.get_processed_item_ids(
+                user_id, self.service_name, [item_key for item_key, _ in candidates], mode
+            )
+            if lease_lost.is_set():
+                raise PollLeaseLostError(f"Lease lost before dispatching {len(candidates)} event changes.")
+            dispatched_keys = []
+            for item_key, change in candidates:
+                if item_key in already_processed or item_key in dispatched_keys:
                     continue
-
-                # Run the main pre-filter here, before dispatching any tasks
-                from workers.proactive.utils import event_pre_filter
-                if not event_pre_filter(event, self.service_name, user_profile.get("userData", {}).get("personalInfo", {}).get("email")):
-                    logger.info(f"Event {event_id} for user {user_id} was discarded by the main pre-filter.")
-                    continue
-
-                if not await self.db_manager.is_item_processed(user_id, self.service_name, event_id, mode):
-                    from workers.tasks import execute_triggered_task
-
-                    if mode == 'triggers':
-                        # 3. Check for and execute triggered tasks
-                        execute_triggered_task.delay(
-                            user_id=user_id, source=self.service_name,
-                            event_type="new_event", event_data=event
-                        )
-                    await self.db_manager.log_processed_item(user_id, self.service_name, event_id, mode)
-                    processed_count += 1
+                from workers.tasks import execute_triggered_task
+
+                if mode == 'triggers':
+                    # 3. Check for and execute triggered tasks
+                    execute_triggered_task.delay(
+                        user_id=user_id, source=self.service_name,
+                        event_type=CHANGE_EVENT_TYPES[change["change_type"]],
+                        event_data={**change["event"], "calendar_id": change["calendar_id"], "change_type": change["change_type"]}
+                    )
+                dispatched_keys.append(item_key)
+
+            if lease_lost.is_set():
+                raise PollLeaseLostError(f"Lease lost before logging {len(dispatched_keys)} dispatched event changes.")
+            await self.db_manager.log_processed_items(user_id, self.service_name, dispatched_keys, mode)
+            processed_count = len(dispatched_keys)
+
+            # Only advance the sync tokens once every change they cover has been dispatched.
+            updated_state["calendar_sync_state"] = new_sync_state
+            if refresh_calendar_list:
+                updated_state["calendar_list_synced_at"] = now
 
             if processed_count > 0:
-                logger.info(f"Dispatched {processed_count} new GCalendar events to the processing pipeline for user {user_id}.") # noqa
-            
-            updated_state["last_successful_poll_status_message"] = f"Successfully polled. Found {len(fetched_events)} events, dispatched {processed_count} new." # noqa
+                logger.info(f"Dispatched {processed_count} GCalendar event changes to the processing pipeline for user {user_id}.") # noqa
+
+            updated_state["last_successful_poll_status_message"] = f"Successfully polled. Found {len(changes)} changed events, dispatched {processed_count} new." # noqa
             updated_state["consecutive_failure_count"] = 0
             updated_state["error_backoff_until_timestamp"] = None
 
+        except PollLeaseLostError as e:
+            logger.warning(f"Abandoning GCalendar poll cycle for user {user_id}: {e}")
         except HttpError as he:
             logger.error(f"GCalendar API Error for user {user_id}: {he}")
             await self._handle_poll_failure(user_id, updated_state, f"API Error: {str(he)}. Status: {he.resp.status if he.resp else 'N/A'}")
@@ -123,31 +179,56 @@ class GCalendarPollingService:
                     updated_state["is_enabled"] = False
                     updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=1)
             else:
-                next_interval = 60  # Always poll every 60 seconds for triggers
+                next_interval = compute_next_poll_interval(
+                    polling_state.get("poll_interval_seconds"), found_count,
+                    TRIGGER_POLL_MIN_SECONDS, TRIGGER_POLL_MAX_SECONDS, TRIGGER_POLL_IDLE_BACKOFF_FACTOR
+                )
+                updated_state["poll_interval_seconds"] = next_interval
                 updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=next_interval)
             
-            updated_state["is_currently_polling"] = False
-            await self.db_manager.update_polling_state(user_id, self.service_name, mode, updated_state)
+            if heartbeat:
+                heartbeat.cancel()
+            updated_state["is_currently_polling"] = False # Release the lease
+            updated_state["lease_owner"] = None
+            updated_state["lease_expires_at"] = None
+            saved = await self.db_manager.update_polling_state(user_id, self.service_name, mode, updated_state, lease_token=lease_token)
+            if not saved:
+                logger.warning(f"GCalendar polling lease for user {user_id} was taken over by another poller. Discarding this cycle's state.")
             logger.info(f"GCalendar poll cycle finished for user {user_id}. Next poll at {updated_state['next_scheduled_poll_time']}.")
 
     async def run_scheduler_loop(self):
-        logger.info(f"GCalendar scheduler starting loop (interval: {POLL_CFG['SCHEDULER_TICK_SECONDS']}s)")
-        # await self.db_manager.initialize_indices_if_needed()
-        # await self.db_manager.reset_stale_polling_locks(self.service_name)
+        """
+        Periodically claims due users and polls them. Any number of replicas can run this loop:
+        users are sharded across the live replicas with a consistent-hash ring, every poll holds a
+        heartbeated lease, and each replica runs at most POLLER_MAX_CONCURRENT_POLLS polls at once.
+        """
+        logger.info(f"GCalendar scheduler {self.replica_id} starting loop (interval: {POLL_CFG['SCHEDULER_TICK_SECONDS']}s)")
 
-        while True:
-            try:
-                due_tasks_states = await self.db_manager.get_due_polling_tasks_for_service(self.service_name, 'triggers')
-                
-                if due_tasks_states:
-                    logger.info(f"Scheduler: Found {len(due_tasks_states)} due GCalendar trigger polling tasks.")
-                    for task_state in due_tasks_states:
-                        user_id = task_state["user_id"]
-                        locked_task_state = await self.db_manager.set_polling_status_and_get(user_id, self.service_name, 'triggers')
-                        if locked_task_state:
-                            logger.info(f"Scheduler: Acquired lock for {user_id} (GCal). Triggering poll cycle.")
-                            asyncio.create_task(self._run_single_user_poll_cycle(user_id, locked_task_state, 'triggers'))
-            except Exception as e:
-                logger.error(f"Error in GCalendar scheduler loop: {e}", exc_info=True)
-            
-            await asyncio.sleep(POLL_CFG["SCHEDULER_TICK_SECONDS"])
\ No newline at end of file
+        try:
+            while True:
+                try:
+                    await self.db_manager.register_replica(self.service_name, self.replica_id, POLLER_REPLICA_TTL_SECONDS)
+                    await self.db_manager.reset_stale_polling_locks(self.service_name, 'triggers')
+
+                    free_slots = POLLER_MAX_CONCURRENT_POLLS - len(self._in_flight_polls)
+                    if free_slots > 0:
+                        ring = HashRing(await self.db_manager.get_live_replica_ids(self.service_name))
+                        due_tasks_states = await self.db_manager.get_due_polling_tasks_for_service(self.service_name, 'triggers')
+                        owned_user_ids = ring.filter_owned(self.replica_id, [state["user_id"] for state in due_tasks_states])
+                        if owned_user_ids:
+                            logger.info(f"Scheduler: {len(owned_user_ids)} of {len(due_tasks_states)} due GCalendar users belong to this replica.")
+
+                        for user_id in owned_user_ids[:free_slots]:
+                            locked_task_state = await self.db_manager.set_polling_status_and_get(
+                                user_id, self.service_name, 'triggers', owner_id=self.replica_id
+                            )
+                            if locked_task_state:
+                                poll = asyncio.create_task(self._run_single_user_poll_cycle(user_id, locked_task_state, 'triggers'))
+                                self._in_flight_polls.add(poll)
+                                poll.add_done_callback(self._in_flight_polls.discard)
+                except Exception as e:
+                    logger.error(f"Error in GCalendar scheduler loop: {e}", exc_info=True)
+
+                await asyncio.sleep(POLL_CFG["SCHEDULER_TICK_SECONDS"])
+        finally:
+            await self.db_manager.deregister_replica(self.service_name, self.replica_id)
@@ -4,10 +4,13 @@ import json
 from datetime import timezone
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request as GoogleAuthRequest
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from workers.utils.crypto import aes_decrypt, aes_encrypt
+from workers.utils.google_services import get_google_service, evict_google_service
+from workers.poller.gcalendar.config import (GCAL_CREATED_UPDATE_TOLERANCE_SECONDS, GCAL_EVENTS_PAGE_SIZE,
+                                             GCAL_FULL_SYNC_LOOKBACK_DAYS, GCAL_FULL_SYNC_MAX_EVENTS,
+                                             GCAL_FULL_SYNC_UPCOMING_DAYS, GCAL_SYNC_MAX_CALENDARS)
 from workers.poller.gcalendar.db import PollerMongoManager
 from typing import Optional, List, Dict, Tuple
 
@@ -42,41 +45,164 @@ async def get_gcalendar_credentials(user_id: str, db_manager: PollerMongoManager
         print(f"[{datetime.datetime.now()}] [GCalendarPoller_Auth_ERROR] Failed to get credentials for {user_id}: {e}")
         return None
 
-async def fetch_events(creds: Credentials, max_results: int = 10) -> List[Dict]:
+# Trigger event type for each kind of calendar change.
+CHANGE_EVENT_TYPES = {
+    "created": "new_event",
+    "updated": "updated_event",
+    "cancelled": "cancelled_event",
+}
+
+def _parse_rfc3339(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+def _event_start(event: Dict) -> Optional[datetime.datetime]:
+    start = event.get("start") or {}
+    if start.get("dateTime"):
+        start_time = _parse_rfc3339(start["dateTime"])
+    elif start.get("date"):
+        # All-day events only have a date.
+        start_time = _parse_rfc3339(f"{start['date']}T00:00:00+00:00")
+    else:
+        return None
+    if start_time and start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return start_time
+
+def classify_event_change(event: Dict) -> str:
+    """Tells whether an event returned by an incremental sync was created, updated or cancelled."""
+    if event.get("status") == "cancelled":
+        return "cancelled"
+    created = _parse_rfc3339(event.get("created"))
+    updated = _parse_rfc3339(event.get("updated"))
+    if created and updated and (updated - created).total_seconds() > GCAL_CREATED_UPDATE_TOLERANCE_SECONDS:
+        return "updated"
+    return "created"
+
+def processed_item_key(event: Dict, change_type: str) -> str:
+    """
+    Identifies one change of an event in the processed items log. Creations keep using the
+    bare event id, so events logged before incremental sync are not emitted again.
+    """
+    if change_type == "created":
+        return event["id"]
+    if change_type == "updated":
+        return f"{event['id']}:updated:{event.get('updated', '')}"
+    return f"{event['id']}:cancelled"
+
+def list_calendar_ids(service, max_calendars: int = GCAL_SYNC_MAX_CALENDARS) -> List[str]:
+    """Returns the user's primary calendar followed by the calendars selected in their calendar list."""
+    primary_ids, selected_ids = [], []
+    page_token = None
+    while True:
+        response = service.calendarList().list(minAccessRole='reader', pageToken=page_token).execute()
+        for entry in response.get('items', []):
+            if entry.get('primary'):
+                primary_ids.append(entry['id'])
+            elif entry.get('selected') and not entry.get('deleted'):
+                selected_ids.append(entry['id'])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    return (primary_ids + selected_ids)[:max_calendars] or ['primary']
+
+def _list_events(service, calendar_id: str, **params) -> Tuple[List[Dict], Optional[str]]:
+    events = []
+    page_token = None
+    while True:
+        response = service.events().list(
+            calendarId=calendar_id, maxResults=GCAL_EVENTS_PAGE_SIZE, showDeleted=True, pageToken=page_token, **params
+        ).execute()
+        events.extend(response.get('items', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return events, response.get('nextSyncToken')
+
+def sync_calendar_events(service, calendar_id: str, sync_token: Optional[str]) -> Tuple[List[Dict], Optional[str], bool]:
+    """
+    Returns the events changed since `sync_token`, the next sync token, and whether a full sync was done.
+    Without a token, or when Google no longer accepts it (410 Gone), the calendar is fully resynced
+    starting GCAL_FULL_SYNC_LOOKBACK_DAYS ago.
+    """
+    if sync_token:
+        try:
+            events, next_sync_token = _list_events(service, calendar_id, syncToken=sync_token)
+            return events, next_sync_token, False
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            print(f"[{datetime.datetime.now()}] [GCalendarPoller_Sync] Sync token for calendar {calendar_id} expired. Running a full resync.")
+
+    time_min = datetime.datetime.now(timezone.utc) - datetime.timedelta(days=GCAL_FULL_SYNC_LOOKBACK_DAYS)
+    events, next_sync_token = _list_events(service, calendar_id, timeMin=time_min.isoformat())
+    return events, next_sync_token, True
+
+def sync_calendars(service, sync_state: List[Dict], refresh_calendar_list: bool) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Syncs every polled calendar from its stored token.
+
+    `sync_state` is a list of `{"calendar_id", "sync_token"}` (a list rather than a mapping,
+    because calendar ids contain dots). Returns the changes, each `{"change_type", "calendar_id",
+    "event"}`, and the new sync state. Created, updated and cancelled events come from incremental
+    syncs. A full sync (first poll, new calendar, expired token) only seeds the token: of the events
+    it lists, just the next GCAL_FULL_SYNC_MAX_EVENTS starting within GCAL_FULL_SYNC_UPCOMING_DAYS
+    are reported as created, so connecting a busy calendar does not fire a trigger per event.
+    """
+    sync_tokens = {entry["calendar_id"]: entry.get("sync_token") for entry in sync_state or []}
+    calendar_ids = list_calendar_ids(service) if refresh_calendar_list or not sync_tokens else list(sync_tokens)
+
+    now = datetime.datetime.now(timezone.utc)
+    upcoming_until = now + datetime.timedelta(days=GCAL_FULL_SYNC_UPCOMING_DAYS)
+    changes = []
+    upcoming = []
+    new_sync_state = []
+    for calendar_id in calendar_ids:
+        try:
+            events, next_sync_token, full_sync = sync_calendar_events(service, calendar_id, sync_tokens.get(calendar_id))
+        except HttpError as error:
+            if error.resp.status == 404:
+                print(f"[{datetime.datetime.now()}] [GCalendarPoller_Sync] Calendar {calendar_id} no longer exists. Dropping it.")
+                continue
+            raise
+
+        for event in events:
+            if full_sync:
+                start_time = _event_start(event)
+                if event.get("status") != "cancelled" and start_time and now <= start_time <= upcoming_until:
+                    upcoming.append((start_time, {"change_type": "created", "calendar_id": calendar_id, "event": event}))
+            else:
+                changes.append({"change_type": classify_event_change(event), "calendar_id": calendar_id, "event": event})
+        new_sync_state.append({"calendar_id": calendar_id, "sync_token": next_sync_token})
+
+    upcoming.sort(key=lambda item: item[0])
+    changes.extend(change for _, change in upcoming[:GCAL_FULL_SYNC_MAX_EVENTS])
+    return changes, new_sync_state
+
+async def fetch_event_changes(creds: Credentials, sync_state: List[Dict], refresh_calendar_list: bool = False,
+                              user_id: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Fetches calendar changes since the stored sync tokens.
+    Returns the changes and the sync state to store (unchanged on non-API errors).
+    """
     import asyncio
     try:
         loop = asyncio.get_event_loop()
-        service = await loop.run_in_executor(None, lambda: build('calendar', 'v3', credentials=creds))
-        
-        now = datetime.datetime.now(timezone.utc)
-        time_min = (now - datetime.timedelta(weeks=2)).isoformat()
-        time_max = (now + datetime.timedelta(weeks=2)).isoformat()
-        
-        list_params = {
-            'calendarId': 'primary',
-            'maxResults': max_results,
-            'singleEvents': True,
-            'orderBy': 'startTime',
-            'showDeleted': True # Important to capture cancellations
-        }
-        list_params['timeMin'] = time_min
-        list_params['timeMax'] = time_max
-
-        results = await loop.run_in_executor(None, 
-            lambda: service.events().list(**list_params).execute()
-        )
-        events_data = results.get('items', [])
-        
-        if not events_data:
-            return []
+        service = await loop.run_in_executor(None, get_google_service, 'calendar', 'v3', creds, user_id)
+        changes, new_sync_state = await loop.run_in_executor(None, sync_calendars, service, sync_state, refresh_calendar_list)
+
+        if changes:
+            print(f"[{datetime.datetime.now()}] [GCalendarPoller_Fetch] Found {len(changes)} changed events.")
+        return changes, new_sync_state
 
-        print(f"[{datetime.datetime.now()}] [GCalendarPoller_Fetch] Found {len(events_data)} updated events.")
-        
-        return events_data
-        
     except HttpError as error:
         print(f"[{datetime.datetime.now()}] [GCalendarPoller_Fetch_ERROR] An API error occurred: {error}")
+        if user_id and error.resp.status in [401, 403]:
+            evict_google_service('calendar', 'v3', user_id)
         raise error
     except Exception as e:
         print(f"[{datetime.datetime.now()}] [GCalendarPoller_Fetch_ERROR] Unexpected error fetching events: {e}")
-        return []
+        return [], sync_state
@@ -42,4 +42,26 @@ RECENTLY_ACTIVE_THRESHOLD_HOURS_WORKER = int(os.getenv("WORKER_RECENT_THRESHOLD_
 PEAK_HOURS_START_WORKER = int(os.getenv("WORKER_PEAK_HOURS_START", 8))
 PEAK_HOURS_END_WORKER = int(os.getenv("WORKER_PEAK_HOURS_END", 22))
 
+# Incremental sync (users.history.list)
+# Upper bound on new messages handled in one poll cycle. The history cursor stops at the
+# last message handled, so the rest of a larger burst is picked up by the next cycle.
+GMAIL_SYNC_MAX_MESSAGES_PER_CYCLE = int(os.getenv("GMAIL_SYNC_MAX_MESSAGES_PER_CYCLE", 100))
+GMAIL_HISTORY_PAGE_SIZE = int(os.getenv("GMAIL_HISTORY_PAGE_SIZE", 500))
+# Message details are fetched through the HTTP batch endpoint. Gmail recommends at most 50 per batch.
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", 50))
+
+# Processed item ids remembered in-process, so items seen again skip the processed items lookup.
+PROCESSED_ITEMS_CACHE_SIZE = int(os.getenv("POLLER_PROCESSED_ITEMS_CACHE_SIZE", 10000))
+
+# Poll scheduling across replicas
+# A claimed user is leased for POLL_LEASE_SECONDS and the lease is renewed every POLL_LEASE_RENEW_SECONDS while polling.
+POLL_LEASE_SECONDS = int(os.getenv("POLL_LEASE_SECONDS", 90))
+POLL_LEASE_RENEW_SECONDS = int(os.getenv("POLL_LEASE_RENEW_SECONDS", 30))
+POLLER_MAX_CONCURRENT_POLLS = int(os.getenv("POLLER_MAX_CONCURRENT_POLLS", 20))
+POLLER_REPLICA_TTL_SECONDS = int(os.getenv("POLLER_REPLICA_TTL_SECONDS", 90))
+# Trigger polling interval: back to the minimum whenever new items are found, stretched on every idle poll.
+TRIGGER_POLL_MIN_SECONDS = int(os.getenv("TRIGGER_POLL_MIN_SECONDS", 60))
+TRIGGER_POLL_MAX_SECONDS = int(os.getenv("TRIGGER_POLL_MAX_SECONDS", 10 * 60))
+TRIGGER_POLL_IDLE_BACKOFF_FACTOR = float(os.getenv("TRIGGER_POLL_IDLE_BACKOFF_FACTOR", 1.5))
+
 print(f"[{datetime.datetime.now()}] [GmailPoller_Config] Config loaded.")
\ No newline at end of file
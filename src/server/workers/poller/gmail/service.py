@@ -6,10 +6,13 @@ import time # For sleep
 import logging # Import logging
 import re
 
-from workers.poller.gmail.config import POLLING_INTERVALS_WORKER as POLL_CFG
+from workers.poller.gmail.config import (POLLING_INTERVALS_WORKER as POLL_CFG, POLL_LEASE_SECONDS, POLL_LEASE_RENEW_SECONDS,
+                                         POLLER_MAX_CONCURRENT_POLLS, POLLER_REPLICA_TTL_SECONDS, TRIGGER_POLL_MIN_SECONDS,
+                                         TRIGGER_POLL_MAX_SECONDS, TRIGGER_POLL_IDLE_BACKOFF_FACTOR)
 from workers.poller.gmail.db import PollerMongoManager
 from workers.poller.gmail.utils import get_gmail_credentials, fetch_emails # noqa
 from workers.proactive.utils import event_pre_filter # Import the pre-filter
+from workers.utils.poller_scheduling import HashRing, PollLeaseLostError, compute_next_poll_interval, make_replica_id
 from googleapiclient.errors import HttpError # Import HttpError
 
 logger = logging.getLogger(__name__)
@@ -18,6 +21,8 @@ class GmailPollingService:
     def __init__(self, db_manager: PollerMongoManager):
         self.db_manager = db_manager
         self.service_name = "gmail"
+        self.replica_id = make_replica_id()
+        self._in_flight_polls = set()
         logger.info("GmailPollingService Initialized.")
 
     async def _handle_poll_failure(self, user_id: str, polling_state: dict, error_message: str):
@@ -32,9 +37,23 @@ class GmailPollingService:
         polling_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=backoff_seconds)
         logger.warning(f"User {user_id} experiencing {failures} failures. Backing off for {backoff_seconds}s.")
 
+    async def _renew_lease_periodically(self, user_id: str, mode: str, lease_token: int, lease_lost: asyncio.Event):
+        """Heartbeats the poll lease until cancelled. Sets `lease_lost` and stops once the lease is lost."""
+        while True:
+            await asyncio.sleep(POLL_LEASE_RENEW_SECONDS)
+            if not await self.db_manager.renew_polling_lease(user_id, self.service_name, mode, lease_token, POLL_LEASE_SECONDS):
+                logger.warning(f"Lost the Gmail polling lease for user {user_id} (token {lease_token}).")
+                lease_lost.set()
+                return
+
     async def _run_single_user_poll_cycle(self, user_id: str, polling_state: dict, mode: str):
         logger.info(f"Starting poll cycle for user {user_id} in mode '{mode}'")
         updated_state = polling_state.copy() # To modify and save later
+        lease_token = polling_state.get("lease_token")
+        # Once set, another replica may own the user, so nothing more is dispatched or logged.
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._renew_lease_periodically(user_id, mode, lease_token, lease_lost)) if lease_token is not None else None
+        found_count = 0
 
         try:
             user_profile = await self.db_manager.get_user_profile(user_id)
@@ -66,13 +85,15 @@ class GmailPollingService:
                 updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=1)
                 return
 
+            # Only messages added since the stored history cursor are returned, so a quiet
+            # mailbox costs a single history call.
             last_ts_unix = polling_state.get("last_successful_poll_timestamp_unix")
-            fetched_emails = await fetch_emails(creds, last_ts_unix, max_results=10)
+            fetched_emails, new_history_id = await fetch_emails(creds, polling_state.get("history_id"), last_ts_unix, user_id=user_id)
+            found_count = len(fetched_emails)
             
-            processed_count = 0
+            candidate_emails = []
 
             for email in fetched_emails: # noqa
-                email_item_id = email["id"]
                 
                 # Keyword check
                 content_to_check = (email.get("subject", "") + " " + email.get("body", "")).lower()
@@ -99,18 +120,32 @@ class GmailPollingService:
                     logger.info(f"Email {email['id']} for user {user_id} was discarded by the main pre-filter.")
                     continue
 
-                if not await self.db_manager.is_item_processed(user_id, self.service_name, email_item_id, mode): # noqa
-                    from workers.tasks import execute_triggered_task # noqa
+                candidate_emails.append(email)
+
+            # One lookup and one bulk write per cycle, however many emails were fetched.
+            already_processed = await self.db_manager.get_processed_item_ids(
+                user_id, self.service_name, [email["id"] for email in candidate_emails], mode
+            )
+            if lease_lost.is_set():
+                raise PollLeaseLostError(f"Lease lost before dispatching {len(candidate_emails)} emails.")
+            dispatched_ids = []
+            for email in candidate_emails:
+                if email["id"] in already_processed or email["id"] in dispatched_ids:
+                    continue
+                from workers.tasks import execute_triggered_task # noqa
 
-                    if mode == 'triggers':
-                        # 3. Check for and execute triggered tasks
-                        execute_triggered_task.delay(
-                            user_id=user_id, source=self.service_name,
-                            event_type="new_email", event_data=email
-                        )
+                if mode == 'triggers':
+                    # 3. Check for and execute triggered tasks
+                    execute_triggered_task.delay(
+                        user_id=user_id, source=self.service_name,
+                        event_type="new_email", event_data=email
+                    )
+                dispatched_ids.append(email["id"])
 
-                    await self.db_manager.log_processed_item(user_id, self.service_name, email_item_id, mode)
-                    processed_count += 1
+            if lease_lost.is_set():
+                raise PollLeaseLostError(f"Lease lost before logging {len(dispatched_ids)} dispatched emails.")
+            await self.db_manager.log_processed_items(user_id, self.service_name, dispatched_ids, mode)
+            processed_count = len(dispatched_ids)
 
             if processed_count > 0:
                 # If we processed emails, update the timestamp to the newest one we saw.
@@ -120,10 +155,15 @@ class GmailPollingService:
             if processed_count > 0:
                 logger.info(f"Dispatched {processed_count} new emails to the processing pipeline for user {user_id}.")
 
+            # Advance the cursor only after the emails it covers have been dispatched.
+            updated_state["history_id"] = new_history_id
+
             updated_state["last_successful_poll_status_message"] = f"Successfully polled. Found {len(fetched_emails)} messages, dispatched {processed_count} new." # noqa
             updated_state["consecutive_failure_count"] = 0
             updated_state["error_backoff_until_timestamp"] = None
 
+        except PollLeaseLostError as e:
+            logger.warning(f"Abandoning Gmail poll cycle for user {user_id}: {e}")
         except HttpError as he: # Catch Google API specific errors
             logger.error(f"Google API Error for user {user_id}: {he}")
             await self._handle_poll_failure(user_id, updated_state, f"API Error: {str(he)}. Status: {he.resp.status if he.resp else 'N/A'}")
@@ -143,46 +183,57 @@ class GmailPollingService:
                     updated_state["is_enabled"] = False # Disable after too many failures
                     updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(days=1) # Check much later
             else:
-                next_interval = 60  # Always poll every 60 seconds for triggers
+                next_interval = compute_next_poll_interval(
+                    polling_state.get("poll_interval_seconds"), found_count,
+                    TRIGGER_POLL_MIN_SECONDS, TRIGGER_POLL_MAX_SECONDS, TRIGGER_POLL_IDLE_BACKOFF_FACTOR
+                )
+                updated_state["poll_interval_seconds"] = next_interval
                 updated_state["next_scheduled_poll_time"] = datetime.datetime.now(timezone.utc) + datetime.timedelta(seconds=next_interval)
             
-            updated_state["is_currently_polling"] = False # Release lock
-            await self.db_manager.update_polling_state(user_id, self.service_name, mode, updated_state)
+            if heartbeat:
+                heartbeat.cancel()
+            updated_state["is_currently_polling"] = False # Release the lease
+            updated_state["lease_owner"] = None
+            updated_state["lease_expires_at"] = None
+            saved = await self.db_manager.update_polling_state(user_id, self.service_name, mode, updated_state, lease_token=lease_token)
+            if not saved:
+                logger.warning(f"Gmail polling lease for user {user_id} was taken over by another poller. Discarding this cycle's state.")
             logger.info(f"Poll cycle finished for user {user_id}. Next poll at {updated_state['next_scheduled_poll_time']}.")
 
 
     async def run_scheduler_loop(self):
         """
-        Periodically checks MongoDB for users whose Gmail polling is due.
+        Periodically claims due users and polls them. Any number of replicas can run this loop:
+        users are sharded across the live replicas with a consistent-hash ring, every poll holds a
+        heartbeated lease, and each replica runs at most POLLER_MAX_CONCURRENT_POLLS polls at once.
         """
-        logger.info(f"Scheduler starting loop (interval: {POLL_CFG['SCHEDULER_TICK_SECONDS']}s)")
-        # await self.db_manager.initialize_indices_if_needed()
-        # await self.db_manager.reset_stale_polling_locks(self.service_name) # Reset locks for "gmail"
+        logger.info(f"Gmail scheduler {self.replica_id} starting loop (interval: {POLL_CFG['SCHEDULER_TICK_SECONDS']}s)")
 
-        while True:
-            try:
-                due_tasks_states = await self.db_manager.get_due_polling_tasks_for_service(self.service_name, 'triggers')
-                
-                if not due_tasks_states:
-                    # logger.debug("Scheduler: No due Gmail polling tasks.")
-                    pass
-                else:
-                    logger.info(f"Scheduler: Found {len(due_tasks_states)} due Gmail trigger polling tasks.")
-
-                for task_state in due_tasks_states:
-                    user_id = task_state["user_id"]
-                    
-                    # Try to acquire a lock on the task
-                    locked_task_state = await self.db_manager.set_polling_status_and_get(user_id, self.service_name, 'triggers')
-                    
-                    if locked_task_state:
-                        logger.info(f"Scheduler: Acquired lock for {user_id}. Triggering poll cycle.")
-                        asyncio.create_task(self._run_single_user_poll_cycle(user_id, locked_task_state, 'triggers'))
-                    else:
-                        logger.debug(f"Scheduler: Could not acquire lock for {user_id} (already processing or no longer due).")
-
-            except Exception as e:
-                logger.error(f"Error in scheduler loop: {e}", exc_info=True)
-                traceback.print_exc()
-            
-            await asyncio.sleep(POLL_CFG["SCHEDULER_TICK_SECONDS"])
\ No newline at end of file
+        try:
+            while True:
+                try:
+                    await self.db_manager.register_replica(self.service_name, self.replica_id, POLLER_REPLICA_TTL_SECONDS)
+                    await self.db_manager.reset_stale_polling_locks(self.service_name, 'triggers')
+
+                    free_slots = POLLER_MAX_CONCURRENT_POLLS - len(self._in_flight_polls)
+                    if free_slots > 0:
+                        ring = HashRing(await self.db_manager.get_live_replica_ids(self.service_name))
+                        due_tasks_states = await self.db_manager.get_due_polling_tasks_for_service(self.service_name, 'triggers')
+                        owned_user_ids = ring.filter_owned(self.replica_id, [state["user_id"] for state in due_tasks_states])
+                        if owned_user_ids:
+                            logger.info(f"Scheduler: {len(owned_user_ids)} of {len(due_tasks_states)} due Gmail users belong to this replica.")
+
+                        for user_id in owned_user_ids[:free_slots]:
+                            locked_task_state = await self.db_manager.set_polling_status_and_get(
+                                user_id, self.service_name, 'triggers', owner_id=self.replica_id
+                            )
+                            if locked_task_state:
+                                poll = asyncio.create_task(self._run_single_user_poll_cycle(user_id, locked_task_state, 'triggers'))
+                                self._in_flight_polls.add(poll)
+                                poll.add_done_callback(self._in_flight_polls.discard)
+                except Exception as e:
+                    logger.error(f"Error in Gmail scheduler loop: {e}", exc_info=True)
+
+                await asyncio.sleep(POLL_CFG["SCHEDULER_TICK_SECONDS"])
+        finally:
+            await self.db_manager.deregister_replica(self.service_name, self.replica_id)
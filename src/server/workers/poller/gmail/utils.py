@@ -4,12 +4,13 @@ import base64
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request as GoogleAuthRequest
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 from workers.utils.crypto import aes_decrypt, aes_encrypt
+from workers.utils.google_services import get_google_service, evict_google_service
+from workers.poller.gmail.config import GMAIL_BATCH_SIZE, GMAIL_HISTORY_PAGE_SIZE, GMAIL_SYNC_MAX_MESSAGES_PER_CYCLE
 from workers.poller.gmail.db import PollerMongoManager
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 
 async def get_gmail_credentials(user_id: str, db_manager: PollerMongoManager) -> Optional[Credentials]:
     import asyncio
@@ -56,66 +57,160 @@ async def get_gmail_credentials(user_id: str, db_manager: PollerMongoManager) ->
         print(f"[{datetime.datetime.now()}] [GmailPoller_Auth_ERROR] Failed to get credentials for {user_id}: {e}")
         return None
 
-async def fetch_emails(creds: Credentials, last_processed_timestamp_unix: Optional[int] = None, max_results: int = 10) -> List[Dict]: # noqa
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-        service = await loop.run_in_executor(None, lambda: build('gmail', 'v1', credentials=creds))
-        
-        query = 'is:unread'
-        if last_processed_timestamp_unix:
-            query += f' after:{last_processed_timestamp_unix}'
-        else:
-            # For the first run, only look at the last 2 weeks to avoid a huge backlog.
-            query += ' newer_than:14d'
-            
-        results = await loop.run_in_executor(None, 
-            lambda: service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
-        )
-        messages_info = results.get('messages', [])
-        
-        emails_data = []
-        if not messages_info:
-            return []
+# Labels of messages that an `is:unread` search would not return.
+_EXCLUDED_LABELS = {"SPAM", "TRASH"}
+
+# Only the parts of a message that `_parse_message` and the poller's filters read.
+MESSAGE_FIELDS = "id,threadId,snippet,internalDate,labelIds,payload(mimeType,headers,body/data,parts(mimeType,body/data))"
+
+def _parse_message(msg_full: Dict) -> Dict:
+    headers = {h['name']: h['value'] for h in msg_full.get('payload', {}).get('headers', [])}
+    email_data = {
+        "id": msg_full.get('id'),
+        "threadId": msg_full.get('threadId'),
+        "snippet": msg_full.get('snippet', ''),
+        "timestamp_ms": int(msg_full.get('internalDate', '0')),
+        "subject": headers.get('Subject', ''),
+        "from": headers.get('From', ''),
+        "to": headers.get('To', ''),
+        "body": "",
+        "labels": msg_full.get('labelIds', [])
+    }
+
+    payload = msg_full.get('payload', {})
+    if payload.get('mimeType') == 'text/plain' and payload.get('body', {}).get('data'):
+        email_data["body"] = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+    elif payload.get('parts'):
+        for part in payload['parts']:
+            if part.get('mimeType') == 'text/plain' and part.get('body', {}).get('data'):
+                email_data["body"] = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+                break
+    return email_data
+
+def _list_new_message_ids(service, start_history_id: str, max_messages: int) -> Tuple[List[str], str]:
+    """
+    Walks the mailbox history since `start_history_id` and returns the ids of new unread
+    messages together with the cursor for the next sync. When `max_messages` is reached the
+    cursor stops at the last history record handled, so the rest is returned by the next call.
+    """
+    message_ids = []
+    seen_ids = set()
+    page_token = None
+    while True:
+        response = service.users().history().list(
+            userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+            maxResults=GMAIL_HISTORY_PAGE_SIZE, pageToken=page_token
+        ).execute()
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added.get('message', {})
+                labels = set(message.get('labelIds', []))
+                if message.get('id') in seen_ids or 'UNREAD' not in labels or labels & _EXCLUDED_LABELS:
+                    continue
+                seen_ids.add(message['id'])
+                message_ids.append(message['id'])
+            if len(message_ids) >= max_messages:
+                return message_ids, record['id']
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return message_ids, response.get('historyId', start_history_id)
+
+def _full_sync_message_ids(service, last_processed_timestamp_unix: Optional[int], max_messages: int) -> Tuple[List[str], str]:
+    """
+    Lists recent unread messages with a search query and returns the current history id as the
+    new cursor. The cursor is read first, so anything arriving during the listing is seen by the next sync.
+    """
+    history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+    query = 'is:unread'
+    if last_processed_timestamp_unix:
+        query += f' after:{last_processed_timestamp_unix}'
+    else:
+        # For the first run, only look at the last 2 weeks to avoid a huge backlog.
+        query += ' newer_than:14d'
 
-        print(f"[{datetime.datetime.now()}] [GmailPoller_Fetch] Found {len(messages_info)} new message(s). Fetching details...")
+    message_ids = []
+    page_token = None
+    while len(message_ids) < max_messages:
+        response = service.users().messages().list(
+            userId='me', q=query, maxResults=min(max_messages - len(message_ids), 500), pageToken=page_token
+        ).execute()
+        message_ids.extend(m['id'] for m in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    # Oldest first, like the incremental sync.
+    return list(reversed(message_ids)), history_id
 
-        for msg_info in messages_info:
-            msg_id = msg_info['id']
-            msg_full = await loop.run_in_executor(None, 
-                lambda: service.users().messages().get(userId='me', id=msg_id, format='full').execute()
+def sync_new_message_ids(service, history_id: Optional[str], last_processed_timestamp_unix: Optional[int] = None,
+                         max_messages: int = GMAIL_SYNC_MAX_MESSAGES_PER_CYCLE) -> Tuple[List[str], str]:
+    """
+    Returns the ids of messages that arrived since the `history_id` cursor, and the new cursor.
+    Without a cursor, or when Gmail no longer has history that old (404), falls back to a full resync.
+    """
+    if history_id:
+        try:
+            return _list_new_message_ids(service, history_id, max_messages)
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            print(f"[{datetime.datetime.now()}] [GmailPoller_Sync] History cursor {history_id} expired. Running a full resync.")
+    return _full_sync_message_ids(service, last_processed_timestamp_unix, max_messages)
+
+def fetch_message_details(service, message_ids: List[str], batch_size: int = GMAIL_BATCH_SIZE) -> List[Dict]:
+    """
+    Fetches messages through the Gmail HTTP batch endpoint, `batch_size` per round trip, and
+    returns them parsed, in the order of `message_ids`. Messages deleted in the meantime are skipped.
+    """
+    fetched = {}
+    errors = []
+
+    def on_response(request_id, response, exception):
+        if exception is None:
+            fetched[request_id] = response
+        elif not (isinstance(exception, HttpError) and exception.resp.status == 404):
+            errors.append(exception)
+
+    for start in range(0, len(message_ids), batch_size):
+        batch = service.new_batch_http_request(callback=on_response)
+        for msg_id in message_ids[start:start + batch_size]:
+            batch.add(
+                service.users().messages().get(userId='me', id=msg_id, format='full', fields=MESSAGE_FIELDS),
+                request_id=msg_id
             )
-            
-            headers = {h['name']: h['value'] for h in msg_full.get('payload', {}).get('headers', [])}
-            email_data = {
-                "id": msg_full.get('id'),
-                "threadId": msg_full.get('threadId'),
-                "snippet": msg_full.get('snippet', ''),
-                "timestamp_ms": int(msg_full.get('internalDate', '0')),
-                "subject": headers.get('Subject', ''),
-                "from": headers.get('From', ''),
-                "to": headers.get('To', ''),
-                "body": "",
-                "labels": msg_full.get('labelIds', [])
-            }
-
-            payload = msg_full.get('payload', {})
-            if payload.get('mimeType') == 'text/plain' and payload.get('body', {}).get('data'):
-                email_data["body"] = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-            elif payload.get('parts'):
-                for part in payload['parts']:
-                    if part.get('mimeType') == 'text/plain' and part.get('body', {}).get('data'):
-                        email_data["body"] = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        break
-            emails_data.append(email_data)
-        
-        return emails_data
+        batch.execute()
+        if errors:
+            raise errors[0]
+
+    return [_parse_message(fetched[msg_id]) for msg_id in message_ids if msg_id in fetched]
+
+async def fetch_emails(creds: Credentials, history_id: Optional[str] = None, last_processed_timestamp_unix: Optional[int] = None,
+                       user_id: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]: # noqa
+    """
+    Fetches the emails that arrived since the `history_id` cursor.
+    Returns the emails and the cursor to store for the next poll (unchanged on non-auth errors).
+    """
+    import asyncio
+
+    def sync_and_fetch():
+        service = get_google_service('gmail', 'v1', creds, user_id)
+        message_ids, new_history_id = sync_new_message_ids(service, history_id, last_processed_timestamp_unix)
+        if not message_ids:
+            return [], new_history_id
+        print(f"[{datetime.datetime.now()}] [GmailPoller_Fetch] Found {len(message_ids)} new message(s). Fetching details...")
+        return fetch_message_details(service, message_ids), new_history_id
+
+    try:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, sync_and_fetch)
     except HttpError as error:
         print(f"[{datetime.datetime.now()}] [GmailPoller_Fetch_ERROR] An API error occurred: {error}")
         if error.resp.status in [401, 403]:
             print(f"[{datetime.datetime.now()}] [GmailPoller_Fetch_ERROR] Gmail token error. User may need to re-authenticate.")
+            if user_id:
+                evict_google_service('gmail', 'v1', user_id)
             raise error
-        return []
+        return [], history_id
     except Exception as e:
         print(f"[{datetime.datetime.now()}] [GmailPoller_Fetch_ERROR] Unexpected error fetching emails: {e}")
-        return []
\ No newline at end of file
+        return [], history_id
@@ -1,39 +1,112 @@
 # src/server/workers/proactive/main.py
+import asyncio
+import contextlib
 import logging
 import json
 import datetime
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional, Tuple
 
+from main.analytics import capture_event
 from main.llm import run_agent
 from json_extractor import JsonExtractor
+from workers.config import PROACTIVE_TRIAGE_ENABLED, PROACTIVE_SUGGESTION_TYPE_CANDIDATES, PROACTIVE_SUGGESTION_TYPE_MATCH_THRESHOLD
 from workers.utils.api_client import notify_user
 from workers.proactive.prompts import (
     PROACTIVE_REASONER_SYSTEM_PROMPT,
+    PROACTIVE_TRIAGE_SYSTEM_PROMPT,
     SUGGESTION_TYPE_STANDARDIZER_SYSTEM_PROMPT,
     QUERY_FORMULATION_SYSTEM_PROMPT
 )
-from workers.proactive.utils import extract_query_text, get_universal_context
+from workers.proactive.utils import extract_query_text, get_universal_context, build_triage_summary
+from workers.proactive.suggestion_types import embed_text, suggestion_template_cache
+from workers.proactive.suppression import check_suggestion_type, is_duplicate_suggestion, suggestion_dedupe_key
 # Use PlannerMongoManager to get a DB connection in the worker
 from workers.planner.db import PlannerMongoManager
 from workers.utils.text_utils import clean_llm_output
 
 logger = logging.getLogger(__name__)
 
-async def formulate_search_queries(user_id: str, event_type: str, event_data: Dict[str, Any]) -> Dict[str, str]:
-    """
-    Uses a dedicated LLM agent to decide what questions to ask universal search.
-    """
-    logger.info(f"Formulating dynamic search queries for user '{user_id}'.")
-
-    prompt = json.dumps({"event_type": event_type, "event_data": event_data}, indent=2)
-    messages = [{'role': 'user', 'content': prompt}]
-
+class PipelineMetrics:
+    """Collects the cost and outcome of one proactive pipeline run."""
+
+    def __init__(self, user_id: str, event_type: str):
+        self.doc = {
+            "user_id": user_id,
+            "event_type": event_type,
+            "created_at": datetime.datetime.now(datetime.timezone.utc),
+            "stage_seconds": {},
+            "llm_calls": 0,
+            "llm_input_chars": 0,
+            "llm_output_chars": 0,
+            "verdict": None,
+        }
+        self._started = time.monotonic()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.doc["stage_seconds"][name] = round(time.monotonic() - started, 3)
+
+    def record_llm_call(self, input_chars: int, output_chars: int):
+        self.doc["llm_calls"] += 1
+        self.doc["llm_input_chars"] += input_chars
+        self.doc["llm_output_chars"] += output_chars
+
+    def finish(self, verdict: str) -> Dict[str, Any]:
+        self.doc["verdict"] = verdict
+        self.doc["total_seconds"] = round(time.monotonic() - self._started, 3)
+        return self.doc
+
+def _run_llm(system_prompt: str, user_content: str) -> str:
+    """Runs a single tool-less LLM call and returns the final assistant message. Blocking."""
+    messages = [{'role': 'user', 'content': user_content}]
     response_str = ""
-    for chunk in run_agent(system_message=QUERY_FORMULATION_SYSTEM_PROMPT, function_list=[], messages=messages):
+    for chunk in run_agent(system_message=system_prompt, function_list=[], messages=messages):
         if isinstance(chunk, list) and chunk:
             last_message = chunk[-1]
             if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
                 response_str = last_message["content"]
+    return response_str
+
+async def _call_llm(system_prompt: str, user_content: str, metrics: Optional[PipelineMetrics] = None) -> str:
+    # run_agent is a blocking generator, so it runs in a thread to let other stages proceed meanwhile.
+    response_str = await asyncio.to_thread(_run_llm, system_prompt, user_content)
+    if metrics:
+        metrics.record_llm_call(len(system_prompt) + len(user_content), len(response_str))
+    return response_str
+
+async def triage_event(event_type: str, event_data: Dict[str, Any], metrics: Optional[PipelineMetrics] = None) -> Tuple[bool, str, str]:
+    """
+    A short LLM call over a compact summary of the event that discards clearly irrelevant
+    events before any context is gathered. Fails open: the event is kept if triage fails.
+    Returns whether the event is relevant, why, and the action it would most likely lead to.
+    """
+    summary = build_triage_summary(event_data, event_type)
+    try:
+        response_str = await _call_llm(PROACTIVE_TRIAGE_SYSTEM_PROMPT, summary, metrics)
+    except Exception as e:
+        logger.warning(f"Triage failed, keeping the event: {e}")
+        return True, "triage failed", ""
+
+    verdict = JsonExtractor.extract_valid_json(clean_llm_output(response_str))
+    if not isinstance(verdict, dict) or "relevant" not in verdict:
+        logger.warning(f"Triage returned an unusable response, keeping the event. Response: {response_str}")
+        return True, "unparseable triage response", ""
+    return bool(verdict["relevant"]), str(verdict.get("reason", "")), str(verdict.get("likely_action") or "")
+
+async def formulate_search_queries(user_id: str, event_type: str, event_data: Dict[str, Any],
+                                   metrics: Optional[PipelineMetrics] = None) -> Dict[str, str]:
+    """
+    Uses a dedicated LLM agent to decide what questions to ask universal search.
+    """
+    logger.info(f"Formulating dynamic search queries for user '{user_id}'.")
+
+    prompt = json.dumps({"event_type": event_type, "event_data": event_data}, indent=2, default=str)
+    response_str = await _call_llm(QUERY_FORMULATION_SYSTEM_PROMPT, prompt, metrics)
 
     queries = JsonExtractor.extract_valid_json(response_str)
     if not isinstance(queries, dict) or not queries:
@@ -44,32 +117,51 @@ async def formulate_search_queries(user_id: str, event_type: str, event_data: Di
     logger.info(f"Dynamically formulated queries: {queries}")
     return queries
 
-async def standardize_suggestion_type(suggestion_type_description: str) -> str:
+async def match_known_suggestion_type(description: str, db_manager: PlannerMongoManager) -> Optional[str]:
+    """The known suggestion type closely matching `description` by embedding, or None. Never calls the LLM."""
+    try:
+        await suggestion_template_cache.load(db_manager)
+        candidates = suggestion_template_cache.nearest(await embed_text(description), 1)
+    except Exception as e:
+        logger.warning(f"Could not match suggestion type for '{description}': {e}")
+        return None
+    if candidates and candidates[0][1] >= PROACTIVE_SUGGESTION_TYPE_MATCH_THRESHOLD:
+        return candidates[0][0]["type_name"]
+    return None
+
+async def standardize_suggestion_type(suggestion_type_description: str, db_manager: PlannerMongoManager,
+                                      metrics: Optional[PipelineMetrics] = None) -> str:
     """
-    Uses an LLM call to map a free-form description to a canonical type from the DB,
-    or generates a new snake_case type if no suitable match is found.
+    Maps a free-form description to a canonical suggestion type. A close embedding match is used
+    directly; otherwise an LLM call picks among the nearest few types or names a new snake_case type.
     """
     logger.info(f"Standardizing suggestion type for description: '{suggestion_type_description}'")
-    db_manager = PlannerMongoManager()
     try:
-        templates = await db_manager.get_all_proactive_suggestion_templates()
-        
+        templates = await suggestion_template_cache.load(db_manager)
+
+        description_embedding = None
+        try:
+            description_embedding = await embed_text(suggestion_type_description)
+            candidates = suggestion_template_cache.nearest(description_embedding, PROACTIVE_SUGGESTION_TYPE_CANDIDATES)
+        except Exception as e:
+            logger.warning(f"Could not embed suggestion type description, falling back to the LLM: {e}")
+            candidates = [(template, None) for template in templates[:PROACTIVE_SUGGESTION_TYPE_CANDIDATES]]
+
+        if candidates and candidates[0][1] is not None and candidates[0][1] >= PROACTIVE_SUGGESTION_TYPE_MATCH_THRESHOLD:
+            best, score = candidates[0]
+            logger.info(f"Matched to existing suggestion type '{best['type_name']}' by embedding (similarity {score:.2f}).")
+            return best["type_name"]
+
+        candidate_types = [{"type_name": template["type_name"], "description": template.get("description", "")} for template, _ in candidates]
         prompt = (
             f"Action Description:\n\"{suggestion_type_description}\"\n\n"
-            f"Available Canonical Types:\n{json.dumps(templates, indent=2)}"
+            f"Available Canonical Types:\n{json.dumps(candidate_types, indent=2)}"
         )
-        
-        messages = [{'role': 'user', 'content': prompt}]
 
-        response_str = ""
-        for chunk in run_agent(system_message=SUGGESTION_TYPE_STANDARDIZER_SYSTEM_PROMPT, function_list=[], messages=messages):
-            if isinstance(chunk, list) and chunk:
-                last_message = chunk[-1]
-                if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
-                    response_str = clean_llm_output(last_message["content"])
+        response_str = clean_llm_output(await _call_llm(SUGGESTION_TYPE_STANDARDIZER_SYSTEM_PROMPT, prompt, metrics))
 
         # The LLM should return a single snake_case string.
-        standardized_type = response_str.strip()
+        standardized_type = response_str.strip().strip('"\'`')
         logger.info(f"Standardizer LLM returned: '{standardized_type}'")
 
         if not standardized_type:
@@ -77,36 +169,31 @@ async def standardize_suggestion_type(suggestion_type_description: str) -> str:
             return "custom_proactive_action"
 
         # Check if it's a new type or an existing one.
-        is_existing_type = any(t['type_name'] == standardized_type for t in templates)
-        if is_existing_type:
+        if suggestion_template_cache.has_type(standardized_type):
             logger.info(f"Matched to existing suggestion type: '{standardized_type}'")
         else:
             logger.info(f"LLM generated a new suggestion type: '{standardized_type}'")
-        
+            await db_manager.add_proactive_suggestion_template(
+                standardized_type, suggestion_type_description,
+                description_embedding.tolist() if description_embedding is not None else None
+            )
+            suggestion_template_cache.invalidate()
+
         return standardized_type
 
     except Exception as e:
         logger.error(f"Error during suggestion type standardization: {e}", exc_info=True)
         return "custom_proactive_action"
-    finally:
-        await db_manager.close()
 
-async def run_proactive_reasoner(scratchpad: Dict[str, Any]) -> Dict[str, Any]:
+async def run_proactive_reasoner(scratchpad: Dict[str, Any], metrics: Optional[PipelineMetrics] = None) -> Dict[str, Any]:
     """
     Makes the LLM call to the proactive reasoner.
     """
     logger.info("Running proactive reasoner LLM call...")
 
     # The user prompt is the scratchpad itself
-    user_prompt = json.dumps(scratchpad, indent=2)
-    messages = [{'role': 'user', 'content': user_prompt}]
-
-    response_str = ""
-    for chunk in run_agent(system_message=PROACTIVE_REASONER_SYSTEM_PROMPT, function_list=[], messages=messages):
-        if isinstance(chunk, list) and chunk:
-            last_message = chunk[-1]
-            if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
-                response_str = last_message["content"]
+    user_prompt = json.dumps(scratchpad, indent=2, default=str)
+    response_str = await _call_llm(PROACTIVE_REASONER_SYSTEM_PROMPT, user_prompt, metrics)
 
     if not response_str:
         logger.error("Proactive reasoner LLM returned an empty response.")
@@ -119,32 +206,78 @@ async def run_proactive_reasoner(scratchpad: Dict[str, Any]) -> Dict[str, Any]:
 
     return reasoner_output
 
+async def _fetch_proactive_feedback(db_manager: PlannerMongoManager, user_id: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        return await db_manager.get_user_proactive_feedback(user_id)
+    except Exception as e:
+        logger.error(f"Failed to fetch user preferences for {user_id}: {e}", exc_info=True)
+        return {"preferences": {}, "cooldowns": {}}
+
 async def run_proactive_pipeline_logic(user_id: str, event_type: str, event_data: Dict[str, Any]):
     """
     The main orchestration logic for the proactive pipeline.
     """
     logger.info(f"Starting proactive pipeline for user '{user_id}', event_type '{event_type}'.")
+    metrics = PipelineMetrics(user_id, event_type)
+    verdict = "error"
+    db_manager = PlannerMongoManager()
+    # Feedback is first needed after triage, so it loads while the earlier stages run.
+    feedback_task = asyncio.create_task(_fetch_proactive_feedback(db_manager, user_id))
+    try:
+        verdict = await _run_pipeline_stages(user_id, event_type, event_data, db_manager, feedback_task, metrics)
+    finally:
+        if not feedback_task.done():
+            feedback_task.cancel()
+        metrics_doc = metrics.finish(verdict)
+        logger.info(f"Proactive pipeline for user '{user_id}' ended with verdict '{verdict}' after {metrics_doc['total_seconds']}s and {metrics_doc['llm_calls']} LLM calls.")
+        try:
+            await db_manager.record_proactive_pipeline_metrics(metrics_doc)
+        except Exception as e:
+            logger.error(f"Failed to record proactive pipeline metrics for user {user_id}: {e}")
+        capture_event(user_id, "proactive_pipeline_completed", {
+            "event_type": event_type, "verdict": verdict, "total_seconds": metrics_doc["total_seconds"],
+            "llm_calls": metrics_doc["llm_calls"], "llm_input_chars": metrics_doc["llm_input_chars"]
+        })
+        await db_manager.close()
+
+async def _run_pipeline_stages(user_id: str, event_type: str, event_data: Dict[str, Any], db_manager: PlannerMongoManager,
+                               feedback_task: "asyncio.Task", metrics: PipelineMetrics) -> str:
+    """Runs the pipeline's stages and returns its verdict."""
+    # 0. Skip threads and calendar events the user was recently given a suggestion about
+    dedupe_key = suggestion_dedupe_key(event_type, event_data)
+    if await is_duplicate_suggestion(db_manager, user_id, dedupe_key):
+        logger.info(f"Skipping event for user '{user_id}': '{dedupe_key}' already got a recent suggestion.")
+        return "duplicate"
+
+    # 1. Triage: discard clearly irrelevant events before any context gathering
+    if PROACTIVE_TRIAGE_ENABLED:
+        with metrics.stage("triage"):
+            relevant, reason, likely_action = await triage_event(event_type, event_data, metrics)
+        if not relevant:
+            logger.info(f"Event for user '{user_id}' discarded by triage: {reason}")
+            return "discarded_by_triage"
+
+        # Drop events that would most likely lead to a suggestion the user does not want right now
+        if likely_action:
+            with metrics.stage("suppression"):
+                likely_type = await match_known_suggestion_type(likely_action, db_manager)
+                suppressed_by = likely_type and await check_suggestion_type(db_manager, user_id, likely_type, await feedback_task)
+            if suppressed_by:
+                logger.info(f"Event for user '{user_id}' likely leads to '{likely_type}', which is suppressed ({suppressed_by}).")
+                metrics.doc["suppressed_by"] = suppressed_by
+                return "suppressed"
 
     # 2. Formulate Dynamic Search Queries
-    situational_queries = await formulate_search_queries(user_id, event_type, event_data)
+    with metrics.stage("query_formulation"):
+        situational_queries = await formulate_search_queries(user_id, event_type, event_data, metrics)
 
     # 3. Get Universal Context (Cognitive Scratchpad)
-    cognitive_scratchpad = await get_universal_context(user_id, situational_queries)
+    with metrics.stage("context"):
+        cognitive_scratchpad = await get_universal_context(user_id, situational_queries, db_manager)
 
-    # --- NEW: Fetch User Preferences ---
-    db_manager = None
-    try:
-        db_manager = PlannerMongoManager()
-        preferences = await db_manager.get_user_proactive_preferences(user_id)
-        cognitive_scratchpad["user_preferences"] = preferences
-        logger.info(f"Added user preferences to cognitive scratchpad for user '{user_id}'.")
-    except Exception as e:
-        logger.error(f"Failed to fetch user preferences for {user_id}: {e}", exc_info=True)
-        cognitive_scratchpad["user_preferences"] = {} # Default to empty if error
-    finally:
-        if db_manager:
-            await db_manager.close()
-    # --- END NEW ---
+    feedback = await feedback_task
+    preferences = feedback["preferences"]
+    cognitive_scratchpad["user_preferences"] = preferences
 
     # 4. Add Trigger Event to Scratchpad
     cognitive_scratchpad["trigger_event"] = {
@@ -154,7 +287,8 @@ async def run_proactive_pipeline_logic(user_id: str, event_type: str, event_data
     cognitive_scratchpad["current_time_utc"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
     # 5. Pass to Proactive Reasoner
-    reasoner_result = await run_proactive_reasoner(cognitive_scratchpad)
+    with metrics.stage("reasoner"):
+        reasoner_result = await run_proactive_reasoner(cognitive_scratchpad, metrics)
 
     # 6. Process Reasoner Output
     if reasoner_result and reasoner_result.get("actionable"):
@@ -163,9 +297,16 @@ async def run_proactive_pipeline_logic(user_id: str, event_type: str, event_data
         suggestion_type_desc = reasoner_result.get("suggestion_type_description")
         if not suggestion_type_desc:
             logger.warning("Reasoner output is missing 'suggestion_type_description'. Cannot proceed.")
-            return
+            return "missing_suggestion_type"
+
+        with metrics.stage("standardize"):
+            standardized_type = await standardize_suggestion_type(suggestion_type_desc, db_manager, metrics)
 
-        standardized_type = await standardize_suggestion_type(suggestion_type_desc)
+        suppressed_by = await check_suggestion_type(db_manager, user_id, standardized_type, feedback)
+        if suppressed_by:
+            logger.info(f"Suggestion '{standardized_type}' for user '{user_id}' is suppressed ({suppressed_by}).")
+            metrics.doc["suppressed_by"] = suppressed_by
+            return "suppressed"
         
         # --- NEW: Dynamic Thresholding Logic ---
         base_threshold = 0.70  # The default confidence score needed to show a suggestion.
@@ -230,11 +371,17 @@ async def run_proactive_pipeline_logic(user_id: str, event_type: str, event_data
                 payload=notification_payload
             )
             logger.info(f"Sent proactive suggestion notification to user '{user_id}'.")
-        
+            try:
+                await db_manager.log_proactive_suggestion(user_id, standardized_type, dedupe_key)
+            except Exception as e:
+                logger.error(f"Failed to log proactive suggestion for user {user_id}: {e}")
+            return "notified"
+
         # --- NEW ---
         else:
             logger.info(f"Suggestion for user '{user_id}' was suppressed. LLM confidence ({llm_confidence:.2f}) did not meet the dynamic threshold ({dynamic_threshold:.2f}) based on user feedback.")
+            return "below_threshold"
         # --- END NEW ---
-        
-    else:
-        logger.info(f"No proactive action deemed necessary for user '{user_id}'. Reasoner output: {reasoner_result}")
\ No newline at end of file
+
+    logger.info(f"No proactive action deemed necessary for user '{user_id}'. Reasoner output: {reasoner_result}")
+    return "not_actionable"
\ No newline at end of file
@@ -0,0 +1,177 @@
+import asyncio
+import datetime
+import logging
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from workers.config import (PROACTIVE_RETRIEVAL_DUPLICATE_QUERY_SIMILARITY, PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE,
+                            PROACTIVE_RETRIEVAL_SOURCE_TIMEOUT_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Calendar searches look this far back, so recent meetings with the same people are found too.
+GCAL_SEARCH_LOOKBACK_DAYS = 30
+
+SourceSearch = Callable[[str], Awaitable[List[Any]]]
+
+def _query_tokens(query: str) -> Set[str]:
+    return set(re.findall(r"\w+", query.lower()))
+
+def dedupe_queries(queries: Dict[str, str], similarity: float = PROACTIVE_RETRIEVAL_DUPLICATE_QUERY_SIMILARITY) -> Dict[str, List[str]]:
+    """
+    Groups queries whose word sets overlap by at least `similarity` (Jaccard).
+    Returns the query text to run for each group, mapped to the keys it answers.
+    """
+    groups: Dict[str, List[str]] = {}
+    group_tokens: Dict[str, Set[str]] = {}
+    for key, text in queries.items():
+        tokens = _query_tokens(text)
+        if not tokens:
+            continue
+        for kept_text, kept_tokens in group_tokens.items():
+            if len(tokens & kept_tokens) / len(tokens | kept_tokens) >= similarity:
+                groups[kept_text].append(key)
+                break
+        else:
+            groups[text] = [key]
+            group_tokens[text] = tokens
+    return groups
+
+# --- Sources ---
+
+async def _search_memory(user_id: str, query: str) -> List[str]:
+    from mcp_hub.memory.utils import initialize_embedding_model, search_memory_facts
+    initialize_embedding_model()
+    return await search_memory_facts(user_id, query, limit=PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE)
+
+async def _search_history(user_id: str, query: str) -> List[str]:
+    from main.vector_db import get_conversation_summaries_collection
+
+    def query_summaries():
+        collection = get_conversation_summaries_collection()
+        results = collection.query(query_texts=[query], n_results=PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE, where={"user_id": user_id})
+        return results.get("documents", [[]])[0]
+
+    return await asyncio.to_thread(query_summaries)
+
+def _search_gmail_sync(service, query: str) -> List[Dict[str, Any]]:
+    from workers.poller.gmail.utils import fetch_message_details
+    response = service.users().messages().list(userId="me", q=query, maxResults=PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE).execute()
+    message_ids = [message["id"] for message in response.get("messages", [])]
+    emails = fetch_message_details(service, message_ids) if message_ids else []
+    return [
+        {"from": email["from"], "subject": email["subject"], "snippet": email["snippet"],
+         "date": datetime.datetime.fromtimestamp(email["timestamp_ms"] / 1000, datetime.timezone.utc).isoformat()}
+        for email in emails
+    ]
+
+def _search_gcal_sync(service, query: str) -> List[Dict[str, Any]]:
+    time_min = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=GCAL_SEARCH_LOOKBACK_DAYS)
+    response = service.events().list(
+        calendarId="primary", q=query, singleEvents=True, orderBy="startTime",
+        timeMin=time_min.isoformat(), maxResults=PROACTIVE_RETRIEVAL_RESULTS_PER_SOURCE
+    ).execute()
+    return [
+        {"summary": event.get("summary", ""), "start": event.get("start", {}).get("dateTime") or event.get("start", {}).get("date"),
+         "attendees": [attendee.get("email") for attendee in event.get("attendees", [])][:10]}
+        for event in response.get("items", [])
+    ]
+
+async def _google_search(user_id: str, db_manager, get_credentials, api_name: str, api_version: str, search_sync) -> Optional[SourceSearch]:
+    """
+    A search over a connected Google service, or None if the user has not connected it.
+    Google API clients (httplib2) are not thread-safe, so each retrieval builds its own client
+    rather than sharing the per-user cached one, and runs that source's queries one at a time.
+    """
+    from workers.utils.google_services import build_google_service
+    creds = await get_credentials(user_id, db_manager)
+    if not creds:
+        return None
+
+    client: Dict[str, Any] = {}
+    # A threading lock rather than an asyncio one: a lookup cancelled at the deadline keeps running
+    # in its thread, and the next query must still wait for it.
+    client_lock = threading.Lock()
+
+    def search_in_thread(query: str) -> List[Dict[str, Any]]:
+        with client_lock:
+            if "service" not in client:
+                client["service"] = build_google_service(api_name, api_version, creds)
+            return search_sync(client["service"], query)
+
+    async def search(query: str) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(search_in_thread, query)
+
+    return search
+
+async def _connected_sources(user_id: str, db_manager) -> Dict[str, Optional[SourceSearch]]:
+    from workers.poller.gmail.utils import get_gmail_credentials
+    from workers.poller.gcalendar.utils import get_gcalendar_credentials
+
+    sources: Dict[str, Optional[SourceSearch]] = {
+        "memory": lambda query: _search_memory(user_id, query),
+        "history": lambda query: _search_history(user_id, query),
+    }
+    if db_manager is None:
+        return sources
+    gmail, gcalendar = await asyncio.gather(
+        _google_search(user_id, db_manager, get_gmail_credentials, "gmail", "v1", _search_gmail_sync),
+        _google_search(user_id, db_manager, get_gcalendar_credentials, "calendar", "v3", _search_gcal_sync),
+        return_exceptions=True
+    )
+    for name, search in (("gmail", gmail), ("gcalendar", gcalendar)):
+        if isinstance(search, Exception):
+            logger.warning(f"Could not prepare {name} retrieval for user '{user_id}': {search}")
+        elif search:
+            sources[name] = search
+    return sources
+
+async def retrieve_context(user_id: str, queries: Dict[str, str], db_manager=None,
+                           timeout_seconds: float = PROACTIVE_RETRIEVAL_SOURCE_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Looks up each query directly in memory, chat history and, if connected, Gmail and Google Calendar,
+    without any agent reasoning. Every lookup runs concurrently under one deadline; whatever has
+    not finished by then is dropped, so slow sources leave partial results instead of blocking.
+    """
+    groups = dedupe_queries(queries)
+    logger.info(f"Retrieving context for user '{user_id}': {len(queries)} queries, {len(groups)} after deduplication.")
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_seconds
+    try:
+        sources = await asyncio.wait_for(_connected_sources(user_id, db_manager), timeout=timeout_seconds)
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out connecting retrieval sources for user '{user_id}'; using memory and history only.")
+        sources = {"memory": lambda query: _search_memory(user_id, query), "history": lambda query: _search_history(user_id, query)}
+
+    lookups = {
+        asyncio.ensure_future(search(text)): (source, text)
+        for source, search in sources.items() for text in groups
+    }
+    done, pending = await asyncio.wait(lookups, timeout=max(0.0, deadline - loop.time())) if lookups else (set(), set())
+    for task in pending:
+        task.cancel()
+
+    source_status: Dict[str, str] = {source: "ok" for source in sources}
+    results: Dict[str, Dict[str, Any]] = {key: {} for keys in groups.values() for key in keys}
+    seen: Dict[str, Set[str]] = {source: set() for source in sources}
+    for task, (source, text) in lookups.items():
+        if task in pending:
+            source_status[source] = "timed_out"
+            continue
+        if task.exception():
+            logger.warning(f"Context lookup in {source} failed for user '{user_id}': {task.exception()}")
+            if source_status[source] == "ok":
+                source_status[source] = "error"
+            continue
+        # The same item found by several queries is only reported once.
+        items = [item for item in task.result() if str(item) not in seen[source]]
+        seen[source].update(str(item) for item in items)
+        if items:
+            for key in groups[text]:
+                results[key][source] = items
+
+    if any(status != "ok" for status in source_status.values()):
+        logger.info(f"Partial context for user '{user_id}': {source_status}")
+    return {"universal_search_results": results, "retrieval_status": source_status}
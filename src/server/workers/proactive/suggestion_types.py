@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from main.memories.utils import _get_normalized_embedding
+from workers.config import PROACTIVE_SUGGESTION_TEMPLATE_CACHE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_TASK_TYPE = "SEMANTIC_SIMILARITY"
+
+async def embed_text(text: str) -> np.ndarray:
+    """Normalized embedding of `text`. The embedding call is blocking, so it runs in a thread."""
+    return await asyncio.to_thread(_get_normalized_embedding, text, EMBEDDING_TASK_TYPE)
+
+class SuggestionTemplateCache:
+    """
+    In-process cache of the canonical suggestion types and a matrix of their normalized embeddings.
+    It is reloaded when it expires or after this process writes a template.
+    """
+
+    def __init__(self, ttl_seconds: float = PROACTIVE_SUGGESTION_TEMPLATE_CACHE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.templates: List[Dict[str, Any]] = []
+        self._embedded: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded_at: Optional[float] = None
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def has_type(self, type_name: str) -> bool:
+        return any(template["type_name"] == type_name for template in self.templates)
+
+    async def load(self, db_manager) -> List[Dict[str, Any]]:
+        if self.is_fresh():
+            return self.templates
+
+        templates = await db_manager.get_all_proactive_suggestion_templates()
+        for template in templates:
+            if template.get("embedding"):
+                continue
+            # Templates from before embeddings were stored are embedded once and saved back.
+            try:
+                embedding = await embed_text(f"{template['type_name']}: {template.get('description', '')}")
+                template["embedding"] = embedding.tolist()
+                await db_manager.set_proactive_suggestion_template_embedding(template["type_name"], template["embedding"])
+            except Exception as e:
+                logger.warning(f"Could not embed suggestion template '{template['type_name']}': {e}")
+
+        embedded = [template for template in templates if template.get("embedding")]
+        dimensions = {len(template["embedding"]) for template in embedded}
+        if len(dimensions) > 1:
+            # Keep only the most common dimensionality, in case the embedding model changed.
+            common = max(dimensions, key=lambda d: sum(len(t["embedding"]) == d for t in embedded))
+            embedded = [template for template in embedded if len(template["embedding"]) == common]
+
+        self.templates = templates
+        self._embedded = embedded
+        self._matrix = np.array([template["embedding"] for template in embedded], dtype=np.float32) if embedded else None
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(templates)} suggestion templates ({len(embedded)} with embeddings).")
+        return self.templates
+
+    def nearest(self, embedding: np.ndarray, k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """The `k` templates most similar to `embedding`, best first, with their cosine similarity."""
+        if self._matrix is None or self._matrix.shape[1] != len(embedding):
+            return []
+        scores = self._matrix @ np.asarray(embedding, dtype=np.float32)
+        top = np.argsort(-scores)[:k]
+        return [(self._embedded[i], float(scores[i])) for i in top]
+
+# Shared by every pipeline run in this worker process.
+suggestion_template_cache = SuggestionTemplateCache()
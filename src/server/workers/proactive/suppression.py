@@ -0,0 +1,58 @@
+import datetime
+import logging
+from typing import Any, Dict, List, Optional
+
+from workers.config import (PROACTIVE_DEDUPE_WINDOW_SECONDS, PROACTIVE_MAX_SUGGESTIONS_PER_TYPE_PER_DAY,
+                            PROACTIVE_SUPPRESS_SCORE, PROACTIVE_TYPE_COOLDOWN_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WINDOW = datetime.timedelta(days=1)
+
+def suggestion_dedupe_key(event_type: str, event_data: Dict[str, Any]) -> Optional[str]:
+    """Identifies what a suggestion is about: the email thread, or the calendar event."""
+    if event_type == "gmail":
+        thread_id = event_data.get("threadId") or event_data.get("id")
+        return f"gmail:{thread_id}" if thread_id else None
+    if event_type == "gcalendar" and event_data.get("id"):
+        return f"gcalendar:{event_data.get('calendar_id', 'primary')}:{event_data['id']}"
+    return None
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    # Motor returns naive datetimes unless the client is tz-aware.
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+def suppression_reason(suggestion_type: str, feedback: Dict[str, Any], recent_suggestion_times: List[datetime.datetime],
+                       now: Optional[datetime.datetime] = None) -> Optional[str]:
+    """
+    Why a suggestion of this type should not be shown to the user right now, or None if it may be.
+    `feedback` holds the user's per-type `preferences` scores and `cooldowns`, and
+    `recent_suggestion_times` when this type was suggested during the last day.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if feedback.get("preferences", {}).get(suggestion_type, 0) <= PROACTIVE_SUPPRESS_SCORE:
+        return "negative_feedback"
+
+    cooldown_until = feedback.get("cooldowns", {}).get(suggestion_type)
+    if cooldown_until and _as_utc(cooldown_until) > now:
+        return "feedback_cooldown"
+
+    recent = [_as_utc(sent_at) for sent_at in recent_suggestion_times if now - _as_utc(sent_at) < RATE_LIMIT_WINDOW]
+    if recent and (now - max(recent)).total_seconds() < PROACTIVE_TYPE_COOLDOWN_SECONDS:
+        return "type_cooldown"
+    if len(recent) >= PROACTIVE_MAX_SUGGESTIONS_PER_TYPE_PER_DAY:
+        return "rate_limited"
+    return None
+
+async def check_suggestion_type(db_manager, user_id: str, suggestion_type: str, feedback: Dict[str, Any]) -> Optional[str]:
+    """Looks up the user's recent suggestions of this type and applies `suppression_reason`."""
+    since = datetime.datetime.now(datetime.timezone.utc) - RATE_LIMIT_WINDOW
+    recent = await db_manager.get_recent_proactive_suggestion_times(user_id, suggestion_type, since)
+    return suppression_reason(suggestion_type, feedback, recent)
+
+async def is_duplicate_suggestion(db_manager, user_id: str, dedupe_key: Optional[str]) -> bool:
+    """Whether the user was already given a suggestion about the same thread or event recently."""
+    if not dedupe_key:
+        return False
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=PROACTIVE_DEDUPE_WINDOW_SECONDS)
+    return await db_manager.has_recent_proactive_suggestion(user_id, dedupe_key, since)
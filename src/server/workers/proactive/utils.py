@@ -5,6 +5,8 @@ import asyncio
 from typing import Dict, Any, Optional, List, Tuple
 
 from main.search.utils import perform_unified_search
+from workers.config import PROACTIVE_CONTEXT_MODE, PROACTIVE_TRIAGE_MAX_EVENT_CHARS
+from workers.proactive.retrieval import retrieve_context
 
 logger = logging.getLogger(__name__)
 
@@ -108,10 +110,34 @@ def extract_query_text(event_data: Dict[str, Any], event_type: str) -> str:
     # Fallback for other event types
     return json.dumps(event_data)
 
-async def get_universal_context(user_id: str, queries: Dict[str, str]) -> Dict[str, Any]:
+def build_triage_summary(event_data: Dict[str, Any], event_type: str) -> str:
     """
-    Calls the unified search agent with multiple queries in parallel to gather context for the cognitive scratchpad.
+    A compact, length-capped description of the event for the triage LLM call.
     """
+    lines = [f"Event type: {event_data.get('change_type', 'new')} {event_type}"]
+    if event_type == "gmail":
+        lines.append(f"From: {event_data.get('from') or event_data.get('sender', '')}")
+    elif event_type == "gcalendar":
+        start = event_data.get("start") or {}
+        lines.append(f"Organizer: {(event_data.get('organizer') or {}).get('email') or event_data.get('organizer_email', '')}")
+        lines.append(f"Starts: {start.get('dateTime') or start.get('date', '') if isinstance(start, dict) else start}")
+        lines.append(f"Attendees: {len(event_data.get('attendees') or [])}")
+    lines.append(f"Content: {extract_query_text(event_data, event_type)}")
+    return "\n".join(lines)[:PROACTIVE_TRIAGE_MAX_EVENT_CHARS]
+
+async def get_universal_context(user_id: str, queries: Dict[str, str], db_manager=None,
+                                mode: str = PROACTIVE_CONTEXT_MODE) -> Dict[str, Any]:
+    """
+    Gathers context for the cognitive scratchpad. In "retrieval" mode the queries are looked up
+    directly in each source; in "agent" mode the unified search agent runs each query in parallel.
+    """
+    if mode == "retrieval":
+        try:
+            return await retrieve_context(user_id, queries, db_manager)
+        except Exception as e:
+            logger.error(f"Error during context retrieval for user '{user_id}': {e}", exc_info=True)
+            return {"universal_search_results": f"An error occurred during search: {e}"}
+
     logger.info(f"Getting universal context for user '{user_id}' with {len(queries)} queries.")
     
     async def run_search(query_key: str, query_text: str) -> Tuple[str, str]:
@@ -10,22 +10,32 @@ from dateutil import rrule
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from typing import Dict, Any, Optional, List, Tuple
 from bson import ObjectId
-from celery import group, chord
+from pymongo import UpdateMany
+from celery import group
 from main.analytics import capture_event
 from json_extractor import JsonExtractor
-from workers.utils.api_client import notify_user, push_task_list_update
+from workers.utils.api_client import notify_user, push_task_list_update, close_http_client_for_loop
 from main.plans import PLAN_LIMITS
 from main.config import INTEGRATIONS_CONFIG
 from main.tasks.prompts import TASK_CREATION_PROMPT
-from mcp_hub.memory.utils import initialize_embedding_model, initialize_agents, cud_memory
+from mcp_hub.memory.utils import initialize_embedding_model, initialize_agents, cud_memory, search_memory_facts
 from main.llm import run_agent as run_main_agent, LLMProviderDownError
 from main.db import MongoManager
 from workers.celery_app import celery_app
+from workers.config import (SUMMARIZATION_CHUNK_SIZE, SUMMARIZATION_MIN_CHUNK_MESSAGES, SUMMARIZATION_MAX_CHUNKS_PER_USER_RUN,
+                            SUMMARIZATION_MAX_CONCURRENT_LLM_CALLS, SUMMARIZATION_MAX_USERS_PER_RUN,
+                            SUMMARIZATION_MIN_MESSAGE_AGE_SECONDS, PLANNING_MEMORY_LIMIT)
 from workers.planner.llm import get_planner_agent
-from workers.planner.db import PlannerMongoManager, get_all_mcp_descriptions
-from workers.executor.tasks import execute_task_plan, run_single_item_worker, aggregate_results_callback
+from workers.planner.db import PlannerMongoManager, get_all_mcp_descriptions, get_plan_cache_key, _decrypt_doc
+from workers.planner.prompts import REFINE_AND_PLAN_OUTPUT_INSTRUCTIONS
+from workers.executor.tasks import execute_task_plan, run_swarm_item_group
+from workers.executor.swarm import (resolve_execution_mode, latency_stats_key, get_average_item_seconds,
+                                    compute_group_size, split_into_groups, build_swarm_context,
+                                    swarm_context_cache_key)
+from workers.executor.config import SWARM_CONTEXT_TTL_SECONDS, SWARM_CONTEXT_MEMORY_LIMIT, SWARM_RUN_TIMEOUT_SECONDS
+from workers.utils.cache import cache_set_json
 from main.vector_db import get_conversation_summaries_collection
-from mcp_hub.tasks.prompts import ITEM_EXTRACTOR_SYSTEM_PROMPT, RESOURCE_MANAGER_SYSTEM_PROMPT
+from mcp_hub.tasks.prompts import ITEM_EXTRACTOR_SYSTEM_PROMPT, RESOURCE_MANAGER_SYSTEM_PROMPT, SWARM_PLANNER_SYSTEM_PROMPT
 from workers.utils.text_utils import clean_llm_output
 
 # Imports for poller logic
@@ -75,9 +85,10 @@ def run_async(coro):
     try:
         return loop.run_until_complete(coro)
     finally:
-        # Ensure the connection pool for this specific loop is closed.
+        # Ensure the connection pools for this specific loop are closed.
         from mcp_hub.memory.db import close_db_pool_for_loop
         loop.run_until_complete(close_db_pool_for_loop(loop))
+        loop.run_until_complete(close_http_client_for_loop(loop))
         loop.close()
         asyncio.set_event_loop(None)
 
@@ -137,113 +148,140 @@ def orchestrate_swarm_task(task_id: str, user_id: str):
     logger.info(f"Celery worker received task 'orchestrate_swarm_task' for task_id: {task_id}")
     run_async(async_orchestrate_swarm_task(task_id, user_id))
 
+def _run_agent_for_json(system_prompt: str, user_content: str) -> Tuple[Any, str]:
+    """Blocking tool-less LLM call. Returns the parsed JSON (or None) and the cleaned response text."""
+    response_str = ""
+    messages = [{'role': 'user', 'content': user_content}]
+    for chunk in run_main_agent(system_message=system_prompt, function_list=[], messages=messages):
+        if isinstance(chunk, list) and chunk:
+            last_message = chunk[-1]
+            if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
+                response_str = last_message["content"]
+    response_str = clean_llm_output(response_str).strip()
+    return JsonExtractor.extract_valid_json(response_str), response_str
+
+def _is_valid_swarm_plan(swarm_plan: Any) -> bool:
+    return isinstance(swarm_plan, list) and bool(swarm_plan) and all(isinstance(config, dict) for config in swarm_plan)
+
+def _get_swarm_available_tools(user_integrations: Dict) -> List[str]:
+    available_tools = []
+    for tool_name, config in INTEGRATIONS_CONFIG.items():
+        if tool_name in ["tasks", "progress_updater"]: continue
+        is_builtin = config.get("auth_type") == "builtin"
+        is_connected = user_integrations.get(tool_name, {}).get("connected", False)
+        if is_builtin or is_connected:
+            available_tools.append(tool_name)
+    return available_tools
+
+def _plan_swarm(goal: str, items: List[Any], available_tools: List[str]) -> List[Dict]:
+    """Invokes the Resource Manager agent for a known list of items."""
+    system_prompt = RESOURCE_MANAGER_SYSTEM_PROMPT.format(available_tools_json=json.dumps(available_tools))
+    items_sample = items[:5]
+    user_prompt = f"Goal: \"{goal}\"\n\nItems (sample of {len(items)} total):\n{json.dumps(items_sample, indent=2, default=str)}"
+    swarm_plan, response_str = _run_agent_for_json(system_prompt, user_prompt)
+
+    if not response_str:
+        raise Exception("Resource Manager agent returned an empty response.")
+    if not _is_valid_swarm_plan(swarm_plan):
+        raise Exception(f"Resource Manager returned an invalid plan. Response: {response_str}")
+    return swarm_plan
+
+def _extract_and_plan_swarm(goal: str, available_tools: List[str]) -> Tuple[List[Any], List[Dict]]:
+    """
+    Extracts the items from the goal and plans the swarm in one structured call. Whatever
+    the combined call gets wrong is redone with the dedicated extractor and Resource Manager.
+    """
+    system_prompt = SWARM_PLANNER_SYSTEM_PROMPT.format(available_tools_json=json.dumps(available_tools))
+    response, response_str = _run_agent_for_json(system_prompt, goal)
+    items = response.get("items") if isinstance(response, dict) else None
+    swarm_plan = response.get("plan") if isinstance(response, dict) else None
+
+    if not isinstance(items, list) or not items:
+        logger.warning("Combined swarm planner did not return items. Falling back to the Item Extractor.")
+        items, extractor_response_str = _run_agent_for_json(ITEM_EXTRACTOR_SYSTEM_PROMPT, goal)
+        if not isinstance(items, list) or not items:
+            raise ValueError(f"Item Extractor agent failed to extract a list of items from the goal. Response: {extractor_response_str}")
+        swarm_plan = None
+
+    if not _is_valid_swarm_plan(swarm_plan):
+        swarm_plan = _plan_swarm(goal, items, available_tools)
+    return items, swarm_plan
+
+async def _fetch_relevant_memories(user_id: str, query: str, limit: int) -> List[str]:
+    """Retrieves memories relevant to a query. A failure only means less context, so it is logged and ignored."""
+    try:
+        initialize_embedding_model()
+        return await search_memory_facts(user_id, query, limit=limit)
+    except Exception as e:
+        logger.warning(f"Could not retrieve memories for user {user_id}: {e}")
+        return []
+
+async def _fetch_user_preferences(db_manager: PlannerMongoManager, user_id: str) -> Dict[str, Any]:
+    """Reads the user's settings preferences. Like memories, they are only extra context, so a failure is logged and ignored."""
+    try:
+        return await db_manager.get_user_preferences(user_id)
+    except Exception as e:
+        logger.warning(f"Could not read preferences for user {user_id}: {e}")
+        return {}
+
 async def async_orchestrate_swarm_task(task_id: str, user_id: str):
     """
     The main orchestration logic for a swarm task.
-    1. Fetches the task.
-    2. Invokes the Resource Manager agent to get an execution plan.
-    3. Updates the task with the plan.
-    4. Dispatches a Celery chord of sub-agent workers.
+    1. Fetches the task and the user profile once.
+    2. Plans the swarm (extracting the items in the same call if needed) while
+       memories relevant to the goal are retrieved concurrently.
+    3. Updates the task with the plan and caches the shared swarm context for the run.
+    4. Dispatches groups of sub-agent workers, sized by observed item latency.
     """
     db_manager = MongoManager()
+    memory_task = None
     try:
         task = await db_manager.get_task(task_id, user_id)
         if not task or task.get("task_type") != "swarm":
             logger.error(f"Orchestrator: Task {task_id} not found or is not a swarm task.")
             return
 
-        # --- Get user plan to check limits ---
+        # --- Load the user context once for the whole run ---
         user_profile = await db_manager.get_user_profile(user_id)
         plan = user_profile.get("userData", {}).get("plan", "free") if user_profile else "free"
         sub_agent_limit = PLAN_LIMITS[plan].get("swarm_sub_agents_max", 10)
+        user_integrations = user_profile.get("userData", {}).get("integrations", {}) if user_profile else {}
+        available_tools = _get_swarm_available_tools(user_integrations)
 
         swarm_details = task.get("swarm_details", {})
         goal = swarm_details.get("goal")
         items = swarm_details.get("items")
 
-        # --- NEW: Item Extraction Step ---
-        if not items: # If items list is empty, try to extract from goal
-            logger.info(f"Task {task_id}: Items list is empty. Attempting to extract items from goal.")
-
-            if not goal:
-                 raise ValueError("Swarm task is missing a goal to extract items from.")
-
-            extractor_response_str = ""
-            messages = [{'role': 'user', 'content': goal}]
-            for chunk in run_main_agent(system_message=ITEM_EXTRACTOR_SYSTEM_PROMPT, function_list=[], messages=messages):
-                if isinstance(chunk, list) and chunk:
-                    last_message = chunk[-1]
-                    if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
-                        extractor_response_str = last_message["content"]
+        if not goal:
+            raise ValueError("Swarm task is missing a goal.")
 
-            extractor_response_str = clean_llm_output(extractor_response_str).strip()
-            extracted_items = JsonExtractor.extract_valid_json(extractor_response_str)
+        memory_task = asyncio.create_task(_fetch_relevant_memories(user_id, goal, SWARM_CONTEXT_MEMORY_LIMIT))
 
-            if not isinstance(extracted_items, list) or not extracted_items:
-                raise ValueError(f"Item Extractor agent failed to extract a list of items from the goal. Response: {extractor_response_str}")
-
-            items = extracted_items # Update local variable
+        # --- 1. Item Extraction and Resource Manager ---
+        logger.info(f"Invoking Resource Manager for user {user_id} with goal: {goal}")
+        if not items:
+            logger.info(f"Task {task_id}: Items list is empty. Extracting items and planning in one call.")
+            items, swarm_plan = await asyncio.to_thread(_extract_and_plan_swarm, goal, available_tools)
             logger.info(f"Task {task_id}: Extracted {len(items)} items. Updating task in DB.")
-
-            # Update the task in the DB with the extracted items
             await db_manager.task_collection.update_one(
                 {"task_id": task_id},
                 {"$set": {"swarm_details.items": items}}
             )
-
-        if not goal or not items: # Re-check after potential extraction attempt
-            raise ValueError("Swarm task is missing goal or items after extraction attempt.")
-
-        # --- 1. Resource Manager Agent ---
-        logger.info(f"Invoking Resource Manager for user {user_id} with goal: {goal}")
-        
-        user_profile = await db_manager.get_user_profile(user_id)
-        user_integrations = user_profile.get("userData", {}).get("integrations", {}) if user_profile else {}
-        
-        available_tools = {}
-        for tool_name, config in INTEGRATIONS_CONFIG.items():
-            if tool_name in ["tasks", "progress_updater"]: continue
-            is_builtin = config.get("auth_type") == "builtin"
-            is_connected = user_integrations.get(tool_name, {}).get("connected", False)
-            if is_builtin or is_connected:
-                available_tools[tool_name] = config.get("description", "")
-        
-        system_prompt = RESOURCE_MANAGER_SYSTEM_PROMPT.format(
-            available_tools_json=json.dumps(list(available_tools.keys()))
-        )
-        
-        items_sample = items[:5]
-        user_prompt = f"Goal: \"{goal}\"\n\nItems (sample of {len(items)} total):\n{json.dumps(items_sample, indent=2, default=str)}"
-        
-        messages = [{'role': 'user', 'content': user_prompt}]
-        
-        manager_response_str = ""
-        for chunk in run_main_agent(system_message=system_prompt, function_list=[], messages=messages):
-            if isinstance(chunk, list) and chunk:
-                last_message = chunk[-1]
-                if last_message.get("role") == "assistant" and isinstance(last_message.get("content"), str):
-                    manager_response_str = last_message["content"]
-
-        manager_response_str = clean_llm_output(manager_response_str).strip()
-
-        if not manager_response_str:
-            raise Exception("Resource Manager agent returned an empty response.")
-        
-        swarm_plan = JsonExtractor.extract_valid_json(manager_response_str)
-
-        if not isinstance(swarm_plan, list) or not all(isinstance(item, dict) for item in swarm_plan):
-            raise Exception(f"Resource Manager returned an invalid plan. Response: {manager_response_str}")
+        else:
+            swarm_plan = await asyncio.to_thread(_plan_swarm, goal, items, available_tools)
 
         logger.info(f"Resource Manager created execution plan with {len(swarm_plan)} sub-task(s).")
 
-        # --- 2. Dispatch Worker Tasks ---
-        all_worker_groups = []
+        # --- 2. Group items for the workers ---
+        # Each worker configuration is split into groups sized from the observed per-item latency
+        # of its execution mode, so fast, homogeneous work isn't spread over one worker per item.
+        worker_groups = []
         total_agents = 0
         for config in swarm_plan:
             item_indices = config.get("item_indices", [])
             worker_prompt = config.get("worker_prompt")
             required_tools = config.get("required_tools", [])
-            
+
             # --- Enforce sub-agent limit ---
             if total_agents > sub_agent_limit:
                 raise Exception(f"Swarm plan exceeds the sub-agent limit for your plan ({total_agents} > {sub_agent_limit}). Please reduce the number of items or upgrade your plan.")
@@ -252,16 +290,44 @@ async def async_orchestrate_swarm_task(task_id: str, user_id: str):
                 logger.warning(f"Skipping invalid worker configuration: {config}")
                 continue
 
-            valid_indices = [i for i in item_indices if i < len(items)]
+            valid_indices = [i for i in item_indices if isinstance(i, int) and 0 <= i < len(items)]
+            if not valid_indices:
+                continue
             total_agents += len(valid_indices)
-            task_group = group(run_single_item_worker.s(parent_task_id=task_id, user_id=user_id, item=items[i], worker_prompt=worker_prompt, worker_tools=required_tools) for i in valid_indices)
-            if task_group:
-                all_worker_groups.append(task_group)
 
-        if not all_worker_groups:
+            execution_mode = resolve_execution_mode(config)
+            avg_item_seconds = await get_average_item_seconds(db_manager.db, latency_stats_key(execution_mode, required_tools))
+            group_size = compute_group_size(len(valid_indices), execution_mode, avg_item_seconds)
+            logger.info(f"Task {task_id}: {len(valid_indices)} items in '{execution_mode}' mode, groups of {group_size} (avg item latency: {avg_item_seconds}).")
+
+            for indices in split_into_groups(valid_indices, group_size):
+                worker_groups.append({
+                    "group_id": str(uuid.uuid4()),
+                    "indexed_items": [[i, items[i]] for i in indices],
+                    "worker_prompt": worker_prompt,
+                    "worker_tools": required_tools,
+                    "execution_mode": execution_mode
+                })
+
+        if total_agents > sub_agent_limit:
+            raise Exception(f"Swarm plan exceeds the sub-agent limit for your plan ({total_agents} > {sub_agent_limit}). Please reduce the number of items or upgrade your plan.")
+
+        if not worker_groups:
             raise Exception("The execution plan resulted in no valid tasks to run.")
-        
+
         parent_run_id = str(uuid.uuid4())
+
+        # --- Shared swarm context ---
+        # Cached once per run so workers don't reload the profile. The context travels inline
+        # with each group when the cache is unavailable.
+        memories = await memory_task
+        swarm_context = build_swarm_context(user_id, user_profile, available_tools, memories)
+        swarm_context_key = swarm_context_cache_key(task_id, parent_run_id)
+        if cache_set_json(swarm_context_key, swarm_context, SWARM_CONTEXT_TTL_SECONDS):
+            context_kwargs = {"swarm_context_key": swarm_context_key}
+        else:
+            context_kwargs = {"swarm_context": swarm_context}
+
         run_doc = {
             "run_id": parent_run_id,
             "status": "processing",
@@ -286,12 +352,28 @@ async def async_orchestrate_swarm_task(task_id: str, user_id: str):
         await db_manager.update_task(task_id, update_payload)
         await push_task_list_update(user_id, task_id, "swarm_plan_created")
 
-        header = group(all_worker_groups)
-        callback = aggregate_results_callback.s(parent_task_id=task_id, user_id=user_id, parent_run_id=parent_run_id)
-        chord_task = chord(header, callback)
-        
-        logger.info(f"Dispatching a chord of {total_agents} parallel workers for task {task_id}, run {parent_run_id}.")
-        chord_task.apply_async()
+        # --- 3. Dispatch the worker groups ---
+        # Workers store each item result as soon as it is ready. The group that completes last
+        # (tracked in swarm_run_progress) triggers the aggregation instead of a terminal chord.
+        # Past `deadline_at`, finalize_overdue_swarm_runs aggregates whatever results were stored.
+        dispatched_at = datetime.datetime.now(datetime.timezone.utc)
+        await db_manager.db.swarm_run_progress.insert_one({
+            "task_id": task_id,
+            "run_id": parent_run_id,
+            "user_id": user_id,
+            "total_groups": len(worker_groups),
+            "total_items": total_agents,
+            "completed_group_ids": [],
+            "aggregated_at": None,
+            "deadline_at": dispatched_at + datetime.timedelta(seconds=SWARM_RUN_TIMEOUT_SECONDS),
+            "created_at": dispatched_at
+        })
+
+        logger.info(f"Dispatching {len(worker_groups)} worker groups for {total_agents} items of task {task_id}, run {parent_run_id}.")
+        group(
+            run_swarm_item_group.s(parent_task_id=task_id, user_id=user_id, parent_run_id=parent_run_id, **worker_group, **context_kwargs)
+            for worker_group in worker_groups
+        ).apply_async()
 
     except LLMProviderDownError as e:
         logger.error(f"LLM provider down during swarm orchestration for {task_id}: {e}", exc_info=True)
@@ -300,6 +382,8 @@ async def async_orchestrate_swarm_task(task_id: str, user_id: str):
         logger.error(f"Error in orchestrate_swarm_task for task {task_id}: {e}", exc_info=True)
         await db_manager.update_task(task_id, {"status": "error", "error": str(e)})
     finally:
+        if memory_task and not memory_task.done():
+            memory_task.cancel()
         await db_manager.close()
 
 @celery_app.task(name="refine_and_plan_ai_task")
@@ -311,9 +395,119 @@ def refine_and_plan_ai_task(task_id: str, user_id: str):
     logger.info(f"Refining and planning for AI task_id: {task_id}")
     run_async(async_refine_and_plan_ai_task(task_id, user_id))
 
+def _get_user_time_context(personal_info: Dict, user_id: str) -> Tuple[str, str]:
+    """Returns the user's timezone name and their current local time, defaulting to UTC."""
+    user_timezone_str = personal_info.get("timezone", "UTC")
+    try:
+        user_timezone = ZoneInfo(user_timezone_str)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"Invalid timezone '{user_timezone_str}' for user {user_id}. Defaulting to UTC.")
+        user_timezone = ZoneInfo("UTC")
+    return user_timezone_str, datetime.datetime.now(user_timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+def _get_user_location(personal_info: Dict) -> str:
+    user_location_raw = personal_info.get("location", "Not specified")
+    if isinstance(user_location_raw, dict):
+        return f"latitude: {user_location_raw.get('latitude')}, longitude: {user_location_raw.get('longitude')}"
+    return user_location_raw
+
+def _format_preferences(preferences: Optional[Dict[str, Any]]) -> str:
+    return "\n- ".join(f"{key}: {value}" for key, value in (preferences or {}).items() if value not in (None, "", [], {}))
+
+def _build_planner_user_prompt(action_items: List[str], memories: List[str], preferences: Optional[Dict[str, Any]] = None) -> str:
+    user_prompt_content = "Please create a plan for the following action items:\n- " + "\n- ".join(action_items)
+    if memories:
+        user_prompt_content += "\n\nRelevant facts already known about the user:\n- " + "\n- ".join(memories)
+    formatted_preferences = _format_preferences(preferences)
+    if formatted_preferences:
+        user_prompt_content += "\n\nThe user's preferences:\n- " + formatted_preferences
+    return user_prompt_content
+
+def _build_refine_user_prompt(description: str, memories: List[str], preferences: Optional[Dict[str, Any]] = None) -> str:
+    context = []
+    if memories:
+        context.append("Relevant facts already known about the user (context only, not part of the request):\n- " + "\n- ".join(memories))
+    formatted_preferences = _format_preferences(preferences)
+    if formatted_preferences:
+        context.append("The user's preferences (context only, not part of the request):\n- " + formatted_preferences)
+    return "\n\n".join([description] + context)
+
+def _get_action_items(task: Dict) -> List[str]:
+    action_items = task.get("action_items", [])
+    if not action_items:
+        # This is likely a manually created task. Use its description as the action item.
+        logger.info(f"Task {task.get('task_id')}: No 'action_items' field found. Using main description as the action.")
+        action_items = [task.get("description", "")]
+    return action_items
+
+def _is_valid_plan_data(plan_data: Any) -> bool:
+    return isinstance(plan_data, dict) and isinstance(plan_data.get("plan"), list) and bool(plan_data["plan"])
+
+async def _save_generated_plan(db_manager: PlannerMongoManager, task: Dict, user_id: str, plan_data: Dict, is_change_request: bool):
+    """Stores a plan for approval and tells the user about it."""
+    task_id = task["task_id"]
+    await db_manager.update_task_with_plan(task_id, plan_data, is_change_request)
+    capture_event(user_id, "proactive_task_generated", {
+        "task_id": task_id,
+        "source": task.get("original_context", {}).get("source", "unknown"),
+        "plan_steps": len(plan_data.get("plan", []))
+    })
+
+    # Notify user that a plan is ready for their approval
+    await notify_user(
+        user_id, f"I've created a new plan for you: '{plan_data.get('name', '...')[:50]}...'", task_id,
+        notification_type="taskNeedsApproval"
+    )
+
+    # CRITICAL: Notify the frontend to refresh its task list.
+    # A run_id doesn't exist yet, as this is the planning stage. We pass a placeholder.
+    await push_task_list_update(user_id, task_id, "plan_generated")
+    logger.info(f"Sent task_list_updated push notification for user {user_id}")
+
+async def _plan_task(db_manager: PlannerMongoManager, task: Dict, user_id: str, personal_info: Dict, memories: List[str], is_change_request: bool,
+                     preferences: Optional[Dict[str, Any]] = None):
+    """
+    Generates and saves a plan for a task whose context is already loaded. New tasks reuse
+    a cached plan when the same request was planned before with the same set of tools.
+    """
+    task_id = task["task_id"]
+    action_items = _get_action_items(task)
+    available_tools = get_all_mcp_descriptions()
+    cache_key = None if is_change_request else get_plan_cache_key(user_id, action_items, available_tools)
+    plan_data = await db_manager.get_cached_plan(cache_key) if cache_key else None
+
+    if plan_data:
+        logger.info(f"Task {task_id}: Reusing cached plan.")
+    else:
+        user_name = personal_info.get("name", "User")
+        _, current_user_time = _get_user_time_context(personal_info, user_id)
+        agent_config = get_planner_agent(available_tools, current_user_time, user_name, _get_user_location(personal_info))
+
+        plan_data, final_response_str = await asyncio.to_thread(
+            _run_agent_for_json, agent_config["system_message"], _build_planner_user_prompt(action_items, memories, preferences)
+        )
+        if not final_response_str:
+            raise Exception("Planner agent returned no response.")
+        if not plan_data or "plan" not in plan_data:
+            raise Exception(f"Planner agent returned invalid JSON: {final_response_str}")
+        if cache_key and _is_valid_plan_data(plan_data):
+            await db_manager.cache_plan(cache_key, user_id, plan_data)
+
+    await _save_generated_plan(db_manager, task, user_id, plan_data, is_change_request)
+
 async def async_refine_and_plan_ai_task(task_id: str, user_id: str):
-    """Async logic for refining an AI task and then kicking off the planner."""
+    """
+    Async logic for refining an AI task and planning it.
+
+    A plan cached for the same raw request and tool set is reused, and then only the task
+    details are refined. Otherwise refinement and planning are a single structured call that
+    also sees the user's preferences and the memories retrieved for the request, both fetched
+    while the profile and the plan cache are read. If the model leaves the plan out because
+    the request is ambiguous, the task is planned separately with the refined details.
+    """
     db_manager = PlannerMongoManager()
+    memory_task = None
+    preferences_task = None
     try:
         task = await db_manager.get_task(task_id)
         if not task or task.get("assignee") != "ai":
@@ -321,34 +515,45 @@ async def async_refine_and_plan_ai_task(task_id: str, user_id: str):
             return
 
         user_id = task["user_id"]
-        user_profile = await db_manager.user_profiles_collection.find_one({"user_id": user_id})
+        raw_description = task["description"]
+        # Only needed when there is no cached plan, so they are awaited (or cancelled) after the cache lookup.
+        memory_task = asyncio.create_task(_fetch_relevant_memories(user_id, raw_description, PLANNING_MEMORY_LIMIT))
+        preferences_task = asyncio.create_task(_fetch_user_preferences(db_manager, user_id))
+        user_profile = await db_manager.user_profiles_collection.find_one({"user_id": user_id}, {"userData.personalInfo": 1})
         personal_info = user_profile.get("userData", {}).get("personalInfo", {}) if user_profile else {}
         user_name = personal_info.get("name", "User")
-        user_timezone_str = personal_info.get("timezone", "UTC")
-        try:
-            user_timezone = ZoneInfo(user_timezone_str)
-        except ZoneInfoNotFoundError:
-            user_timezone = ZoneInfo("UTC")
-        current_time_str = datetime.datetime.now(user_timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
+        user_timezone_str, current_time_str = _get_user_time_context(personal_info, user_id)
+        available_tools = get_all_mcp_descriptions()
 
-        system_prompt = TASK_CREATION_PROMPT.format(
+        # Keyed by the request as the user wrote it, so the lookup can happen before any LLM call.
+        cache_key = get_plan_cache_key(user_id, [raw_description], available_tools)
+        cached_plan = await db_manager.get_cached_plan(cache_key)
+        if not _is_valid_plan_data(cached_plan):
+            cached_plan = None
+
+        task_creation_prompt = TASK_CREATION_PROMPT.format(
             user_name=user_name,
             user_timezone=user_timezone_str,
             current_time=current_time_str
         )
-        # Use the raw prompt from the task's description for parsing
-        messages = [{'role': 'user', 'content': task["description"]}]
-
-        response_str = ""
-        for chunk in run_main_agent(system_message=system_prompt, function_list=[], messages=messages):
-            if isinstance(chunk, list) and chunk and chunk[-1].get("role") == "assistant":
-                response_str = chunk[-1].get("content", "")
-
-        parsed_data = JsonExtractor.extract_valid_json(clean_llm_output(response_str))
-        if parsed_data:
-            # Safeguard: never allow the refiner to nullify or change the user_id
+        if cached_plan:
+            # The schedule depends on the current time, so the details are still refined; the plan is not.
+            logger.info(f"Task {task_id}: Reusing cached plan; refining the task details only.")
+            memory_task.cancel()
+            preferences_task.cancel()
+            memories, preferences = [], {}
+            parsed_data, _ = await asyncio.to_thread(_run_agent_for_json, task_creation_prompt, raw_description)
+        else:
+            memories, preferences = await asyncio.gather(memory_task, preferences_task)
+            planner_prompt = get_planner_agent(available_tools, current_time_str, user_name, _get_user_location(personal_info))["system_message"]
+            system_prompt = "\n\n".join([task_creation_prompt, planner_prompt, REFINE_AND_PLAN_OUTPUT_INSTRUCTIONS])
+            parsed_data, _ = await asyncio.to_thread(_run_agent_for_json, system_prompt, _build_refine_user_prompt(raw_description, memories, preferences))
+
+        plan_data = None
+        if isinstance(parsed_data, dict) and parsed_data:
+            plan_steps = parsed_data.pop("plan", None)
             # --- ADD POSTHOG EVENT TRACKING ---
-            schedule_type = parsed_data.get("schedule", {}).get("type", "once")
+            schedule_type = (parsed_data.get("schedule") or {}).get("type", "once")
             capture_event(
                 user_id,
                 "task_created",
@@ -356,9 +561,6 @@ async def async_refine_and_plan_ai_task(task_id: str, user_id: str):
             )
             # --- END POSTHOG EVENT TRACKING ---
 
-            if "user_id" in parsed_data:
-                del parsed_data["user_id"]
-
             # Safeguard: never allow the refiner to nullify or change the user_id
             if "user_id" in parsed_data:
                 del parsed_data["user_id"]
@@ -375,13 +577,27 @@ async def async_refine_and_plan_ai_task(task_id: str, user_id: str):
             if not parsed_data.get("name"):
                 parsed_data["name"] = task["description"] or task["name"]
             await db_manager.update_task_field(task_id, parsed_data)
+            task.update(parsed_data)
             logger.info(f"Successfully refined and updated AI task {task_id} with new details.")
+
+            candidate_plan = {
+                "name": parsed_data.get("name"), "description": parsed_data.get("description", ""),
+                "plan": cached_plan["plan"] if cached_plan else plan_steps
+            }
+            if _is_valid_plan_data(candidate_plan):
+                plan_data = candidate_plan
         else:
             logger.warning(f"Could not parse details for AI task {task_id}, proceeding with raw description.")
+            plan_data = cached_plan
 
-        # Now trigger the planning step, which is the main purpose of AI-assigned tasks
-        generate_plan_from_context.delay(task_id, user_id)
-        logger.info(f"Refinement complete for AI task {task_id}, dispatched to planner.")
+        if plan_data:
+            if not cached_plan:
+                await db_manager.cache_plan(cache_key, user_id, plan_data)
+            await _save_generated_plan(db_manager, task, user_id, plan_data, is_change_request=False)
+            logger.info(f"Refined and planned AI task {task_id} ({'cached plan' if cached_plan else 'single call'}).")
+        else:
+            logger.info(f"Task {task_id}: Plan was not produced with the refinement. Planning separately.")
+            await _plan_task(db_manager, task, user_id, personal_info, memories, is_change_request=False, preferences=preferences)
 
     except LLMProviderDownError as e:
         logger.error(f"LLM provider down during task refinement for {task_id}: {e}", exc_info=True)
@@ -390,6 +606,9 @@ async def async_refine_and_plan_ai_task(task_id: str, user_id: str):
         logger.error(f"Error refining and planning AI task {task_id}: {e}", exc_info=True)
         await db_manager.update_task_field(task_id, {"status": "error", "error": "Failed during initial refinement."})
     finally:
+        for prefetch_task in (memory_task, preferences_task):
+            if prefetch_task and not prefetch_task.done():
+                prefetch_task.cancel()
         await db_manager.close()
 
 @celery_app.task(name="process_task_change_request")
@@ -515,80 +734,24 @@ async def async_generate_plan(task_id: str, user_id: str):
             original_context["previous_plan"] = task.get("plan")
             original_context["previous_result"] = task.get("result")
 
-        user_profile = await db_manager.user_profiles_collection.find_one(
-            {"user_id": user_id},
-            {"userData.personalInfo": 1} # Projection to get only necessary data
+        # The profile and the memories relevant to the task are loaded concurrently.
+        action_items = _get_action_items(task)
+        user_profile, memories = await asyncio.gather(
+            db_manager.user_profiles_collection.find_one(
+                {"user_id": user_id},
+                {"userData.personalInfo": 1, "userData.preferences": 1} # Projection to get only necessary data
+            ),
+            _fetch_relevant_memories(user_id, " ".join(action_items), PLANNING_MEMORY_LIMIT)
         )
         if not user_profile:
             logger.error(f"User profile not found for user_id '{user_id}' associated with task {task_id}. Cannot generate plan.")
             await db_manager.update_task_status(task_id, "error", {"error": f"User profile not found for user_id '{user_id}'."})
             return
 
-        if not user_profile:
-            logger.error(f"User profile not found for user_id '{user_id}' associated with task {task_id}. Cannot generate plan.")
-            await db_manager.update_task_status(task_id, "error", {"error": f"User profile not found for user_id '{user_id}'."})
-            return
-
         personal_info = user_profile.get("userData", {}).get("personalInfo", {})
-        user_name = personal_info.get("name", "User")
-        user_location_raw = personal_info.get("location", "Not specified")
-        if isinstance(user_location_raw, dict):
-            user_location = f"latitude: {user_location_raw.get('latitude')}, longitude: {user_location_raw.get('longitude')}"
-        else:
-            user_location = user_location_raw
-
-        user_timezone_str = personal_info.get("timezone", "UTC")
-        try:
-            user_timezone = ZoneInfo(user_timezone_str)
-        except ZoneInfoNotFoundError:
-            logger.warning(f"Invalid timezone '{user_timezone_str}' for user {user_id}. Defaulting to UTC.")
-            user_timezone = ZoneInfo("UTC")
-
-        current_user_time = datetime.datetime.now(user_timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
-
-        action_items = task.get("action_items", [])
-        if not action_items:
-            # This is likely a manually created task. Use its description as the action item.
-            logger.info(f"Task {task_id}: No 'action_items' field found. Using main description as the action.")
-            action_items = [task.get("description", "")]
-
-        available_tools = get_all_mcp_descriptions()
-
-        agent_config = get_planner_agent(available_tools, current_user_time, user_name, user_location)
-
-        user_prompt_content = "Please create a plan for the following action items:\n- " + "\n- ".join(action_items)
-        messages = [{'role': 'user', 'content': user_prompt_content}]
-
-        final_response_str = ""
-        for chunk in run_main_agent(system_message=agent_config["system_message"], function_list=agent_config["function_list"], messages=messages):
-            if isinstance(chunk, list) and chunk and chunk[-1].get("role") == "assistant":
-                final_response_str = chunk[-1].get("content", "")
-
-        if not final_response_str:
-            raise Exception("Planner agent returned no response.")
-
-        plan_data = JsonExtractor.extract_valid_json(clean_llm_output(final_response_str))
-        if not plan_data or "plan" not in plan_data:
-            raise Exception(f"Planner agent returned invalid JSON: {final_response_str}")
-
-        await db_manager.update_task_with_plan(task_id, plan_data, is_change_request)
-        capture_event(user_id, "proactive_task_generated", {
-            "task_id": task_id,
-            "source": task.get("original_context", {}).get("source", "unknown"),
-            "plan_steps": len(plan_data.get("plan", []))
-        })
-
-        # Notify user that a plan is ready for their approval
-        await notify_user(
-            user_id, f"I've created a new plan for you: '{plan_data.get('name', '...')[:50]}...'", task_id,
-            notification_type="taskNeedsApproval"
-        )
-
-        # CRITICAL: Notify the frontend to refresh its task list.
-        # A run_id doesn't exist yet, as this is the planning stage. We pass a placeholder.
-        await push_task_list_update(user_id, task_id, "plan_generated")
-        logger.info(f"Sent task_list_updated push notification for user {user_id}")
-
+        preferences = user_profile.get("userData", {}).get("preferences") or {}
+        task["task_id"] = task_id
+        await _plan_task(db_manager, task, user_id, personal_info, memories, is_change_request, preferences)
 
     except LLMProviderDownError as e:
         logger.error(f"LLM provider down during plan generation for task {task_id}: {e}", exc_info=True)
@@ -826,7 +989,7 @@ async def async_schedule_polling(mode: str):
 
             for task_state in due_tasks_states:
                 user_id = task_state["user_id"]
-                locked_task_state = await db_manager.set_polling_status_and_get(user_id, service_name, mode)
+                locked_task_state = await db_manager.set_polling_status_and_get(user_id, service_name, mode, owner_id="celery-beat")
 
                 if locked_task_state and '_id' in locked_task_state and isinstance(locked_task_state['_id'], ObjectId):
                     locked_task_state['_id'] = str(locked_task_state['_id'])
@@ -947,115 +1110,184 @@ async def async_run_due_tasks():
 
 
 # --- Chat History Summarization Task ---
+SUMMARIZATION_SYSTEM_PROMPT = """
+You are the AI assistant in the provided conversation log. Your task is to write a summary of the conversation from your own perspective, as if you are recalling the memory of the interaction.
+
+Core Instructions:
+1.  Adopt a First-Person Narrative: Use "I", "me", and "my" to refer to your own actions and thoughts. Refer to the other party as "the user".
+2.  Describe the Flow: Recount the conversation as a sequence of events. For example: "The user told me about their project...", "I then asked for clarification on...", "We then discussed...".
+3.  CRITICAL INSTRUCTION FOR FILE UPLOADS: If a user message involves uploading a file (e.g., "user: (Attached file for context: report.pdf) Can you summarize this?"), your summary must NOT state that you cannot process it. Instead, you MUST describe the user's action factually. For example: "The user uploaded a file named 'report.pdf' and asked for a summary."
+4.  Goal: The goal is to create a dense, narrative paragraph that captures the key information, decisions, and flow of the conversation from your point of view. Focus on information that would be useful for future context.
+5.  Format: Do not add any preamble or sign-off. Respond only with the summary paragraph.
+"""
+
+def _summarization_cutoff() -> datetime.datetime:
+    """Messages newer than this are left alone so live conversations aren't summarized mid-flow."""
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=SUMMARIZATION_MIN_MESSAGE_AGE_SECONDS)
+
+def _summary_id_for_chunk(user_id: str, chunk: List[Dict]) -> str:
+    """
+    Derives a deterministic summary ID from the exact set of messages in a chunk.
+    A retried or crashed run produces the same ID for the same messages, so the
+    summary is recognised as already stored instead of being generated twice.
+    """
+    message_ids = ",".join(msg['message_id'] for msg in chunk)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"conversation-summary:{user_id}:{message_ids}"))
+
+def _summarize_conversation_text(conversation_text: str) -> str:
+    """Blocking LLM call that turns a chunk of conversation into a narrative summary."""
+    messages = [{'role': 'user', 'content': conversation_text}]
+    summary_text = ""
+    for response_chunk in run_main_agent(system_message=SUMMARIZATION_SYSTEM_PROMPT, function_list=[], messages=messages):
+        if isinstance(response_chunk, list) and response_chunk and response_chunk[-1].get("role") == "assistant":
+            summary_text = response_chunk[-1].get("content", "")
+    return clean_llm_output(summary_text)
+
 @celery_app.task(name="summarize_old_conversations")
 def summarize_old_conversations():
     """
-    Celery Beat task to find old, unsummarized messages, group them into chunks,
-    summarize them, and store the summaries and embeddings in ChromaDB.
+    Celery Beat task that measures the summarization backlog and fans out one
+    `summarize_user_conversations` task per user with old, unsummarized messages.
     """
     logger.info("Summarization Task: Starting to look for old conversations to summarize.")
     run_async(async_summarize_conversations())
 
-# src/server/workers/tasks.py
-
 async def async_summarize_conversations():
     db_manager = PlannerMongoManager()  # Re-using for its mongo access
     try:
-        # 1. Find users with recent, unsummarized messages
-        # We process one user at a time to keep the task manageable.
-        # This aggregation finds the first user with unsummarized messages older than 1 day.
-        # Temporarily changed for testing
-        one_day_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
         pipeline = [
-            {"$match": {"is_summarized": False, "timestamp": {"$lt": one_day_ago}}},
-            {"$group": {"_id": "$user_id"}},
-            {"$limit": 1} # Process one user per run
+            {"$match": {"is_summarized": False, "timestamp": {"$lt": _summarization_cutoff()}}},
+            {"$group": {"_id": "$user_id", "pending_messages": {"$sum": 1}}},
+            # A lone trailing message cannot be summarized yet, so it does not make a user part of the backlog.
+            {"$match": {"pending_messages": {"$gte": SUMMARIZATION_MIN_CHUNK_MESSAGES}}},
+            {"$sort": {"pending_messages": -1}}
         ]
-        user_to_process = await db_manager.messages_collection.aggregate(pipeline).to_list(length=1)
+        backlog = await db_manager.messages_collection.aggregate(pipeline).to_list(length=None)
 
-        if not user_to_process:
+        if not backlog:
             logger.info("Summarization Task: No users with old, unsummarized messages found.")
             return
 
-        user_id = user_to_process[0]['_id']
-        logger.info(f"Summarization Task: Found user {user_id} with messages to summarize.")
+        total_pending = sum(entry["pending_messages"] for entry in backlog)
+        users_to_dispatch = backlog[:SUMMARIZATION_MAX_USERS_PER_RUN]
+        logger.info(
+            f"Summarization Task: Backlog is {total_pending} messages across {len(backlog)} users "
+            f"(largest: {backlog[0]['pending_messages']}). Dispatching {len(users_to_dispatch)} user tasks, "
+            f"deferring {len(backlog) - len(users_to_dispatch)} to the next run."
+        )
+        # Not tied to a user, so it is recorded under a fixed system id.
+        capture_event("system", "summarization_backlog_measured", {
+            "pending_messages": total_pending,
+            "users_with_backlog": len(backlog),
+            "largest_user_backlog": backlog[0]["pending_messages"],
+            "users_dispatched": len(users_to_dispatch),
+            "users_deferred": len(backlog) - len(users_to_dispatch),
+        })
+
+        group(summarize_user_conversations.s(entry["_id"]) for entry in users_to_dispatch).apply_async()
+
+    except Exception as e:
+        logger.error(f"Error during conversation summarization dispatch: {e}", exc_info=True)
+    finally:
+        await db_manager.close()
+
+@celery_app.task(name="summarize_user_conversations")
+def summarize_user_conversations(user_id: str):
+    """
+    Summarizes one user's old, unsummarized messages in chunks and stores the
+    summaries and embeddings in ChromaDB.
+    """
+    logger.info(f"Summarization Task: Summarizing conversations for user {user_id}.")
+    run_async(async_summarize_user_conversations(user_id))
+
+async def async_summarize_user_conversations(user_id: str):
+    db_manager = PlannerMongoManager()
+    try:
+        # 1. Fetch a bounded batch of unsummarized messages in chronological order
+        max_messages = SUMMARIZATION_CHUNK_SIZE * SUMMARIZATION_MAX_CHUNKS_PER_USER_RUN
+        pending_query = {"user_id": user_id, "is_summarized": False, "timestamp": {"$lt": _summarization_cutoff()}}
+        messages_cursor = db_manager.messages_collection.find(pending_query).sort("timestamp", 1).limit(max_messages)
+        messages_to_process = await messages_cursor.to_list(length=max_messages)
 
-        # 2. Fetch all unsummarized messages for this user
-        messages_cursor = db_manager.messages_collection.find({
-            "user_id": user_id,
-            "is_summarized": False
-        }).sort("timestamp", 1) # Get them in chronological order
-        
-        messages_to_process = await messages_cursor.to_list(length=None)
-        
         if not messages_to_process:
             logger.info(f"Summarization Task: No unsummarized messages to process for user {user_id}.")
             return
 
-        # 3. Group messages into chunks (e.g., of 30 messages)
-        chunk_size = 30
-        message_chunks = [messages_to_process[i:i + chunk_size] for i in range(0, len(messages_to_process), chunk_size)]
-        
-        # 4. Process each chunk
-        
-        for chunk in message_chunks:
-            if len(chunk) < 2: # Don't summarize single messages
-                continue
+        for msg in messages_to_process:
+            _decrypt_doc(msg, ["content"])
 
-            conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in chunk])
-            
-            # 4a. Summarize with LLM using the new, narrative-style prompt
-            messages = [{'role': 'user', 'content': conversation_text}]
-            summary_text = ""
-            
-            # --- MODIFIED PROMPT ---
-            system_prompt = """
-You are the AI assistant in the provided conversation log. Your task is to write a summary of the conversation from your own perspective, as if you are recalling the memory of the interaction.
+        # 2. Group messages into chunks. Single messages aren't worth summarizing.
+        message_chunks = [messages_to_process[i:i + SUMMARIZATION_CHUNK_SIZE] for i in range(0, len(messages_to_process), SUMMARIZATION_CHUNK_SIZE)]
+        chunks_by_id = {_summary_id_for_chunk(user_id, chunk): chunk for chunk in message_chunks if len(chunk) >= SUMMARIZATION_MIN_CHUNK_MESSAGES}
+        if not chunks_by_id:
+            return
 
-Core Instructions:
-1.  Adopt a First-Person Narrative: Use "I", "me", and "my" to refer to your own actions and thoughts. Refer to the other party as "the user".
-2.  Describe the Flow: Recount the conversation as a sequence of events. For example: "The user told me about their project...", "I then asked for clarification on...", "We then discussed...".
-3.  CRITICAL INSTRUCTION FOR FILE UPLOADS: If a user message involves uploading a file (e.g., "user: (Attached file for context: report.pdf) Can you summarize this?"), your summary must NOT state that you cannot process it. Instead, you MUST describe the user's action factually. For example: "The user uploaded a file named 'report.pdf' and asked for a summary."
-4.  Goal: The goal is to create a dense, narrative paragraph that captures the key information, decisions, and flow of the conversation from your point of view. Focus on information that would be useful for future context.
-5.  Format: Do not add any preamble or sign-off. Respond only with the summary paragraph.
-"""
-            # --- END MODIFIED PROMPT ---
+        # 3. Skip chunks whose summary already made it into ChromaDB on a previous, interrupted run
+        collection = await asyncio.to_thread(get_conversation_summaries_collection)
+        existing = await asyncio.to_thread(collection.get, ids=list(chunks_by_id.keys()), include=[])
+        already_stored_ids = set(existing.get("ids") or [])
+        chunks_to_summarize = [(summary_id, chunk) for summary_id, chunk in chunks_by_id.items() if summary_id not in already_stored_ids]
+
+        # 4. Summarize the remaining chunks concurrently, bounded by the LLM concurrency limit
+        llm_semaphore = asyncio.Semaphore(SUMMARIZATION_MAX_CONCURRENT_LLM_CALLS)
 
-            for response_chunk in run_main_agent(system_message=system_prompt, function_list=[], messages=messages):
-                 if isinstance(response_chunk, list) and response_chunk and response_chunk[-1].get("role") == "assistant":
-                    summary_text = response_chunk[-1].get("content", "")
+        async def summarize_chunk(chunk: List[Dict]) -> str:
+            conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in chunk])
+            async with llm_semaphore:
+                return await asyncio.to_thread(_summarize_conversation_text, conversation_text)
 
-            summary_text = clean_llm_output(summary_text)
-            
+        summaries = await asyncio.gather(*(summarize_chunk(chunk) for _, chunk in chunks_to_summarize), return_exceptions=True)
+
+        summary_ids, documents, metadatas = [], [], []
+        for (summary_id, chunk), summary_text in zip(chunks_to_summarize, summaries):
+            if isinstance(summary_text, Exception):
+                logger.error(f"Summarization for user {user_id} failed for chunk {summary_id}: {summary_text}")
+                continue
             if not summary_text:
                 logger.warning(f"Summarization for user {user_id} produced an empty result. Skipping chunk.")
                 continue
+            summary_ids.append(summary_id)
+            documents.append(summary_text)
+            metadatas.append({
+                "user_id": user_id,
+                "start_timestamp": chunk[0]['timestamp'].isoformat(),
+                "end_timestamp": chunk[-1]['timestamp'].isoformat(),
+                "message_ids_json": json.dumps([msg['message_id'] for msg in chunk])
+            })
+
+        # 5. Store all new summaries in a single ChromaDB write. Upsert keeps a retried write idempotent.
+        if summary_ids:
+            await asyncio.to_thread(collection.upsert, ids=summary_ids, documents=documents, metadatas=metadatas)
+            logger.info(f"Summarization Task: Stored {len(summary_ids)} summaries in ChromaDB for user {user_id}.")
+
+        # 6. Mark the original messages in MongoDB, including chunks recovered from an earlier run
+        summarized_ids = already_stored_ids.union(summary_ids)
+        if summarized_ids:
+            await db_manager.messages_collection.bulk_write([
+                UpdateMany(
+                    {"_id": {"$in": [msg['_id'] for msg in chunks_by_id[summary_id]]}},
+                    {"$set": {"is_summarized": True, "summary_id": summary_id}}
+                ) for summary_id in summarized_ids
+            ], ordered=False)
+
+        remaining = await db_manager.messages_collection.count_documents(pending_query)
+        logger.info(
+            f"Summarization Task: User {user_id} - {len(summary_ids)} new summaries, "
+            f"{len(already_stored_ids)} recovered, {len(chunks_to_summarize) - len(summary_ids)} failed, "
+            f"{remaining} messages still pending."
+        )
+        capture_event(user_id, "conversation_summarization_completed", {
+            "new_summaries": len(summary_ids),
+            "recovered_summaries": len(already_stored_ids),
+            "failed_chunks": len(chunks_to_summarize) - len(summary_ids),
+            "pending_messages": remaining,
+        })
 
-            # 4b. Store summary and embedding in ChromaDB
-            summary_id = str(uuid.uuid4())
-            message_ids = [msg['message_id'] for msg in chunk]
-            
-            collection = get_conversation_summaries_collection()
-            collection.add(
-                ids=[summary_id],
-                documents=[summary_text],
-                metadatas=[{
-                    "user_id": user_id,
-                    "start_timestamp": chunk[0]['timestamp'].isoformat(),
-                    "end_timestamp": chunk[-1]['timestamp'].isoformat(),
-                    "message_ids_json": json.dumps(message_ids)
-                }]
-            )
-            logger.info(f"Summarization Task: Stored summary {summary_id} in ChromaDB for user {user_id}.")
-            
-            # 4c. Update original messages in MongoDB
-            message_object_ids = [msg['_id'] for msg in chunk]
-            await db_manager.messages_collection.update_many(
-                {"_id": {"$in": message_object_ids}},
-                {"$set": {"is_summarized": True, "summary_id": summary_id}}
-            )
+        # Keep draining a large backlog without waiting for the next hourly run, as long as we're making progress.
+        if summary_ids and len(messages_to_process) == max_messages and remaining >= SUMMARIZATION_MIN_CHUNK_MESSAGES:
+            summarize_user_conversations.delay(user_id)
 
     except Exception as e:
-        logger.error(f"Error during conversation summarization: {e}", exc_info=True)
+        logger.error(f"Error during conversation summarization for user {user_id}: {e}", exc_info=True)
     finally:
-        await db_manager.close()
\ No newline at end of file
+        await db_manager.close()
@@ -1,10 +1,13 @@
+import asyncio
 import httpx
 import logging
 import os
 import motor.motor_asyncio
 import datetime
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List
+
+from workers.utils.events import EVENT_NOTIFICATION, EVENT_TASK_LIST_UPDATED, EVENT_TASK_PROGRESS, publish_event
 
 logger = logging.getLogger(__name__)
 
@@ -27,11 +30,30 @@ async def get_user_preferences_from_db(user_id: str):
         if client:
             client.close()
 
+# --- HTTP fallback ---
+# httpx clients are bound to the event loop they were created on, and Celery tasks run on
+# their own loops, so one pooled client is kept per loop.
+_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    for closed_loop in [other for other in _http_clients if other.is_closed()]:
+        _http_clients.pop(closed_loop, None)
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+        _http_clients[loop] = client
+    return client
+
+async def close_http_client_for_loop(loop: asyncio.AbstractEventLoop):
+    client = _http_clients.pop(loop, None)
+    if client:
+        await client.aclose()
+
 async def notify_user(user_id: str, message: str, task_id: Optional[str] = None, notification_type: str = "general", payload: Optional[dict] = None):
     """
-    Calls the main server to create a notification for the user, after checking preferences.
+    Has the main server create a notification for the user, through the event stream or, failing that, over HTTP.
     """
-    endpoint = f"{MAIN_SERVER_URL}/notifications/internal/create"
     request_payload = {
         "user_id": user_id,
         "message": message,
@@ -39,11 +61,15 @@ async def notify_user(user_id: str, message: str, task_id: Optional[str] = None,
         "notification_type": notification_type,
         "payload": payload
     }
+    if publish_event(EVENT_NOTIFICATION, user_id, request_payload):
+        logger.info(f"Queued notification for user {user_id}: {message}")
+        return
+
+    endpoint = f"{MAIN_SERVER_URL}/notifications/internal/create"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(endpoint, json=request_payload, timeout=10)
-            response.raise_for_status()
-            logger.info(f"Successfully sent notification for user {user_id}: {message}")
+        response = await get_http_client().post(endpoint, json=request_payload, timeout=10)
+        response.raise_for_status()
+        logger.info(f"Successfully sent notification for user {user_id}: {message}")
     except httpx.HTTPStatusError as e:
         logger.error(f"Failed to send notification for user {user_id}. Status: {e.response.status_code}, Response: {e.response.text}")
     except Exception as e:
@@ -51,38 +77,58 @@ async def notify_user(user_id: str, message: str, task_id: Optional[str] = None,
 
 async def push_progress_update(user_id: str, task_id: str, run_id: str, message: Any):
     """
-    Calls the main server's internal endpoint to push a progress update via WebSocket.
+    Pushes a single progress update to the client via the main server.
+    """
+    await push_progress_updates(user_id, task_id, run_id, [{"message": message, "timestamp": datetime.datetime.now(datetime.timezone.utc)}])
+
+async def push_progress_updates(user_id: str, task_id: str, run_id: str, updates: List[Dict[str, Any]]):
     """
-    endpoint = f"{MAIN_SERVER_URL}/tasks/internal/progress-update"
+    Pushes a batch of progress updates to the client via the main server.
+    Each update is a dict with 'message' and 'timestamp', in the order they occurred.
+    """
+    if not updates:
+        return
     payload = {
         "user_id": user_id,
         "task_id": task_id,
         "run_id": run_id,
-        "message": message
+        "updates": [
+            {
+                "message": update.get("message"),
+                "timestamp": update["timestamp"].isoformat() if isinstance(update.get("timestamp"), datetime.datetime) else update.get("timestamp")
+            } for update in updates
+        ]
     }
+    if publish_event(EVENT_TASK_PROGRESS, user_id, payload):
+        logger.info(f"Queued {len(updates)} progress updates for task {task_id}.")
+        return
+
+    endpoint = f"{MAIN_SERVER_URL}/tasks/internal/progress-update-batch"
     try:
-        async with httpx.AsyncClient() as client:
-            # This is a fire-and-forget call, we don't need to wait long or handle the response extensively.
-            await client.post(endpoint, json=payload, timeout=5)
-            logger.info(f"Pushed progress update for task {task_id} to main server.")
+        await get_http_client().post(endpoint, json=payload, timeout=5)
+        logger.info(f"Pushed {len(updates)} progress updates for task {task_id} to main server.")
     except Exception as e:
         # Log the error but don't let it crash the worker task.
-        logger.error(f"Failed to push progress update to main server for task {task_id}: {e}", exc_info=False)
+        logger.error(f"Failed to push progress updates to main server for task {task_id}: {e}", exc_info=False)
+
 async def push_task_list_update(user_id: str, task_id: str, run_id: str):
     """
-    Calls the main server's internal endpoint to tell the client to refetch its task list.
+    Tells the client, via the main server, to refetch its task list.
     """
-    endpoint = f"{MAIN_SERVER_URL}/tasks/internal/task-update-push"
-    # We can reuse the ProgressUpdateRequest model for simplicity as it has the required fields.
     payload = {
         "user_id": user_id,
         "task_id": task_id,
         "run_id": run_id,
         "message": "refresh" # Message content isn't used but good to have
     }
+    if publish_event(EVENT_TASK_LIST_UPDATED, user_id, payload):
+        logger.info(f"Queued task list update notification for user {user_id}.")
+        return
+
+    # We can reuse the ProgressUpdateRequest model for simplicity as it has the required fields.
+    endpoint = f"{MAIN_SERVER_URL}/tasks/internal/task-update-push"
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(endpoint, json=payload, timeout=5)
-            logger.info(f"Pushed task list update notification for user {user_id}.")
+        await get_http_client().post(endpoint, json=payload, timeout=5)
+        logger.info(f"Pushed task list update notification for user {user_id}.")
     except Exception as e:
-        logger.error(f"Failed to push task list update to main server for task {task_id}: {e}", exc_info=False)
\ No newline at end of file
+        logger.error(f"Failed to push task list update to main server for task {task_id}: {e}", exc_info=False)
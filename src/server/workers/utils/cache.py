@@ -0,0 +1,46 @@
+import json
+import logging
+from typing import Any, Optional
+
+import redis
+
+from workers.executor.config import SWARM_CONTEXT_CACHE_URL
+
+logger = logging.getLogger(__name__)
+
+# A synchronous client is used on purpose: Celery tasks run each job on a fresh event loop,
+# and an async client would stay bound to the loop it was first used on.
+_client: Optional[redis.Redis] = None
+
+def get_cache_client() -> Optional[redis.Redis]:
+    global _client
+    if _client is None and SWARM_CONTEXT_CACHE_URL:
+        try:
+            _client = redis.Redis.from_url(SWARM_CONTEXT_CACHE_URL, decode_responses=True, socket_timeout=2)
+        except Exception as e:
+            logger.error(f"Could not create cache client: {e}")
+    return _client
+
+def cache_set_json(key: str, value: Any, ttl_seconds: int) -> bool:
+    """Stores a value as compact JSON. Returns False if the cache is unavailable."""
+    client = get_cache_client()
+    if client is None:
+        return False
+    try:
+        client.set(key, json.dumps(value, separators=(",", ":"), default=str), ex=ttl_seconds)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to write cache key '{key}': {e}")
+        return False
+
+def cache_get_json(key: str) -> Optional[Any]:
+    """Returns the cached value, or None if it is missing, expired or the cache is unavailable."""
+    client = get_cache_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(key)
+    except Exception as e:
+        logger.warning(f"Failed to read cache key '{key}': {e}")
+        return None
+    return json.loads(raw) if raw else None
@@ -0,0 +1,52 @@
+import datetime
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import redis
+
+from workers.config import WORKER_EVENT_REDIS_URL, WORKER_EVENT_STREAM, WORKER_EVENT_STREAM_MAXLEN, WORKER_EVENT_TRANSPORT
+
+logger = logging.getLogger(__name__)
+
+# Event types understood by the main server's consumer (main/worker_events.py).
+EVENT_NOTIFICATION = "notification"
+EVENT_TASK_PROGRESS = "task_progress"
+EVENT_TASK_LIST_UPDATED = "task_list_updated"
+
+# Synchronous for the same reason as workers/utils/cache.py: Celery tasks run on short-lived
+# event loops, and an XADD is a sub-millisecond call.
+_client: Optional[redis.Redis] = None
+
+def _get_stream_client() -> Optional[redis.Redis]:
+    global _client
+    if _client is None and WORKER_EVENT_REDIS_URL:
+        try:
+            _client = redis.Redis.from_url(WORKER_EVENT_REDIS_URL, decode_responses=True, socket_timeout=2)
+        except Exception as e:
+            logger.error(f"Could not create worker event stream client: {e}")
+    return _client
+
+def publish_event(event_type: str, user_id: str, data: Dict[str, Any]) -> bool:
+    """
+    Appends an event for the main server to the worker event stream.
+    Returns False if streaming is disabled or the stream could not be written, so the caller
+    can fall back to HTTP.
+    """
+    if WORKER_EVENT_TRANSPORT != "stream":
+        return False
+    client = _get_stream_client()
+    if client is None:
+        return False
+    fields = {
+        "type": event_type,
+        "user_id": user_id,
+        "data": json.dumps(data, default=str),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    try:
+        client.xadd(WORKER_EVENT_STREAM, fields, maxlen=WORKER_EVENT_STREAM_MAXLEN, approximate=True)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to publish '{event_type}' event for user {user_id} to the stream: {e}")
+        return False
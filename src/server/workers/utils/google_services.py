@@ -0,0 +1,51 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_SERVICES = 256
+
+# (api_name, api_version, user_id) -> (access token the service was built with, service)
+_services: "OrderedDict[Tuple[str, str, str], Tuple[Optional[str], Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+def build_google_service(api_name: str, api_version: str, creds: Credentials):
+    """
+    Builds a Google API client from the discovery document bundled with google-api-python-client,
+    so no discovery document is fetched over the network.
+    """
+    return build(api_name, api_version, credentials=creds, static_discovery=True, cache_discovery=False)
+
+def get_google_service(api_name: str, api_version: str, creds: Credentials, user_id: Optional[str] = None):
+    """
+    Returns a cached API client for this user. The client is rebuilt when the user's credentials
+    were refreshed since it was built, so it never keeps using a stale access token.
+    Clients are not thread-safe: callers must not use one from several threads at once.
+    """
+    if not user_id:
+        return build_google_service(api_name, api_version, creds)
+
+    key = (api_name, api_version, user_id)
+    with _lock:
+        cached = _services.get(key)
+        if cached and cached[0] == creds.token:
+            _services.move_to_end(key)
+            return cached[1]
+
+    service = build_google_service(api_name, api_version, creds)
+    with _lock:
+        _services[key] = (creds.token, service)
+        _services.move_to_end(key)
+        while len(_services) > MAX_CACHED_SERVICES:
+            _services.popitem(last=False)
+    return service
+
+def evict_google_service(api_name: str, api_version: str, user_id: str):
+    """Drops a user's cached client, e.g. after an auth error."""
+    with _lock:
+        _services.pop((api_name, api_version, user_id), None)
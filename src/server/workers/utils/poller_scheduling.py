@@ -0,0 +1,53 @@
+import bisect
+import hashlib
+import os
+import socket
+import uuid
+from typing import Iterable, List, Optional
+
+def make_replica_id() -> str:
+    """Identifies this poller process. Set POLLER_REPLICA_ID to keep a stable id across restarts."""
+    return os.getenv("POLLER_REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+class PollLeaseLostError(Exception):
+    """Raised inside a poll cycle whose lease was taken over, so it stops before dispatching or logging anything."""
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """
+    Consistent-hash ring of poller replicas. Each replica owns the users that hash onto its
+    virtual nodes, so adding or removing a replica only moves about 1/N of the users.
+    """
+
+    def __init__(self, replica_ids: Iterable[str], virtual_nodes: int = 64):
+        self.replica_ids = sorted(set(replica_ids))
+        points = [(_hash(f"{replica_id}#{i}"), replica_id) for replica_id in self.replica_ids for i in range(virtual_nodes)]
+        points.sort()
+        self._hashes = [point for point, _ in points]
+        self._owners = [owner for _, owner in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def owns(self, replica_id: str, key: str) -> bool:
+        owner = self.owner(key)
+        # Without any registered replica, every replica may claim; leases still prevent double polling.
+        return owner is None or owner == replica_id
+
+    def filter_owned(self, replica_id: str, keys: List[str]) -> List[str]:
+        return [key for key in keys if self.owns(replica_id, key)]
+
+def compute_next_poll_interval(previous_interval: Optional[float], found_count: int, min_seconds: float,
+                               max_seconds: float, idle_backoff_factor: float) -> float:
+    """
+    Adapts a user's poll interval to their activity: any new item brings it back to the minimum,
+    and every idle poll stretches it by `idle_backoff_factor`, up to the maximum.
+    """
+    if found_count > 0 or not previous_interval:
+        return min_seconds
+    return min(max_seconds, max(min_seconds, previous_interval * idle_backoff_factor))
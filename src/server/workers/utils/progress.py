@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from workers.executor.config import (PROGRESS_FLUSH_INTERVAL_SECONDS, PROGRESS_FLUSH_MAX_BATCH_SIZE,
+                                     PROGRESS_VERBOSITY, SWARM_PROGRESS_PUSH_INTERVAL_SECONDS)
+from workers.utils.api_client import push_progress_updates, push_task_list_update
+
+logger = logging.getLogger(__name__)
+
+# Progress update types that are kept at each verbosity level. None keeps everything not in NEVER_KEPT_TYPES.
+VERBOSITY_LEVELS = {
+    "minimal": {"info", "error", "final_answer"},
+    "normal": {"info", "error", "final_answer", "tool_call", "tool_result"},
+    "verbose": None,
+}
+# The agent's internal thoughts are never stored or pushed, at any verbosity.
+NEVER_KEPT_TYPES = {"thought"}
+
+# Swarm worker statuses that are kept at each verbosity level. None keeps everything.
+SWARM_VERBOSITY_LEVELS = {
+    "minimal": {"completed", "error"},
+    "normal": None,
+    "verbose": None,
+}
+
+# Last 'task list changed' push per swarm task, shared by all workers in this process, oldest first.
+# Entries older than the push interval no longer throttle anything and are dropped, so this stays
+# as small as the number of swarms pushing right now.
+_last_swarm_push_times: "OrderedDict[str, float]" = OrderedDict()
+
+
+class ProgressAggregator:
+    """
+    Buffers the progress updates of a single task run and writes them out in batches.
+
+    Each flush is one Mongo `$push` with `$each` and one HTTP push to the main server,
+    instead of one of each per update. Updates are written in the order they were added.
+    A flush happens when `flush_if_due()` is called and either the batch is full or the
+    flush interval has elapsed. `close()` (or leaving the `async with` block) always
+    flushes whatever is left, so the final updates of a completed or failed run are never lost.
+    """
+
+    def __init__(self, db, task_id: str, run_id: str, user_id: str, block_id: Optional[str] = None,
+                 flush_interval: float = PROGRESS_FLUSH_INTERVAL_SECONDS,
+                 max_batch_size: int = PROGRESS_FLUSH_MAX_BATCH_SIZE,
+                 verbosity: str = PROGRESS_VERBOSITY):
+        if verbosity not in VERBOSITY_LEVELS:
+            logger.warning(f"Unknown progress verbosity '{verbosity}'. Falling back to 'normal'.")
+            verbosity = "normal"
+        self.db = db
+        self.task_id = task_id
+        self.run_id = run_id
+        self.user_id = user_id
+        self.block_id = block_id
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.verbosity = verbosity
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _is_wanted(self, message: Any) -> bool:
+        if not isinstance(message, dict):
+            return True
+        if message.get("type") in NEVER_KEPT_TYPES:
+            return False
+        allowed_types = VERBOSITY_LEVELS[self.verbosity]
+        return allowed_types is None or message.get("type") in allowed_types
+
+    def _enqueue(self, entry: Dict[str, Any]):
+        self._buffer.append(entry)
+
+    def add(self, message: Any) -> bool:
+        """Queues a progress update. Returns False if the verbosity level filtered it out."""
+        if not self._is_wanted(message):
+            return False
+        self._enqueue({"message": message, "timestamp": datetime.datetime.now(datetime.timezone.utc)})
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def is_due(self) -> bool:
+        if not self._buffer:
+            return False
+        return len(self._buffer) >= self.max_batch_size or time.monotonic() - self._last_flush >= self.flush_interval
+
+    async def flush_if_due(self):
+        if self.is_due():
+            await self.flush()
+
+    async def flush(self):
+        """Writes and pushes everything buffered so far as a single batch."""
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                await self._write(batch)
+            except Exception as e:
+                # Put the batch back in front of anything added since, so ordering is preserved on retry.
+                logger.error(f"Failed to write {len(batch)} progress updates for task {self.task_id}: {e}", exc_info=True)
+                self._buffer[:0] = batch
+                return
+            await self._push(batch)
+
+    async def close(self):
+        await self.flush()
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        await self.db.tasks.update_one(
+            {"task_id": self.task_id, "user_id": self.user_id},
+            {"$push": {"runs.$[run].progress_updates": {"$each": batch}}},
+            array_filters=[{"run.run_id": self.run_id}]
+        )
+        if self.block_id:
+            await self.db.tasks_blocks_collection.update_one(
+                {"block_id": self.block_id, "user_id": self.user_id},
+                {"$push": {"task_progress": {"$each": batch}}}
+            )
+
+    async def _push(self, batch: List[Dict[str, Any]]):
+        await push_progress_updates(self.user_id, self.task_id, self.run_id, batch)
+
+
+class SwarmProgressAggregator(ProgressAggregator):
+    """
+    Buffers a swarm sub-agent's updates into the parent task's `swarm_details.progress_updates`.
+
+    Instead of pushing every update, the client is told to refetch its task list at most once
+    per `SWARM_PROGRESS_PUSH_INTERVAL_SECONDS` per swarm task and worker process. The swarm's
+    aggregation callback sends the final refresh.
+    """
+
+    def __init__(self, db, parent_task_id: str, user_id: str, worker_id: str,
+                 push_interval: float = SWARM_PROGRESS_PUSH_INTERVAL_SECONDS, **kwargs):
+        super().__init__(db, parent_task_id, "swarm_progress", user_id, **kwargs)
+        self.worker_id = worker_id
+        self.push_interval = push_interval
+
+    def add(self, status: str, message: str) -> bool:
+        allowed_statuses = SWARM_VERBOSITY_LEVELS[self.verbosity]
+        if allowed_statuses is not None and status not in allowed_statuses:
+            return False
+        self._enqueue({
+            "worker_id": self.worker_id,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+            "status": status,
+            "message": message
+        })
+        return True
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        update = {"$push": {"swarm_details.progress_updates": {"$each": batch}}}
+        finished = sum(1 for entry in batch if entry["status"] in ["completed", "error"])
+        if finished:
+            update["$inc"] = {"swarm_details.completed_agents": finished}
+        await self.db.tasks.update_one({"task_id": self.task_id}, update)
+
+    async def _push(self, batch: List[Dict[str, Any]]):
+        now = time.monotonic()
+        while _last_swarm_push_times and now - next(iter(_last_swarm_push_times.values())) >= self.push_interval:
+            _last_swarm_push_times.popitem(last=False)
+        if self.task_id in _last_swarm_push_times:
+            return
+        _last_swarm_push_times[self.task_id] = now
+        await push_task_list_update(self.user_id, self.task_id, self.run_id)